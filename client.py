@@ -51,6 +51,7 @@ try:
     argparser.add_argument( '--db_memory_journaling', action='store_true', help = 'run db journaling entirely in memory (DANGEROUS)' )
     argparser.add_argument( '--db_synchronous_override', help = 'override SQLite Synchronous PRAGMA (range 0-3, default=2)' )
     argparser.add_argument( '--no_db_temp_files', action='store_true', help = 'run db temp operations entirely in memory' )
+    argparser.add_argument( '--db_read_only_connections', help = 'number of read-only db connections that can serve searches and metadata requests while the db is writing (default=2, 0 to disable)' )
     
     result = argparser.parse_args()
     
@@ -112,6 +113,25 @@ try:
     
     HG.no_db_temp_files = result.no_db_temp_files
     
+    if result.db_read_only_connections is not None:
+        
+        try:
+            
+            db_read_only_connections = int( result.db_read_only_connections )
+            
+        except ValueError:
+            
+            raise Exception( 'db_read_only_connections must be a non-negative integer' )
+            
+        
+        if db_read_only_connections < 0:
+            
+            raise Exception( 'db_read_only_connections must be a non-negative integer' )
+            
+        
+        HG.db_read_only_connections = db_read_only_connections
+        
+    
     if result.temp_dir is not None:
         
         HydrusPaths.SetEnvTempDir( result.temp_dir )
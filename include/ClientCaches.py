@@ -24,6 +24,7 @@ from . import ClientData
 from . import ClientConstants as CC
 from . import HydrusGlobals as HG
 import collections
+import heapq
 from . import HydrusTags
 import traceback
 import weakref
@@ -424,50 +425,328 @@ class BitmapManager( object ):
         self._ScheduleDestruction()
         
     
+class DataCacheBudget( object ):
+    
+    # one memory limit for one or more datacaches
+    # when the caches are over it together, the cache that holds the least recently used victim gives it up
+    
+    def __init__( self, cache_size ):
+        
+        self._cache_size = cache_size
+        
+        self._data_caches = []
+        
+        self._lock = threading.Lock()
+        
+    
+    def AddDataCache( self, data_cache ):
+        
+        with self._lock:
+            
+            self._data_caches.append( data_cache )
+            
+        
+    
+    def GetCacheSize( self ):
+        
+        return self._cache_size
+        
+    
+    def GetMemoryUsage( self ):
+        
+        return sum( ( data_cache.GetMemoryUsage() for data_cache in self._data_caches ) )
+        
+    
+    def MaintainBudget( self ):
+        
+        # we never hold a cache's lock while asking for this lock, so no deadlocks
+        
+        with self._lock:
+            
+            while self.GetMemoryUsage() > self._cache_size:
+                
+                candidates = [ ( data_cache.GetVictimLastAccessTime(), data_cache ) for data_cache in self._data_caches ]
+                
+                candidates = [ ( last_access_time, data_cache ) for ( last_access_time, data_cache ) in candidates if last_access_time is not None ]
+                
+                if len( candidates ) == 0:
+                    
+                    break
+                    
+                
+                ( last_access_time, data_cache ) = min( candidates, key = lambda pair: pair[0] )
+                
+                data_cache.EvictItem()
+                
+            
+        
+    
+class DataCacheEvictionPolicyLRU( object ):
+    
+    def __init__( self ):
+        
+        self._keys = collections.OrderedDict()
+        
+    
+    def Add( self, key, size ):
+        
+        self._keys[ key ] = size
+        
+    
+    def Clear( self ):
+        
+        self._keys = collections.OrderedDict()
+        
+    
+    def GetVictim( self ):
+        
+        return next( iter( self._keys ) )
+        
+    
+    def Remove( self, key, evicted = False ):
+        
+        del self._keys[ key ]
+        
+    
+    def Touch( self, key, size ):
+        
+        self._keys.move_to_end( key )
+        
+        self._keys[ key ] = size
+        
+    
+class DataCacheEvictionPolicySizeWeightedLRU( object ):
+    
+    # this is greedydual-size
+    # every touch sets an item's priority to the current clock plus an amount that gets smaller as the item gets bigger
+    # the lowest priority goes first, and each eviction winds the clock up to that priority, so untouched small items still age out eventually
+    # looking at the victim does not move the clock--only actually evicting it does
+    
+    def __init__( self ):
+        
+        self.Clear()
+        
+    
+    def _Push( self, key, size ):
+        
+        self._counter += 1
+        
+        priority = self._clock + 1.0 / max( 1, size )
+        
+        self._keys_to_priorities[ key ] = ( priority, self._counter )
+        
+        heapq.heappush( self._heap, ( priority, self._counter, key ) )
+        
+        if len( self._heap ) > 64 + 2 * len( self._keys_to_priorities ):
+            
+            # too many stale entries from touches and removes, so rebuild
+            
+            self._heap = [ ( priority, counter, key ) for ( key, ( priority, counter ) ) in self._keys_to_priorities.items() ]
+            
+            heapq.heapify( self._heap )
+            
+        
+    
+    def Add( self, key, size ):
+        
+        self._Push( key, size )
+        
+    
+    def Clear( self ):
+        
+        self._clock = 0.0
+        self._counter = 0
+        
+        self._keys_to_priorities = {}
+        self._heap = []
+        
+    
+    def GetVictim( self ):
+        
+        while True:
+            
+            ( priority, counter, key ) = self._heap[0]
+            
+            if self._keys_to_priorities.get( key, None ) == ( priority, counter ):
+                
+                return key
+                
+            
+            heapq.heappop( self._heap )
+            
+        
+    
+    def Remove( self, key, evicted = False ):
+        
+        ( priority, counter ) = self._keys_to_priorities.pop( key )
+        
+        if evicted:
+            
+            self._clock = priority
+            
+        
+    
+    def Touch( self, key, size ):
+        
+        self._Push( key, size )
+        
+    
+class DataCacheEvictionPolicy2Q( object ):
+    
+    # new items go in a fifo, and only items touched again after falling out of it are promoted to the main lru
+    # a single scroll through a big page therefore cannot flush out the items that are actually being reused
+    
+    IN_FRACTION = 0.25
+    
+    def __init__( self ):
+        
+        self.Clear()
+        
+    
+    def Add( self, key, size ):
+        
+        if key in self._ghost_keys:
+            
+            del self._ghost_keys[ key ]
+            
+            self._main_keys[ key ] = size
+            
+            self._main_size += size
+            
+        else:
+            
+            self._in_keys[ key ] = size
+            
+            self._in_size += size
+            
+        
+    
+    def Clear( self ):
+        
+        self._in_keys = collections.OrderedDict()
+        self._main_keys = collections.OrderedDict()
+        self._ghost_keys = collections.OrderedDict()
+        
+        self._in_size = 0
+        self._main_size = 0
+        
+    
+    def GetVictim( self ):
+        
+        if len( self._main_keys ) == 0 or ( len( self._in_keys ) > 0 and self._in_size > self.IN_FRACTION * ( self._in_size + self._main_size ) ):
+            
+            return next( iter( self._in_keys ) )
+            
+        else:
+            
+            return next( iter( self._main_keys ) )
+            
+        
+    
+    def Remove( self, key, evicted = False ):
+        
+        if key in self._in_keys:
+            
+            self._in_size -= self._in_keys[ key ]
+            
+            del self._in_keys[ key ]
+            
+            self._ghost_keys[ key ] = None
+            
+            while len( self._ghost_keys ) > max( 64, len( self._in_keys ) + len( self._main_keys ) ):
+                
+                self._ghost_keys.popitem( last = False )
+                
+            
+        else:
+            
+            self._main_size -= self._main_keys[ key ]
+            
+            del self._main_keys[ key ]
+            
+        
+    
+    def Touch( self, key, size ):
+        
+        if key in self._in_keys:
+            
+            self._in_size += size - self._in_keys[ key ]
+            
+            self._in_keys[ key ] = size
+            
+        else:
+            
+            self._main_size += size - self._main_keys[ key ]
+            
+            self._main_keys.move_to_end( key )
+            
+            self._main_keys[ key ] = size
+            
+        
+    
+eviction_policy_lookup = {}
+
+eviction_policy_lookup[ CC.CACHE_EVICTION_LRU ] = DataCacheEvictionPolicyLRU
+eviction_policy_lookup[ CC.CACHE_EVICTION_SIZE_WEIGHTED_LRU ] = DataCacheEvictionPolicySizeWeightedLRU
+eviction_policy_lookup[ CC.CACHE_EVICTION_2Q ] = DataCacheEvictionPolicy2Q
+
 class DataCache( object ):
     
-    def __init__( self, controller, cache_size, timeout = 1200 ):
+    def __init__( self, controller, cache_size, timeout = 1200, eviction_policy = CC.CACHE_EVICTION_LRU, budget = None ):
         
         self._controller = controller
-        self._cache_size = cache_size
         self._timeout = timeout
         
+        if budget is None:
+            
+            budget = DataCacheBudget( cache_size )
+            
+        
+        self._budget = budget
+        
         self._keys_to_data = {}
+        self._keys_to_footprints = {}
         self._keys_fifo = collections.OrderedDict()
         
+        self._eviction_policy = eviction_policy_lookup[ eviction_policy ]()
+        
         self._total_estimated_memory_footprint = 0
         
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_evictions = 0
+        
         self._lock = threading.Lock()
         
+        self._budget.AddDataCache( self )
+        
         self._controller.sub( self, 'MaintainCache', 'memory_maintenance_pulse' )
         
     
-    def _Delete( self, key ):
+    def _Delete( self, key, evicted = False ):
         
         if key not in self._keys_to_data:
             
             return
             
         
-        deletee_data = self._keys_to_data[ key ]
-        
         del self._keys_to_data[ key ]
+        del self._keys_fifo[ key ]
+        
+        self._total_estimated_memory_footprint -= self._keys_to_footprints[ key ]
         
-        self._RecalcMemoryUsage()
+        del self._keys_to_footprints[ key ]
+        
+        self._eviction_policy.Remove( key, evicted = evicted )
         
     
     def _DeleteItem( self ):
         
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+        ( deletee_key, last_access_time ) = next( iter( self._keys_fifo.items() ) )
         
         self._Delete( deletee_key )
         
     
-    def _RecalcMemoryUsage( self ):
-        
-        self._total_estimated_memory_footprint = sum( ( data.GetEstimatedMemoryFootprint() for data in self._keys_to_data.values() ) )
-        
-    
     def _TouchKey( self, key ):
         
         # have to delete first, rather than overwriting, so the ordereddict updates its internal order
@@ -478,14 +757,36 @@ class DataCache( object ):
         
         self._keys_fifo[ key ] = HydrusData.GetNow()
         
+        # some data, like an image renderer, grows once it has finished loading, so we re-measure just this one
+        
+        footprint = self._keys_to_data[ key ].GetEstimatedMemoryFootprint()
+        
+        if key in self._keys_to_footprints:
+            
+            self._total_estimated_memory_footprint += footprint - self._keys_to_footprints[ key ]
+            
+            self._eviction_policy.Touch( key, footprint )
+            
+        else:
+            
+            self._total_estimated_memory_footprint += footprint
+            
+            self._eviction_policy.Add( key, footprint )
+            
+        
+        self._keys_to_footprints[ key ] = footprint
+        
     
     def Clear( self ):
         
         with self._lock:
             
             self._keys_to_data = {}
+            self._keys_to_footprints = {}
             self._keys_fifo = collections.OrderedDict()
             
+            self._eviction_policy.Clear()
+            
             self._total_estimated_memory_footprint = 0
             
         
@@ -494,19 +795,22 @@ class DataCache( object ):
         
         with self._lock:
             
-            if key not in self._keys_to_data:
+            if key in self._keys_to_data:
                 
-                while self._total_estimated_memory_footprint > self._cache_size:
-                    
-                    self._DeleteItem()
-                    
+                return
+                
+            
+        
+        self._budget.MaintainBudget()
+        
+        with self._lock:
+            
+            if key not in self._keys_to_data:
                 
                 self._keys_to_data[ key ] = data
                 
                 self._TouchKey( key )
                 
-                self._RecalcMemoryUsage()
-                
             
         
     
@@ -518,6 +822,19 @@ class DataCache( object ):
             
         
     
+    def EvictItem( self ):
+        
+        with self._lock:
+            
+            if len( self._keys_to_data ) > 0:
+                
+                self._Delete( self._eviction_policy.GetVictim(), evicted = True )
+                
+                self._num_evictions += 1
+                
+            
+        
+    
     def GetData( self, key ):
         
         with self._lock:
@@ -539,15 +856,45 @@ class DataCache( object ):
             
             if key in self._keys_to_data:
                 
+                self._num_hits += 1
+                
                 self._TouchKey( key )
                 
                 return self._keys_to_data[ key ]
                 
             else:
                 
+                self._num_misses += 1
+                
+                return None
+                
+            
+        
+    
+    def GetMemoryUsage( self ):
+        
+        return self._total_estimated_memory_footprint
+        
+    
+    def GetStats( self ):
+        
+        with self._lock:
+            
+            return ( len( self._keys_to_data ), self._total_estimated_memory_footprint, self._num_hits, self._num_misses, self._num_evictions )
+            
+        
+    
+    def GetVictimLastAccessTime( self ):
+        
+        with self._lock:
+            
+            if len( self._keys_to_data ) == 0:
+                
                 return None
                 
             
+            return self._keys_fifo[ self._eviction_policy.GetVictim() ]
+            
         
     
     def HasData( self, key ):
@@ -1157,6 +1504,8 @@ class ParsingCache( object ):
         self._next_clean_cache_time = HydrusData.GetNow()
         
         self._html_to_soups = {}
+        self._html_to_lxml_roots = {}
+        self._html_to_lxml_sub_page_elements = {}
         self._json_to_jsons = {}
         
         self._lock = threading.Lock()
@@ -1166,7 +1515,7 @@ class ParsingCache( object ):
         
         if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
             
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
+            for cache in ( self._html_to_soups, self._html_to_lxml_roots, self._html_to_lxml_sub_page_elements, self._json_to_jsons ):
                 
                 dead_datas = set()
                 
@@ -1188,6 +1537,20 @@ class ParsingCache( object ):
             
         
     
+    def AddLXMLSubPageElement( self, html, element ):
+        
+        # a parser that has already cut this html out of a larger tree can hand the element over here, saving a re-parse when a sub-page parser asks for it
+        # the element stays in its page's tree, and we only copy it out if someone actually asks
+        
+        with self._lock:
+            
+            if html not in self._html_to_lxml_roots:
+                
+                self._html_to_lxml_sub_page_elements[ html ] = ( HydrusData.GetNow(), element )
+                
+            
+        
+    
     def CleanCache( self ):
         
         with self._lock:
@@ -1225,6 +1588,44 @@ class ParsingCache( object ):
             
         
     
+    def GetLXMLRoot( self, html ):
+        
+        with self._lock:
+            
+            now = HydrusData.GetNow()
+            
+            if html not in self._html_to_lxml_roots:
+                
+                if html in self._html_to_lxml_sub_page_elements:
+                    
+                    ( last_accessed, element ) = self._html_to_lxml_sub_page_elements.pop( html )
+                    
+                    root = ClientParsing.GetLXMLSubPageRoot( element )
+                    
+                else:
+                    
+                    root = ClientParsing.GetLXMLRoot( html )
+                    
+                
+                self._html_to_lxml_roots[ html ] = ( now, root )
+                
+            
+            ( last_accessed, root ) = self._html_to_lxml_roots[ html ]
+            
+            if last_accessed != now:
+                
+                self._html_to_lxml_roots[ html ] = ( now, root )
+                
+            
+            if len( self._html_to_lxml_roots ) > 10:
+                
+                self._CleanCache()
+                
+            
+            return root
+            
+        
+    
     def GetSoup( self, html ):
         
         with self._lock:
@@ -1256,14 +1657,15 @@ class ParsingCache( object ):
     
 class RenderedImageCache( object ):
     
-    def __init__( self, controller ):
+    def __init__( self, controller, budget = None ):
         
         self._controller = controller
         
         cache_size = self._controller.options[ 'fullscreen_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'image_cache_timeout' )
+        eviction_policy = self._controller.new_options.GetInteger( 'media_cache_eviction_policy' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout, eviction_policy = eviction_policy, budget = budget )
         
     
     def Clear( self ):
@@ -1293,6 +1695,11 @@ class RenderedImageCache( object ):
         return image_renderer
         
     
+    def GetStats( self ):
+        
+        return self._data_cache.GetStats()
+        
+    
     def HasImageRenderer( self, hash ):
         
         key = hash
@@ -1804,11 +2211,22 @@ class TagSiblingsManager( object ):
         
         with self._lock:
             
+            siblings = self._service_keys_to_siblings[ service_key ]
+            
             new_statuses_to_tags = HydrusData.default_dict_set()
             
             for ( status, tags ) in statuses_to_tags.items():
                 
-                new_statuses_to_tags[ status ] = self._CollapseTags( service_key, tags )
+                if siblings.keys().isdisjoint( tags ):
+                    
+                    # nothing to collapse, so share the set rather than copying it
+                    
+                    new_statuses_to_tags[ status ] = tags
+                    
+                else:
+                    
+                    new_statuses_to_tags[ status ] = self._CollapseTags( service_key, tags )
+                    
                 
             
             return new_statuses_to_tags
@@ -1964,14 +2382,15 @@ class TagSiblingsManager( object ):
     
 class ThumbnailCache( object ):
     
-    def __init__( self, controller ):
+    def __init__( self, controller, budget = None ):
         
         self._controller = controller
         
         cache_size = self._controller.options[ 'thumbnail_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
+        eviction_policy = self._controller.new_options.GetInteger( 'media_cache_eviction_policy' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout, eviction_policy = eviction_policy, budget = budget )
         
         self._magic_mime_thumbnail_ease_score_lookup = {}
         
@@ -1983,11 +2402,15 @@ class ThumbnailCache( object ):
         
         self._waterfall_queue_quick = set()
         self._waterfall_queue = []
+        self._waterfall_rendered = []
+        self._num_waterfall_jobs_in_progress = 0
+        self._priority_page_key = None
         
         self._delayed_regeneration_queue_quick = set()
         self._delayed_regeneration_queue = []
         
         self._waterfall_event = threading.Event()
+        self._waterfall_work_event = threading.Event()
         
         self._special_thumbs = {}
         
@@ -1995,6 +2418,13 @@ class ThumbnailCache( object ):
         
         self._controller.CallToThreadLongRunning( self.DAEMONWaterfall )
         
+        # decoding mostly happens in cv2/PIL without the GIL, so several workers really do run in parallel
+        
+        for i in range( self._controller.new_options.GetInteger( 'thumbnail_waterfall_workers' ) ):
+            
+            self._controller.CallToThreadLongRunning( self.DAEMONWaterfallWorker )
+            
+        
         self._controller.sub( self, 'Clear', 'reset_thumbnail_cache' )
         self._controller.sub( self, 'ClearThumbnails', 'clear_thumbnails' )
         
@@ -2010,7 +2440,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            path = self._controller.client_files_manager.GetThumbnailPath( display_media )
+            thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
             
         except HydrusExceptions.FileMissingException as e:
             
@@ -2026,7 +2456,7 @@ class ThumbnailCache( object ):
         
         try:
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
             
         except Exception as e:
             
@@ -2035,6 +2465,8 @@ class ThumbnailCache( object ):
                 # file is malformed, let's force a regen
                 self._controller.files_maintenance_manager.RunJobImmediately( [ display_media ], ClientFiles.REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, pub_job_key = False )
                 
+                thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
+                
             except Exception as e:
                 
                 summary = 'The thumbnail for file ' + hash.hex() + ' was not loadable. An attempt to regenerate it failed.'
@@ -2046,7 +2478,7 @@ class ThumbnailCache( object ):
             
             try:
                 
-                numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+                numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
                 
             except Exception as e:
                 
@@ -2266,10 +2698,11 @@ class ThumbnailCache( object ):
             
             display_media = media.GetDisplayMedia()
             
+            is_priority_page = page_key == self._priority_page_key
             magic_score = self._magic_mime_thumbnail_ease_score_lookup[ display_media.GetMime() ]
             hash = display_media.GetHash()
             
-            return ( magic_score, hash )
+            return ( not is_priority_page, magic_score, hash )
             
         
         self._waterfall_queue = list( self._waterfall_queue_quick )
@@ -2369,7 +2802,7 @@ class ThumbnailCache( object ):
         
         with self._lock:
             
-            return len( self._waterfall_queue ) > 0
+            return len( self._waterfall_queue ) > 0 or self._num_waterfall_jobs_in_progress > 0
             
         
     
@@ -2432,6 +2865,11 @@ class ThumbnailCache( object ):
             
         
     
+    def GetStats( self ):
+        
+        return self._data_cache.GetStats()
+        
+    
     def HasThumbnailCached( self, media ):
         
         display_media = media.GetDisplayMedia()
@@ -2456,23 +2894,24 @@ class ThumbnailCache( object ):
             
             self._waterfall_queue_quick.update( ( ( page_key, media ) for media in medias ) )
             
+            # only a page that is being drawn asks for thumbs, so the latest asker is the one the user is looking at
+            self._priority_page_key = page_key
+            
             self._RecalcQueues()
             
         
-        self._waterfall_event.set()
+        self._waterfall_work_event.set()
         
     
     def DAEMONWaterfall( self ):
         
-        last_paused = HydrusData.GetNowPrecise()
+        # the workers do the decoding, and this thread publishes what they have done once a frame
         
         while not HydrusThreading.IsThreadShuttingDown():
             
-            time.sleep( 0.00001 )
-            
             with self._lock:
                 
-                do_wait = len( self._waterfall_queue ) == 0 and len( self._delayed_regeneration_queue ) == 0
+                do_wait = len( self._waterfall_rendered ) == 0 and len( self._delayed_regeneration_queue ) == 0
                 
             
             if do_wait:
@@ -2481,36 +2920,24 @@ class ThumbnailCache( object ):
                 
                 self._waterfall_event.clear()
                 
-                last_paused = HydrusData.GetNowPrecise()
-                
-            
-            start_time = HydrusData.GetNowPrecise()
-            stop_time = start_time + 0.005 # a bit of a typical frame
             
-            page_keys_to_rendered_medias = collections.defaultdict( list )
+            time.sleep( 0.005 ) # a bit of a typical frame
             
-            while not HydrusData.TimeHasPassedPrecise( stop_time ):
+            with self._lock:
                 
-                with self._lock:
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        break
-                        
-                    
-                    result = self._waterfall_queue.pop()
-                    
-                    self._waterfall_queue_quick.discard( result )
-                    
+                rendered = self._waterfall_rendered
                 
-                ( page_key, media ) = result
+                self._waterfall_rendered = []
                 
-                self.GetThumbnail( media )
+            
+            if len( rendered ) > 0:
                 
-                page_keys_to_rendered_medias[ page_key ].append( media )
+                page_keys_to_rendered_medias = collections.defaultdict( list )
                 
-            
-            if len( page_keys_to_rendered_medias ) > 0:
+                for ( page_key, media ) in rendered:
+                    
+                    page_keys_to_rendered_medias[ page_key ].append( media )
+                    
                 
                 for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
                     
@@ -2525,7 +2952,7 @@ class ThumbnailCache( object ):
             with self._lock:
                 
                 # got more important work or no work to do
-                if len( self._waterfall_queue ) > 0 or len( self._delayed_regeneration_queue ) == 0 or HG.client_controller.CurrentlyPubSubbing():
+                if len( self._waterfall_queue ) > 0 or self._num_waterfall_jobs_in_progress > 0 or len( self._delayed_regeneration_queue ) == 0 or HG.client_controller.CurrentlyPubSubbing():
                     
                     continue
                     
@@ -2561,6 +2988,68 @@ class ThumbnailCache( object ):
             
         
     
+    def DAEMONWaterfallWorker( self ):
+        
+        while not HydrusThreading.IsThreadShuttingDown():
+            
+            with self._lock:
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    self._waterfall_work_event.clear()
+                    
+                    result = None
+                    
+                else:
+                    
+                    result = self._waterfall_queue.pop()
+                    
+                    self._waterfall_queue_quick.discard( result )
+                    
+                    self._num_waterfall_jobs_in_progress += 1
+                    
+                
+            
+            if result is None:
+                
+                self._waterfall_work_event.wait( 1 )
+                
+                continue
+                
+            
+            ( page_key, media ) = result
+            
+            try:
+                
+                self.GetThumbnail( media )
+                
+                rendered = True
+                
+            except Exception as e:
+                
+                # one bad thumbnail should not take this worker down with it
+                
+                HydrusData.Print( 'The thumbnail waterfall could not render a thumbnail:' )
+                
+                HydrusData.PrintException( e )
+                
+                rendered = False
+                
+            
+            with self._lock:
+                
+                if rendered:
+                    
+                    self._waterfall_rendered.append( result )
+                    
+                
+                self._num_waterfall_jobs_in_progress -= 1
+                
+            
+            self._waterfall_event.set()
+            
+        
+    
 class UndoManager( object ):
     
     def __init__( self, controller ):
@@ -16,6 +16,16 @@ APPLICATION_COMMAND_TYPE_CONTENT = 1
 
 BLANK_PHASH = b'\x80\x00\x00\x00\x00\x00\x00\x00' # first bit 1 but everything else 0 means only significant part of dct was [0,0], which represents flat colour
 
+CACHE_EVICTION_LRU = 0
+CACHE_EVICTION_SIZE_WEIGHTED_LRU = 1
+CACHE_EVICTION_2Q = 2
+
+cache_eviction_string_lookup = {}
+
+cache_eviction_string_lookup[ CACHE_EVICTION_LRU ] = 'least recently used'
+cache_eviction_string_lookup[ CACHE_EVICTION_SIZE_WEIGHTED_LRU ] = 'least recently used, weighted to drop big items first'
+cache_eviction_string_lookup[ CACHE_EVICTION_2Q ] = '2Q (resists one-off scrolls flushing the cache)'
+
 CAN_HIDE_MOUSE = True
 
 FILTER_WHITELIST = 0
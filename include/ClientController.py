@@ -846,8 +846,17 @@ class Controller( HydrusController.HydrusController ):
         
         def wx_code():
             
-            self._caches[ 'images' ] = ClientCaches.RenderedImageCache( self )
-            self._caches[ 'thumbnail' ] = ClientCaches.ThumbnailCache( self )
+            if self.new_options.GetBoolean( 'share_media_cache_budget' ):
+                
+                budget = ClientCaches.DataCacheBudget( self.options[ 'fullscreen_cache_size' ] + self.options[ 'thumbnail_cache_size' ] )
+                
+            else:
+                
+                budget = None
+                
+            
+            self._caches[ 'images' ] = ClientCaches.RenderedImageCache( self, budget = budget )
+            self._caches[ 'thumbnail' ] = ClientCaches.ThumbnailCache( self, budget = budget )
             self.bitmap_manager = ClientCaches.BitmapManager( self )
             
             CC.GlobalBMPs.STATICInitialise()
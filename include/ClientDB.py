@@ -15,6 +15,7 @@ from . import ClientOptions
 from . import ClientRatings
 from . import ClientSearch
 from . import ClientServices
+from . import ClientSimilarFiles
 from . import ClientTags
 from . import ClientThreading
 import collections
@@ -42,6 +43,7 @@ import random
 import re
 import sqlite3
 import stat
+import sys
 import time
 import traceback
 import wx
@@ -187,9 +189,21 @@ def report_speed_to_log( precise_timestamp, num_rows, row_name ):
     
     HydrusData.Print( summary )
     
+class DBConnectionData( HydrusDB.DBConnectionData ):
+    
+    def __init__( self ):
+        
+        HydrusDB.DBConnectionData.__init__( self )
+        
+        self.hash_ids_to_hashes_cache = {}
+        self.service_cache = {}
+        self.tag_ids_to_tags_cache = {}
+        
+    
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
+    READ_ONLY_ACTIONS = [ 'autocomplete_predicates', 'file_duplicate_info', 'file_hashes', 'file_hashes_mapping', 'file_notes', 'file_query_ids', 'filter_hashes', 'filter_orphans', 'hash_status', 'in_inbox', 'media_results', 'media_results_from_ids', 'related_tags', 'url_statuses' ]
     
     def __init__( self, controller, db_dir, db_name ):
         
@@ -1213,6 +1227,15 @@ class DB( HydrusDB.HydrusDB ):
         self._service_cache = {}
         
     
+    def _ClearReadOnlyCaches( self ):
+        
+        # the writer does not tell the read-only workers when ids are remapped, so their caches only live for one job
+        
+        self._hash_ids_to_hashes_cache = {}
+        self._service_cache = {}
+        self._tag_ids_to_tags_cache = {}
+        
+    
     def _ClearOrphanFileRecords( self ):
         
         job_key = ClientThreading.JobKey( cancellable = True )
@@ -2005,21 +2028,38 @@ class DB( HydrusDB.HydrusDB ):
     
     def _DuplicatesAddPotentialDuplicates( self, media_id, potential_duplicate_media_ids_and_distances ):
         
-        inserts = []
+        self._DuplicatesAddPotentialDuplicatePairs( ( ( media_id, potential_duplicate_media_id, distance ) for ( potential_duplicate_media_id, distance ) in potential_duplicate_media_ids_and_distances ) )
         
-        for ( potential_duplicate_media_id, distance ) in potential_duplicate_media_ids_and_distances:
+    
+    def _DuplicatesAddPotentialDuplicatePairs( self, rows ):
+        
+        pairs_to_distances = {}
+        
+        for ( media_id_a, media_id_b, distance ) in rows:
             
-            if potential_duplicate_media_id == media_id: # already duplicates!
+            if media_id_a == media_id_b: # already duplicates!
                 
                 continue
                 
             
-            if self._DuplicatesMediasAreFalsePositive( media_id, potential_duplicate_media_id ):
+            pair = ( min( media_id_a, media_id_b ), max( media_id_a, media_id_b ) )
+            
+            if pair not in pairs_to_distances or distance < pairs_to_distances[ pair ]:
+                
+                pairs_to_distances[ pair ] = distance
+                
+            
+        
+        inserts = []
+        
+        for ( ( smaller_media_id, larger_media_id ), distance ) in pairs_to_distances.items():
+            
+            if self._DuplicatesMediasAreFalsePositive( smaller_media_id, larger_media_id ):
                 
                 continue
                 
             
-            if self._DuplicatesMediasAreConfirmedAlternates( media_id, potential_duplicate_media_id ):
+            if self._DuplicatesMediasAreConfirmedAlternates( smaller_media_id, larger_media_id ):
                 
                 continue
                 
@@ -2027,9 +2067,6 @@ class DB( HydrusDB.HydrusDB ):
             # if they are alternates with different alt label and index, do not add
             # however this _could_ be folded into areconfirmedalts on the setalt event--any other alt with diff label/index also gets added
             
-            smaller_media_id = min( media_id, potential_duplicate_media_id )
-            larger_media_id = max( media_id, potential_duplicate_media_id )
-            
             inserts.append( ( smaller_media_id, larger_media_id, distance ) )
             
         
@@ -2848,6 +2885,21 @@ class DB( HydrusDB.HydrusDB ):
         return media_id
         
     
+    def _DuplicatesGetMediaIds( self, hash_ids ):
+        
+        hash_ids_to_media_ids = dict( self._SelectFromList( 'SELECT hash_id, media_id FROM duplicate_file_members WHERE hash_id IN {};', hash_ids ) )
+        
+        for hash_id in hash_ids:
+            
+            if hash_id not in hash_ids_to_media_ids:
+                
+                hash_ids_to_media_ids[ hash_id ] = self._DuplicatesGetMediaId( hash_id )
+                
+            
+        
+        return hash_ids_to_media_ids
+        
+    
     def _DuplicatesGetPotentialDuplicatePairsTableJoinInfoOnFileService( self, file_service_key ):
         
         if file_service_key == CC.COMBINED_FILE_SERVICE_KEY:
@@ -3909,6 +3961,51 @@ class DB( HydrusDB.HydrusDB ):
         return hashes_result
         
     
+    def _FilterOrphans( self, test_type, possible_hashes ):
+        
+        return [ possible_hash for possible_hash in possible_hashes if self._IsAnOrphan( test_type, possible_hash ) ]
+        
+    
+    def _GenerateConnectionData( self ):
+        
+        return DBConnectionData()
+        
+    
+    def _GetHashIdsToHashesCache( self ):
+        
+        return self._connection_data.hash_ids_to_hashes_cache
+        
+    
+    def _GetServiceCache( self ):
+        
+        return self._connection_data.service_cache
+        
+    
+    def _GetTagIdsToTagsCache( self ):
+        
+        return self._connection_data.tag_ids_to_tags_cache
+        
+    
+    def _SetHashIdsToHashesCache( self, cache ):
+        
+        self._connection_data.hash_ids_to_hashes_cache = cache
+        
+    
+    def _SetServiceCache( self, cache ):
+        
+        self._connection_data.service_cache = cache
+        
+    
+    def _SetTagIdsToTagsCache( self, cache ):
+        
+        self._connection_data.tag_ids_to_tags_cache = cache
+        
+    
+    # these are per-thread, so the read-only workers can populate and reset their own without pulling entries out from under the writer
+    _hash_ids_to_hashes_cache = property( _GetHashIdsToHashesCache, _SetHashIdsToHashesCache )
+    _service_cache = property( _GetServiceCache, _SetServiceCache )
+    _tag_ids_to_tags_cache = property( _GetTagIdsToTagsCache, _SetTagIdsToTagsCache )
+    
     def _GenerateMappingsTables( self, service_id ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
@@ -4445,6 +4542,67 @@ class DB( HydrusDB.HydrusDB ):
         return desired_hashes
         
     
+    def _GetFileHashesMapping( self, given_hashes, given_hash_type, desired_hash_type, file_service_key = CC.COMBINED_FILE_SERVICE_KEY ):
+        
+        # the bulk version of file_hashes, for big jobs like migration that would otherwise do one db job per hash
+        # returns a dict of given_hash : desired_hash for the hashes we know, and that are currently in the file service if one is given
+        # the given hashes go in a temp table and everything is one join from there, probing the hash indices as it goes
+        
+        if given_hash_type == 'sha256':
+            
+            ( given_column, given_table_name ) = ( 'hash', 'hashes' )
+            
+        else:
+            
+            ( given_column, given_table_name ) = ( given_hash_type, 'local_hashes' )
+            
+        
+        if desired_hash_type == 'sha256':
+            
+            ( desired_column, desired_table_name ) = ( 'hash', 'hashes' )
+            
+        else:
+            
+            ( desired_column, desired_table_name ) = ( desired_hash_type, 'local_hashes' )
+            
+        
+        with HydrusDB.TemporaryValueTable( self._c, ( sqlite3.Binary( given_hash ) for given_hash in given_hashes if given_hash is not None ), 'given_hash', 'BLOB_BYTES' ) as temp_table_name:
+            
+            table_join = '{} CROSS JOIN {} ON ( {} = given_hash )'.format( temp_table_name, given_table_name, given_column )
+            
+            predicates = []
+            args = []
+            
+            if file_service_key != CC.COMBINED_FILE_SERVICE_KEY:
+                
+                service_id = self._GetServiceId( file_service_key )
+                
+                table_join += ' CROSS JOIN current_files USING ( hash_id )'
+                
+                predicates.append( 'service_id = ?' )
+                args.append( service_id )
+                
+            
+            if desired_table_name != given_table_name:
+                
+                table_join += ' CROSS JOIN {} USING ( hash_id )'.format( desired_table_name )
+                
+            
+            query = 'SELECT given_hash, {} FROM {}'.format( desired_column, table_join )
+            
+            if len( predicates ) > 0:
+                
+                query += ' WHERE ' + ' AND '.join( predicates )
+                
+            
+            query += ';'
+            
+            given_hashes_to_desired_hashes = dict( self._c.execute( query, args ) )
+            
+        
+        return given_hashes_to_desired_hashes
+        
+    
     def _GetFileNotes( self, hash ):
         
         hash_id = self._GetHashId( hash )
@@ -4661,9 +4819,9 @@ class DB( HydrusDB.HydrusDB ):
             # service_id -> ( status, tag )
             service_ids_to_tag_data = HydrusData.BuildKeyToListDict( ( ( tag_service_id, ( status, self._tag_ids_to_tags_cache[ tag_id ] ) ) for ( tag_service_id, status, tag_id ) in raw_tag_data ) )
             
-            service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            service_keys_to_statuses_to_tags = collections.defaultdict( ClientMedia.GenerateStatusesToTags )
             
-            service_keys_to_statuses_to_tags.update( { service_ids_to_service_keys[ service_id ] : HydrusData.BuildKeyToSetDict( tag_data ) for ( service_id, tag_data ) in list(service_ids_to_tag_data.items()) } )
+            service_keys_to_statuses_to_tags.update( { service_ids_to_service_keys[ service_id ] : ClientMedia.BuildStatusesToTags( tag_data ) for ( service_id, tag_data ) in list(service_ids_to_tag_data.items()) } )
             
             tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags )
             
@@ -6718,7 +6876,13 @@ class DB( HydrusDB.HydrusDB ):
                 missing_media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
                 
             
-            self._weakref_media_result_cache.AddMediaResults( missing_media_results )
+            # a read-only worker reads the last commit, and a write may commit and publish its content updates while we are still working
+            # our results are right for that commit, but in the shared cache nothing would ever correct them, so only the writer's results go in
+            
+            if not self._connection_data.read_only:
+                
+                self._weakref_media_result_cache.AddMediaResults( missing_media_results )
+                
             
             cached_media_results.extend( missing_media_results )
             
@@ -7987,102 +8151,141 @@ class DB( HydrusDB.HydrusDB ):
     
     def _ImportFile( self, file_import_job ):
         
+        return self._ImportFiles( ( file_import_job, ) )[0]
+        
+    
+    def _ImportFiles( self, file_import_jobs ):
+        
+        # everything goes in with one executemany per table, so a burst of imports is one transaction, not one each
+        # returns ( status, note ) for each job, in order
+        
         if HG.file_import_report_mode:
             
-            HydrusData.ShowText( 'File import job starting db job' )
+            HydrusData.ShowText( 'File import jobs starting db job for {} files'.format( HydrusData.ToHumanInt( len( file_import_jobs ) ) ) )
             
         
-        hash = file_import_job.GetHash()
+        results = []
         
-        hash_id = self._GetHashId( hash )
+        timestamp = HydrusData.GetNow()
         
-        ( status, status_hash, note ) = self._GetHashIdStatus( hash_id, prefix = 'file recognised' )
+        files_info_rows = []
+        add_rows = []
+        local_hashes_rows = []
+        file_modified_timestamp_rows = []
+        archive_hash_ids = []
+        inbox_hash_ids = []
+        content_updates = []
+        new_hash_ids_to_hashes = {}
         
-        if status != CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
+        for file_import_job in file_import_jobs:
             
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job adding new file' )
-                
+            hash = file_import_job.GetHash()
             
-            ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = file_import_job.GetFileInfo()
+            hash_id = self._GetHashId( hash )
             
-            timestamp = HydrusData.GetNow()
+            if hash_id in new_hash_ids_to_hashes:
+                
+                results.append( ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, 'file recognised: Imported earlier in the same batch.' ) )
+                
+                continue
+                
             
-            phashes = file_import_job.GetPHashes()
+            ( status, status_hash, note ) = self._GetHashIdStatus( hash_id, prefix = 'file recognised' )
             
-            if phashes is not None:
+            if status != CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
                 
                 if HG.file_import_report_mode:
                     
-                    HydrusData.ShowText( 'File import job associating phashes' )
+                    HydrusData.ShowText( 'File import job adding new file' )
                     
                 
-                self._PHashesAssociatePHashes( hash_id, phashes )
+                ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = file_import_job.GetFileInfo()
                 
-            
-            if HG.file_import_report_mode:
+                phashes = file_import_job.GetPHashes()
                 
-                HydrusData.ShowText( 'File import job adding file info row' )
+                if phashes is not None:
+                    
+                    if HG.file_import_report_mode:
+                        
+                        HydrusData.ShowText( 'File import job associating phashes' )
+                        
+                    
+                    self._PHashesAssociatePHashes( hash_id, phashes )
+                    
                 
-            
-            self._AddFilesInfo( [ ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) ], overwrite = True )
-            
-            if HG.file_import_report_mode:
+                files_info_rows.append( ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) )
+                add_rows.append( ( hash_id, timestamp ) )
                 
-                HydrusData.ShowText( 'File import job mapping file to local file service' )
+                file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, has_audio, num_words )
+                
+                content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, timestamp ) ) )
+                
+                ( md5, sha1, sha512 ) = file_import_job.GetExtraHashes()
+                
+                local_hashes_rows.append( ( hash_id, sqlite3.Binary( md5 ), sqlite3.Binary( sha1 ), sqlite3.Binary( sha512 ) ) )
+                
+                file_modified_timestamp_rows.append( ( hash_id, file_import_job.GetFileModifiedTimestamp() ) )
+                
+                file_import_options = file_import_job.GetFileImportOptions()
+                
+                if file_import_options.AutomaticallyArchives():
+                    
+                    archive_hash_ids.append( hash_id )
+                    
+                else:
+                    
+                    inbox_hash_ids.append( hash_id )
+                    
+                
+                status = CC.STATUS_SUCCESSFUL_AND_NEW
+                
+                new_hash_ids_to_hashes[ hash_id ] = hash
                 
             
-            self._AddFiles( self._local_file_service_id, [ ( hash_id, timestamp ) ] )
-            
-            file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size, mime, width, height, duration, num_frames, has_audio, num_words )
+            results.append( ( status, note ) )
             
-            content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, timestamp ) )
+        
+        if len( add_rows ) > 0:
             
-            self.pub_content_updates_after_commit( { CC.LOCAL_FILE_SERVICE_KEY : [ content_update ] } )
+            if HG.file_import_report_mode:
+                
+                HydrusData.ShowText( 'File import jobs adding {} file info rows and mapping them to the local file service'.format( HydrusData.ToHumanInt( len( add_rows ) ) ) )
+                
             
-            ( md5, sha1, sha512 ) = file_import_job.GetExtraHashes()
+            self._AddFilesInfo( files_info_rows, overwrite = True )
             
-            self._c.execute( 'INSERT OR IGNORE INTO local_hashes ( hash_id, md5, sha1, sha512 ) VALUES ( ?, ?, ?, ? );', ( hash_id, sqlite3.Binary( md5 ), sqlite3.Binary( sha1 ), sqlite3.Binary( sha512 ) ) )
+            self._AddFiles( self._local_file_service_id, add_rows )
             
-            file_modified_timestamp = file_import_job.GetFileModifiedTimestamp()
+            self.pub_content_updates_after_commit( { CC.LOCAL_FILE_SERVICE_KEY : content_updates } )
             
-            self._c.execute( 'REPLACE INTO file_modified_timestamps ( hash_id, file_modified_timestamp ) VALUES ( ?, ? );', ( hash_id, file_modified_timestamp ) )
+            self._c.executemany( 'INSERT OR IGNORE INTO local_hashes ( hash_id, md5, sha1, sha512 ) VALUES ( ?, ?, ?, ? );', local_hashes_rows )
             
-            file_import_options = file_import_job.GetFileImportOptions()
+            self._c.executemany( 'REPLACE INTO file_modified_timestamps ( hash_id, file_modified_timestamp ) VALUES ( ?, ? );', file_modified_timestamp_rows )
             
-            if file_import_options.AutomaticallyArchives():
+            if len( archive_hash_ids ) > 0:
                 
-                if HG.file_import_report_mode:
-                    
-                    HydrusData.ShowText( 'File import job archiving new file' )
-                    
+                self._ArchiveFiles( archive_hash_ids )
                 
-                self._ArchiveFiles( ( hash_id, ) )
+            
+            if len( inbox_hash_ids ) > 0:
                 
-            else:
+                self._InboxFiles( inbox_hash_ids )
                 
-                if HG.file_import_report_mode:
-                    
-                    HydrusData.ShowText( 'File import job inboxing new file' )
-                    
+            
+            for ( hash_id, hash ) in new_hash_ids_to_hashes.items():
                 
-                self._InboxFiles( ( hash_id, ) )
+                self._weakref_media_result_cache.DropMediaResult( hash_id, hash )
                 
             
-            status = CC.STATUS_SUCCESSFUL_AND_NEW
-            
-            self._weakref_media_result_cache.DropMediaResult( hash_id, hash )
-            
-            self._controller.pub( 'new_file_info', set( ( hash, ) ) )
+            self._controller.pub( 'new_file_info', set( new_hash_ids_to_hashes.values() ) )
             
         
         if HG.file_import_report_mode:
             
-            HydrusData.ShowText( 'File import job done at db level, final status: {}, {}'.format( CC.status_string_lookup[ status ], note ) )
+            HydrusData.ShowText( 'File import jobs done at db level, final statuses: {}'.format( ', '.join( ( '{}, {}'.format( CC.status_string_lookup[ status ], note ) for ( status, note ) in results ) ) ) )
             
         
-        return ( status, note )
+        return results
         
     
     def _ImportUpdate( self, update_network_bytes, update_hash, mime ):
@@ -8158,6 +8361,8 @@ class DB( HydrusDB.HydrusDB ):
         self._hash_ids_to_hashes_cache = {}
         self._tag_ids_to_tags_cache = {}
         
+        self._phash_index = None
+        
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
         HG.client_controller.pub( 'splash_set_status_subtext', 'inbox' )
@@ -8367,6 +8572,9 @@ class DB( HydrusDB.HydrusDB ):
             HydrusData.ShowText( 'A database exception looked like it could be a very serious \'database image is malformed\' error! Unless you know otherwise, please shut down the client immediately and check the \'help my db is broke.txt\' under install_dir/db.' )
             
         
+        # the index may have been told about changes that are now being rolled back, so it'll reload on next use
+        self._phash_index = None
+        
         if job.IsSynchronous():
             
             db_traceback = 'Database ' + tb
@@ -8385,7 +8593,7 @@ class DB( HydrusDB.HydrusDB ):
     
     def _MigrationClearJob( self, database_temp_job_name ):
         
-        self._c.execute( 'DROP TABLE {};'.format( database_temp_job_name ) )
+        self._c.execute( 'DROP TABLE IF EXISTS {};'.format( database_temp_job_name ) )
         
     
     def _MigrationGetMappings( self, database_temp_job_name, file_service_key, tag_service_key, hash_type, tag_filter, content_statuses ):
@@ -8936,6 +9144,29 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'INSERT OR REPLACE INTO shape_vptree ( phash_id, parent_id, radius, inner_id, inner_population, outer_id, outer_population ) VALUES ( ?, ?, ?, ?, ?, ?, ? );', insert_rows )
         
     
+    def _PHashesGetIndex( self ):
+        
+        if not self._controller.new_options.GetBoolean( 'use_in_memory_similar_files_index' ):
+            
+            self._phash_index = None
+            
+            return None
+            
+        
+        # a read-only worker may not be able to see all the writer's phashes yet, so only the writer loads the index
+        
+        if self._phash_index is None and not self._connection_data.read_only:
+            
+            phash_index = ClientSimilarFiles.PHashIndex()
+            
+            phash_index.AddPHashes( self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ) )
+            
+            self._phash_index = phash_index
+            
+        
+        return self._phash_index
+        
+    
     def _PHashesGetMaintenanceStatus( self ):
         
         searched_distances_to_count = collections.Counter( dict( self._c.execute( 'SELECT searched_distance, COUNT( * ) FROM shape_search_cache GROUP BY searched_distance;' ) ) )
@@ -8955,6 +9186,11 @@ class DB( HydrusDB.HydrusDB ):
             
             self._PHashesAddLeaf( phash_id, phash )
             
+            if self._phash_index is not None:
+                
+                self._phash_index.AddPHashes( ( ( phash_id, phash ), ) )
+                
+            
         else:
             
             ( phash_id, ) = result
@@ -9177,6 +9413,11 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_phash_ids ) )
         
+        if self._phash_index is not None:
+            
+            self._phash_index.RemovePHashIds( orphan_phash_ids )
+            
+        
         useful_nodes = [ row for row in unbalanced_nodes if row[0] in useful_phash_ids ]
         
         useful_population = len( useful_nodes )
@@ -9284,9 +9525,23 @@ class DB( HydrusDB.HydrusDB ):
             
             total_done_previously = total_num_hash_ids_in_cache - len( hash_ids )
             
-            for ( i, hash_id ) in enumerate( hash_ids ):
+            job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
+            
+            # with the in-memory index, searching a big block of files at once is far faster than one at a time
+            
+            if search_distance > 0 and self._PHashesGetIndex() is not None:
+                
+                block_size = 1024
                 
-                job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
+            else:
+                
+                block_size = 1
+                
+            
+            precise_timestamp = HydrusData.GetNowPrecise()
+            num_done = 0
+            
+            for ( i, block_of_hash_ids ) in enumerate( HydrusData.SplitListIntoChunks( hash_ids, block_size ) ):
                 
                 if pub_job_key and not job_key_pubbed and HydrusData.TimeHasPassed( time_started + 5 ):
                     
@@ -9304,25 +9559,50 @@ class DB( HydrusDB.HydrusDB ):
                     return
                     
                 
-                if i % 25 == 0:
+                if block_size > 1 or i % 25 == 0:
                     
-                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + i, total_num_hash_ids_in_cache ) + ' files'
+                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + num_done, total_num_hash_ids_in_cache ) + ' files'
                     
                     job_key.SetVariable( 'popup_text_1', text )
-                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + i, total_num_hash_ids_in_cache ) )
+                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + num_done, total_num_hash_ids_in_cache ) )
                     
                     HG.client_controller.pub( 'splash_set_status_subtext', text )
                     
                 
-                media_id = self._DuplicatesGetMediaId( hash_id )
+                hash_ids_to_similar_hash_ids_and_distances = self._PHashesSearchMany( block_of_hash_ids, search_distance )
+                
+                all_hash_ids = set( block_of_hash_ids )
+                
+                for similar_hash_ids_and_distances in hash_ids_to_similar_hash_ids_and_distances.values():
+                    
+                    all_hash_ids.update( ( similar_hash_id for ( similar_hash_id, distance ) in similar_hash_ids_and_distances ) )
+                    
+                
+                hash_ids_to_media_ids = self._DuplicatesGetMediaIds( all_hash_ids )
+                
+                pair_rows = []
+                
+                for ( hash_id, similar_hash_ids_and_distances ) in hash_ids_to_similar_hash_ids_and_distances.items():
+                    
+                    media_id = hash_ids_to_media_ids[ hash_id ]
+                    
+                    pair_rows.extend( ( ( media_id, hash_ids_to_media_ids[ similar_hash_id ], distance ) for ( similar_hash_id, distance ) in similar_hash_ids_and_distances if similar_hash_id != hash_id ) )
+                    
+                
+                self._DuplicatesAddPotentialDuplicatePairs( pair_rows )
                 
-                potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in self._PHashesSearch( hash_id, search_distance ) if duplicate_hash_id != hash_id ]
+                self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in block_of_hash_ids ) )
                 
-                self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                num_done += len( block_of_hash_ids )
                 
-                self._c.execute( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( search_distance, hash_id ) )
+                if block_size > 1:
+                    
+                    report_speed_to_job_key( job_key, precise_timestamp, num_done, 'similar files searches' )
+                    
                 
             
+            report_speed_to_log( precise_timestamp, num_done, 'similar files searches' )
+            
         finally:
             
             job_key.SetVariable( 'popup_text_1', 'done!' )
@@ -9346,15 +9626,6 @@ class DB( HydrusDB.HydrusDB ):
             
             search_radius = max_hamming_distance
             
-            top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
-            
-            if top_node_result is None:
-                
-                return []
-                
-            
-            ( root_node_phash_id, ) = top_node_result
-            
             search_phashes = self._STL( self._c.execute( 'SELECT phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
             
             if len( search_phashes ) == 0:
@@ -9362,73 +9633,102 @@ class DB( HydrusDB.HydrusDB ):
                 return []
                 
             
-            similar_phash_ids_to_distances = {}
+            phash_index = self._PHashesGetIndex()
             
-            num_cycles = 0
-            
-            for search_phash in search_phashes:
+            if phash_index is not None:
                 
-                next_potentials = [ root_node_phash_id ]
+                similar_phash_ids_to_distances = {}
                 
-                while len( next_potentials ) > 0:
+                for results in phash_index.SearchMany( search_phashes, search_radius ):
                     
-                    current_potentials = next_potentials
-                    next_potentials = []
+                    for ( phash_id, distance ) in results:
+                        
+                        if phash_id not in similar_phash_ids_to_distances or distance < similar_phash_ids_to_distances[ phash_id ]:
+                            
+                            similar_phash_ids_to_distances[ phash_id ] = distance
+                            
+                        
+                    
+                
+            else:
+                
+                top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+                
+                if top_node_result is None:
                     
-                    num_cycles += 1
+                    return []
                     
-                    for group_of_current_potentials in HydrusData.SplitListIntoChunks( current_potentials, 1024 ):
-                        
-                        # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
-                        # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
-                        # the crash was in sqlite code, again presumably on subsequent fetch
-                        # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
-                        # anyway, we now just get the whole lot of results first and then work on the whole lot
+                
+                ( root_node_phash_id, ) = top_node_result
+                
+                similar_phash_ids_to_distances = {}
+                
+                num_cycles = 0
+                
+                for search_phash in search_phashes:
+                    
+                    next_potentials = [ root_node_phash_id ]
+                    
+                    while len( next_potentials ) > 0:
                         
-                        select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id IN {};'
+                        current_potentials = next_potentials
+                        next_potentials = []
                         
-                        results = list( self._SelectFromList( select_statement, group_of_current_potentials ) )
+                        num_cycles += 1
                         
-                        for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
+                        for group_of_current_potentials in HydrusData.SplitListIntoChunks( current_potentials, 1024 ):
                             
-                            # first check the node itself--is it similar?
+                            # this is split into fixed lists of results of subgroups because as an iterable it was causing crashes on linux!!
+                            # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching phashes it presumably was still hanging on to
+                            # the crash was in sqlite code, again presumably on subsequent fetch
+                            # adding a delay in seemed to fix it as well. guess it was some memory maintenance buffer/bytes thing
+                            # anyway, we now just get the whole lot of results first and then work on the whole lot
                             
-                            node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
+                            select_statement = 'SELECT phash_id, phash, radius, inner_id, outer_id FROM shape_perceptual_hashes NATURAL JOIN shape_vptree WHERE phash_id IN {};'
                             
-                            if node_hamming_distance <= search_radius:
+                            results = list( self._SelectFromList( select_statement, group_of_current_potentials ) )
+                            
+                            for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
                                 
-                                similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
+                                # first check the node itself--is it similar?
                                 
-                            
-                            # now how about its children?
-                            
-                            if node_radius is not None:
+                                node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
+                                
+                                if node_hamming_distance <= search_radius:
+                                    
+                                    similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
+                                    
                                 
-                                # we have two spheres--node and search--their centers separated by node_hamming_distance
-                                # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
-                                # there are four possibles:
-                                # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
-                                # (----N---(-)-S--)      intersects with both
-                                # (----N-(--S-)-)        intersects with both
-                                # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
+                                # now how about its children?
                                 
-                                if inner_phash_id is not None:
+                                if node_radius is not None:
                                     
-                                    spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
+                                    # we have two spheres--node and search--their centers separated by node_hamming_distance
+                                    # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
+                                    # there are four possibles:
+                                    # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
+                                    # (----N---(-)-S--)      intersects with both
+                                    # (----N-(--S-)-)        intersects with both
+                                    # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
                                     
-                                    if not spheres_disjoint: # i.e. they intersect at some point
+                                    if inner_phash_id is not None:
                                         
-                                        next_potentials.append( inner_phash_id )
+                                        spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
+                                        
+                                        if not spheres_disjoint: # i.e. they intersect at some point
+                                            
+                                            next_potentials.append( inner_phash_id )
+                                            
                                         
                                     
-                                
-                                if outer_phash_id is not None:
-                                    
-                                    search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
-                                    
-                                    if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
+                                    if outer_phash_id is not None:
                                         
-                                        next_potentials.append( outer_phash_id )
+                                        search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
+                                        
+                                        if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
+                                            
+                                            next_potentials.append( outer_phash_id )
+                                            
                                         
                                     
                                 
@@ -9436,10 +9736,10 @@ class DB( HydrusDB.HydrusDB ):
                         
                     
                 
-            
-            if HG.db_report_mode:
-                
-                HydrusData.ShowText( 'Similar file search completed in ' + HydrusData.ToHumanInt( num_cycles ) + ' cycles.' )
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( 'Similar file search completed in ' + HydrusData.ToHumanInt( num_cycles ) + ' cycles.' )
+                    
                 
             
             # so, so now we have phash_ids and distances. let's map that to actual files.
@@ -9481,6 +9781,51 @@ class DB( HydrusDB.HydrusDB ):
         return similar_hash_ids_and_distances
         
     
+    def _PHashesSearchMany( self, hash_ids, max_hamming_distance ):
+        
+        phash_index = self._PHashesGetIndex()
+        
+        if max_hamming_distance == 0 or phash_index is None:
+            
+            return { hash_id : self._PHashesSearch( hash_id, max_hamming_distance ) for hash_id in hash_ids }
+            
+        
+        search_rows = list( self._SelectFromList( 'SELECT hash_id, phash FROM shape_perceptual_hash_map NATURAL JOIN shape_perceptual_hashes WHERE hash_id IN {};', hash_ids ) )
+        
+        if len( search_rows ) == 0:
+            
+            return { hash_id : [] for hash_id in hash_ids }
+            
+        
+        results = phash_index.SearchMany( [ phash for ( hash_id, phash ) in search_rows ], max_hamming_distance )
+        
+        similar_phash_ids = { phash_id for result in results for ( phash_id, distance ) in result }
+        
+        similar_phash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._SelectFromList( 'SELECT phash_id, hash_id FROM shape_perceptual_hash_map WHERE phash_id IN {};', similar_phash_ids ) )
+        
+        # files can have multiple phashes, so keep the smallest distance for each pair
+        
+        hash_ids_to_similar_hash_ids_to_distances = { hash_id : {} for hash_id in hash_ids }
+        
+        for ( ( hash_id, search_phash ), result ) in zip( search_rows, results ):
+            
+            similar_hash_ids_to_distances = hash_ids_to_similar_hash_ids_to_distances[ hash_id ]
+            
+            for ( phash_id, distance ) in result:
+                
+                for similar_hash_id in similar_phash_ids_to_hash_ids[ phash_id ]:
+                    
+                    if similar_hash_id not in similar_hash_ids_to_distances or distance < similar_hash_ids_to_distances[ similar_hash_id ]:
+                        
+                        similar_hash_ids_to_distances[ similar_hash_id ] = distance
+                        
+                    
+                
+            
+        
+        return { hash_id : list( similar_hash_ids_to_distances.items() ) for ( hash_id, similar_hash_ids_to_distances ) in hash_ids_to_similar_hash_ids_to_distances.items() }
+        
+    
     def _PHashesSetFileMetadata( self, hash_id, phashes ):
         
         current_phash_ids = self._STS( self._c.execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
@@ -9557,7 +9902,9 @@ class DB( HydrusDB.HydrusDB ):
             
             select_statement = 'SELECT tag_id, tag FROM local_tags_cache WHERE tag_id IN {};'
             
-            local_uncached_tag_ids_to_tags = { tag_id : tag for ( tag_id, tag ) in self._SelectFromList( select_statement, uncached_tag_ids ) }
+            # interned, so the same tag on many files, or loaded again after this cache resets, is one string in memory
+            
+            local_uncached_tag_ids_to_tags = { tag_id : sys.intern( tag ) for ( tag_id, tag ) in self._SelectFromList( select_statement, uncached_tag_ids ) }
             
             self._tag_ids_to_tags_cache.update( local_uncached_tag_ids_to_tags )
             
@@ -9568,7 +9915,7 @@ class DB( HydrusDB.HydrusDB ):
             
             select_statement = 'SELECT tag_id, namespace, subtag FROM tags NATURAL JOIN namespaces NATURAL JOIN subtags WHERE tag_id IN {};'
             
-            uncached_tag_ids_to_tags = { tag_id : HydrusTags.CombineTag( namespace, subtag ) for ( tag_id, namespace, subtag ) in self._SelectFromList( select_statement, uncached_tag_ids ) }
+            uncached_tag_ids_to_tags = { tag_id : sys.intern( HydrusTags.CombineTag( namespace, subtag ) ) for ( tag_id, namespace, subtag ) in self._SelectFromList( select_statement, uncached_tag_ids ) }
             
             if len( uncached_tag_ids_to_tags ) < len( uncached_tag_ids ):
                 
@@ -10571,6 +10918,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'file_duplicate_hashes': result = self._DuplicatesGetFileHashesByDuplicateType( *args, **kwargs )
         elif action == 'file_duplicate_info': result = self._DuplicatesGetFileDuplicateInfo( *args, **kwargs )
         elif action == 'file_hashes': result = self._GetFileHashes( *args, **kwargs )
+        elif action == 'file_hashes_mapping': result = self._GetFileHashesMapping( *args, **kwargs )
         elif action == 'file_maintenance_get_job': result = self._FileMaintenanceGetJob( *args, **kwargs )
         elif action == 'file_maintenance_get_job_counts': result = self._FileMaintenanceGetJobCounts( *args, **kwargs )
         elif action == 'file_notes': result = self._GetFileNotes( *args, **kwargs )
@@ -10578,6 +10926,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'file_system_predicates': result = self._GetFileSystemPredicates( *args, **kwargs )
         elif action == 'filter_existing_tags': result = self._FilterExistingTags( *args, **kwargs )
         elif action == 'filter_hashes': result = self._FilterHashes( *args, **kwargs )
+        elif action == 'filter_orphans': result = self._FilterOrphans( *args, **kwargs )
         elif action == 'force_refresh_tags_managers': result = self._GetForceRefreshTagsManagers( *args, **kwargs )
         elif action == 'hash_ids_to_hashes': result = self._GetHashIdsToHashes( *args, **kwargs )
         elif action == 'hash_status': result = self._GetHashStatus( *args, **kwargs )
@@ -10758,6 +11107,8 @@ class DB( HydrusDB.HydrusDB ):
         self._hash_ids_to_hashes_cache = {}
         self._tag_ids_to_tags_cache = {}
         
+        self._phash_index = None
+        
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
         tag_service_ids = self._GetServiceIds( HC.TAG_SERVICES )
@@ -13714,6 +14065,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'imageboard': self._SetYAMLDump( YAML_DUMP_ID_IMAGEBOARD, *args, **kwargs )
         elif action == 'ideal_client_files_locations': self._SetIdealClientFilesLocations( *args, **kwargs )
         elif action == 'import_file': result = self._ImportFile( *args, **kwargs )
+        elif action == 'import_files': result = self._ImportFiles( *args, **kwargs )
         elif action == 'import_update': self._ImportUpdate( *args, **kwargs )
         elif action == 'last_shutdown_work_time': self._SetLastShutdownWorkTime( *args, **kwargs )
         elif action == 'local_booru_share': self._SetYAMLDump( YAML_DUMP_ID_LOCAL_BOORU, *args, **kwargs )
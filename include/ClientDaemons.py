@@ -158,7 +158,29 @@ def DAEMONSynchroniseRepositories( controller ):
                 return
                 
             
-            service.SyncRemote()
+            # we download on another thread, so whatever is already on disk gets processed while the next lot comes in
+            
+            download_done = threading.Event()
+            
+            def do_download( service, download_done ):
+                
+                try:
+                    
+                    service.SyncRemote()
+                    
+                finally:
+                    
+                    download_done.set()
+                    
+                
+            
+            controller.CallToThread( do_download, service, download_done )
+            
+            service.SyncProcessUpdates( maintenance_mode = HC.MAINTENANCE_IDLE )
+            
+            download_done.wait()
+            
+            # and anything that arrived while we were processing
             
             service.SyncProcessUpdates( maintenance_mode = HC.MAINTENANCE_IDLE )
             
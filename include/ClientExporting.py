@@ -241,9 +241,9 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER
     SERIALISABLE_NAME = 'Export Folder'
-    SERIALISABLE_VERSION = 4
+    SERIALISABLE_VERSION = 5
     
-    def __init__( self, name, path = '', export_type = HC.EXPORT_FOLDER_TYPE_REGULAR, delete_from_client_after_export = False, file_search_context = None, run_regularly = True, period = 3600, phrase = None, last_checked = 0, paused = False, run_now = False ):
+    def __init__( self, name, path = '', export_type = HC.EXPORT_FOLDER_TYPE_REGULAR, delete_from_client_after_export = False, file_search_context = None, run_regularly = True, period = 3600, phrase = None, last_checked = 0, paused = False, run_now = False, link_files = False, manifest = None ):
         
         HydrusSerialisable.SerialisableBaseNamed.__init__( self, name )
         
@@ -262,6 +262,11 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             phrase = HG.client_controller.new_options.GetString( 'export_phrase' )
             
         
+        if manifest is None:
+            
+            manifest = ( None, {} )
+            
+        
         self._path = path
         self._export_type = export_type
         self._delete_from_client_after_export = delete_from_client_after_export
@@ -272,18 +277,33 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         self._last_checked = last_checked
         self._paused = paused and not run_now
         self._run_now = run_now
+        self._link_files = link_files
+        
+        # the manifest remembers what each previous run exported, so a run only has to do work for files that came or went
+        # hash_id -> ( hash, filename, mtime, size ), valid only for the path, phrase and type in its key
+        
+        ( self._manifest_key, self._hash_ids_to_exports ) = manifest
+        
+    
+    def _GetManifestKey( self ):
+        
+        return ( self._path, self._phrase, self._export_type )
         
     
     def _GetSerialisableInfo( self ):
         
         serialisable_file_search_context = self._file_search_context.GetSerialisableTuple()
         
-        return ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._run_regularly, self._period, self._phrase, self._last_checked, self._paused, self._run_now )
+        serialisable_exports = [ ( hash_id, hash.hex(), filename, mtime, size ) for ( hash_id, ( hash, filename, mtime, size ) ) in self._hash_ids_to_exports.items() ]
+        
+        serialisable_manifest = ( self._manifest_key, serialisable_exports )
+        
+        return ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._run_regularly, self._period, self._phrase, self._last_checked, self._paused, self._run_now, self._link_files, serialisable_manifest )
         
     
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
-        ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._run_regularly, self._period, self._phrase, self._last_checked, self._paused, self._run_now ) = serialisable_info
+        ( self._path, self._export_type, self._delete_from_client_after_export, serialisable_file_search_context, self._run_regularly, self._period, self._phrase, self._last_checked, self._paused, self._run_now, self._link_files, serialisable_manifest ) = serialisable_info
         
         if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
             
@@ -292,6 +312,16 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         
         self._file_search_context = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_file_search_context )
         
+        ( manifest_key, serialisable_exports ) = serialisable_manifest
+        
+        if manifest_key is not None:
+            
+            manifest_key = tuple( manifest_key )
+            
+        
+        self._manifest_key = manifest_key
+        self._hash_ids_to_exports = { hash_id : ( bytes.fromhex( encoded_hash ), filename, mtime, size ) for ( hash_id, encoded_hash, filename, mtime, size ) in serialisable_exports }
+        
     
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
@@ -330,92 +360,175 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             return ( 4, new_serialisable_info )
             
         
+        if version == 4:
+            
+            ( path, export_type, delete_from_client_after_export, serialisable_file_search_context, run_regularly, period, phrase, last_checked, paused, run_now ) = old_serialisable_info
+            
+            link_files = False
+            serialisable_manifest = ( None, [] )
+            
+            new_serialisable_info = ( path, export_type, delete_from_client_after_export, serialisable_file_search_context, run_regularly, period, phrase, last_checked, paused, run_now, link_files, serialisable_manifest )
+            
+            return ( 5, new_serialisable_info )
+            
+        
     
     def _DoExport( self ):
         
         query_hash_ids = HG.client_controller.Read( 'file_query_ids', self._file_search_context )
         
-        media_results = []
+        query_hash_ids = sorted( query_hash_ids )
+        
+        query_hash_ids_set = set( query_hash_ids )
         
-        i = 0
+        manifest_key = self._GetManifestKey()
         
-        base = 256
+        starting_fresh = self._manifest_key != manifest_key
         
-        while i < len( query_hash_ids ):
+        if starting_fresh:
             
-            if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
+            self._manifest_key = manifest_key
+            self._hash_ids_to_exports = {}
+            
+        
+        hash_ids_to_exports = self._hash_ids_to_exports
+        
+        #
+        
+        previous_paths = set()
+        
+        if starting_fresh and self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
+            
+            for ( root, dirnames, filenames ) in os.walk( self._path ):
                 
-                return
+                previous_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
                 
             
-            if i == 0: ( last_i, i ) = ( 0, base )
-            else: ( last_i, i ) = ( i, i + base )
-            
-            sub_query_hash_ids = query_hash_ids[ last_i : i ]
+        
+        deletee_paths = set()
+        
+        removed_hash_ids = [ hash_id for hash_id in hash_ids_to_exports if hash_id not in query_hash_ids_set ]
+        
+        for hash_id in removed_hash_ids:
             
-            more_media_results = HG.client_controller.Read( 'media_results_from_ids', sub_query_hash_ids )
+            ( hash, filename, mtime, size ) = hash_ids_to_exports.pop( hash_id )
             
-            media_results.extend( more_media_results )
+            deletee_paths.add( os.path.normpath( os.path.join( self._path, filename ) ) )
             
         
-        media_results.sort( key = lambda mr: mr.GetHashId() )
-        
-        #
+        if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
+            
+            for deletee_path in deletee_paths:
+                
+                if os.path.exists( deletee_path ):
+                    
+                    ClientPaths.DeletePath( deletee_path )
+                    
+                
+            
         
-        terms = ParseExportPhrase( self._phrase )
+        # files a previous run exported are skipped unless their exported file has gone or changed
         
-        previous_paths = set()
+        hash_ids_to_export = []
         
-        for ( root, dirnames, filenames ) in os.walk( self._path ):
+        for hash_id in query_hash_ids:
+            
+            if hash_id in hash_ids_to_exports:
+                
+                ( hash, filename, mtime, size ) = hash_ids_to_exports[ hash_id ]
+                
+                try:
+                    
+                    stat_result = os.stat( os.path.join( self._path, filename ) )
+                    
+                    if int( stat_result.st_mtime ) == mtime and stat_result.st_size == size:
+                        
+                        continue
+                        
+                    
+                except OSError:
+                    
+                    pass
+                    
+                
+                del hash_ids_to_exports[ hash_id ]
+                
             
-            previous_paths.update( ( os.path.join( root, filename ) for filename in filenames ) )
+            hash_ids_to_export.append( hash_id )
             
         
-        sync_paths = set()
+        #
+        
+        terms = ParseExportPhrase( self._phrase )
+        
+        dest_paths_in_use = { os.path.normpath( os.path.join( self._path, filename ) ) for ( hash, filename, mtime, size ) in hash_ids_to_exports.values() }
         
         client_files_manager = HG.client_controller.client_files_manager
         
         num_copied = 0
         
-        for media_result in media_results:
+        for block_of_hash_ids in HydrusData.SplitListIntoChunks( hash_ids_to_export, 256 ):
             
             if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
                 
                 return
                 
             
-            hash = media_result.GetHash()
-            mime = media_result.GetMime()
-            size = media_result.GetSize()
-            
-            source_path = client_files_manager.GetFilePath( hash, mime )
-            
-            filename = GenerateExportFilename( self._path, media_result, terms )
+            media_results = HG.client_controller.Read( 'media_results_from_ids', block_of_hash_ids )
             
-            dest_path = os.path.normpath( os.path.join( self._path, filename ) )
+            media_results.sort( key = lambda mr: mr.GetHashId() )
             
-            if not dest_path.startswith( self._path ):
+            for media_result in media_results:
                 
-                raise Exception( 'It seems a destination path for export folder "{}" was above the main export directory! The file was "{}" and its destination path was "{}".'.format( self._path, hash.hex(), dest_path ) )
+                if HC.options[ 'pause_export_folders_sync' ] or HydrusThreading.IsThreadShuttingDown():
+                    
+                    return
+                    
                 
-            
-            dest_path_dir = os.path.dirname( dest_path )
-            
-            HydrusPaths.MakeSureDirectoryExists( dest_path_dir )
-            
-            if dest_path not in sync_paths:
+                hash_id = media_result.GetHashId()
+                hash = media_result.GetHash()
+                mime = media_result.GetMime()
+                
+                source_path = client_files_manager.GetFilePath( hash, mime )
+                
+                filename = GenerateExportFilename( self._path, media_result, terms )
                 
-                copied = HydrusPaths.MirrorFile( source_path, dest_path )
+                dest_path = os.path.normpath( os.path.join( self._path, filename ) )
+                
+                if not dest_path.startswith( self._path ):
+                    
+                    raise Exception( 'It seems a destination path for export folder "{}" was above the main export directory! The file was "{}" and its destination path was "{}".'.format( self._path, hash.hex(), dest_path ) )
+                    
+                
+                if dest_path in dest_paths_in_use:
+                    
+                    continue
+                    
+                
+                dest_path_dir = os.path.dirname( dest_path )
+                
+                HydrusPaths.MakeSureDirectoryExists( dest_path_dir )
+                
+                copied = HydrusPaths.MirrorFile( source_path, dest_path, try_linking = self._link_files )
                 
                 if copied:
                     
                     num_copied += 1
                     
-                    HydrusPaths.MakeFileWritable( dest_path )
+                    # a hard link is the client's own file under another name, so leave its permissions alone
+                    
+                    if not ( self._link_files and os.path.samefile( source_path, dest_path ) ):
+                        
+                        HydrusPaths.MakeFileWritable( dest_path )
+                        
+                    
+                    stat_result = os.stat( dest_path )
+                    
+                    hash_ids_to_exports[ hash_id ] = ( hash, filename, int( stat_result.st_mtime ), stat_result.st_size )
                     
                 
-            
-            sync_paths.add( dest_path )
+                dest_paths_in_use.add( dest_path )
+                
             
         
         if num_copied > 0:
@@ -425,39 +538,42 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         
         if self._export_type == HC.EXPORT_FOLDER_TYPE_SYNCHRONISE:
             
-            deletee_paths = previous_paths.difference( sync_paths )
+            stale_previous_paths = previous_paths.difference( dest_paths_in_use )
             
-            for deletee_path in deletee_paths:
+            for deletee_path in stale_previous_paths:
                 
                 ClientPaths.DeletePath( deletee_path )
                 
             
-            deletee_dirs = set()
+            deletee_paths.update( stale_previous_paths )
+            
+            # only the folders we just deleted from can have become empty, unless this is the first run
             
-            for ( root, dirnames, filenames ) in os.walk( self._path, topdown = False ):
+            if starting_fresh:
                 
-                if root == self._path:
-                    
-                    continue
-                    
+                candidate_dirs = [ root for ( root, dirnames, filenames ) in os.walk( self._path, topdown = False ) ]
                 
-                no_files = len( filenames ) == 0
+            else:
                 
-                useful_dirnames = [ dirname for dirname in dirnames if os.path.join( root, dirname ) not in deletee_dirs ]
+                candidate_dirs = sorted( { os.path.dirname( deletee_path ) for deletee_path in deletee_paths }, key = len, reverse = True )
                 
-                no_useful_dirs = len( useful_dirnames ) == 0
+            
+            deletee_dirs = set()
+            
+            for candidate_dir in candidate_dirs:
                 
-                if no_useful_dirs and no_files:
+                while candidate_dir.startswith( self._path ) and os.path.normpath( candidate_dir ) != os.path.normpath( self._path ):
                     
-                    deletee_dirs.add( root )
+                    if not os.path.isdir( candidate_dir ) or len( os.listdir( candidate_dir ) ) > 0:
+                        
+                        break
+                        
                     
-                
-            
-            for deletee_dir in deletee_dirs:
-                
-                if os.path.exists( deletee_dir ):
+                    HydrusPaths.DeletePath( candidate_dir )
+                    
+                    deletee_dirs.add( candidate_dir )
                     
-                    HydrusPaths.DeletePath( deletee_dir )
+                    candidate_dir = os.path.dirname( candidate_dir )
                     
                 
             
@@ -469,7 +585,7 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         
         if self._delete_from_client_after_export:
             
-            deletee_hashes = { media_result.GetHash() for media_result in media_results }
+            deletee_hashes = [ hash for ( hash_id, ( hash, filename, mtime, size ) ) in hash_ids_to_exports.items() if hash_id in query_hash_ids_set ]
             
             chunks_of_hashes = HydrusData.SplitListIntoChunks( deletee_hashes, 64 )
             
@@ -531,6 +647,11 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def GetManifest( self ):
+        
+        return ( self._manifest_key, dict( self._hash_ids_to_exports ) )
+        
+    
     def RunNow( self ):
         
         self._paused = False
@@ -539,7 +660,7 @@ class ExportFolder( HydrusSerialisable.SerialisableBaseNamed ):
     
     def ToTuple( self ):
         
-        return ( self._name, self._path, self._export_type, self._delete_from_client_after_export, self._file_search_context, self._run_regularly, self._period, self._phrase, self._last_checked, self._paused, self._run_now )
+        return ( self._name, self._path, self._export_type, self._delete_from_client_after_export, self._file_search_context, self._run_regularly, self._period, self._phrase, self._last_checked, self._paused, self._run_now, self._link_files )
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER ] = ExportFolder
@@ -13,8 +13,10 @@ from . import HydrusImageHandling
 from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusThreading
+import mmap
 import os
 import random
+import struct
 import threading
 import time
 import wx
@@ -89,6 +91,10 @@ regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_
 regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA ] = [ REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP ]
 regen_file_enum_to_overruled_jobs[ REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP ] = []
 
+THUMBNAIL_PACK_FILENAME = 'thumbnails.pack'
+
+ORPHAN_CHECK_CHUNK_SIZE = 256
+
 ALL_REGEN_JOBS_IN_PREFERRED_ORDER = [ REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE, REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA, REGENERATE_FILE_DATA_JOB_FILE_METADATA, REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL, REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, REGENERATE_FILE_DATA_JOB_CHECK_SIMILAR_FILES_MEMBERSHIP, REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS, REGENERATE_FILE_DATA_JOB_FILE_MODIFIED_TIMESTAMP, REGENERATE_FILE_DATA_JOB_OTHER_HASHES, REGENERATE_FILE_DATA_JOB_DELETE_NEIGHBOUR_DUPES ]
 
 def GetAllFilePaths( raw_paths, do_human_sort = True ):
@@ -140,6 +146,10 @@ class ClientFilesManager( object ):
         
         self._prefixes_to_locations = {}
         
+        # the db checks thumbnail packs without the rwlock, so the packs get their own lock
+        self._prefixes_to_thumbnail_packs = {}
+        self._thumbnail_packs_lock = threading.Lock()
+        
         self._bad_error_occurred = False
         self._missing_locations = set()
         
@@ -174,11 +184,27 @@ class ClientFilesManager( object ):
         
         try:
             
-            HydrusPaths.MakeFileWritable( dest_path )
+            thumbnail_pack = self._GetThumbnailPack( hash )
             
-            with open( dest_path, 'wb' ) as f:
+            if self._controller.new_options.GetBoolean( 'use_packed_thumbnails' ):
+                
+                thumbnail_pack.AddThumbnail( hash, thumbnail_bytes )
+                
+                if os.path.exists( dest_path ):
+                    
+                    HydrusPaths.DeletePath( dest_path )
+                    
                 
-                f.write( thumbnail_bytes )
+            else:
+                
+                HydrusPaths.MakeFileWritable( dest_path )
+                
+                with open( dest_path, 'wb' ) as f:
+                    
+                    f.write( thumbnail_bytes )
+                    
+                
+                thumbnail_pack.DeleteThumbnail( hash )
                 
             
         except Exception as e:
@@ -330,6 +356,31 @@ class ClientFilesManager( object ):
         return needed_to_copy_file
         
     
+    def _FilterOrphanPaths( self, test_type, paths ):
+        
+        paths_to_hashes = {}
+        
+        for path in paths:
+            
+            ( directory, filename ) = os.path.split( path )
+            
+            should_be_a_hex_hash = filename[:64]
+            
+            try:
+                
+                paths_to_hashes[ path ] = bytes.fromhex( should_be_a_hex_hash )
+                
+            except ValueError:
+                
+                continue # not one of ours, so an orphan
+                
+            
+        
+        orphan_hashes = set( self._controller.Read( 'filter_orphans', test_type, list( paths_to_hashes.values() ) ) )
+        
+        return [ path for path in paths if path not in paths_to_hashes or paths_to_hashes[ path ] in orphan_hashes ]
+        
+    
     def _GenerateExpectedFilePath( self, hash, mime ):
         
         self._WaitOnWakeup()
@@ -360,6 +411,21 @@ class ClientFilesManager( object ):
         return path
         
     
+    def _ClearThumbnailPacks( self ):
+        
+        with self._thumbnail_packs_lock:
+            
+            thumbnail_packs = list( self._prefixes_to_thumbnail_packs.values() )
+            
+            self._prefixes_to_thumbnail_packs = {}
+            
+        
+        for thumbnail_pack in thumbnail_packs:
+            
+            thumbnail_pack.Close()
+            
+        
+    
     def _GenerateThumbnailBytes( self, file_path, media ):
         
         hash = media.GetHash()
@@ -386,6 +452,30 @@ class ClientFilesManager( object ):
         return thumbnail_bytes
         
     
+    def _GetThumbnailPack( self, hash ):
+        
+        prefix = 't' + hash.hex()[:2]
+        
+        return self._GetThumbnailPackForPrefix( prefix )
+        
+    
+    def _GetThumbnailPackForPrefix( self, prefix ):
+        
+        with self._thumbnail_packs_lock:
+            
+            if prefix not in self._prefixes_to_thumbnail_packs:
+                
+                location = self._prefixes_to_locations[ prefix ]
+                
+                path = os.path.join( location, prefix, THUMBNAIL_PACK_FILENAME )
+                
+                self._prefixes_to_thumbnail_packs[ prefix ] = ThumbnailPack( path )
+                
+            
+            return self._prefixes_to_thumbnail_packs[ prefix ]
+            
+        
+    
     def _GetRecoverTuple( self ):
         
         all_locations = { location for location in list(self._prefixes_to_locations.values()) }
@@ -541,12 +631,28 @@ class ClientFilesManager( object ):
                 
                 for filename in filenames:
                     
+                    if filename.startswith( THUMBNAIL_PACK_FILENAME ):
+                        
+                        continue
+                        
+                    
                     yield os.path.join( dir, filename )
                     
                 
             
         
     
+    def _IterateAllThumbnailPacks( self ):
+        
+        for prefix in list( self._prefixes_to_locations.keys() ):
+            
+            if prefix.startswith( 't' ):
+                
+                yield self._GetThumbnailPackForPrefix( prefix )
+                
+            
+        
+    
     def _LookForFilePath( self, hash ):
         
         for potential_mime in HC.ALLOWED_MIMES:
@@ -575,8 +681,36 @@ class ClientFilesManager( object ):
         raise HydrusExceptions.FileMissingException( 'File for ' + hash.hex() + ' not found!' )
         
     
+    def _LookForThumbnailBytes( self, hash ):
+        
+        # packed thumbs come first, but we always fall back to a loose file
+        
+        thumbnail_bytes = self._GetThumbnailPack( hash ).GetThumbnailBytes( hash )
+        
+        if thumbnail_bytes is not None:
+            
+            return thumbnail_bytes
+            
+        
+        path = self._GenerateExpectedThumbnailPath( hash )
+        
+        if not os.path.exists( path ):
+            
+            raise HydrusExceptions.FileMissingException( 'Thumbnail for ' + hash.hex() + ' not found!' )
+            
+        
+        with open( path, 'rb' ) as f:
+            
+            thumbnail_bytes = f.read()
+            
+        
+        return thumbnail_bytes
+        
+    
     def _Reinit( self ):
         
+        self._ClearThumbnailPacks()
+        
         self._prefixes_to_locations = self._controller.Read( 'client_files_locations' )
         
         if HG.client_controller.IsFirstStart():
@@ -780,7 +914,9 @@ class ClientFilesManager( object ):
             orphan_paths = []
             orphan_thumbnails = []
             
-            for ( i, path ) in enumerate( self._IterateAllFilePaths() ):
+            num_reviewed = 0
+            
+            for paths in HydrusData.SplitIteratorIntoChunks( self._IterateAllFilePaths(), ORPHAN_CHECK_CHUNK_SIZE ):
                 
                 ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                 
@@ -789,31 +925,7 @@ class ClientFilesManager( object ):
                     return
                     
                 
-                if i % 100 == 0:
-                    
-                    status = 'reviewed ' + HydrusData.ToHumanInt( i ) + ' files, found ' + HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphans'
-                    
-                    job_key.SetVariable( 'popup_text_1', status )
-                    
-                
-                try:
-                    
-                    is_an_orphan = False
-                    
-                    ( directory, filename ) = os.path.split( path )
-                    
-                    should_be_a_hex_hash = filename[:64]
-                    
-                    hash = bytes.fromhex( should_be_a_hex_hash )
-                    
-                    is_an_orphan = HG.client_controller.Read( 'is_an_orphan', 'file', hash )
-                    
-                except:
-                    
-                    is_an_orphan = True
-                    
-                
-                if is_an_orphan:
+                for path in self._FilterOrphanPaths( 'file', paths ):
                     
                     if move_location is not None:
                         
@@ -831,10 +943,18 @@ class ClientFilesManager( object ):
                     orphan_paths.append( path )
                     
                 
+                num_reviewed += len( paths )
+                
+                status = 'reviewed ' + HydrusData.ToHumanInt( num_reviewed ) + ' files, found ' + HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphans'
+                
+                job_key.SetVariable( 'popup_text_1', status )
+                
             
             time.sleep( 2 )
             
-            for ( i, path ) in enumerate( self._IterateAllThumbnailPaths() ):
+            num_reviewed = 0
+            
+            for paths in HydrusData.SplitIteratorIntoChunks( self._IterateAllThumbnailPaths(), ORPHAN_CHECK_CHUNK_SIZE ):
                 
                 ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                 
@@ -843,34 +963,36 @@ class ClientFilesManager( object ):
                     return
                     
                 
-                if i % 100 == 0:
-                    
-                    status = 'reviewed ' + HydrusData.ToHumanInt( i ) + ' thumbnails, found ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphans'
-                    
-                    job_key.SetVariable( 'popup_text_1', status )
-                    
+                orphan_thumbnails.extend( self._FilterOrphanPaths( 'thumbnail', paths ) )
                 
-                try:
-                    
-                    is_an_orphan = False
-                    
-                    ( directory, filename ) = os.path.split( path )
-                    
-                    should_be_a_hex_hash = filename[:64]
+                num_reviewed += len( paths )
+                
+                status = 'reviewed ' + HydrusData.ToHumanInt( num_reviewed ) + ' thumbnails, found ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphans'
+                
+                job_key.SetVariable( 'popup_text_1', status )
+                
+            
+            orphan_packed_thumbnails = []
+            
+            for thumbnail_pack in self._IterateAllThumbnailPacks():
+                
+                for hashes in HydrusData.SplitListIntoChunks( list( thumbnail_pack.GetHashes() ), ORPHAN_CHECK_CHUNK_SIZE ):
                     
-                    hash = bytes.fromhex( should_be_a_hex_hash )
+                    ( i_paused, should_quit ) = job_key.WaitIfNeeded()
                     
-                    is_an_orphan = HG.client_controller.Read( 'is_an_orphan', 'thumbnail', hash )
+                    if should_quit:
+                        
+                        return
+                        
                     
-                except:
+                    orphan_hashes = self._controller.Read( 'filter_orphans', 'thumbnail', hashes )
                     
-                    is_an_orphan = True
+                    orphan_packed_thumbnails.extend( ( ( thumbnail_pack, hash ) for hash in orphan_hashes ) )
                     
                 
-                if is_an_orphan:
-                    
-                    orphan_thumbnails.append( path )
-                    
+                status = 'reviewed thumbnail packs, found ' + HydrusData.ToHumanInt( len( orphan_packed_thumbnails ) ) + ' packed orphans'
+                
+                job_key.SetVariable( 'popup_text_1', status )
                 
             
             time.sleep( 2 )
@@ -929,13 +1051,32 @@ class ClientFilesManager( object ):
                     
                 
             
-            if len( orphan_paths ) == 0 and len( orphan_thumbnails ) == 0:
+            if len( orphan_packed_thumbnails ) > 0:
+                
+                status = 'found ' + HydrusData.ToHumanInt( len( orphan_packed_thumbnails ) ) + ' orphan packed thumbnails, now deleting'
+                
+                job_key.SetVariable( 'popup_text_1', status )
+                
+                for ( thumbnail_pack, hash ) in orphan_packed_thumbnails:
+                    
+                    thumbnail_pack.DeleteThumbnail( hash )
+                    
+                
+                for thumbnail_pack in { thumbnail_pack for ( thumbnail_pack, hash ) in orphan_packed_thumbnails }:
+                    
+                    thumbnail_pack.Compact()
+                    
+                
+            
+            num_orphan_thumbnails = len( orphan_thumbnails ) + len( orphan_packed_thumbnails )
+            
+            if len( orphan_paths ) == 0 and num_orphan_thumbnails == 0:
                 
                 final_text = 'no orphans found!'
                 
             else:
                 
-                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphan thumbnails cleared!'
+                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( num_orphan_thumbnails ) + ' orphan thumbnails cleared!'
                 
             
             job_key.SetVariable( 'popup_text_1', final_text )
@@ -1001,6 +1142,8 @@ class ClientFilesManager( object ):
                     
                     ClientPaths.DeletePath( path, always_delete_fully = True )
                     
+                    self._GetThumbnailPack( hash ).DeleteThumbnail( hash )
+                    
                 
             
             big_pauser.Pause()
@@ -1110,30 +1253,35 @@ class ClientFilesManager( object ):
         return path
         
     
-    def GetThumbnailPath( self, media ):
+    def GetThumbnailBytes( self, media ):
         
         hash = media.GetHash()
         mime = media.GetMime()
         
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Thumbnail path request: ' + str( ( hash, mime ) ) )
+            HydrusData.ShowText( 'Thumbnail request: ' + str( ( hash, mime ) ) )
             
         
         with self._rwlock.read:
             
-            path = self._GenerateExpectedThumbnailPath( hash )
-            
-            thumb_missing = not os.path.exists( path )
+            try:
+                
+                return self._LookForThumbnailBytes( hash )
+                
+            except HydrusExceptions.FileMissingException:
+                
+                pass
+                
             
         
-        if thumb_missing:
+        self.RegenerateThumbnail( media )
+        
+        with self._rwlock.read:
             
-            self.RegenerateThumbnail( media )
+            return self._LookForThumbnailBytes( hash )
             
         
-        return path
-        
     
     def LocklessHasThumbnail( self, hash ):
         
@@ -1144,7 +1292,153 @@ class ClientFilesManager( object ):
             HydrusData.ShowText( 'Thumbnail path test: ' + path )
             
         
-        return os.path.exists( path )
+        if os.path.exists( path ):
+            
+            return True
+            
+        
+        # this is called from the db thread, which should not walk a cold pack index, so call LoadThumbnailPackIndices beforehand
+        
+        return self._GetThumbnailPack( hash ).HasThumbnail( hash, load_index = False )
+        
+    
+    def LoadThumbnailPackIndices( self ):
+        
+        with self._rwlock.read:
+            
+            for thumbnail_pack in self._IterateAllThumbnailPacks():
+                
+                thumbnail_pack.LoadIndex()
+                
+            
+        
+    
+    def MigrateThumbnailStorage( self, packed ):
+        
+        self._controller.new_options.SetBoolean( 'use_packed_thumbnails', packed )
+        
+        job_key = ClientThreading.JobKey( cancellable = True )
+        
+        if packed:
+            
+            job_key.SetVariable( 'popup_title', 'packing thumbnails' )
+            
+        else:
+            
+            job_key.SetVariable( 'popup_title', 'unpacking thumbnails' )
+            
+        
+        self._controller.pub( 'message', job_key )
+        
+        num_done = 0
+        
+        try:
+            
+            with self._rwlock.read:
+                
+                prefixes = sorted( ( prefix for prefix in self._prefixes_to_locations.keys() if prefix.startswith( 't' ) ) )
+                
+            
+            for ( i, prefix ) in enumerate( prefixes ):
+                
+                ( i_paused, should_quit ) = job_key.WaitIfNeeded()
+                
+                if should_quit:
+                    
+                    # either storage is fine to read from, so a half-done job is safe to leave
+                    
+                    return
+                    
+                
+                job_key.SetVariable( 'popup_text_1', 'migrating \'' + prefix + '\', ' + HydrusData.ToHumanInt( num_done ) + ' thumbnails done' )
+                job_key.SetVariable( 'popup_gauge_1', ( i, len( prefixes ) ) )
+                
+                # one prefix at a time, so thumbnails are only unavailable briefly
+                
+                with self._rwlock.write:
+                    
+                    thumbnail_pack = self._GetThumbnailPackForPrefix( prefix )
+                    
+                    dir = os.path.join( self._prefixes_to_locations[ prefix ], prefix )
+                    
+                    if packed:
+                        
+                        migrated_paths = []
+                        
+                        for filename in os.listdir( dir ):
+                            
+                            if not filename.endswith( '.thumbnail' ):
+                                
+                                continue
+                                
+                            
+                            try:
+                                
+                                hash = bytes.fromhex( filename[:64] )
+                                
+                            except ValueError:
+                                
+                                continue
+                                
+                            
+                            path = os.path.join( dir, filename )
+                            
+                            with open( path, 'rb' ) as f:
+                                
+                                thumbnail_bytes = f.read()
+                                
+                            
+                            thumbnail_pack.AddThumbnail( hash, thumbnail_bytes )
+                            
+                            migrated_paths.append( path )
+                            
+                        
+                        thumbnail_pack.Compact()
+                        
+                        for path in migrated_paths:
+                            
+                            HydrusPaths.DeletePath( path )
+                            
+                        
+                        num_done += len( migrated_paths )
+                        
+                    else:
+                        
+                        hashes = thumbnail_pack.GetHashes()
+                        
+                        for hash in hashes:
+                            
+                            path = self._GenerateExpectedThumbnailPath( hash )
+                            
+                            with open( path, 'wb' ) as f:
+                                
+                                f.write( thumbnail_pack.GetThumbnailBytes( hash ) )
+                                
+                            
+                        
+                        thumbnail_pack.Close()
+                        
+                        pack_path = os.path.join( dir, THUMBNAIL_PACK_FILENAME )
+                        
+                        if os.path.exists( pack_path ):
+                            
+                            HydrusPaths.DeletePath( pack_path )
+                            
+                        
+                        num_done += len( hashes )
+                        
+                    
+                
+            
+        finally:
+            
+            job_key.SetVariable( 'popup_text_1', 'done! ' + HydrusData.ToHumanInt( num_done ) + ' thumbnails migrated' )
+            job_key.DeleteVariable( 'popup_gauge_1' )
+            
+            HydrusData.Print( job_key.ToString() )
+            
+            job_key.Finish()
+            
         
     
     def Rebalance( self, job_key ):
@@ -1177,6 +1471,9 @@ class ClientFilesManager( object ):
                     
                     job_key.SetVariable( 'popup_text_1', text )
                     
+                    # the pack files have to be let go of before their folders can move
+                    self._ClearThumbnailPacks()
+                    
                     # these two lines can cause a deadlock because the db sometimes calls stuff in here.
                     self._controller.Write( 'relocate_client_files', prefix, overweight_location, underweight_location )
                     
@@ -1205,6 +1502,8 @@ class ClientFilesManager( object ):
                     recoverable_path = os.path.join( recoverable_location, prefix )
                     correct_path = os.path.join( correct_location, prefix )
                     
+                    self._ClearThumbnailPacks()
+                    
                     HydrusPaths.MergeTree( recoverable_path, correct_path )
                     
                     recover_tuple = self._GetRecoverTuple()
@@ -1273,9 +1572,9 @@ class ClientFilesManager( object ):
             
             ( media_width, media_height ) = media.GetResolution()
             
-            path = self._GenerateExpectedThumbnailPath( hash )
+            thumbnail_bytes = self._LookForThumbnailBytes( hash )
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, mime )
             
             ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
             
@@ -2104,3 +2403,294 @@ class FilesMaintenanceManager( object ):
         
         self._controller.CallToThreadLongRunning( self.MainLoopBackgroundWork )
         
+class ThumbnailPack( object ):
+    
+    # an append-only container for all the thumbnails of one prefix, so a page of thumbs is a handful of mmap reads, not thousands of opens
+    # each record is a 32 byte hash, a 4 byte length, and then the thumbnail bytes. a zero length marks the hash as deleted
+    # there is no separate index file to fall out of sync--we walk the record headers the first time we need the pack
+    # that walk is O(records) for the prefix, one header read per thumbnail ever written to it, dead ones included, so the first access to each pack after boot pays for it
+    # with 256 prefixes and a million thumbs, that is about 4,000 headers per pack, and something that touches every pack, like orphan clearing, walks all million
+    
+    HEADER = struct.Struct( '>32sI' )
+    
+    def __init__( self, path ):
+        
+        self._path = path
+        
+        self._f = None
+        self._mmap = None
+        
+        self._hashes_to_records = None
+        self._end_offset = 0
+        self._num_dead_bytes = 0
+        
+        self._lock = threading.Lock()
+        
+    
+    def _AppendRecord( self, hash, thumbnail_bytes ):
+        
+        self._InitialiseIndex()
+        
+        if self._f is None:
+            
+            open( self._path, 'ab' ).close()
+            
+            self._f = open( self._path, 'r+b' )
+            
+        
+        if hash in self._hashes_to_records:
+            
+            ( old_offset, old_length ) = self._hashes_to_records[ hash ]
+            
+            self._num_dead_bytes += self.HEADER.size + old_length
+            
+            del self._hashes_to_records[ hash ]
+            
+        
+        self._f.seek( self._end_offset )
+        
+        self._f.write( self.HEADER.pack( hash, len( thumbnail_bytes ) ) )
+        self._f.write( thumbnail_bytes )
+        
+        self._f.flush()
+        
+        offset = self._end_offset + self.HEADER.size
+        
+        self._end_offset = offset + len( thumbnail_bytes )
+        
+        return offset
+        
+    
+    def _Close( self ):
+        
+        if self._mmap is not None:
+            
+            self._mmap.close()
+            
+            self._mmap = None
+            
+        
+        if self._f is not None:
+            
+            self._f.close()
+            
+            self._f = None
+            
+        
+        self._hashes_to_records = None
+        
+    
+    def _GetMMap( self ):
+        
+        # appends do not show up in an existing map, so remap when we have grown past it
+        
+        if self._mmap is None or len( self._mmap ) < self._end_offset:
+            
+            if self._mmap is not None:
+                
+                self._mmap.close()
+                
+            
+            self._mmap = mmap.mmap( self._f.fileno(), 0, access = mmap.ACCESS_READ )
+            
+        
+        return self._mmap
+        
+    
+    def _InitialiseIndex( self ):
+        
+        if self._hashes_to_records is not None:
+            
+            return
+            
+        
+        # this cold open is the expensive part of a pack--see the class comment
+        
+        self._hashes_to_records = {}
+        self._end_offset = 0
+        self._num_dead_bytes = 0
+        
+        if not os.path.exists( self._path ):
+            
+            # we don't want to make an empty pack for every prefix just because someone looked
+            
+            return
+            
+        
+        self._f = open( self._path, 'r+b' )
+        
+        file_size = os.path.getsize( self._path )
+        
+        offset = 0
+        
+        if file_size > 0:
+            
+            m = mmap.mmap( self._f.fileno(), 0, access = mmap.ACCESS_READ )
+            
+            try:
+                
+                while offset + self.HEADER.size <= file_size:
+                    
+                    ( hash, length ) = self.HEADER.unpack_from( m, offset )
+                    
+                    data_offset = offset + self.HEADER.size
+                    
+                    if data_offset + length > file_size:
+                        
+                        break
+                        
+                    
+                    if hash in self._hashes_to_records:
+                        
+                        ( old_offset, old_length ) = self._hashes_to_records[ hash ]
+                        
+                        self._num_dead_bytes += self.HEADER.size + old_length
+                        
+                        del self._hashes_to_records[ hash ]
+                        
+                    
+                    if length == 0:
+                        
+                        self._num_dead_bytes += self.HEADER.size
+                        
+                    else:
+                        
+                        self._hashes_to_records[ hash ] = ( data_offset, length )
+                        
+                    
+                    offset = data_offset + length
+                    
+                
+            finally:
+                
+                m.close()
+                
+            
+        
+        if offset < file_size:
+            
+            # a write was interrupted, so drop the partial record
+            
+            HydrusData.Print( 'Thumbnail pack ' + self._path + ' had a partial record at its end, which was discarded.' )
+            
+            self._f.truncate( offset )
+            
+        
+        self._end_offset = offset
+        
+    
+    def AddThumbnail( self, hash, thumbnail_bytes ):
+        
+        with self._lock:
+            
+            offset = self._AppendRecord( hash, thumbnail_bytes )
+            
+            self._hashes_to_records[ hash ] = ( offset, len( thumbnail_bytes ) )
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            self._Close()
+            
+        
+    
+    def Compact( self ):
+        
+        # rewrite the pack with only its live records
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            if self._num_dead_bytes == 0:
+                
+                return
+                
+            
+            temp_path = self._path + '.compacting'
+            
+            m = self._GetMMap()
+            
+            with open( temp_path, 'wb' ) as f:
+                
+                for ( hash, ( offset, length ) ) in self._hashes_to_records.items():
+                    
+                    f.write( self.HEADER.pack( hash, length ) )
+                    f.write( m[ offset : offset + length ] )
+                    
+                
+            
+            self._Close()
+            
+            os.replace( temp_path, self._path )
+            
+        
+    
+    def DeleteThumbnail( self, hash ):
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            if hash in self._hashes_to_records:
+                
+                self._AppendRecord( hash, b'' )
+                
+                self._num_dead_bytes += self.HEADER.size
+                
+            
+        
+    
+    def GetHashes( self ):
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            return list( self._hashes_to_records.keys() )
+            
+        
+    
+    def GetThumbnailBytes( self, hash ):
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            if hash not in self._hashes_to_records:
+                
+                return None
+                
+            
+            ( offset, length ) = self._hashes_to_records[ hash ]
+            
+            return self._GetMMap()[ offset : offset + length ]
+            
+        
+    
+    def HasThumbnail( self, hash, load_index = True ):
+        
+        with self._lock:
+            
+            if self._hashes_to_records is None and not load_index:
+                
+                return False
+                
+            
+            self._InitialiseIndex()
+            
+            return hash in self._hashes_to_records
+            
+        
+    
+    def LoadIndex( self ):
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+        
+    
@@ -1178,6 +1178,18 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
         HydrusData.DebugPrint( 'garbage printing finished' )
         
     
+    def _DebugShowMediaCacheStats( self ):
+        
+        for ( name, cache_name ) in ( ( 'thumbnails', 'thumbnail' ), ( 'images', 'images' ) ):
+            
+            ( num_items, memory_usage, num_hits, num_misses, num_evictions ) = self._controller.GetCache( cache_name ).GetStats()
+            
+            message = name + ': ' + HydrusData.ToHumanInt( num_items ) + ' items, ' + HydrusData.ToHumanBytes( memory_usage ) + ', ' + HydrusData.ToHumanInt( num_hits ) + ' hits, ' + HydrusData.ToHumanInt( num_misses ) + ' misses, ' + HydrusData.ToHumanInt( num_evictions ) + ' evictions'
+            
+            HydrusData.ShowText( message )
+            
+        
+    
     def _DebugShowScheduledJobs( self ):
         
         self._controller.DebugShowScheduledJobs()
@@ -1822,6 +1834,15 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             ClientGUIMenus.AppendMenuItem( self, submenu, 'clear orphan files', 'Clear out surplus files that have found their way into the file structure.', self._ClearOrphanFiles )
             ClientGUIMenus.AppendMenuItem( self, submenu, 'clear orphan file records', 'Clear out surplus file records that have not been deleted correctly.', self._ClearOrphanFileRecords )
             
+            if self._controller.new_options.GetBoolean( 'use_packed_thumbnails' ):
+                
+                ClientGUIMenus.AppendMenuItem( self, submenu, 'unpack thumbnails', 'Move all thumbnails out of their pack files and back to one file each.', self._MigrateThumbnailStorage, False )
+                
+            else:
+                
+                ClientGUIMenus.AppendMenuItem( self, submenu, 'pack thumbnails', 'Move all thumbnails into one pack file per folder, which is much faster to read and back up.', self._MigrateThumbnailStorage, True )
+                
+            
             if self._controller.new_options.GetBoolean( 'advanced_mode' ):
                 
                 ClientGUIMenus.AppendMenuItem( self, submenu, 'clear orphan tables', 'Clear out surplus db tables that have not been deleted correctly.', self._ClearOrphanTables )
@@ -2282,6 +2303,7 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
+            ClientGUIMenus.AppendMenuItem( self, data_actions, 'show media cache stats', 'Show how full the thumbnail and image caches are and how often they hit.', self._DebugShowMediaCacheStats )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'print garbage', 'Print some information about the python garbage to the log.', self._DebugPrintGarbage )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'enable truncated image loading', 'Enable the truncated image loading to test out broken jpegs.', self._EnableLoadTruncatedImages )
             ClientGUIMenus.AppendMenuItem( self, data_actions, 'clear image rendering cache', 'Tell the image rendering system to forget all current images. This will often free up a bunch of memory immediately.', self._controller.ClearCaches )
@@ -3391,6 +3413,30 @@ class FrameGUI( ClientGUITopLevelWindows.FrameThatResizes ):
         self._menu_updater.Update()
         
     
+    def _MigrateThumbnailStorage( self, packed ):
+        
+        if packed:
+            
+            text = 'This will move every thumbnail into one pack file per thumbnail folder. It makes opening big pages and backing up much faster, particularly on slow or network drives.'
+            
+        else:
+            
+            text = 'This will move every thumbnail out of its pack file and back to one file per thumbnail.'
+            
+        
+        text += os.linesep * 2
+        text += 'It may take some time, and thumbnails will load slowly while it works. It is safe to cancel part way through.'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, text, yes_label = 'do it', no_label = 'forget it' )
+        
+        if result == wx.ID_YES:
+            
+            self._controller.CallToThread( self._controller.client_files_manager.MigrateThumbnailStorage, packed )
+            
+            self._DirtyMenu( 'database' )
+            
+        
+    
     def _MigrateTags( self ):
         
         default_tag_repository_key = HC.options[ 'default_tag_repository' ]
@@ -5694,9 +5694,9 @@ class EmbedButton( wx.Window ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            self._thumbnail_bmp = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetWxBitmap()
+            self._thumbnail_bmp = ClientRendering.GenerateHydrusBitmapFromBytes( thumbnail_bytes, mime ).GetWxBitmap()
             
             self._SetDirty()
             
@@ -5724,9 +5724,9 @@ class OpenExternallyPanel( wx.Panel ):
             
             mime = self._media.GetMime()
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            bmp = ClientRendering.GenerateHydrusBitmap( thumbnail_path, mime ).GetWxBitmap()
+            bmp = ClientRendering.GenerateHydrusBitmapFromBytes( thumbnail_bytes, mime ).GetWxBitmap()
             
             thumbnail_window = ClientGUICommon.BufferedWindowIcon( self, bmp )
             
@@ -89,7 +89,7 @@ class EditExportFoldersPanel( ClientGUIScrolledPanels.EditPanel ):
     
     def _ConvertExportFolderToListCtrlTuples( self, export_folder ):
         
-        ( name, path, export_type, delete_from_client_after_export, file_search_context, run_regularly, period, phrase, last_checked, paused, run_now ) = export_folder.ToTuple()
+        ( name, path, export_type, delete_from_client_after_export, file_search_context, run_regularly, period, phrase, last_checked, paused, run_now, link_files ) = export_folder.ToTuple()
         
         if export_type == HC.EXPORT_FOLDER_TYPE_REGULAR:
             
@@ -191,7 +191,7 @@ class EditExportFolderPanel( ClientGUIScrolledPanels.EditPanel ):
         
         self._export_folder = export_folder
         
-        ( name, path, export_type, delete_from_client_after_export, file_search_context, run_regularly, period, phrase, self._last_checked, paused, run_now ) = self._export_folder.ToTuple()
+        ( name, path, export_type, delete_from_client_after_export, file_search_context, run_regularly, period, phrase, self._last_checked, paused, run_now, link_files ) = self._export_folder.ToTuple()
         
         self._path_box = ClientGUICommon.StaticBox( self, 'name and location' )
         
@@ -209,6 +209,14 @@ class EditExportFolderPanel( ClientGUIScrolledPanels.EditPanel ):
         
         self._delete_from_client_after_export = wx.CheckBox( self._type_box )
         
+        self._link_files = wx.CheckBox( self._type_box )
+        
+        tt = 'If the export folder is on the same drive as your client files, this will try to clone or hardlink the files rather than copying them, which is much faster and uses no extra space.'
+        tt += os.linesep * 2
+        tt += 'A hardlink is the same file as the one in your client, so do not edit or convert exported files if you use this!'
+        
+        self._link_files.SetToolTip( tt )
+        
         #
         
         self._query_box = ClientGUICommon.StaticBox( self, 'query to export' )
@@ -251,6 +259,8 @@ class EditExportFolderPanel( ClientGUIScrolledPanels.EditPanel ):
         
         self._delete_from_client_after_export.SetValue( delete_from_client_after_export )
         
+        self._link_files.SetValue( link_files )
+        
         self._period.SetValue( period )
         
         self._run_regularly.SetValue( run_regularly )
@@ -290,6 +300,7 @@ If you select synchronise, be careful!'''
         rows = []
         
         rows.append( ( 'delete files from client after export: ', self._delete_from_client_after_export ) )
+        rows.append( ( 'link files instead of copying when possible: ', self._link_files ) )
         
         gridbox = ClientGUICommon.WrapInGrid( self._type_box, rows )
         
@@ -390,6 +401,8 @@ If you select synchronise, be careful!'''
         
         delete_from_client_after_export = self._delete_from_client_after_export.GetValue()
         
+        link_files = self._link_files.GetValue()
+        
         file_search_context = self._searchbox.GetFileSearchContext()
         
         predicates = self._predicates_box.GetPredicates()
@@ -422,7 +435,11 @@ If you select synchronise, be careful!'''
         
         paused = self._paused.GetValue()
         
-        export_folder = ClientExporting.ExportFolder( name, path = path, export_type = export_type, delete_from_client_after_export = delete_from_client_after_export, file_search_context = file_search_context, run_regularly = run_regularly, period = period, phrase = phrase, last_checked = self._last_checked, paused = paused, run_now = run_now )
+        # the manifest is keyed on path, phrase and type, so the folder starts over by itself if any of those changed
+        
+        manifest = self._export_folder.GetManifest()
+        
+        export_folder = ClientExporting.ExportFolder( name, path = path, export_type = export_type, delete_from_client_after_export = delete_from_client_after_export, file_search_context = file_search_context, run_regularly = run_regularly, period = period, phrase = phrase, last_checked = self._last_checked, paused = paused, run_now = run_now, link_files = link_files, manifest = manifest )
         
         return export_folder
         
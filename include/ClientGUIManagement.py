@@ -1141,6 +1141,10 @@ class ManagementPanelDuplicateFilter( ManagementPanel ):
         
         menu_items.append( ( 'check', 'search for duplicate pairs at the current distance during normal db maintenance', 'Tell the client to find duplicate pairs in its normal db maintenance cycles, whether you have that set to idle or shutdown time.', check_manager ) )
         
+        check_manager = ClientGUICommon.CheckboxManagerOptions( 'use_in_memory_similar_files_index' )
+        
+        menu_items.append( ( 'check', 'keep an in-memory similar files index for fast searching', 'Tell the client to load all the similar files data into memory and search it directly, rather than walking the search tree in the database. This is much faster for large searches but uses about 16 bytes of memory per file.', check_manager ) )
+        
         self._cog_button = ClientGUICommon.MenuBitmapButton( self._main_left_panel, CC.GlobalBMPs.cog, menu_items )
         
         menu_items = []
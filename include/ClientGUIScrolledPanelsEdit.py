@@ -3328,6 +3328,11 @@ class EditServersideService( ClientGUIScrolledPanels.EditPanel ):
             
             self._panels.append( self._ServiceRestrictedPanel( self, self._dictionary ) )
             
+            if self._service_type in HC.REPOSITORIES:
+                
+                self._panels.append( self._ServiceRepositoryPanel( self, self._dictionary ) )
+                
+            
             if self._service_type == HC.FILE_REPOSITORY:
                 
                 self._panels.append( self._ServiceFileRepositoryPanel( self, self._dictionary ) )
@@ -3456,6 +3461,45 @@ class EditServersideService( ClientGUIScrolledPanels.EditPanel ):
             
         
     
+    class _ServiceRepositoryPanel( ClientGUICommon.StaticBox ):
+        
+        def __init__( self, parent, dictionary ):
+            
+            ClientGUICommon.StaticBox.__init__( self, parent, 'repository' )
+            
+            self._binary_updates = wx.CheckBox( self )
+            
+            tt = 'Binary update files are smaller and much quicker for clients to process, but clients older than v{} cannot read them. Only turn this on once your users have updated.'.format( HC.SOFTWARE_VERSION )
+            
+            self._binary_updates.SetToolTip( tt )
+            
+            #
+            
+            binary_updates = dictionary.get( 'binary_updates', False )
+            
+            self._binary_updates.SetValue( binary_updates )
+            
+            #
+            
+            rows = []
+            
+            rows.append( ( 'write new updates in the compact binary format: ', self._binary_updates ) )
+            
+            gridbox = ClientGUICommon.WrapInGrid( self, rows )
+            
+            self.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
+            
+        
+        def GetValue( self ):
+            
+            dictionary_part = {}
+            
+            dictionary_part[ 'binary_updates' ] = self._binary_updates.GetValue()
+            
+            return dictionary_part
+            
+        
+    
     class _ServiceFileRepositoryPanel( ClientGUICommon.StaticBox ):
         
         def __init__( self, parent, dictionary ):
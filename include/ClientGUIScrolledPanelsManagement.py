@@ -1732,6 +1732,15 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._max_network_jobs = wx.SpinCtrl( general, min = 1, max = 30 )
             self._max_network_jobs_per_domain = wx.SpinCtrl( general, min = 1, max = 5 )
             
+            self._network_keep_alive = wx.CheckBox( general )
+            self._network_keep_alive.SetToolTip( 'Keep connections open after a request finishes so the next request to the same host can skip the connect and TLS handshake.' )
+            
+            self._network_connection_pool_num_hosts = wx.SpinCtrl( general, min = 1, max = 256 )
+            self._network_connection_pool_num_hosts.SetToolTip( 'How many different hosts (e.g. cdn subdomains) each session will keep open connections to.' )
+            
+            self._network_connection_pool_size = wx.SpinCtrl( general, min = 1, max = 64 )
+            self._network_connection_pool_size.SetToolTip( 'How many open connections each session will keep to one host. This will never be fewer than the max number of jobs per domain.' )
+            
             #
             
             proxy_panel = ClientGUICommon.StaticBox( self, 'proxy settings' )
@@ -1753,6 +1762,10 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._max_network_jobs.SetValue( self._new_options.GetInteger( 'max_network_jobs' ) )
             self._max_network_jobs_per_domain.SetValue( self._new_options.GetInteger( 'max_network_jobs_per_domain' ) )
             
+            self._network_keep_alive.SetValue( self._new_options.GetBoolean( 'network_keep_alive' ) )
+            self._network_connection_pool_num_hosts.SetValue( self._new_options.GetInteger( 'network_connection_pool_num_hosts' ) )
+            self._network_connection_pool_size.SetValue( self._new_options.GetInteger( 'network_connection_pool_size' ) )
+            
             #
             
             rows = []
@@ -1760,6 +1773,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'network timeout (seconds): ', self._network_timeout ) )
             rows.append( ( 'max number of simultaneous active network jobs: ', self._max_network_jobs ) )
             rows.append( ( 'max number of simultaneous active network jobs per domain: ', self._max_network_jobs_per_domain ) )
+            rows.append( ( 'keep connections alive between requests: ', self._network_keep_alive ) )
+            rows.append( ( 'max number of hosts to keep connections open to, per session: ', self._network_connection_pool_num_hosts ) )
+            rows.append( ( 'max number of connections to keep open, per host: ', self._network_connection_pool_size ) )
             rows.append( ( 'BUGFIX: verify regular https traffic:', self._verify_regular_https ) )
             
             gridbox = ClientGUICommon.WrapInGrid( general, rows )
@@ -1811,6 +1827,10 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'network_timeout', self._network_timeout.GetValue() )
             self._new_options.SetInteger( 'max_network_jobs', self._max_network_jobs.GetValue() )
             self._new_options.SetInteger( 'max_network_jobs_per_domain', self._max_network_jobs_per_domain.GetValue() )
+            
+            self._new_options.SetBoolean( 'network_keep_alive', self._network_keep_alive.GetValue() )
+            self._new_options.SetInteger( 'network_connection_pool_num_hosts', self._network_connection_pool_num_hosts.GetValue() )
+            self._new_options.SetInteger( 'network_connection_pool_size', self._network_connection_pool_size.GetValue() )
         
     
     class _DownloadingPanel( wx.Panel ):
@@ -1870,6 +1890,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._stop_character = wx.TextCtrl( misc )
             self._show_new_on_file_seed_short_summary = wx.CheckBox( misc )
             self._show_deleted_on_file_seed_short_summary = wx.CheckBox( misc )
+            self._parse_html_with_lxml = wx.CheckBox( misc )
+            self._parse_html_with_lxml.SetToolTip( 'lxml is much faster than the default html5lib on large pages, but it is less forgiving of broken html. Parsing rules it cannot handle will still use html5lib.' )
             
             self._subscription_network_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
             self._subscription_other_error_delay = ClientGUITime.TimeDeltaButton( misc, min = 600, days = True, hours = True, minutes = True )
@@ -1907,6 +1929,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._stop_character.SetValue( self._new_options.GetString( 'stop_character' ) )
             self._show_new_on_file_seed_short_summary.SetValue( self._new_options.GetBoolean( 'show_new_on_file_seed_short_summary' ) )
             self._show_deleted_on_file_seed_short_summary.SetValue( self._new_options.GetBoolean( 'show_deleted_on_file_seed_short_summary' ) )
+            self._parse_html_with_lxml.SetValue( self._new_options.GetBoolean( 'parse_html_with_lxml' ) )
             
             self._watcher_page_wait_period.SetValue( self._new_options.GetInteger( 'watcher_page_wait_period' ) )
             self._watcher_page_wait_period.SetToolTip( gallery_page_tt )
@@ -1963,6 +1986,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Stop character:', self._stop_character ) )
             rows.append( ( 'Show a \'N\' (for \'new\') count on short file import summaries:', self._show_new_on_file_seed_short_summary ) )
             rows.append( ( 'Show a \'D\' (for \'deleted\') count on short file import summaries:', self._show_deleted_on_file_seed_short_summary ) )
+            rows.append( ( 'Parse html with lxml where possible:', self._parse_html_with_lxml ) )
             rows.append( ( 'Delay time on a gallery/watcher network error:', self._downloader_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription network error:', self._subscription_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription other error:', self._subscription_other_error_delay ) )
@@ -2006,6 +2030,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetString( 'stop_character', self._stop_character.GetValue() )
             self._new_options.SetBoolean( 'show_new_on_file_seed_short_summary', self._show_new_on_file_seed_short_summary.GetValue() )
             self._new_options.SetBoolean( 'show_deleted_on_file_seed_short_summary', self._show_deleted_on_file_seed_short_summary.GetValue() )
+            self._new_options.SetBoolean( 'parse_html_with_lxml', self._parse_html_with_lxml.GetValue() )
             
             self._new_options.SetInteger( 'subscription_network_error_delay', self._subscription_network_error_delay.GetValue() )
             self._new_options.SetInteger( 'subscription_other_error_delay', self._subscription_other_error_delay.GetValue() )
@@ -2922,9 +2947,27 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            local_imports = ClientGUICommon.StaticBox( self, 'local file imports' )
+            
+            self._file_import_workers = wx.SpinCtrl( local_imports, min = 1, max = 64 )
+            self._file_import_workers.SetToolTip( 'How many files local imports and import folders hash, inspect and thumbnail at once. The database part of each import still happens one file at a time. A number near your CPU core count is usually best.' )
+            
+            self._file_import_workers.SetValue( self._new_options.GetInteger( 'file_import_workers' ) )
+            
+            rows = []
+            
+            rows.append( ( 'Files to prepare in parallel: ', self._file_import_workers ) )
+            
+            gridbox = ClientGUICommon.WrapInGrid( local_imports, rows )
+            
+            local_imports.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
+            
+            #
+            
             vbox = wx.BoxSizer( wx.VERTICAL )
             
             vbox.Add( default_fios, CC.FLAGS_EXPAND_PERPENDICULAR )
+            vbox.Add( local_imports, CC.FLAGS_EXPAND_PERPENDICULAR )
             
             self.SetSizer( vbox )
             
@@ -2934,6 +2977,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetDefaultFileImportOptions( 'quiet', self._quiet_fios.GetValue() )
             self._new_options.SetDefaultFileImportOptions( 'loud', self._loud_fios.GetValue() )
             
+            self._new_options.SetInteger( 'file_import_workers', self._file_import_workers.GetValue() )
+            
         
     
     class _MaintenanceAndProcessingPanel( wx.Panel ):
@@ -3609,6 +3654,21 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._image_cache_timeout = ClientGUITime.TimeDeltaButton( media_panel, min = 300, days = True, hours = True, minutes = True )
             self._image_cache_timeout.SetToolTip( 'The amount of time after which a rendered image in the cache will naturally be removed, if it is not shunted out due to a new member exceeding the size limit. Requires restart to kick in.' )
             
+            self._media_cache_eviction_policy = ClientGUICommon.BetterChoice( media_panel )
+            
+            for eviction_policy in ( CC.CACHE_EVICTION_LRU, CC.CACHE_EVICTION_SIZE_WEIGHTED_LRU, CC.CACHE_EVICTION_2Q ):
+                
+                self._media_cache_eviction_policy.Append( CC.cache_eviction_string_lookup[ eviction_policy ], eviction_policy )
+                
+            
+            self._media_cache_eviction_policy.SetToolTip( 'How the thumbnail and image caches decide what to forget when they are full. Requires restart to kick in.' )
+            
+            self._thumbnail_waterfall_workers = wx.SpinCtrl( media_panel, min = 1, max = 64 )
+            self._thumbnail_waterfall_workers.SetToolTip( 'How many threads load and decode thumbnails in parallel as pages fill up. A number near your CPU core count is usually best. Requires restart to kick in.' )
+            
+            self._share_media_cache_budget = wx.CheckBox( media_panel )
+            self._share_media_cache_budget.SetToolTip( 'If checked, the thumbnail and image caches will share one budget of their combined size, so whichever is busier can use the memory the other is not. Requires restart to kick in.' )
+            
             #
             
             buffer_panel = ClientGUICommon.StaticBox( self, 'video buffer' )
@@ -3657,6 +3717,11 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._thumbnail_cache_timeout.SetValue( self._new_options.GetInteger( 'thumbnail_cache_timeout' ) )
             self._image_cache_timeout.SetValue( self._new_options.GetInteger( 'image_cache_timeout' ) )
             
+            self._media_cache_eviction_policy.SetValue( self._new_options.GetInteger( 'media_cache_eviction_policy' ) )
+            self._share_media_cache_budget.SetValue( self._new_options.GetBoolean( 'share_media_cache_budget' ) )
+            
+            self._thumbnail_waterfall_workers.SetValue( self._new_options.GetInteger( 'thumbnail_waterfall_workers' ) )
+            
             self._video_buffer_size_mb.SetValue( self._new_options.GetInteger( 'video_buffer_size_mb' ) )
             
             self._autocomplete_results_fetch_automatically.SetValue( self._new_options.GetBoolean( 'autocomplete_results_fetch_automatically' ) )
@@ -3704,6 +3769,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'MB memory reserved for image cache: ', fullscreens_sizer ) )
             rows.append( ( 'Thumbnail cache timeout: ', self._thumbnail_cache_timeout ) )
             rows.append( ( 'Image cache timeout: ', self._image_cache_timeout ) )
+            rows.append( ( 'Cache eviction policy: ', self._media_cache_eviction_policy ) )
+            rows.append( ( 'Thumbnail and image caches share one memory budget: ', self._share_media_cache_budget ) )
+            rows.append( ( 'Thumbnail loading threads: ', self._thumbnail_waterfall_workers ) )
             
             gridbox = ClientGUICommon.WrapInGrid( media_panel, rows )
             
@@ -3842,6 +3910,11 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'thumbnail_cache_timeout', self._thumbnail_cache_timeout.GetValue() )
             self._new_options.SetInteger( 'image_cache_timeout', self._image_cache_timeout.GetValue() )
             
+            self._new_options.SetInteger( 'media_cache_eviction_policy', self._media_cache_eviction_policy.GetValue() )
+            self._new_options.SetBoolean( 'share_media_cache_budget', self._share_media_cache_budget.GetValue() )
+            
+            self._new_options.SetInteger( 'thumbnail_waterfall_workers', self._thumbnail_waterfall_workers.GetValue() )
+            
             self._new_options.SetInteger( 'video_buffer_size_mb', self._video_buffer_size_mb.GetValue() )
             
             self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
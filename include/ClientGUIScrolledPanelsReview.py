@@ -3783,7 +3783,7 @@ class ReviewNetworkSessionsPanel( ClientGUIScrolledPanels.ReviewPanel ):
         
         listctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
         
-        columns = [ ( 'network context', -1 ), ( 'cookies', 9 ), ( 'expires', 28 ) ]
+        columns = [ ( 'network context', -1 ), ( 'cookies', 9 ), ( 'expires', 28 ), ( 'connections', 24 ), ( 'requests', 10 ) ]
         
         self._listctrl = ClientGUIListCtrl.BetterListCtrl( listctrl_panel, 'review_network_sessions', 32, 34, columns, self._ConvertNetworkContextToListCtrlTuples, delete_key_callback = self._Clear, activation_callback = self._Review )
         
@@ -3903,8 +3903,21 @@ class ReviewNetworkSessionsPanel( ClientGUIScrolledPanels.ReviewPanel ):
                 
             
         
-        display_tuple = ( pretty_network_context, pretty_number_of_cookies, pretty_expiry )
-        sort_tuple = ( pretty_network_context, number_of_cookies, expiry )
+        ( num_hosts, num_connections_made, num_requests, num_idle_connections ) = self._session_manager.GetConnectionPoolStats( network_context )
+        
+        if num_hosts == 0:
+            
+            pretty_connections = ''
+            
+        else:
+            
+            pretty_connections = HydrusData.ToHumanInt( num_connections_made ) + ' made to ' + HydrusData.ToHumanInt( num_hosts ) + ' hosts, ' + HydrusData.ToHumanInt( num_idle_connections ) + ' idle'
+            
+        
+        pretty_num_requests = HydrusData.ToHumanInt( num_requests )
+        
+        display_tuple = ( pretty_network_context, pretty_number_of_cookies, pretty_expiry, pretty_connections, pretty_num_requests )
+        sort_tuple = ( pretty_network_context, number_of_cookies, expiry, num_connections_made, num_requests )
         
         return ( display_tuple, sort_tuple )
         
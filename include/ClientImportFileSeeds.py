@@ -6,7 +6,9 @@ from . import ClientNetworkingDomain
 from . import ClientParsing
 from . import ClientPaths
 from . import ClientTags
+import bisect
 import collections
+import itertools
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
@@ -22,6 +24,130 @@ import time
 import traceback
 import urllib.parse
 
+# file seeds are shared with importers that set their status directly, so every status change gets an id that caches can check their status index against
+file_seed_status_change_ids = itertools.count( 1 )
+last_file_seed_status_change_id = 0
+
+def FinishFileImportJobs( file_import_jobs ):
+    
+    # the client files and db half of a batch of prepared jobs. the db rows for all the new files go in with one write
+    # returns, for each job, ( status, hash, note ) or the exception that stopped it
+    
+    results = [ None for file_import_job in file_import_jobs ]
+    
+    indices_to_write = []
+    
+    # the same file can turn up more than once in a batch. only the first copy goes to client files and the db
+    
+    hashes_to_first_indices = {}
+    duplicate_indices_to_first_indices = {}
+    
+    for ( i, file_import_job ) in enumerate( file_import_jobs ):
+        
+        if file_import_job.IsNewToDB():
+            
+            hash = file_import_job.GetHash()
+            
+            if hash in hashes_to_first_indices:
+                
+                duplicate_indices_to_first_indices[ i ] = hashes_to_first_indices[ hash ]
+                
+                continue
+                
+            
+            hashes_to_first_indices[ hash ] = i
+            
+            try:
+                
+                file_import_job.AddToClientFiles()
+                
+                indices_to_write.append( i )
+                
+            except Exception as e:
+                
+                results[ i ] = e
+                
+            
+        else:
+            
+            ( status, note ) = file_import_job.GetPreImportStatusAndNote()
+            
+            results[ i ] = ( status, file_import_job.GetHash(), note )
+            
+        
+    
+    if len( indices_to_write ) > 0:
+        
+        try:
+            
+            WriteFileImportJobs( file_import_jobs, indices_to_write, results )
+            
+        except Exception as e:
+            
+            if len( indices_to_write ) == 1:
+                
+                results[ indices_to_write[0] ] = e
+                
+            else:
+                
+                # one bad file should not fail the whole batch, so go again one at a time. each job that still fails gets its own exception
+                
+                if HG.file_import_report_mode:
+                    
+                    HydrusData.ShowText( 'File import batch write failed, trying the files one at a time' )
+                    
+                
+                for i in indices_to_write:
+                    
+                    try:
+                        
+                        WriteFileImportJobs( file_import_jobs, ( i, ), results )
+                        
+                    except Exception as e:
+                        
+                        results[ i ] = e
+                        
+                    
+                
+            
+        
+    
+    for ( i, first_i ) in duplicate_indices_to_first_indices.items():
+        
+        first_result = results[ first_i ]
+        
+        if isinstance( first_result, Exception ):
+            
+            results[ i ] = Exception( 'This file was the same as an earlier one in the batch, which failed: {}'.format( first_result ) )
+            
+        else:
+            
+            ( status, hash, note ) = first_result
+            
+            if status == CC.STATUS_SUCCESSFUL_AND_NEW:
+                
+                ( status, note ) = ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, 'file recognised: Imported earlier in the same batch.' )
+                
+            
+            results[ i ] = ( status, hash, note )
+            
+        
+    
+    if HG.file_import_report_mode:
+        
+        HydrusData.ShowText( 'File import jobs are done, now publishing content updates' )
+        
+    
+    for ( file_import_job, result ) in zip( file_import_jobs, results ):
+        
+        if not isinstance( result, Exception ):
+            
+            file_import_job.PubsubContentUpdates()
+            
+        
+    
+    return results
+    
 def GenerateFileSeedCacheStatus( file_seed_cache ):
     
     statuses_to_counts = file_seed_cache.GetStatusesToCounts()
@@ -154,6 +280,29 @@ def GenerateStatusesToCountsStatus( statuses_to_counts ):
     
     return ( status, simple_status, ( total_processed, total ) )
     
+def RemoveFromSortedList( sorted_list, value ):
+    
+    i = bisect.bisect_left( sorted_list, value )
+    
+    if i < len( sorted_list ) and sorted_list[ i ] == value:
+        
+        del sorted_list[ i ]
+        
+    
+def WriteFileImportJobs( file_import_jobs, indices_to_write, results ):
+    
+    db_results = HG.client_controller.WriteSynchronous( 'import_files', [ file_import_jobs[ i ] for i in indices_to_write ] )
+    
+    if db_results is None or len( db_results ) != len( indices_to_write ):
+        
+        raise Exception( 'The database gave back the wrong number of import results for {} files!'.format( HydrusData.ToHumanInt( len( indices_to_write ) ) ) )
+        
+    
+    for ( i, ( status, note ) ) in zip( indices_to_write, db_results ):
+        
+        results[ i ] = ( status, file_import_jobs[ i ].GetHash(), note )
+        
+    
 class FileImportJob( object ):
     
     def __init__( self, temp_path, file_import_options = None ):
@@ -173,6 +322,7 @@ class FileImportJob( object ):
         
         self._hash = None
         self._pre_import_status = None
+        self._pre_import_note = ''
         
         self._file_info = None
         self._thumbnail_bytes = None
@@ -181,6 +331,13 @@ class FileImportJob( object ):
         self._file_modified_timestamp = None
         
     
+    def AddToClientFiles( self ):
+        
+        mime = self.GetMime()
+        
+        HG.client_controller.client_files_manager.AddFile( self._hash, mime, self._temp_path, thumbnail_bytes = self._thumbnail_bytes )
+        
+    
     def CheckIsGoodToImport( self ):
         
         if HG.file_import_report_mode:
@@ -200,54 +357,47 @@ class FileImportJob( object ):
             HydrusData.ShowText( 'File import job starting work.' )
             
         
-        ( pre_import_status, hash, note ) = self.GenerateHashAndStatus()
+        self.PrepareWork()
         
-        if self.IsNewToDB():
-            
-            self.GenerateInfo()
-            
-            self.CheckIsGoodToImport()
-            
-            mime = self.GetMime()
-            
-            HG.client_controller.client_files_manager.AddFile( hash, mime, self._temp_path, thumbnail_bytes = self._thumbnail_bytes )
-            
-            ( import_status, note ) = HG.client_controller.WriteSynchronous( 'import_file', self )
-            
-        else:
-            
-            import_status = pre_import_status
-            
+        return self.FinishWork()
         
-        if HG.file_import_report_mode:
+    
+    def FinishWork( self ):
+        
+        # this is the part that touches the client files and the db, so parallel importers call it one job at a time
+        
+        result = FinishFileImportJobs( ( self, ) )[0]
+        
+        if isinstance( result, Exception ):
             
-            HydrusData.ShowText( 'File import job is done, now publishing content updates' )
+            raise result
             
         
-        self.PubsubContentUpdates()
-        
-        return ( import_status, hash, note )
+        return result
         
     
     def GenerateHashAndStatus( self ):
         
         HydrusImageHandling.ConvertToPngIfBmp( self._temp_path )
         
-        self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+        # we get all the hashes now, in one read, so we do not have to go back to the disk for the extra ones later
+        ( self._hash, md5, sha1, sha512 ) = HydrusFileHandling.GetAllHashesFromPath( self._temp_path )
+        
+        self._extra_hashes = ( md5, sha1, sha512 )
         
         if HG.file_import_report_mode:
             
             HydrusData.ShowText( 'File import job hash: {}'.format( self._hash.hex() ) )
             
         
-        ( self._pre_import_status, hash, note ) = HG.client_controller.Read( 'hash_status', 'sha256', self._hash, prefix = 'file recognised' )
+        ( self._pre_import_status, hash, self._pre_import_note ) = HG.client_controller.Read( 'hash_status', 'sha256', self._hash, prefix = 'file recognised' )
         
         if HG.file_import_report_mode:
             
-            HydrusData.ShowText( 'File import job pre-import status: {}, {}'.format( CC.status_string_lookup[ self._pre_import_status ], note ) )
+            HydrusData.ShowText( 'File import job pre-import status: {}, {}'.format( CC.status_string_lookup[ self._pre_import_status ], self._pre_import_note ) )
             
         
-        return ( self._pre_import_status, self._hash, note )
+        return ( self._pre_import_status, self._hash, self._pre_import_note )
         
     
     def GenerateInfo( self ):
@@ -319,13 +469,16 @@ class FileImportJob( object ):
                 
             
         
-        if HG.file_import_report_mode:
+        if self._extra_hashes is None:
+            
+            if HG.file_import_report_mode:
+                
+                HydrusData.ShowText( 'File import job generating other hashes' )
+                
             
-            HydrusData.ShowText( 'File import job generating other hashes' )
+            self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
             
         
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
-        
         self._file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( self._temp_path )
         
     
@@ -366,6 +519,11 @@ class FileImportJob( object ):
         return self._pre_import_status
         
     
+    def GetPreImportStatusAndNote( self ):
+        
+        return ( self._pre_import_status, self._pre_import_note )
+        
+    
     def GetPHashes( self ):
         
         return self._phashes
@@ -402,6 +560,20 @@ class FileImportJob( object ):
         return False
         
     
+    def PrepareWork( self ):
+        
+        # hashing, file info, thumbnail and phashes. this is the cpu and disk heavy part, and it is safe to run in parallel with other jobs
+        
+        self.GenerateHashAndStatus()
+        
+        if self.IsNewToDB():
+            
+            self.GenerateInfo()
+            
+            self.CheckIsGoodToImport()
+            
+        
+    
 FILE_SEED_TYPE_HDD = 0
 FILE_SEED_TYPE_URL = 1
 
@@ -908,8 +1080,97 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self.SetHash( hash )
         
     
+    def FinishImportPath( self, file_seed_cache, prepared, import_result = None ):
+        
+        # prepared is what PrepareImportPath gave us. if it is None, our status is already set
+        # import_result is our entry from FinishFileImportJobs, if the caller did a batch. otherwise we do our own
+        
+        if prepared is not None:
+            
+            ( os_file_handle, temp_path, file_import_job ) = prepared
+            
+            try:
+                
+                try:
+                    
+                    if import_result is None:
+                        
+                        import_result = file_import_job.FinishWork()
+                        
+                    elif isinstance( import_result, Exception ):
+                        
+                        raise import_result
+                        
+                    
+                    ( status, hash, note ) = import_result
+                    
+                    self.SetStatus( status, note = note )
+                    self.SetHash( hash )
+                    
+                finally:
+                    
+                    HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+                    
+                
+                self.WriteContentUpdates()
+                
+            except HydrusExceptions.MimeException as e:
+                
+                self.SetStatus( CC.STATUS_ERROR, exception = e )
+                
+            except HydrusExceptions.VetoException as e:
+                
+                self.SetStatus( CC.STATUS_VETOED, note = str( e ) )
+                
+            except Exception as e:
+                
+                self.SetStatus( CC.STATUS_ERROR, exception = e )
+                
+            
+        
+        file_seed_cache.NotifyFileSeedsUpdated( ( self, ) )
+        
+    
     def ImportPath( self, file_seed_cache, file_import_options, limited_mimes = None ):
         
+        prepared = self.PrepareImportPath( file_import_options, limited_mimes = limited_mimes )
+        
+        self.FinishImportPath( file_seed_cache, prepared )
+        
+    
+    def IsAPostURL( self ):
+        
+        if self.file_seed_type == FILE_SEED_TYPE_URL:
+            
+            ( url_type, match_name, can_parse ) = HG.client_controller.network_engine.domain_manager.GetURLParseCapability( self.file_seed_data )
+            
+            if url_type == HC.URL_TYPE_POST:
+                
+                return True
+                
+            
+        
+        return False
+        
+    
+    def IsDeleted( self ):
+        
+        return self.status == CC.STATUS_DELETED
+        
+    
+    def Normalise( self ):
+        
+        if self.file_seed_type == FILE_SEED_TYPE_URL:
+            
+            self.file_seed_data = HG.client_controller.network_engine.domain_manager.NormaliseURL( self.file_seed_data )
+            
+        
+    
+    def PrepareImportPath( self, file_import_options, limited_mimes = None ):
+        
+        # does everything up to the client files and db work, so several paths can be prepared at once
+        # returns what FinishImportPath needs, or None if the import already failed or was vetoed
+        
         try:
             
             if self.file_seed_type != FILE_SEED_TYPE_HDD:
@@ -945,14 +1206,18 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                     raise Exception( 'File failed to copy to temp path--see log for error.' )
                     
                 
-                self.Import( temp_path, file_import_options )
+                file_import_job = FileImportJob( temp_path, file_import_options )
                 
-            finally:
+                file_import_job.PrepareWork()
+                
+            except:
                 
                 HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
                 
+                raise
+                
             
-            self.WriteContentUpdates()
+            return ( os_file_handle, temp_path, file_import_job )
             
         except HydrusExceptions.MimeException as e:
             
@@ -967,35 +1232,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             self.SetStatus( CC.STATUS_ERROR, exception = e )
             
         
-        file_seed_cache.NotifyFileSeedsUpdated( ( self, ) )
-        
-    
-    def IsAPostURL( self ):
-        
-        if self.file_seed_type == FILE_SEED_TYPE_URL:
-            
-            ( url_type, match_name, can_parse ) = HG.client_controller.network_engine.domain_manager.GetURLParseCapability( self.file_seed_data )
-            
-            if url_type == HC.URL_TYPE_POST:
-                
-                return True
-                
-            
-        
-        return False
-        
-    
-    def IsDeleted( self ):
-        
-        return self.status == CC.STATUS_DELETED
-        
-    
-    def Normalise( self ):
-        
-        if self.file_seed_type == FILE_SEED_TYPE_URL:
-            
-            self.file_seed_data = HG.client_controller.network_engine.domain_manager.NormaliseURL( self.file_seed_data )
-            
+        return None
         
     
     def PredictPreImportStatus( self, file_import_options, tag_import_options, file_url = None ):
@@ -1096,11 +1333,15 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             HydrusData.Print( traceback.format_exc() )
             
         
+        global last_file_seed_status_change_id
+        
         self.status = status
         self.note = note
         
         self._UpdateModified()
         
+        last_file_seed_status_change_id = next( file_seed_status_change_ids )
+        
     
     def ShouldPresent( self, file_import_options, in_inbox = None ):
         
@@ -1510,6 +1751,11 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self._file_seeds = HydrusSerialisable.SerialisableList()
         
         self._file_seeds_to_indices = {}
+        self._file_seeds_to_statuses = {}
+        self._file_seeds_to_source_timestamps = {}
+        
+        self._statuses_to_indices = collections.defaultdict( list )
+        self._sorted_source_timestamps = []
         
         self._file_seed_cache_key = HydrusData.GenerateKey()
         
@@ -1517,6 +1763,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self._status_cache_generation_time = 0
         
         self._status_dirty = True
+        self._status_index_checked_change_id = 0
         
         self._lock = threading.Lock()
         
@@ -1526,6 +1773,39 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return len( self._file_seeds )
         
     
+    def _AddSourceTimestamp( self, file_seed ):
+        
+        source_timestamp = self._GetSourceTimestamp( file_seed )
+        
+        self._file_seeds_to_source_timestamps[ file_seed ] = source_timestamp
+        
+        bisect.insort( self._sorted_source_timestamps, source_timestamp )
+        
+    
+    def _CheckStatusIndex( self ):
+        
+        if self._status_index_checked_change_id == last_file_seed_status_change_id:
+            
+            return
+            
+        
+        # some file seed somewhere has changed status since we last looked, and it may have been one of ours without a notify
+        
+        self._status_index_checked_change_id = last_file_seed_status_change_id
+        
+        stale_file_seeds = [ file_seed for file_seed in self._file_seeds if file_seed.status != self._file_seeds_to_statuses[ file_seed ] ]
+        
+        if len( stale_file_seeds ) > 0:
+            
+            for file_seed in stale_file_seeds:
+                
+                self._UpdateFileSeedIndices( file_seed )
+                
+            
+            self._SetStatusDirty()
+            
+        
+    
     def _GenerateStatus( self ):
         
         self._status_cache = GenerateStatusesToCountsStatus( self._GetStatusesToCounts() )
@@ -1542,9 +1822,47 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         else:
             
-            return [ file_seed for file_seed in self._file_seeds if file_seed.status == status ]
+            self._CheckStatusIndex()
+            
+            return [ self._file_seeds[ index ] for index in self._statuses_to_indices.get( status, [] ) ]
+            
+        
+    
+    def _GetNextFileSeeds( self, status, num_to_get ):
+        
+        self._CheckStatusIndex()
+        
+        file_seeds = []
+        stale_file_seeds = []
+        
+        for index in self._statuses_to_indices.get( status, [] ):
+            
+            file_seed = self._file_seeds[ index ]
+            
+            if file_seed.status != status:
+                
+                # someone changed this without telling us
+                
+                stale_file_seeds.append( file_seed )
+                
+                continue
+                
+            
+            file_seeds.append( file_seed )
+            
+            if len( file_seeds ) >= num_to_get:
+                
+                break
+                
             
         
+        for file_seed in stale_file_seeds:
+            
+            self._UpdateFileSeedIndices( file_seed )
+            
+        
+        return file_seeds
+        
     
     def _GetSerialisableInfo( self ):
         
@@ -1568,12 +1886,9 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
     
     def _GetStatusesToCounts( self ):
         
-        statuses_to_counts = collections.Counter()
+        self._CheckStatusIndex()
         
-        for file_seed in self._file_seeds:
-            
-            statuses_to_counts[ file_seed.status ] += 1
-            
+        statuses_to_counts = collections.Counter( { status : len( indices ) for ( status, indices ) in self._statuses_to_indices.items() if len( indices ) > 0 } )
         
         return statuses_to_counts
         
@@ -1593,15 +1908,90 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             self._file_seeds = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_info )
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._RebuildIndices()
+            
+        
+    
+    def _RebuildIndices( self ):
+        
+        self._file_seeds_to_indices = {}
+        self._file_seeds_to_statuses = {}
+        self._file_seeds_to_source_timestamps = { file_seed : self._GetSourceTimestamp( file_seed ) for file_seed in self._file_seeds }
+        
+        self._statuses_to_indices = collections.defaultdict( list )
+        self._sorted_source_timestamps = sorted( self._file_seeds_to_source_timestamps.values() )
+        
+        self._ReindexFileSeeds( 0 )
+        
+    
+    def _ReindexFileSeeds( self, from_index ):
+        
+        # call this when the file seeds from this position onwards have moved
+        # everything before it is still correct, so the common cases of appending or working near the end of a big cache are cheap
+        
+        for indices in self._statuses_to_indices.values():
+            
+            del indices[ bisect.bisect_left( indices, from_index ) : ]
             
         
+        for index in range( from_index, len( self._file_seeds ) ):
+            
+            file_seed = self._file_seeds[ index ]
+            
+            status = file_seed.status
+            
+            self._file_seeds_to_indices[ file_seed ] = index
+            self._file_seeds_to_statuses[ file_seed ] = status
+            
+            self._statuses_to_indices[ status ].append( index )
+            
+        
+        self._SetStatusDirty()
+        
+    
+    def _RemoveSourceTimestamp( self, file_seed ):
+        
+        source_timestamp = self._file_seeds_to_source_timestamps.pop( file_seed )
+        
+        RemoveFromSortedList( self._sorted_source_timestamps, source_timestamp )
+        
     
     def _SetStatusDirty( self ):
         
         self._status_dirty = True
         
     
+    def _UpdateFileSeedIndices( self, file_seed ):
+        
+        if file_seed not in self._file_seeds_to_indices:
+            
+            return
+            
+        
+        index = self._file_seeds_to_indices[ file_seed ]
+        
+        # the caller may have an equal but different object, so check our own
+        file_seed = self._file_seeds[ index ]
+        
+        old_status = self._file_seeds_to_statuses[ file_seed ]
+        status = file_seed.status
+        
+        if status != old_status:
+            
+            RemoveFromSortedList( self._statuses_to_indices[ old_status ], index )
+            
+            bisect.insort( self._statuses_to_indices[ status ], index )
+            
+            self._file_seeds_to_statuses[ file_seed ] = status
+            
+        
+        if self._GetSourceTimestamp( file_seed ) != self._file_seeds_to_source_timestamps[ file_seed ]:
+            
+            self._RemoveSourceTimestamp( file_seed )
+            self._AddSourceTimestamp( file_seed )
+            
+        
+    
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
         if version == 1:
@@ -1819,6 +2209,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            first_new_index = len( self._file_seeds )
+            
             for file_seed in file_seeds:
                 
                 if self._HasFileSeed( file_seed ):
@@ -1843,8 +2235,10 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 self._file_seeds_to_indices[ file_seed ] = len( self._file_seeds ) - 1
                 
+                self._AddSourceTimestamp( file_seed )
+                
             
-            self._SetStatusDirty()
+            self._ReindexFileSeeds( first_new_index )
             
         
         self.NotifyFileSeedsUpdated( new_file_seeds )
@@ -1862,12 +2256,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 if index > 0:
                     
-                    self._file_seeds.remove( file_seed )
+                    file_seed = self._file_seeds.pop( index )
                     
                     self._file_seeds.insert( index - 1, file_seed )
                     
+                    self._ReindexFileSeeds( index - 1 )
+                    
                 
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
                 
             
         
@@ -1925,9 +2320,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             new_file_seeds.extend( self._file_seeds[-self.COMPACT_NUMBER:] )
             
             self._file_seeds = new_file_seeds
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
             
-            self._SetStatusDirty()
+            self._RebuildIndices()
             
         
     
@@ -1941,12 +2335,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 if index < len( self._file_seeds ) - 1:
                     
-                    self._file_seeds.remove( file_seed )
+                    file_seed = self._file_seeds.pop( index )
                     
                     self._file_seeds.insert( index + 1, file_seed )
                     
+                    self._ReindexFileSeeds( index )
+                    
                 
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
                 
             
         
@@ -1959,6 +2354,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             d = {}
             
+            self._CheckStatusIndex()
+            
             if self._status_dirty:
                 
                 self._GenerateStatus()
@@ -1989,7 +2386,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 return None
                 
             
-            earliest_timestamp = min( ( self._GetSourceTimestamp( file_seed ) for file_seed in self._file_seeds ) )
+            earliest_timestamp = self._sorted_source_timestamps[0]
             
         
         return earliest_timestamp
@@ -2012,13 +2409,9 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
             else:
                 
-                for file_seed in self._file_seeds:
-                    
-                    if file_seed.status == status:
-                        
-                        result += 1
-                        
-                    
+                self._CheckStatusIndex()
+                
+                result = len( self._statuses_to_indices.get( status, [] ) )
                 
             
         
@@ -2075,7 +2468,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 return 0
                 
             
-            latest_timestamp = max( ( self._GetSourceTimestamp( file_seed ) for file_seed in self._file_seeds ) )
+            latest_timestamp = self._sorted_source_timestamps[-1]
             
         
         return latest_timestamp
@@ -2085,33 +2478,30 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            for file_seed in self._file_seeds:
-                
-                if file_seed.status == status:
-                    
-                    return file_seed
-                    
-                
+            file_seeds = self._GetNextFileSeeds( status, 1 )
             
         
-        return None
+        if len( file_seeds ) == 0:
+            
+            return None
+            
+        
+        return file_seeds[0]
         
     
-    def GetNumNewFilesSince( self, since ):
+    def GetNextFileSeeds( self, status, num_to_get ):
         
-        num_files = 0
+        with self._lock:
+            
+            return self._GetNextFileSeeds( status, num_to_get )
+            
+        
+    
+    def GetNumNewFilesSince( self, since ):
         
         with self._lock:
             
-            for file_seed in self._file_seeds:
-                
-                source_timestamp = self._GetSourceTimestamp( file_seed )
-                
-                if source_timestamp >= since:
-                    
-                    num_files += 1
-                    
-                
+            num_files = len( self._sorted_source_timestamps ) - bisect.bisect_left( self._sorted_source_timestamps, since )
             
         
         return num_files
@@ -2156,6 +2546,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._CheckStatusIndex()
+            
             if self._status_dirty:
                 
                 self._GenerateStatus()
@@ -2169,6 +2561,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._CheckStatusIndex()
+            
             if self._status_dirty:
                 
                 return HydrusData.GetNow()
@@ -2190,6 +2584,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._CheckStatusIndex()
+            
             if self._status_dirty:
                 
                 self._GenerateStatus()
@@ -2222,6 +2618,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             index = min( index, len( self._file_seeds ) )
             
+            first_new_index = index
+            
             for file_seed in file_seeds:
                 
                 if self._HasFileSeed( file_seed ) or file_seed in new_file_seeds:
@@ -2235,12 +2633,12 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 self._file_seeds.insert( index, file_seed )
                 
+                self._AddSourceTimestamp( file_seed )
+                
                 index += 1
                 
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
-            
-            self._SetStatusDirty()
+            self._ReindexFileSeeds( first_new_index )
             
         
         self.NotifyFileSeedsUpdated( new_file_seeds )
@@ -2252,6 +2650,11 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            for file_seed in file_seeds:
+                
+                self._UpdateFileSeedIndices( file_seed )
+                
+            
             self._SetStatusDirty()
             
         
@@ -2264,11 +2667,25 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             file_seeds_to_delete = set( file_seeds )
             
-            self._file_seeds = HydrusSerialisable.SerialisableList( [ file_seed for file_seed in self._file_seeds if file_seed not in file_seeds_to_delete ] )
+            present_file_seeds_to_delete = [ file_seed for file_seed in file_seeds_to_delete if file_seed in self._file_seeds_to_indices ]
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            if len( present_file_seeds_to_delete ) > 0:
+                
+                first_removed_index = min( ( self._file_seeds_to_indices[ file_seed ] for file_seed in present_file_seeds_to_delete ) )
+                
+                for file_seed in present_file_seeds_to_delete:
+                    
+                    self._RemoveSourceTimestamp( file_seed )
+                    
+                    del self._file_seeds_to_indices[ file_seed ]
+                    del self._file_seeds_to_statuses[ file_seed ]
+                    
+                
+                self._file_seeds = HydrusSerialisable.SerialisableList( [ file_seed for file_seed in self._file_seeds if file_seed not in file_seeds_to_delete ] )
+                
+                self._ReindexFileSeeds( first_removed_index )
+                
             
-            self._SetStatusDirty()
             
         
         self.NotifyFileSeedsUpdated( file_seeds_to_delete )
@@ -2328,6 +2745,8 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
+            self._CheckStatusIndex()
+            
             if self._status_dirty:
                 
                 self._GenerateStatus()
@@ -124,61 +124,66 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
     
     def _WorkOnFiles( self, page_key ):
         
-        file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+        num_workers = HG.client_controller.new_options.GetInteger( 'file_import_workers' )
         
-        if file_seed is None:
+        file_seeds = self._file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, num_workers )
+        
+        if len( file_seeds ) == 0:
             
             return
             
         
         did_substantial_work = False
         
-        path = file_seed.file_seed_data
-        
         with self._lock:
             
             self._current_action = 'importing'
             
         
-        file_seed.ImportPath( self._file_seed_cache, self._file_import_options )
+        ClientImporting.ImportPaths( file_seeds, self._file_seed_cache, self._file_import_options )
         
         did_substantial_work = True
         
-        if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+        for file_seed in file_seeds:
             
-            if file_seed.ShouldPresent( self._file_import_options ):
-                
-                file_seed.PresentToPage( page_key )
-                
-                did_substantial_work = True
-                
+            path = file_seed.file_seed_data
             
-            if self._delete_after_success:
+            if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
                 
-                try:
-                    
-                    ClientPaths.DeletePath( path )
+                if file_seed.ShouldPresent( self._file_import_options ):
                     
-                except Exception as e:
+                    file_seed.PresentToPage( page_key )
                     
-                    HydrusData.ShowText( 'While attempting to delete ' + path + ', the following error occurred:' )
-                    HydrusData.ShowException( e )
+                    did_substantial_work = True
                     
                 
-                txt_path = path + '.txt'
-                
-                if os.path.exists( txt_path ):
+                if self._delete_after_success:
                     
                     try:
                         
-                        ClientPaths.DeletePath( txt_path )
+                        ClientPaths.DeletePath( path )
                         
                     except Exception as e:
                         
-                        HydrusData.ShowText( 'While attempting to delete ' + txt_path + ', the following error occurred:' )
+                        HydrusData.ShowText( 'While attempting to delete ' + path + ', the following error occurred:' )
                         HydrusData.ShowException( e )
                         
                     
+                    txt_path = path + '.txt'
+                    
+                    if os.path.exists( txt_path ):
+                        
+                        try:
+                            
+                            ClientPaths.DeletePath( txt_path )
+                            
+                        except Exception as e:
+                            
+                            HydrusData.ShowText( 'While attempting to delete ' + txt_path + ', the following error occurred:' )
+                            HydrusData.ShowException( e )
+                            
+                        
+                    
                 
             
         
@@ -575,15 +580,17 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         num_total_unknown = self._file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN )
         num_total_done = num_total - num_total_unknown
         
+        num_workers = HG.client_controller.new_options.GetInteger( 'file_import_workers' )
+        
         while True:
             
-            file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+            file_seeds = self._file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, num_workers )
             
             p1 = HC.options[ 'pause_import_folders_sync' ] or self._paused
             p2 = HydrusThreading.IsThreadShuttingDown()
             p3 = job_key.IsCancelled()
             
-            if file_seed is None or p1 or p2 or p3:
+            if len( file_seeds ) == 0 or p1 or p2 or p3:
                 
                 break
                 
@@ -597,91 +604,94 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 time_to_save = HydrusData.GetNow() + 600
                 
             
-            gauge_num_done = num_total_done + num_files_imported + 1
+            gauge_num_done = num_total_done + num_files_imported + len( file_seeds )
             
             job_key.SetVariable( 'popup_text_1', 'importing file ' + HydrusData.ConvertValueRangeToPrettyString( gauge_num_done, num_total ) )
             job_key.SetVariable( 'popup_gauge_1', ( gauge_num_done, num_total ) )
             
-            path = file_seed.file_seed_data
-            
-            file_seed.ImportPath( self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes )
+            ClientImporting.ImportPaths( file_seeds, self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes )
             
-            if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+            for file_seed in file_seeds:
                 
-                if file_seed.HasHash():
-                    
-                    hash = file_seed.GetHash()
+                path = file_seed.file_seed_data
+                
+                if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
                     
-                    if self._tag_import_options.HasAdditionalTags():
+                    if file_seed.HasHash():
                         
-                        in_inbox = HG.client_controller.Read( 'in_inbox', hash )
+                        hash = file_seed.GetHash()
                         
-                        downloaded_tags = []
-                        
-                        service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, in_inbox, hash, downloaded_tags ) # additional tags
-                        
-                        if len( service_keys_to_content_updates ) > 0:
+                        if self._tag_import_options.HasAdditionalTags():
                             
-                            HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                            in_inbox = HG.client_controller.Read( 'in_inbox', hash )
                             
-                        
-                    
-                    service_keys_to_tags = ClientTags.ServiceKeysToTags()
-                    
-                    for ( tag_service_key, filename_tagging_options ) in list(self._tag_service_keys_to_filename_tagging_options.items()):
-                        
-                        if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                            downloaded_tags = []
                             
-                            continue
+                            service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, in_inbox, hash, downloaded_tags ) # additional tags
+                            
+                            if len( service_keys_to_content_updates ) > 0:
+                                
+                                HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                                
                             
                         
-                        try:
+                        service_keys_to_tags = ClientTags.ServiceKeysToTags()
+                        
+                        for ( tag_service_key, filename_tagging_options ) in list(self._tag_service_keys_to_filename_tagging_options.items()):
                             
-                            tags = filename_tagging_options.GetTags( tag_service_key, path )
+                            if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                                
+                                continue
+                                
                             
-                            if len( tags ) > 0:
+                            try:
+                                
+                                tags = filename_tagging_options.GetTags( tag_service_key, path )
+                                
+                                if len( tags ) > 0:
+                                    
+                                    service_keys_to_tags[ tag_service_key ] = tags
+                                    
+                                
+                            except Exception as e:
                                 
-                                service_keys_to_tags[ tag_service_key ] = tags
+                                HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                                
+                                HydrusData.ShowException( e )
                                 
                             
-                        except Exception as e:
+                        
+                        if len( service_keys_to_tags ) > 0:
                             
-                            HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                            service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
                             
-                            HydrusData.ShowException( e )
+                            HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
                             
                         
                     
-                    if len( service_keys_to_tags ) > 0:
-                        
-                        service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
+                    num_files_imported += 1
+                    
+                    if hash not in presentation_hashes_fast:
                         
-                        HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                        if file_seed.ShouldPresent( self._file_import_options ):
+                            
+                            presentation_hashes.append( hash )
+                            
+                            presentation_hashes_fast.add( hash )
+                            
                         
                     
-                
-                num_files_imported += 1
-                
-                if hash not in presentation_hashes_fast:
+                elif file_seed.status == CC.STATUS_ERROR:
                     
-                    if file_seed.ShouldPresent( self._file_import_options ):
-                        
-                        presentation_hashes.append( hash )
-                        
-                        presentation_hashes_fast.add( hash )
-                        
+                    HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
                     
                 
-            elif file_seed.status == CC.STATUS_ERROR:
-                
-                HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
-                
-            
-            i += 1
-            
-            if i % 10 == 0:
+                i += 1
                 
-                self._ActionPaths()
+                if i % 10 == 0:
+                    
+                    self._ActionPaths()
+                    
                 
             
         
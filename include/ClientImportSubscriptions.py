@@ -607,6 +607,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                         
                         file_seed.SetStatus( status, note = note )
                         
+                        file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                        
                     except HydrusExceptions.NotFoundException:
                         
                         status = CC.STATUS_VETOED
@@ -615,6 +617,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                         
                         file_seed.SetStatus( status, note = note )
                         
+                        file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                        
                     except Exception as e:
                         
                         status = CC.STATUS_ERROR
@@ -623,6 +627,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                         
                         file_seed.SetStatus( status, exception = e )
                         
+                        file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                        
                         if isinstance( e, HydrusExceptions.DataMissing ):
                             
                             # DataMissing is a quick thing to avoid subscription abandons when lots of deleted files in e621 (or any other booru)
@@ -108,6 +108,61 @@ def GetRepeatingJobInitialDelay():
     
     return 0.5 + ( random.random() * 0.5 )
     
+def ImportPaths( file_seeds, file_seed_cache, file_import_options, limited_mimes = None ):
+    
+    # the temp copy, hashing, file info, thumbnail and phashes for each path run on the thread pool at the same time
+    # the client files and db work is then done here for the whole batch, with one db write, in the original order
+    
+    prepared_results = [ None for file_seed in file_seeds ]
+    done_events = [ threading.Event() for file_seed in file_seeds ]
+    
+    def do_it( i, file_seed ):
+        
+        try:
+            
+            prepared_results[ i ] = file_seed.PrepareImportPath( file_import_options, limited_mimes = limited_mimes )
+            
+        finally:
+            
+            done_events[ i ].set()
+            
+        
+    
+    if len( file_seeds ) == 1:
+        
+        do_it( 0, file_seeds[0] )
+        
+    else:
+        
+        for ( i, file_seed ) in enumerate( file_seeds ):
+            
+            HG.client_controller.CallToThread( do_it, i, file_seed )
+            
+        
+    
+    for done_event in done_events:
+        
+        done_event.wait()
+        
+    
+    file_import_jobs = [ prepared[2] for prepared in prepared_results if prepared is not None ]
+    
+    import_results = iter( ClientImportFileSeeds.FinishFileImportJobs( file_import_jobs ) )
+    
+    for ( file_seed, prepared ) in zip( file_seeds, prepared_results ):
+        
+        if prepared is None:
+            
+            import_result = None
+            
+        else:
+            
+            import_result = next( import_results )
+            
+        
+        file_seed.FinishImportPath( file_seed_cache, prepared, import_result = import_result )
+        
+    
 def PageImporterShouldStopWorking( page_key ):
     
     return HG.view_shutdown or not HG.client_controller.PageAlive( page_key )
@@ -273,7 +273,7 @@ class HydrusResourceBooruFile( HydrusResourceBooru ):
         
         path = client_files_manager.GetFilePath( hash, mime )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, hash = hash )
         
         return response_context
         
@@ -472,9 +472,11 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
             
             client_files_manager = HG.client_controller.client_files_manager
             
-            path = client_files_manager.GetThumbnailPath( media_result )
+            thumbnail_bytes = client_files_manager.GetThumbnailBytes( media_result )
             
-            response_context_mime = HC.APPLICATION_UNKNOWN
+            response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_UNKNOWN, body = thumbnail_bytes )
+            
+            return response_context
             
         elif mime in HC.AUDIO:
             
@@ -1365,7 +1367,7 @@ class HydrusResourceClientAPIRestrictedGetFilesGetFile( HydrusResourceClientAPIR
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, hash = hash )
         
         return response_context
         
@@ -1531,14 +1533,14 @@ class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClien
         
         try:
             
-            path = HG.client_controller.client_files_manager.GetThumbnailPath( media_result )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( media_result )
             
         except HydrusExceptions.FileMissingException:
             
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, body = thumbnail_bytes )
         
         return response_context
         
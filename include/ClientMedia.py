@@ -23,6 +23,23 @@ import itertools
 hashes_to_jpeg_quality = {}
 hashes_to_pixel_hashes = {}
 
+# a page of files mostly has nothing in most statuses, so they all share one empty set rather than each making their own
+EMPTY_TAGS = frozenset()
+
+def BuildStatusesToTags( status_and_tag_pairs ):
+    
+    statuses_to_tags = GenerateStatusesToTags()
+    
+    statuses_to_tags.update( HydrusData.BuildKeyToSetDict( status_and_tag_pairs ) )
+    
+    return statuses_to_tags
+    
+def GenerateStatusesToTags():
+    
+    return collections.defaultdict( lambda: EMPTY_TAGS )
+    
+EMPTY_STATUSES_TO_TAGS = GenerateStatusesToTags()
+
 def FlattenMedia( media_list ):
     
     flat_media = []
@@ -495,6 +512,8 @@ class DuplicatesManager( object ):
     
 class FileInfoManager( object ):
     
+    __slots__ = ( 'hash_id', 'hash', 'size', 'mime', 'width', 'height', 'duration', 'num_frames', 'has_audio', 'num_words' )
+    
     def __init__( self, hash_id, hash, size = None, mime = None, width = None, height = None, duration = None, num_frames = None, has_audio = None, num_words = None ):
         
         if mime is None:
@@ -579,6 +598,8 @@ class LocationsManager( object ):
     
     LOCAL_LOCATIONS = { CC.LOCAL_FILE_SERVICE_KEY, CC.TRASH_SERVICE_KEY, CC.COMBINED_LOCAL_FILE_SERVICE_KEY }
     
+    __slots__ = ( '_current', '_deleted', '_pending', '_petitioned', '_inbox', '_urls', '_service_keys_to_filenames', '_current_to_timestamps', '_file_modified_timestamp' )
+    
     def __init__( self, current, deleted, pending, petitioned, inbox = False, urls = None, service_keys_to_filenames = None, current_to_timestamps = None, file_modified_timestamp = None ):
         
         self._current = current
@@ -2215,6 +2236,9 @@ class MediaSingleton( Media ):
     
 class MediaResult( object ):
     
+    # the media result cache holds these in a WeakValueDictionary
+    __slots__ = ( '_file_info_manager', '_tags_manager', '_locations_manager', '_ratings_manager', '_file_viewing_stats_manager', '__weakref__' )
+    
     def __init__( self, file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ):
         
         self._file_info_manager = file_info_manager
@@ -2937,6 +2961,8 @@ class SortedList( object ):
     
 class TagsManager( object ):
     
+    __slots__ = ( '_tag_display_types_to_service_keys_to_statuses_to_tags', '_cache_is_dirty' )
+    
     def __init__( self, service_keys_to_statuses_to_tags ):
         
         self._tag_display_types_to_service_keys_to_statuses_to_tags = { ClientTags.TAG_DISPLAY_STORAGE : service_keys_to_statuses_to_tags }
@@ -2944,16 +2970,67 @@ class TagsManager( object ):
         self._cache_is_dirty = True
         
     
+    def _GetMutableStatusesToTags( self, service_key ):
+        
+        service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
+        
+        if service_key not in service_keys_to_statuses_to_tags:
+            
+            service_keys_to_statuses_to_tags[ service_key ] = GenerateStatusesToTags()
+            
+        
+        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        
+        # empty statuses share one frozen set, so give this service its own sets before anything edits them
+        
+        for status in ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_DELETED, HC.CONTENT_STATUS_PENDING, HC.CONTENT_STATUS_PETITIONED ):
+            
+            tags = statuses_to_tags.get( status, EMPTY_TAGS )
+            
+            if not isinstance( tags, set ):
+                
+                statuses_to_tags[ status ] = set( tags )
+                
+            
+        
+        return statuses_to_tags
+        
+    
     def _GetServiceKeysToStatusesToTags( self, tag_display_type ):
         
-        self._RecalcCaches()
+        if self._cache_is_dirty:
+            
+            service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
+            
+            self._SetCombinedStatusesToTags( service_keys_to_statuses_to_tags )
+            
+            # the display views are only worked out when something asks for them
+            
+            self._tag_display_types_to_service_keys_to_statuses_to_tags = { ClientTags.TAG_DISPLAY_STORAGE : service_keys_to_statuses_to_tags }
+            
+            self._cache_is_dirty = False
+            
+        
+        if tag_display_type not in self._tag_display_types_to_service_keys_to_statuses_to_tags:
+            
+            self._RecalcCache( tag_display_type )
+            
         
         return self._tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ]
         
     
-    def _RecalcCaches( self ):
+    def _GetStatusesToTags( self, service_key, tag_display_type ):
         
-        if self._cache_is_dirty:
+        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        
+        return service_keys_to_statuses_to_tags.get( service_key, EMPTY_STATUSES_TO_TAGS )
+        
+    
+    def _RecalcCache( self, tag_display_type ):
+        
+        destination_service_keys_to_statuses_to_tags = collections.defaultdict( GenerateStatusesToTags )
+        
+        if tag_display_type == ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS:
             
             # siblings (parents later)
             
@@ -2964,93 +3041,131 @@ class TagsManager( object ):
             # we'll want to keep this live updating capability though so we can keep up with content updates without needing a db refresh
             # main difference is cache_dirty will default to False or similar
             
-            source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
-            
-            destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            source_service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
             
             for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
                 
+                if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                    
+                    continue
+                    
+                
                 destination_statuses_to_tags = tag_siblings_manager.CollapseStatusesToTags( service_key, source_statuses_to_tags )
                 
+                # most files have no siblings to collapse, in which case we share the storage tags
+                
+                if False not in ( destination_statuses_to_tags[ status ] is source_tags for ( status, source_tags ) in source_statuses_to_tags.items() ):
+                    
+                    destination_statuses_to_tags = source_statuses_to_tags
+                    
+                
                 destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
                 
             
-            self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ] = destination_service_keys_to_statuses_to_tags
+        else:
             
             # display filtering
             
             tag_display_manager = HG.client_controller.tag_display_manager
             
-            cache_jobs = []
+            source_service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS )
             
-            cache_jobs.append( ( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SINGLE_MEDIA ) )
-            cache_jobs.append( ( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SELECTION_LIST ) )
-            
-            for ( source_tag_display_type, dest_tag_display_type ) in cache_jobs:
+            for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
                 
-                source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ source_tag_display_type ]
+                if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                    
+                    continue
+                    
                 
-                destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+                destination_statuses_to_tags = source_statuses_to_tags
                 
-                for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+                if tag_display_manager.FiltersTags( tag_display_type, service_key ):
                     
-                    if tag_display_manager.FiltersTags( dest_tag_display_type, service_key ):
+                    for ( status, source_tags ) in source_statuses_to_tags.items():
                         
-                        destination_statuses_to_tags = HydrusData.default_dict_set()
+                        dest_tags = tag_display_manager.FilterTags( tag_display_type, service_key, source_tags )
                         
-                        for ( status, source_tags ) in source_statuses_to_tags.items():
-                            
-                            dest_tags = tag_display_manager.FilterTags( dest_tag_display_type, service_key, source_tags )
+                        if len( source_tags ) != len( dest_tags ):
                             
-                            if len( source_tags ) != len( dest_tags ):
+                            if destination_statuses_to_tags is source_statuses_to_tags:
                                 
-                                destination_statuses_to_tags[ status ] = dest_tags
+                                destination_statuses_to_tags = GenerateStatusesToTags()
                                 
-                            else:
-                                
-                                destination_statuses_to_tags[ status ] = source_tags
+                                destination_statuses_to_tags.update( source_statuses_to_tags )
                                 
                             
-                        
-                        destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
-                        
-                    else:
-                        
-                        destination_service_keys_to_statuses_to_tags[ service_key ] = source_statuses_to_tags
+                            destination_statuses_to_tags[ status ] = dest_tags
+                            
                         
                     
                 
-                self._tag_display_types_to_service_keys_to_statuses_to_tags[ dest_tag_display_type ] = destination_service_keys_to_statuses_to_tags
+                destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
                 
             
-            # combined service merge calculation
-            # would be great if this also could be db pre-computed
+        
+        self._SetCombinedStatusesToTags( destination_service_keys_to_statuses_to_tags )
+        
+        self._tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ] = destination_service_keys_to_statuses_to_tags
+        
+    
+    @staticmethod
+    def _SetCombinedStatusesToTags( service_keys_to_statuses_to_tags ):
+        
+        # combined service merge calculation
+        # would be great if this also could be db pre-computed
+        
+        populated_statuses_to_tags = []
+        
+        for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+            
+            if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                
+                continue
+                
             
-            for ( tag_display_type, service_keys_to_statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags.items():
+            if True in ( len( tags ) > 0 for tags in statuses_to_tags.values() ):
                 
-                combined_statuses_to_tags = HydrusData.default_dict_set()
+                populated_statuses_to_tags.append( statuses_to_tags )
                 
-                for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+            
+        
+        if len( populated_statuses_to_tags ) == 0:
+            
+            combined_statuses_to_tags = EMPTY_STATUSES_TO_TAGS
+            
+        elif len( populated_statuses_to_tags ) == 1:
+            
+            # nothing to merge, so combined can share the one service's tags
+            
+            combined_statuses_to_tags = populated_statuses_to_tags[0]
+            
+        else:
+            
+            combined_statuses_to_tags = GenerateStatusesToTags()
+            
+            for statuses_to_tags in populated_statuses_to_tags:
+                
+                for ( status, tags ) in statuses_to_tags.items():
                     
-                    if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                    if len( tags ) == 0:
                         
                         continue
                         
                     
-                    for ( status, tags ) in statuses_to_tags.items():
+                    if status in combined_statuses_to_tags:
                         
                         combined_statuses_to_tags[ status ].update( tags )
                         
+                    else:
+                        
+                        combined_statuses_to_tags[ status ] = set( tags )
+                        
                     
                 
-                service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
-                
-            
-            #
-            
-            self._cache_is_dirty = False
             
         
+        service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+        
     
     @staticmethod
     def MergeTagsManagers( tags_managers ):
@@ -3098,14 +3213,12 @@ class TagsManager( object ):
     
     def DeletePending( self, service_key ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetStatusesToTags( service_key, ClientTags.TAG_DISPLAY_STORAGE )
         
         if len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] ) + len( statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] ) > 0:
             
-            statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] = set()
-            statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] = set()
+            statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] = EMPTY_TAGS
+            statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] = EMPTY_TAGS
             
             self._cache_is_dirty = True
             
@@ -3113,40 +3226,36 @@ class TagsManager( object ):
     
     def Duplicate( self ):
         
-        dupe_tags_manager = TagsManager( {} )
+        # only storage is copied, the dupe works out its own display views when it needs them
         
-        dupe_tag_display_types_to_service_keys_to_statuses_to_tags = dict()
+        dupe_service_keys_to_statuses_to_tags = collections.defaultdict( GenerateStatusesToTags )
         
-        for ( tag_display_type, service_keys_to_statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags.items():
-            
-            dupe_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        for ( service_key, statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ].items():
             
-            for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+            if service_key == CC.COMBINED_TAG_SERVICE_KEY:
                 
-                dupe_statuses_to_tags = HydrusData.default_dict_set()
+                continue
                 
-                for ( status, tags ) in statuses_to_tags.items():
+            
+            dupe_statuses_to_tags = GenerateStatusesToTags()
+            
+            for ( status, tags ) in statuses_to_tags.items():
+                
+                if len( tags ) > 0:
                     
                     dupe_statuses_to_tags[ status ] = set( tags )
                     
                 
-                dupe_service_keys_to_statuses_to_tags[ service_key ] = dupe_statuses_to_tags
-                
             
-            dupe_tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ] = dupe_service_keys_to_statuses_to_tags
+            dupe_service_keys_to_statuses_to_tags[ service_key ] = dupe_statuses_to_tags
             
         
-        dupe_tags_manager._tag_display_types_to_service_keys_to_statuses_to_tags = dupe_tag_display_types_to_service_keys_to_statuses_to_tags
-        dupe_tags_manager._cache_is_dirty = self._cache_is_dirty
-        
-        return dupe_tags_manager
+        return TagsManager( dupe_service_keys_to_statuses_to_tags )
         
     
     def GetComparableNamespaceSlice( self, namespaces, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
+        combined_statuses_to_tags = self._GetStatusesToTags( CC.COMBINED_TAG_SERVICE_KEY, tag_display_type )
         
         combined_current = combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
         combined_pending = combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
@@ -3171,36 +3280,32 @@ class TagsManager( object ):
     
     def GetCurrent( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetStatusesToTags( service_key, tag_display_type )
         
         return statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
         
     
     def GetCurrentAndPending( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+        statuses_to_tags = self._GetStatusesToTags( service_key, tag_display_type )
         
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        current_and_pending = set( statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] )
         
-        return statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+        current_and_pending.update( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+        
+        return current_and_pending
         
     
     def GetDeleted( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetStatusesToTags( service_key, tag_display_type )
         
         return statuses_to_tags[ HC.CONTENT_STATUS_DELETED ]
         
     
     def GetNamespaceSlice( self, namespaces, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
+        combined_statuses_to_tags = self._GetStatusesToTags( CC.COMBINED_TAG_SERVICE_KEY, tag_display_type )
         
         combined_current = combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
         combined_pending = combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
@@ -3218,9 +3323,7 @@ class TagsManager( object ):
         
         num_tags = 0
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetStatusesToTags( service_key, tag_display_type )
         
         if include_current_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] )
         if include_pending_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
@@ -3230,18 +3333,14 @@ class TagsManager( object ):
     
     def GetPending( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetStatusesToTags( service_key, tag_display_type )
         
         return statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
         
     
     def GetPetitioned( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetStatusesToTags( service_key, tag_display_type )
         
         return statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ]
         
@@ -3255,16 +3354,12 @@ class TagsManager( object ):
     
     def GetStatusesToTags( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        return service_keys_to_statuses_to_tags[ service_key ]
+        return self._GetStatusesToTags( service_key, tag_display_type )
         
     
     def HasTag( self, tag, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-        
-        combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
+        combined_statuses_to_tags = self._GetStatusesToTags( CC.COMBINED_TAG_SERVICE_KEY, tag_display_type )
         
         return tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] or tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
         
@@ -3276,9 +3371,7 @@ class TagsManager( object ):
     
     def ProcessContentUpdate( self, service_key, content_update ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
-        
-        statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+        statuses_to_tags = self._GetMutableStatusesToTags( service_key )
         
         ( data_type, action, row ) = content_update.ToTuple()
         
@@ -3326,7 +3419,7 @@ class TagsManager( object ):
     
     def ResetService( self, service_key ):
         
-        service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+        service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
         
         if service_key in service_keys_to_statuses_to_tags:
             
@@ -5,6 +5,8 @@ from . import HydrusData
 from . import HydrusGlobals as HG
 from . import HydrusTagArchive
 import os
+import queue
+import threading
 
 pair_types_to_content_types = {}
 
@@ -77,6 +79,11 @@ class MigrationDestinationHTA( MigrationDestination ):
     
     def CleanUp( self ):
         
+        if self._hta is None:
+            
+            return
+            
+        
         self._hta.CommitBigJob()
         
         if HydrusData.TimeHasPassed( self._time_started + 120 ):
@@ -138,6 +145,11 @@ class MigrationDestinationHTPA( MigrationDestination ):
     
     def CleanUp( self ):
         
+        if self._htpa is None:
+            
+            return
+            
+        
         self._htpa.CommitBigJob()
         
         if HydrusData.TimeHasPassed( self._time_started + 120 ):
@@ -342,18 +354,20 @@ class MigrationJob( object ):
         
         self._controller.pub( 'message', job_key )
         
-        job_key.SetVariable( 'popup_text_1', 'preparing source' )
-        
-        self._source.Prepare()
-        
-        job_key.SetVariable( 'popup_text_1', 'preparing destination' )
-        
-        self._destination.Prepare()
-        
-        job_key.SetVariable( 'popup_text_1', 'beginning work' )
-        
         try:
             
+            # prepare is in here so a source or destination that fails to prepare still gets cleaned up
+            
+            job_key.SetVariable( 'popup_text_1', 'preparing source' )
+            
+            self._source.Prepare()
+            
+            job_key.SetVariable( 'popup_text_1', 'preparing destination' )
+            
+            self._destination.Prepare()
+            
+            job_key.SetVariable( 'popup_text_1', 'beginning work' )
+            
             while self._source.StillWorkToDo():
                 
                 progress_statement = self._destination.DoSomeWork( self._source )
@@ -372,11 +386,16 @@ class MigrationJob( object ):
             
             job_key.SetVariable( 'popup_text_1', 'done, cleaning up source' )
             
-            self._source.CleanUp()
-            
-            job_key.SetVariable( 'popup_text_1', 'done, cleaning up destination' )
-            
-            self._destination.CleanUp()
+            try:
+                
+                self._source.CleanUp()
+                
+            finally:
+                
+                job_key.SetVariable( 'popup_text_1', 'done, cleaning up destination' )
+                
+                self._destination.CleanUp()
+                
             
             job_key.SetVariable( 'popup_text_1', 'done!' )
             
@@ -435,32 +454,22 @@ class MigrationSourceHTA( MigrationSource ):
         self._hashes = hashes
         self._tag_filter = tag_filter
         
-        self._hta = None
         self._source_hash_type = None
-        self._iterator = None
+        
+        # the archive is read, filtered and converted on its own thread, a few chunks ahead of the destination
+        
+        self._chunks = queue.Queue( maxsize = 8 )
+        self._stop_reading = threading.Event()
+        self._reader_thread = None
         
     
     def _ConvertHashes( self, source_hash_type, desired_hash_type, data ):
         
         if source_hash_type != desired_hash_type:
             
-            fixed_data = []
-            
-            for ( hash, tags ) in data:
-                
-                result = self._controller.Read( 'file_hashes', ( hash, ), source_hash_type, desired_hash_type )
-                
-                if len( result ) == 0:
-                    
-                    continue
-                    
-                
-                desired_hash = result[0]
-                
-                fixed_data.append( ( desired_hash, tags ) )
-                
+            hashes_to_desired_hashes = self._controller.Read( 'file_hashes_mapping', [ hash for ( hash, tags ) in data ], source_hash_type, desired_hash_type )
             
-            data = fixed_data
+            data = [ ( hashes_to_desired_hashes[ hash ], tags ) for ( hash, tags ) in data if hash in hashes_to_desired_hashes ]
             
         
         return data
@@ -475,58 +484,15 @@ class MigrationSourceHTA( MigrationSource ):
         
         if self._file_service_key != CC.COMBINED_FILE_SERVICE_KEY:
             
-            filtered_data = []
-            
-            all_hashes = [ hash for ( hash, tags ) in data ]
-            
-            hashes_to_media_results = { media_result.GetHash() : media_result for media_result in self._controller.Read( 'media_results', all_hashes ) }
-            
-            for ( hash, tags ) in data:
-                
-                if hash in hashes_to_media_results:
-                    
-                    media_result = hashes_to_media_results[ hash ]
-                    
-                    if self._file_service_key not in media_result.GetLocationsManager().GetCurrent():
-                        
-                        continue
-                        
-                    
-                    filtered_data.append( ( hash, tags ) )
-                    
-                
+            hashes_in_service = self._controller.Read( 'file_hashes_mapping', [ hash for ( hash, tags ) in data ], 'sha256', 'sha256', file_service_key = self._file_service_key )
             
-            data = filtered_data
+            data = [ ( hash, tags ) for ( hash, tags ) in data if hash in hashes_in_service ]
             
         
         return data
         
     
-    def _SHA256FilteringNeeded( self ):
-        
-        return self._hashes is not None or self._file_service_key != CC.COMBINED_FILE_SERVICE_KEY
-        
-    
-    def CleanUp( self ):
-        
-        self._hta.CommitBigJob()
-        
-        self._hta.Close()
-        
-        self._hta = None
-        self._iterator = None
-        
-    
-    def GetSomeData( self ):
-        
-        data = HydrusData.PullNFromIterator( self._iterator, 256 )
-        
-        if len( data ) == 0:
-            
-            self._work_to_do = False
-            
-            return data
-            
+    def _ProcessChunk( self, data ):
         
         if not self._tag_filter.AllowsEverything():
             
@@ -576,15 +542,111 @@ class MigrationSourceHTA( MigrationSource ):
         return data
         
     
-    def Prepare( self ):
+    def _PutChunk( self, chunk ):
         
-        self._hta = HydrusTagArchive.HydrusTagArchive( self._path )
+        while not self._stop_reading.is_set():
+            
+            try:
+                
+                self._chunks.put( chunk, timeout = 0.5 )
+                
+                return
+                
+            except queue.Full:
+                
+                continue
+                
+            
         
-        self._hta.BeginBigJob()
+    
+    def _SHA256FilteringNeeded( self ):
         
-        self._source_hash_type = HydrusTagArchive.hash_type_to_str_lookup[ self._hta.GetHashType() ]
+        return self._hashes is not None or self._file_service_key != CC.COMBINED_FILE_SERVICE_KEY
         
-        self._iterator = self._hta.IterateMappings()
+    
+    def _THREADReadArchive( self ):
+        
+        # the archive's sqlite connection has to live on this thread, so we open and close it here
+        
+        hta = None
+        
+        try:
+            
+            hta = HydrusTagArchive.HydrusTagArchive( self._path )
+            
+            hta.BeginBigJob()
+            
+            self._source_hash_type = HydrusTagArchive.hash_type_to_str_lookup[ hta.GetHashType() ]
+            
+            iterator = hta.IterateMappings()
+            
+            while not self._stop_reading.is_set():
+                
+                data = HydrusData.PullNFromIterator( iterator, 256 )
+                
+                if len( data ) == 0:
+                    
+                    break
+                    
+                
+                self._PutChunk( self._ProcessChunk( data ) )
+                
+            
+        except Exception as e:
+            
+            self._PutChunk( e )
+            
+        finally:
+            
+            if hta is not None:
+                
+                hta.CommitBigJob()
+                
+                hta.Close()
+                
+            
+            self._PutChunk( None )
+            
+        
+    
+    def CleanUp( self ):
+        
+        self._stop_reading.set()
+        
+        if self._reader_thread is not None:
+            
+            self._reader_thread.join()
+            
+            self._reader_thread = None
+            
+        
+    
+    def GetSomeData( self ):
+        
+        chunk = self._chunks.get()
+        
+        if chunk is None:
+            
+            self._work_to_do = False
+            
+            return []
+            
+        
+        if isinstance( chunk, Exception ):
+            
+            self._work_to_do = False
+            
+            raise chunk
+            
+        
+        return chunk
+        
+    
+    def Prepare( self ):
+        
+        self._reader_thread = threading.Thread( target = self._THREADReadArchive, name = 'migration archive reader', daemon = True )
+        
+        self._reader_thread.start()
         
     
 class MigrationSourceHTPA( MigrationSource ):
@@ -605,6 +667,11 @@ class MigrationSourceHTPA( MigrationSource ):
     
     def CleanUp( self ):
         
+        if self._htpa is None:
+            
+            return
+            
+        
         self._htpa.CommitBigJob()
         
         self._htpa.Close()
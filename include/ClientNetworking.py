@@ -8,6 +8,7 @@ from . import HydrusNetwork
 from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusSerialisable
+import heapq
 import itertools
 import os
 import random
@@ -60,15 +61,29 @@ class NetworkEngine( object ):
         
         self._active_domains_counter = collections.Counter()
         
+        # jobs with the same network contexts get the same answer from the bandwidth manager, so they queue together and only the first in each queue is checked
+        # jobs waiting for a slot queue by domain, so a full domain costs nothing until one of its jobs finishes
+        
         self._jobs_awaiting_validity = []
         self._current_validation_process = None
-        self._jobs_awaiting_bandwidth = []
+        self._jobs_awaiting_bandwidth = collections.OrderedDict()
+        self._network_contexts_to_bandwidth_blocking_jobs = {}
         self._jobs_awaiting_login = []
         self._current_login_process = None
-        self._jobs_awaiting_slot = []
+        self._jobs_awaiting_slot = collections.OrderedDict()
         self._jobs_running = []
         
+        # jobs that are asleep wait here, ordered by wake time, until they are due
+        
+        self._sleeping_jobs = []
+        self._sleeping_jobs_to_sleep_data = {}
+        self._sleep_ids = itertools.count()
+        
+        self._jobs_to_wake_lock = threading.Lock()
+        self._jobs_to_wake = set()
+        
         self._pause_all_new_network_traffic = self.controller.new_options.GetBoolean( 'pause_all_new_network_traffic' )
+        self._slot_wait_status = None
         
         self._is_running = False
         self._is_shutdown = False
@@ -77,6 +92,219 @@ class NetworkEngine( object ):
         self.controller.sub( self, 'RefreshOptions', 'notify_new_options' )
         
     
+    def _AddJobAwaitingBandwidth( self, job, at_front = False ):
+        
+        network_contexts = tuple( job.GetNetworkContexts() )
+        
+        if network_contexts not in self._jobs_awaiting_bandwidth:
+            
+            self._jobs_awaiting_bandwidth[ network_contexts ] = collections.deque()
+            
+        
+        queue = self._jobs_awaiting_bandwidth[ network_contexts ]
+        
+        if at_front or not job.ObeysBandwidth():
+            
+            # a job coming back from a nap was at the front already, and one that ignores bandwidth will get through regardless, so don't make either wait behind the others
+            
+            queue.appendleft( job )
+            
+        else:
+            
+            queue.append( job )
+            
+        
+    
+    def _AddJobAwaitingSlot( self, job, at_front = False ):
+        
+        second_level_domain = job.GetSecondLevelDomain()
+        
+        if second_level_domain not in self._jobs_awaiting_slot:
+            
+            self._jobs_awaiting_slot[ second_level_domain ] = collections.deque()
+            
+        
+        queue = self._jobs_awaiting_slot[ second_level_domain ]
+        
+        if at_front:
+            
+            queue.appendleft( job )
+            
+        else:
+            
+            queue.append( job )
+            
+        
+        if self._slot_wait_status is not None:
+            
+            job.SetStatus( self._slot_wait_status )
+            
+        elif self._active_domains_counter[ second_level_domain ] >= self.MAX_JOBS_PER_DOMAIN:
+            
+            job.SetStatus( 'waiting for a slot on this domain' )
+            
+        else:
+            
+            job.SetStatus( 'waiting for a slot\u2026' )
+            
+        
+    
+    def _GetQueueDepths( self ):
+        
+        job_statuses_to_counts = collections.Counter()
+        second_level_domains_to_counts = collections.Counter()
+        
+        job_statuses_to_counts[ JOB_STATUS_AWAITING_VALIDITY ] = len( self._jobs_awaiting_validity )
+        job_statuses_to_counts[ JOB_STATUS_AWAITING_LOGIN ] = len( self._jobs_awaiting_login )
+        job_statuses_to_counts[ JOB_STATUS_RUNNING ] = len( self._jobs_running )
+        
+        for queue in self._jobs_awaiting_bandwidth.values():
+            
+            job_statuses_to_counts[ JOB_STATUS_AWAITING_BANDWIDTH ] += len( queue )
+            
+            if len( queue ) > 0:
+                
+                second_level_domains_to_counts[ queue[0].GetSecondLevelDomain() ] += len( queue )
+                
+            
+        
+        for ( second_level_domain, queue ) in self._jobs_awaiting_slot.items():
+            
+            job_statuses_to_counts[ JOB_STATUS_AWAITING_SLOT ] += len( queue )
+            
+            second_level_domains_to_counts[ second_level_domain ] += len( queue )
+            
+        
+        for ( job_status, job ) in self._IterateSleepingJobs():
+            
+            job_statuses_to_counts[ job_status ] += 1
+            
+        
+        return ( job_statuses_to_counts, second_level_domains_to_counts )
+        
+    
+    def _IterateSleepingJobs( self ):
+        
+        for ( wake_time, sleep_id, job_status, job ) in self._sleeping_jobs:
+            
+            # stale entries for jobs that were woken early are left in the heap and skipped
+            
+            if job in self._sleeping_jobs_to_sleep_data and self._sleeping_jobs_to_sleep_data[ job ][0] == sleep_id:
+                
+                yield ( job_status, job )
+                
+            
+        
+    
+    def _PushSleepingJob( self, job, job_status, wake_time ):
+        
+        sleep_id = next( self._sleep_ids )
+        
+        self._sleeping_jobs_to_sleep_data[ job ] = ( sleep_id, job_status )
+        
+        heapq.heappush( self._sleeping_jobs, ( wake_time, sleep_id, job_status, job ) )
+        
+    
+    def _ReturnJob( self, job, job_status ):
+        
+        if job_status == JOB_STATUS_AWAITING_VALIDITY:
+            
+            self._jobs_awaiting_validity.append( job )
+            
+        elif job_status == JOB_STATUS_AWAITING_BANDWIDTH:
+            
+            self._AddJobAwaitingBandwidth( job, at_front = True )
+            
+        elif job_status == JOB_STATUS_AWAITING_LOGIN:
+            
+            self._jobs_awaiting_login.append( job )
+            
+        elif job_status == JOB_STATUS_AWAITING_SLOT:
+            
+            self._AddJobAwaitingSlot( job, at_front = True )
+            
+        
+    
+    def _SleepJob( self, job, job_status ):
+        
+        self._PushSleepingJob( job, job_status, job.GetWakeTime() )
+        
+    
+    def _WakeJobs( self ):
+        
+        with self._jobs_to_wake_lock:
+            
+            jobs_to_wake = self._jobs_to_wake
+            
+            self._jobs_to_wake = set()
+            
+        
+        if len( jobs_to_wake ) > 0:
+            
+            network_contexts_to_check = set()
+            second_level_domains_to_check = set()
+            
+            for job in jobs_to_wake:
+                
+                if job in self._sleeping_jobs_to_sleep_data:
+                    
+                    ( sleep_id, job_status ) = self._sleeping_jobs_to_sleep_data[ job ]
+                    
+                    self._PushSleepingJob( job, job_status, 0 )
+                    
+                elif job not in self._jobs_running:
+                    
+                    network_contexts_to_check.add( tuple( job.GetNetworkContexts() ) )
+                    second_level_domains_to_check.add( job.GetSecondLevelDomain() )
+                    
+                
+            
+            # a woken job waiting behind others for bandwidth might have been overridden, so it goes to the front
+            # a cancelled one just gets cleared out
+            
+            for network_contexts in network_contexts_to_check:
+                
+                if network_contexts in self._jobs_awaiting_bandwidth:
+                    
+                    queue = self._jobs_awaiting_bandwidth[ network_contexts ]
+                    
+                    woken_jobs = [ job for job in queue if job in jobs_to_wake and not job.IsDone() ]
+                    other_jobs = [ job for job in queue if job not in jobs_to_wake ]
+                    
+                    self._jobs_awaiting_bandwidth[ network_contexts ] = collections.deque( woken_jobs + other_jobs )
+                    
+                
+            
+            for second_level_domain in second_level_domains_to_check:
+                
+                if second_level_domain in self._jobs_awaiting_slot:
+                    
+                    queue = self._jobs_awaiting_slot[ second_level_domain ]
+                    
+                    self._jobs_awaiting_slot[ second_level_domain ] = collections.deque( ( job for job in queue if job not in jobs_to_wake or not job.IsDone() ) )
+                    
+                
+            
+        
+        now = HydrusData.GetNow()
+        
+        # a job is asleep until the second after its wake time
+        
+        while len( self._sleeping_jobs ) > 0 and self._sleeping_jobs[0][0] < now:
+            
+            ( wake_time, sleep_id, job_status, job ) = heapq.heappop( self._sleeping_jobs )
+            
+            if job not in self._sleeping_jobs_to_sleep_data or self._sleeping_jobs_to_sleep_data[ job ][0] != sleep_id:
+                
+                continue
+                
+            
+            del self._sleeping_jobs_to_sleep_data[ job ]
+            
+            self._ReturnJob( job, job_status )
+            
+        
+    
     def AddJob( self, job ):
         
         if HG.network_report_mode:
@@ -111,20 +339,31 @@ class NetworkEngine( object ):
             jobs = []
             
             jobs.extend( ( ( JOB_STATUS_AWAITING_VALIDITY, j ) for j in self._jobs_awaiting_validity ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_BANDWIDTH, j ) for j in self._jobs_awaiting_bandwidth ) )
+            jobs.extend( ( ( JOB_STATUS_AWAITING_BANDWIDTH, j ) for j in itertools.chain.from_iterable( self._jobs_awaiting_bandwidth.values() ) ) )
             jobs.extend( ( ( JOB_STATUS_AWAITING_LOGIN, j ) for j in self._jobs_awaiting_login ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_SLOT, j ) for j in self._jobs_awaiting_slot ) )
+            jobs.extend( ( ( JOB_STATUS_AWAITING_SLOT, j ) for j in itertools.chain.from_iterable( self._jobs_awaiting_slot.values() ) ) )
+            jobs.extend( self._IterateSleepingJobs() )
             jobs.extend( ( ( JOB_STATUS_RUNNING, j ) for j in self._jobs_running ) )
             
             return jobs
             
         
     
+    def GetQueueDepths( self ):
+        
+        with self._lock:
+            
+            return self._GetQueueDepths()
+            
+        
+    
     def IsBusy( self ):
         
         with self._lock:
             
-            return len( self._jobs_awaiting_validity ) + len( self._jobs_awaiting_bandwidth ) + len( self._jobs_awaiting_login ) + len( self._jobs_awaiting_slot ) + len( self._jobs_running ) > 50
+            ( job_statuses_to_counts, second_level_domains_to_counts ) = self._GetQueueDepths()
+            
+            return sum( job_statuses_to_counts.values() ) > 50
             
         
     
@@ -154,7 +393,9 @@ class NetworkEngine( object ):
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job, JOB_STATUS_AWAITING_VALIDITY )
+                
+                return False
                 
             elif not job.IsValid():
                 
@@ -190,7 +431,7 @@ class NetworkEngine( object ):
                 
             else:
                 
-                self._jobs_awaiting_bandwidth.append( job )
+                self._AddJobAwaitingBandwidth( job )
                 
                 return False
                 
@@ -207,25 +448,50 @@ class NetworkEngine( object ):
                 
             
         
-        def ProcessBandwidthJob( job ):
+        def ProcessBandwidthQueue( network_contexts, queue ):
             
-            if job.IsDone():
-                
-                return False
-                
-            elif job.IsAsleep():
-                
-                return True
+            while len( queue ) > 0:
                 
-            elif not job.BandwidthOK():
+                job = queue[0]
                 
-                return True
-                
-            else:
+                if job.IsDone():
+                    
+                    queue.popleft()
+                    
+                elif job.IsAsleep():
+                    
+                    if self._network_contexts_to_bandwidth_blocking_jobs.get( network_contexts, None ) == ( job, job.GetWakeTime() ):
+                        
+                        # this job is napping until the bandwidth for all of us frees up
+                        
+                        return
+                        
+                    
+                    # it is asleep for its own reasons, so let the jobs behind it have a go
+                    
+                    queue.popleft()
+                    
+                    self._SleepJob( job, JOB_STATUS_AWAITING_BANDWIDTH )
+                    
+                elif not job.BandwidthOK():
+                    
+                    # everything behind this job shares its network contexts, so it is blocked too
+                    
+                    self._network_contexts_to_bandwidth_blocking_jobs[ network_contexts ] = ( job, job.GetWakeTime() )
+                    
+                    return
+                    
+                else:
+                    
+                    queue.popleft()
+                    
+                    self._jobs_awaiting_login.append( job )
+                    
                 
-                self._jobs_awaiting_login.append( job )
+            
+            if network_contexts in self._network_contexts_to_bandwidth_blocking_jobs:
                 
-                return False
+                del self._network_contexts_to_bandwidth_blocking_jobs[ network_contexts ]
                 
             
         
@@ -260,7 +526,9 @@ class NetworkEngine( object ):
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job, JOB_STATUS_AWAITING_LOGIN )
+                
+                return False
                 
             elif job.NeedsLogin():
                 
@@ -327,7 +595,7 @@ class NetworkEngine( object ):
                 
             else:
                 
-                self._jobs_awaiting_slot.append( job )
+                self._AddJobAwaitingSlot( job )
                 
                 return False
                 
@@ -344,45 +612,68 @@ class NetworkEngine( object ):
                 
             
         
-        def ProcessReadyJob( job ):
+        def ProcessSlotQueues():
             
-            if job.IsDone():
+            if self._pause_all_new_network_traffic:
                 
-                return False
+                slot_wait_status = 'all new network traffic is paused\u2026'
                 
-            elif job.IsAsleep():
+            elif self.controller.JustWokeFromSleep():
                 
-                return True
+                slot_wait_status = 'looks like computer just woke up, waiting a bit'
                 
-            elif len( self._jobs_running ) < self.MAX_JOBS:
+            else:
                 
-                if self._pause_all_new_network_traffic:
-                    
-                    job.SetStatus( 'all new network traffic is paused\u2026' )
-                    
-                    job.Sleep( 2 )
-                    
-                    return True
-                    
-                elif self.controller.JustWokeFromSleep():
-                    
-                    job.SetStatus( 'looks like computer just woke up, waiting a bit' )
-                    
-                    job.Sleep( 5 )
+                slot_wait_status = None
+                
+            
+            if slot_wait_status != self._slot_wait_status:
+                
+                # only tell the waiting jobs when the reason changes
+                
+                for job in itertools.chain.from_iterable( self._jobs_awaiting_slot.values() ):
                     
-                    return True
+                    job.SetStatus( 'waiting for a slot\u2026' if slot_wait_status is None else slot_wait_status )
                     
-                elif self._active_domains_counter[ job.GetSecondLevelDomain() ] >= self.MAX_JOBS_PER_DOMAIN:
+                
+                self._slot_wait_status = slot_wait_status
+                
+            
+            if slot_wait_status is not None:
+                
+                return
+                
+            
+            # hand out free slots one domain at a time, so when MAX_JOBS is the limit, the domain that happened to queue first does not get them all
+            # a domain that gets a slot goes to the back of the line for next time
+            
+            second_level_domains = list( self._jobs_awaiting_slot.keys() )
+            
+            while len( second_level_domains ) > 0 and len( self._jobs_running ) < self.MAX_JOBS:
+                
+                second_level_domains = [ second_level_domain for second_level_domain in second_level_domains if StartSlotJob( second_level_domain ) ]
+                
+            
+        
+        def StartSlotJob( second_level_domain ):
+            
+            queue = self._jobs_awaiting_slot[ second_level_domain ]
+            
+            while len( queue ) > 0 and len( self._jobs_running ) < self.MAX_JOBS and self._active_domains_counter[ second_level_domain ] < self.MAX_JOBS_PER_DOMAIN:
+                
+                job = queue.popleft()
+                
+                if job.IsDone():
                     
-                    job.SetStatus( 'waiting for a slot on this domain' )
+                    continue
                     
-                    job.Sleep( 2 )
+                elif job.IsAsleep():
                     
-                    return True
+                    self._SleepJob( job, JOB_STATUS_AWAITING_SLOT )
                     
                 elif not job.TokensOK():
                     
-                    return True
+                    self._SleepJob( job, JOB_STATUS_AWAITING_SLOT )
                     
                 else:
                     
@@ -391,21 +682,19 @@ class NetworkEngine( object ):
                         HydrusData.ShowText( 'Network Job Starting: ' + job._method + ' ' + job._url )
                         
                     
-                    self._active_domains_counter[ job.GetSecondLevelDomain() ] += 1
+                    self._active_domains_counter[ second_level_domain ] += 1
                     
                     self.controller.CallToThread( job.Start )
                     
                     self._jobs_running.append( job )
                     
-                    return False
+                    self._jobs_awaiting_slot.move_to_end( second_level_domain )
+                    
+                    return True
                     
                 
-            else:
-                
-                job.SetStatus( 'waiting for a slot\u2026' )
-                
-                return True
-                
+            
+            return False
             
         
         def ProcessRunningJob( job ):
@@ -434,17 +723,34 @@ class NetworkEngine( object ):
                 
             
         
+        def ClearEmptyQueues( queues ):
+            
+            empty_keys = [ key for ( key, queue ) in queues.items() if len( queue ) == 0 ]
+            
+            for key in empty_keys:
+                
+                del queues[ key ]
+                
+            
+        
         self._is_running = True
         
         while not ( self._local_shutdown or HG.model_shutdown ):
             
             with self._lock:
                 
+                self._WakeJobs()
+                
                 self._jobs_awaiting_validity = list( filter( ProcessValidationJob, self._jobs_awaiting_validity ) )
                 
                 ProcessCurrentValidationJob()
                 
-                self._jobs_awaiting_bandwidth = list( filter( ProcessBandwidthJob, self._jobs_awaiting_bandwidth ) )
+                for ( network_contexts, queue ) in self._jobs_awaiting_bandwidth.items():
+                    
+                    ProcessBandwidthQueue( network_contexts, queue )
+                    
+                
+                ClearEmptyQueues( self._jobs_awaiting_bandwidth )
                 
                 ProcessForceLogins()
                 
@@ -452,10 +758,12 @@ class NetworkEngine( object ):
                 
                 ProcessCurrentLoginJob()
                 
-                self._jobs_awaiting_slot = list( filter( ProcessReadyJob, self._jobs_awaiting_slot ) )
-                
                 self._jobs_running = list( filter( ProcessRunningJob, self._jobs_running ) )
                 
+                ProcessSlotQueues()
+                
+                ClearEmptyQueues( self._jobs_awaiting_slot )
+                
             
             # we want to catch the rollover of the second for bandwidth jobs
             
@@ -480,6 +788,8 @@ class NetworkEngine( object ):
         
         self.controller.new_options.SetBoolean( 'pause_all_new_network_traffic', self._pause_all_new_network_traffic )
         
+        self._new_work_to_do.set()
+        
     
     def RefreshOptions( self ):
         
@@ -497,3 +807,16 @@ class NetworkEngine( object ):
         self._new_work_to_do.set()
         
     
+    def WakeJob( self, job ):
+        
+        # called by jobs when something outside the engine (a cancel, an override, finishing) means they may not need to wait any more
+        # this takes its own lock so a job can call it while the engine is working on it
+        
+        with self._jobs_to_wake_lock:
+            
+            self._jobs_to_wake.add( job )
+            
+        
+        self._new_work_to_do.set()
+        
+    
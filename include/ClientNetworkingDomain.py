@@ -131,42 +131,16 @@ def ConvertQueryTextToDict( query_text ):
             
             ( key, value ) = result
             
-            try:
-                
-                unquoted_key = urllib.parse.unquote( key )
-                
-                if True not in ( bad_char in unquoted_key for bad_char in bad_chars ):
-                    
-                    requoted_key = urllib.parse.quote( unquoted_key )
-                    
-                    if requoted_key == key:
-                        
-                        key = unquoted_key
-                        
-                    
-                
-            except:
-                
-                pass
-                
+            # unquoting something without a '%' does nothing, and this is called a great deal, so skip the work
             
-            try:
+            if '%' in key:
                 
-                unquoted_value = urllib.parse.unquote( value )
+                key = UnquoteQueryComponentIfReversible( key, bad_chars )
                 
-                if True not in ( bad_char in unquoted_value for bad_char in bad_chars ):
-                    
-                    requoted_value = urllib.parse.quote( unquoted_value )
-                    
-                    if requoted_value == value:
-                        
-                        value = unquoted_value
-                        
-                    
-                
-            except:
+            
+            if '%' in value:
                 
-                pass
+                value = UnquoteQueryComponentIfReversible( value, bad_chars )
                 
             
             query_dict[ key ] = value
@@ -234,6 +208,18 @@ def ConvertURLIntoSecondLevelDomain( url ):
     
     return ConvertDomainIntoSecondLevelDomain( domain )
     
+def ConvertURLIntoURLClassTestComponents( url ):
+    
+    # the bits of a url that url classes test, parsed once so the url can be tried against several classes
+    
+    p = urllib.parse.urlparse( url )
+    
+    url_path_components = p.path.lstrip( '/' ).split( '/' )
+    
+    url_parameters = ConvertQueryTextToDict( p.query )
+    
+    return ( p.netloc, url_path_components, url_parameters )
+    
 def DomainEqualsAnotherForgivingWWW( test_domain, wwwable_domain ):
     
     # domain is either the same or starts with www. or www2. or something
@@ -343,6 +329,31 @@ def GetSearchURLs( url ):
     
     return search_urls
     
+def UnquoteQueryComponentIfReversible( text, bad_chars ):
+    
+    try:
+        
+        unquoted_text = urllib.parse.unquote( text )
+        
+        if True not in ( bad_char in unquoted_text for bad_char in bad_chars ):
+            
+            requoted_text = urllib.parse.quote( unquoted_text )
+            
+            if requoted_text == text:
+                
+                return unquoted_text
+                
+            
+        
+    except:
+        
+        pass
+        
+    
+    return text
+    
+URL_CLASS_CACHE_SIZE = 50000
+
 VALID_DENIED = 0
 VALID_APPROVED = 1
 VALID_UNKNOWN = 2
@@ -378,6 +389,9 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         self._url_class_keys_to_parser_keys = HydrusSerialisable.SerialisableBytesDictionary()
         
         self._domains_to_url_classes = collections.defaultdict( list )
+        self._domains_and_num_path_components_to_url_classes = {}
+        
+        self._urls_to_url_classes_and_normalised_urls = collections.OrderedDict()
         
         from . import ClientImportOptions
         
@@ -537,28 +551,48 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
     
     def _GetURLClass( self, url ):
         
+        # everything from file seed dedupe to normalisation comes through here, often for the same urls again and again, so we remember recent answers
+        
+        if url in self._urls_to_url_classes_and_normalised_urls:
+            
+            self._urls_to_url_classes_and_normalised_urls.move_to_end( url )
+            
+            ( url_class, normalised_url ) = self._urls_to_url_classes_and_normalised_urls[ url ]
+            
+            return url_class
+            
+        
         domain = ConvertDomainIntoSecondLevelDomain( ConvertURLIntoDomain( url ) )
         
+        url_class = None
+        
         if domain in self._domains_to_url_classes:
             
-            url_classes = self._domains_to_url_classes[ domain ]
+            ( netloc, url_path_components, url_parameters ) = ConvertURLIntoURLClassTestComponents( url )
             
-            for url_class in url_classes:
+            # a url class that needs more path components than the url has can never match, so we only try the ones that might
+            
+            key = ( domain, len( url_path_components ) )
+            
+            if key not in self._domains_and_num_path_components_to_url_classes:
                 
-                try:
-                    
-                    url_class.Test( url )
-                    
-                    return url_class
+                self._domains_and_num_path_components_to_url_classes[ key ] = [ possible_url_class for possible_url_class in self._domains_to_url_classes[ domain ] if possible_url_class.GetNumRequiredPathComponents() <= len( url_path_components ) ]
+                
+            
+            for possible_url_class in self._domains_and_num_path_components_to_url_classes[ key ]:
+                
+                if possible_url_class.MatchesURLClassTestComponents( netloc, url_path_components, url_parameters ):
                     
-                except HydrusExceptions.URLClassException:
+                    url_class = possible_url_class
                     
-                    continue
+                    break
                     
                 
             
         
-        return None
+        self._SetCachedURLClassAndNormalisedURL( url, url_class, None )
+        
+        return url_class
         
     
     def _GetURLToFetchAndParser( self, url ):
@@ -623,6 +657,9 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
     def _RecalcCache( self ):
         
         self._domains_to_url_classes = collections.defaultdict( list )
+        self._domains_and_num_path_components_to_url_classes = {}
+        
+        self._urls_to_url_classes_and_normalised_urls = collections.OrderedDict()
         
         for url_class in self._url_classes:
             
@@ -653,6 +690,18 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         self._parser_namespaces.sort()
         
     
+    def _SetCachedURLClassAndNormalisedURL( self, url, url_class, normalised_url ):
+        
+        self._urls_to_url_classes_and_normalised_urls[ url ] = ( url_class, normalised_url )
+        
+        self._urls_to_url_classes_and_normalised_urls.move_to_end( url )
+        
+        while len( self._urls_to_url_classes_and_normalised_urls ) > URL_CLASS_CACHE_SIZE:
+            
+            self._urls_to_url_classes_and_normalised_urls.popitem( last = False )
+            
+        
+    
     def _SetDirty( self ):
         
         self._dirty = True
@@ -1491,7 +1540,14 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            url_class = self._GetURLClass( url )
+            self._GetURLClass( url )
+            
+            ( url_class, normalised_url ) = self._urls_to_url_classes_and_normalised_urls[ url ]
+            
+            if normalised_url is not None:
+                
+                return normalised_url
+                
             
             if url_class is None:
                 
@@ -1513,6 +1569,8 @@ class NetworkDomainManager( HydrusSerialisable.SerialisableBase ):
                 normalised_url = url_class.Normalise( url )
                 
             
+            self._SetCachedURLClassAndNormalisedURL( url, url_class, normalised_url )
+            
             return normalised_url
             
         
@@ -3001,6 +3059,21 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
         return r.geturl()
         
     
+    def GetNumRequiredPathComponents( self ):
+        
+        num_required_path_components = 0
+        
+        for ( index, ( string_match, default ) ) in enumerate( self._path_components ):
+            
+            if default is None:
+                
+                num_required_path_components = index + 1
+                
+            
+        
+        return num_required_path_components
+        
+    
     def GetReferralURL( self, url, referral_url ):
         
         if self._send_referral_url == SEND_REFERRAL_URL_ONLY_IF_PROVIDED:
@@ -3082,6 +3155,61 @@ class URLClass( HydrusSerialisable.SerialisableBaseNamed ):
             
         
     
+    def MatchesURLClassTestComponents( self, netloc, url_path_components, url_parameters ):
+        
+        # the same as Test, but on a url that has already been parsed, and without building any error text
+        
+        if self._match_subdomains:
+            
+            if netloc != self._netloc and not netloc.endswith( '.' + self._netloc ):
+                
+                return False
+                
+            
+        else:
+            
+            if not DomainEqualsAnotherForgivingWWW( netloc, self._netloc ):
+                
+                return False
+                
+            
+        
+        for ( index, ( string_match, default ) ) in enumerate( self._path_components ):
+            
+            if len( url_path_components ) > index:
+                
+                if not string_match.Matches( url_path_components[ index ] ):
+                    
+                    return False
+                    
+                
+            elif default is None:
+                
+                return False
+                
+            
+        
+        for ( key, ( string_match, default ) ) in self._parameters.items():
+            
+            if key not in url_parameters:
+                
+                if default is None:
+                    
+                    return False
+                    
+                
+                continue
+                
+            
+            if not string_match.Matches( url_parameters[ key ] ):
+                
+                return False
+                
+            
+        
+        return True
+        
+    
     def Normalise( self, url ):
         
         p = urllib.parse.urlparse( url )
@@ -167,6 +167,9 @@ class NetworkJob( object ):
         self._num_bytes_read = 0
         self._num_bytes_to_read = 1
         
+        self._range_validator = None
+        self._num_bytes_to_resume_from = 0
+        
         self._file_import_options = None
         
         self._network_contexts = self._GenerateNetworkContexts()
@@ -217,6 +220,50 @@ class NetworkJob( object ):
         return ( session_network_context, login_network_context )
         
     
+    def _GetNumBytesToResumeFrom( self, response ):
+        
+        if response.status_code == 206 and self._num_bytes_to_resume_from > 0:
+            
+            # 'bytes 1000-1999/2000'
+            
+            content_range = response.headers.get( 'content-range', '' )
+            
+            match = re.match( r'^bytes (\d+)-', content_range )
+            
+            if match is not None and int( match.group( 1 ) ) == self._num_bytes_to_resume_from:
+                
+                return self._num_bytes_to_resume_from
+                
+            
+            self._num_bytes_to_resume_from = 0
+            
+            raise HydrusExceptions.ShouldReattemptNetworkException( 'Server resumed the download from the wrong place!' )
+            
+        
+        # we are starting from the beginning, so note how we can ask for the rest if this attempt breaks
+        
+        self._num_bytes_to_resume_from = 0
+        self._range_validator = None
+        
+        if self._method == 'GET' and response.headers.get( 'content-encoding', 'identity' ) == 'identity' and response.headers.get( 'accept-ranges', 'bytes' ) != 'none':
+            
+            etag = response.headers.get( 'etag', None )
+            
+            # weak etags are no good for If-Range
+            
+            if etag is not None and not etag.startswith( 'W/' ):
+                
+                self._range_validator = etag
+                
+            elif 'last-modified' in response.headers:
+                
+                self._range_validator = response.headers[ 'last-modified' ]
+                
+            
+        
+        return 0
+        
+    
     def _SendRequestAndGetResponse( self ):
         
         with self._lock:
@@ -270,7 +317,20 @@ class NetworkJob( object ):
                 headers[ key ] = value
                 
             
-            self._status_text = 'sending request\u2026'
+            if self._num_bytes_to_resume_from > 0:
+                
+                # If-Range means we get the whole file again if it changed since the broken attempt
+                
+                headers[ 'Range' ] = 'bytes={}-'.format( self._num_bytes_to_resume_from )
+                headers[ 'If-Range' ] = self._range_validator
+                
+                self._status_text = 'resuming download\u2026'
+                
+            else:
+                
+                self._status_text = 'sending request\u2026'
+                
+            
             
             snc = self._session_network_context
             
@@ -362,7 +422,7 @@ class NetworkJob( object ):
             
         
     
-    def _ReadResponse( self, response, stream_dest, max_allowed = None ):
+    def _ReadResponse( self, response, stream_dest, max_allowed = None, num_bytes_already_read = 0 ):
         
         with self._lock:
             
@@ -377,7 +437,7 @@ class NetworkJob( object ):
             
             if 'content-length' in response.headers:
                 
-                self._num_bytes_to_read = int( response.headers[ 'content-length' ] )
+                self._num_bytes_to_read = num_bytes_already_read + int( response.headers[ 'content-length' ] )
                 
                 if max_allowed is not None and self._num_bytes_to_read > max_allowed:
                     
@@ -399,6 +459,10 @@ class NetworkJob( object ):
         
         num_bytes_read_is_accurate = True
         
+        # only bytes that actually come over the wire this time count against bandwidth
+        
+        self._num_bytes_read = num_bytes_already_read
+        
         for chunk in response.iter_content( chunk_size = 65536 ):
             
             if self._IsCancelled():
@@ -408,9 +472,9 @@ class NetworkJob( object ):
             
             stream_dest.write( chunk )
             
-            total_bytes_read = response.raw.tell()
+            raw_bytes_read = response.raw.tell()
             
-            if total_bytes_read == 0:
+            if raw_bytes_read == 0:
                 
                 # this seems to occur when the response is chunked transfer encoding (note, no Content-Length)
                 # there's no great way to track raw bytes read in this case. the iter_content chunk can be unzipped from that
@@ -424,6 +488,8 @@ class NetworkJob( object ):
                 
             else:
                 
+                total_bytes_read = num_bytes_already_read + raw_bytes_read
+                
                 chunk_num_bytes = total_bytes_read - self._num_bytes_read
                 
                 self._num_bytes_read = total_bytes_read
@@ -499,6 +565,22 @@ class NetworkJob( object ):
         
         self._is_done_event.set()
         
+        self._WakeInEngine()
+        
+    
+    def _SetResumePoint( self ):
+        
+        # whatever made it to disk before an attempt broke can be kept if the server will give us the rest
+        
+        if self._range_validator is not None and self._temp_path is not None and os.path.exists( self._temp_path ):
+            
+            self._num_bytes_to_resume_from = os.path.getsize( self._temp_path )
+            
+        else:
+            
+            self._num_bytes_to_resume_from = 0
+            
+        
     
     def _Sleep( self, seconds ):
         
@@ -528,6 +610,16 @@ class NetworkJob( object ):
             
         
     
+    def _WakeInEngine( self ):
+        
+        # the engine only looks at sleeping and queued jobs when it thinks they are due, so tell it when that changes
+        
+        if self.engine is not None:
+            
+            self.engine.WakeJob( self )
+            
+        
+    
     def AddAdditionalHeader( self, key, value ):
         
         with self._lock:
@@ -623,6 +715,8 @@ class NetworkJob( object ):
             self._SetCancelled()
             
         
+        self._WakeInEngine()
+        
     
     def CanValidateInPopup( self ):
         
@@ -797,6 +891,14 @@ class NetworkJob( object ):
             
         
     
+    def GetWakeTime( self ):
+        
+        with self._lock:
+            
+            return self._wake_time
+            
+        
+    
     def HasError( self ):
         
         with self._lock:
@@ -893,6 +995,8 @@ class NetworkJob( object ):
                 
             
         
+        self._WakeInEngine()
+        
     
     def OverrideConnectionErrorWait( self ):
         
@@ -911,6 +1015,8 @@ class NetworkJob( object ):
             self._wake_time = 0
             
         
+        self._WakeInEngine()
+        
     
     def SetError( self, e, error ):
         
@@ -1030,9 +1136,35 @@ class NetworkJob( object ):
                             
                         else:
                             
-                            with open( self._temp_path, 'wb' ) as f:
+                            with self._lock:
+                                
+                                num_bytes_already_read = self._GetNumBytesToResumeFrom( response )
+                                
+                            
+                            if num_bytes_already_read > 0:
+                                
+                                open_mode = 'ab'
                                 
-                                self._ReadResponse( response, f )
+                            else:
+                                
+                                open_mode = 'wb'
+                                
+                            
+                            try:
+                                
+                                with open( self._temp_path, open_mode ) as f:
+                                    
+                                    self._ReadResponse( response, f, num_bytes_already_read = num_bytes_already_read )
+                                    
+                                
+                            except Exception:
+                                
+                                with self._lock:
+                                    
+                                    self._SetResumePoint()
+                                    
+                                
+                                raise
                                 
                             
                         
@@ -1045,6 +1177,13 @@ class NetworkJob( object ):
                         
                         with self._lock:
                             
+                            if response.status_code == 416 and self._num_bytes_to_resume_from > 0:
+                                
+                                self._num_bytes_to_resume_from = 0
+                                
+                                raise HydrusExceptions.ShouldReattemptNetworkException( 'Server could not resume the download!' )
+                                
+                            
                             self._status_text = str( response.status_code ) + ' - ' + str( response.reason )
                             
                         
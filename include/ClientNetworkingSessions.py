@@ -6,6 +6,7 @@ from . import HydrusData
 from . import HydrusSerialisable
 from . import HydrusGlobals as HG
 import requests
+import requests.adapters
 import threading
 
 try:
@@ -42,8 +43,14 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         
         self._network_contexts_to_session_timeouts = {}
         
+        self._network_contexts_to_pool_settings = {}
+        
         self._proxies_dict = {}
         
+        self._keep_alive = True
+        self._pool_num_hosts = 10
+        self._pool_size = 10
+        
         self._Reinitialise()
         
         HG.client_controller.sub( self, 'Reinitialise', 'notify_new_options' )
@@ -85,6 +92,11 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         return serialisable_network_contexts_to_sessions
         
     
+    def _GetSessionAdapters( self, session ):
+        
+        return [ session.adapters[ prefix ] for prefix in ( 'https://', 'http://' ) if prefix in session.adapters ]
+        
+    
     def _GetSessionNetworkContext( self, network_context ):
         
         # just in case one of these slips through somehow
@@ -123,8 +135,41 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def _MountConnectionPools( self, network_context, session ):
+        
+        # requests' default adapter only remembers pools for ten hosts, so a session that spreads over many cdn subdomains keeps dropping its open connections
+        
+        pool_settings = ( self._pool_num_hosts, self._pool_size )
+        
+        if self._network_contexts_to_pool_settings.get( network_context, None ) == pool_settings:
+            
+            return
+            
+        
+        old_adapters = self._GetSessionAdapters( session )
+        
+        for prefix in ( 'https://', 'http://' ):
+            
+            session.mount( prefix, requests.adapters.HTTPAdapter( pool_connections = self._pool_num_hosts, pool_maxsize = self._pool_size ) )
+            
+        
+        for adapter in old_adapters:
+            
+            adapter.close()
+            
+        
+        self._network_contexts_to_pool_settings[ network_context ] = pool_settings
+        
+    
     def _Reinitialise( self ):
         
+        self._keep_alive = HG.client_controller.new_options.GetBoolean( 'network_keep_alive' )
+        
+        # a job should never have to wait on or throw away a connection because its domain's pool is full
+        
+        self._pool_num_hosts = HG.client_controller.new_options.GetInteger( 'network_connection_pool_num_hosts' )
+        self._pool_size = max( HG.client_controller.new_options.GetInteger( 'network_connection_pool_size' ), HG.client_controller.new_options.GetInteger( 'max_network_jobs_per_domain' ) )
+        
         self._proxies_dict = {}
         
         http_proxy = HG.client_controller.new_options.GetNoneableString( 'http_proxy' )
@@ -154,13 +199,77 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
             if network_context in self._network_contexts_to_sessions:
                 
+                session = self._network_contexts_to_sessions[ network_context ]
+                
+                for adapter in self._GetSessionAdapters( session ):
+                    
+                    adapter.close()
+                    
+                
                 del self._network_contexts_to_sessions[ network_context ]
                 
+                if network_context in self._network_contexts_to_pool_settings:
+                    
+                    del self._network_contexts_to_pool_settings[ network_context ]
+                    
+                
                 self._SetDirty()
                 
             
         
     
+    def GetConnectionPoolStats( self, network_context ):
+        
+        with self._lock:
+            
+            network_context = self._GetSessionNetworkContext( network_context )
+            
+            num_hosts = 0
+            num_connections_made = 0
+            num_requests = 0
+            num_idle_connections = 0
+            
+            if network_context in self._network_contexts_to_sessions:
+                
+                session = self._network_contexts_to_sessions[ network_context ]
+                
+                for adapter in self._GetSessionAdapters( session ):
+                    
+                    pool_managers = [ adapter.poolmanager ] + list( adapter.proxy_manager.values() )
+                    
+                    for pool_manager in pool_managers:
+                        
+                        if pool_manager is None:
+                            
+                            continue
+                            
+                        
+                        for key in pool_manager.pools.keys():
+                            
+                            pool = pool_manager.pools.get( key )
+                            
+                            if pool is None:
+                                
+                                continue
+                                
+                            
+                            num_hosts += 1
+                            num_connections_made += pool.num_connections
+                            num_requests += pool.num_requests
+                            
+                            if pool.pool is not None:
+                                
+                                num_idle_connections += len( [ connection for connection in list( pool.pool.queue ) if connection is not None ] )
+                                
+                            
+                        
+                    
+                
+            
+            return ( num_hosts, num_connections_made, num_requests, num_idle_connections )
+            
+        
+    
     def GetNetworkContexts( self ):
         
         with self._lock:
@@ -187,6 +296,15 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
                 session.proxies = dict( self._proxies_dict )
                 
             
+            self._MountConnectionPools( network_context, session )
+            
+            connection_header = 'keep-alive' if self._keep_alive else 'close'
+            
+            if session.headers.get( 'Connection', None ) != connection_header:
+                
+                session.headers[ 'Connection' ] = connection_header
+                
+            
             #
             
             self._CleanSessionCookies( network_context, session )
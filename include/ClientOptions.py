@@ -68,13 +68,18 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'load_images_with_pil' ] = False
         
+        self._dictionary[ 'booleans' ][ 'share_media_cache_budget' ] = False
+        self._dictionary[ 'booleans' ][ 'use_packed_thumbnails' ] = False
+        
         self._dictionary[ 'booleans' ][ 'use_system_ffmpeg' ] = False
         
         self._dictionary[ 'booleans' ][ 'maintain_similar_files_duplicate_pairs_during_idle' ] = False
+        self._dictionary[ 'booleans' ][ 'use_in_memory_similar_files_index' ] = False
         
         self._dictionary[ 'booleans' ][ 'show_namespaces' ] = True
         
         self._dictionary[ 'booleans' ][ 'verify_regular_https' ] = True
+        self._dictionary[ 'booleans' ][ 'network_keep_alive' ] = True
         
         self._dictionary[ 'booleans' ][ 'reverse_page_shift_drag_behaviour' ] = False
         
@@ -133,6 +138,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'autocomplete_results_fetch_automatically' ] = True
         
+        self._dictionary[ 'booleans' ][ 'parse_html_with_lxml' ] = False
+        
         #
         
         self._dictionary[ 'colours' ] = HydrusSerialisable.SerialisableDictionary()
@@ -211,6 +218,9 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'max_network_jobs' ] = 15
         self._dictionary[ 'integers' ][ 'max_network_jobs_per_domain' ] = 3
         
+        self._dictionary[ 'integers' ][ 'network_connection_pool_num_hosts' ] = 32
+        self._dictionary[ 'integers' ][ 'network_connection_pool_size' ] = 10
+        
         self._dictionary[ 'integers' ][ 'max_simultaneous_subscriptions' ] = 1
         
         self._dictionary[ 'integers' ][ 'gallery_page_wait_period_pages' ] = 15
@@ -232,6 +242,10 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'integers' ][ 'thumbnail_cache_timeout' ] = 86400
         self._dictionary[ 'integers' ][ 'image_cache_timeout' ] = 600
+        self._dictionary[ 'integers' ][ 'media_cache_eviction_policy' ] = CC.CACHE_EVICTION_LRU
+        
+        self._dictionary[ 'integers' ][ 'thumbnail_waterfall_workers' ] = 4
+        self._dictionary[ 'integers' ][ 'file_import_workers' ] = 4
         
         self._dictionary[ 'integers' ][ 'thumbnail_border' ] = 1
         self._dictionary[ 'integers' ][ 'thumbnail_margin' ] = 2
@@ -2,6 +2,7 @@ import base64
 import bs4
 import calendar
 import codecs
+import copy
 from . import ClientNetworkingDomain
 from . import ClientNetworkingJobs
 import collections
@@ -32,6 +33,8 @@ except ImportError:
 try:
     
     import lxml
+    import lxml.etree
+    import lxml.html
     
     LXML_IS_OK = True
     
@@ -39,6 +42,20 @@ except ImportError:
     
     LXML_IS_OK = False
     
+HAS_NEWLINES_RE = re.compile( r'\r|\n' )
+
+HTML_MULTI_VALUED_ATTRIBUTES = bs4.builder.HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+BS4_CDATA_CONTAINING_TAGS = { 'script', 'style' }
+BS4_EMPTY_ELEMENT_TAGS = bs4.builder.HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS
+
+LXML_BOOLEAN_ATTRIBUTES = { 'checked', 'compact', 'declare', 'defer', 'disabled', 'ismap', 'multiple', 'nohref', 'noresize', 'noshade', 'nowrap', 'readonly', 'selected' }
+
+XPATH_SAFE_NAME_RE = re.compile( r'^[a-zA-Z][a-zA-Z0-9_\-]*$' )
+
+# the text of these is code, not page text, so a tag's string skips over them unless the tag is one of them itself
+NON_TEXT_TAG_NAMES = { 'script', 'style', 'template' }
+
 def ConvertParseResultToPrettyString( result ):
     
     ( ( name, content_type, additional_info ), parsed_text ) = result
@@ -253,25 +270,192 @@ def GetHashesFromParseResults( results ):
     
 def GetHTMLTagString( tag ):
     
+    # bs4's .strings skips script and style text with some parsers but not html5lib, so walk it ourselves
+    
     try:
         
-        all_strings = [ s for s in tag.strings if len( s ) > 0 ]
+        for s in IterateHTMLTagStrings( tag ):
+            
+            if len( s ) > 0:
+                
+                return s
+                
+            
         
     except:
         
         return ''
         
     
-    if len( all_strings ) == 0:
+    return ''
+    
+def GetLXMLRoot( html ):
+    
+    if not LXML_IS_OK:
         
-        result = ''
+        raise HydrusExceptions.ParseException( 'This client does not have access to lxml, and so it cannot use the lxml parse engine.' )
         
-    else:
+    
+    # lxml will not take a str that has an xml encoding declaration, so give it utf-8 bytes
+    
+    if isinstance( html, str ):
+        
+        html = html.encode( 'utf-8', 'replace' )
+        
+    
+    parser = lxml.html.HTMLParser( encoding = 'utf-8' )
+    
+    try:
+        
+        root = lxml.html.document_fromstring( html, parser = parser )
         
-        result = all_strings[0]
+    except lxml.etree.ParserError:
         
+        # the document was empty
+        
+        root = lxml.html.Element( 'html' )
+        
+    
+    return root
+    
+def GetLXMLSubPageRoot( element ):
+    
+    # this makes a standalone tree that looks like what lxml would make from this element's html
+    # the element belongs to a cached page tree that other formulas may still be parsing, so we work on a copy
+    
+    element = copy.deepcopy( element )
+    
+    element.tail = None
+    
+    root = lxml.html.Element( 'html' )
+    
+    body = lxml.etree.SubElement( root, 'body' )
+    
+    body.append( element )
+    
+    return root
+    
+def GetLXMLTagHTML( element ):
     
-    return result
+    # the lxml equivalent of str( tag ), written out the way bs4 does it so both engines give downstream parsers the same text
+    # that is: sorted attributes, multi-valued attributes normalised, void tags as <br/>, and minimal escaping outside of script and style
+    
+    def escape_text( node, text ):
+        
+        if node is not None and node.tag in BS4_CDATA_CONTAINING_TAGS:
+            
+            return text
+            
+        
+        return text.replace( '&', '&amp;' ).replace( '<', '&lt;' ).replace( '>', '&gt;' )
+        
+    
+    def quote_attribute( value ):
+        
+        value = value.replace( '&', '&amp;' ).replace( '<', '&lt;' ).replace( '>', '&gt;' )
+        
+        if '"' in value:
+            
+            if "'" in value:
+                
+                return '"' + value.replace( '"', '&quot;' ) + '"'
+                
+            
+            return "'" + value + "'"
+            
+        
+        return '"' + value + '"'
+        
+    
+    pieces = []
+    
+    stack = [ ( element, 'open' ) ]
+    
+    while len( stack ) > 0:
+        
+        ( node, action ) = stack.pop()
+        
+        if action == 'close':
+            
+            pieces.append( '</' + node.tag + '>' )
+            
+        elif action == 'tail':
+            
+            if node.tail:
+                
+                pieces.append( escape_text( node.getparent(), node.tail ) )
+                
+            
+        elif not isinstance( node.tag, str ):
+            
+            if node.tag is lxml.etree.Comment:
+                
+                pieces.append( '<!--' + ( node.text or '' ) + '-->' )
+                
+            else:
+                
+                pieces.append( lxml.etree.tostring( node, encoding = 'unicode', with_tail = False ) )
+                
+            
+        else:
+            
+            attributes = []
+            
+            for ( key, value ) in sorted( node.attrib.items() ):
+                
+                if IsHTMLMultiValuedAttribute( node.tag, key ):
+                    
+                    value = ' '.join( value.split() )
+                    
+                elif key in LXML_BOOLEAN_ATTRIBUTES and value == key:
+                    
+                    value = '' # libxml2 fills in <input checked> as checked="checked", where bs4 leaves it empty
+                    
+                
+                attributes.append( ' ' + key + '=' + quote_attribute( value ) )
+                
+            
+            children = list( node )
+            
+            if node.tag in BS4_EMPTY_ELEMENT_TAGS and not node.text and len( children ) == 0:
+                
+                pieces.append( '<' + node.tag + ''.join( attributes ) + '/>' )
+                
+            else:
+                
+                pieces.append( '<' + node.tag + ''.join( attributes ) + '>' )
+                
+                if node.text:
+                    
+                    pieces.append( escape_text( node, node.text ) )
+                    
+                
+                stack.append( ( node, 'close' ) )
+                
+                for child in reversed( children ):
+                    
+                    stack.append( ( child, 'tail' ) )
+                    stack.append( ( child, 'open' ) )
+                    
+                
+            
+        
+    
+    return ''.join( pieces )
+    
+def GetLXMLTagString( element ):
+    
+    # the lxml equivalent of GetHTMLTagString
+    
+    for s in IterateLXMLTagStrings( element ):
+        
+        if len( s ) > 0:
+            
+            return s
+            
+        
+    
+    return ''
     
 def GetNamespacesFromParsableContent( parsable_content ):
     
@@ -454,6 +638,83 @@ def GetVariableFromParseResults( results ):
     
     return None
     
+def IsHTMLMultiValuedAttribute( tag_name, attribute ):
+    
+    # bs4 splits attributes like 'class' into lists, so we do the same when we are not using bs4
+    
+    if attribute in HTML_MULTI_VALUED_ATTRIBUTES.get( '*', () ):
+        
+        return True
+        
+    
+    return attribute in HTML_MULTI_VALUED_ATTRIBUTES.get( tag_name, () )
+    
+def IterateHTMLTagStrings( tag ):
+    
+    # the tag's text in document order, like .strings. comments and doctypes are not text, and nor are any script/style descendants
+    
+    stack = list( reversed( list( tag.children ) ) )
+    
+    while len( stack ) > 0:
+        
+        node = stack.pop()
+        
+        if isinstance( node, bs4.element.Tag ):
+            
+            if node.name not in NON_TEXT_TAG_NAMES:
+                
+                stack.extend( reversed( list( node.children ) ) )
+                
+            
+        elif isinstance( node, bs4.element.NavigableString ):
+            
+            if isinstance( node, bs4.element.PreformattedString ) and not isinstance( node, bs4.element.CData ):
+                
+                continue
+                
+            
+            yield str( node )
+            
+        
+    
+def IterateLXMLTagStrings( element ):
+    
+    # the lxml equivalent of IterateHTMLTagStrings. comments have a function for a tag, and only their tail is text
+    
+    if isinstance( element.tag, str ) and element.text is not None:
+        
+        yield element.text
+        
+    
+    stack = list( reversed( element ) )
+    
+    while len( stack ) > 0:
+        
+        node = stack.pop()
+        
+        if isinstance( node, str ):
+            
+            yield node
+            
+            continue
+            
+        
+        if node.tail is not None:
+            
+            stack.append( node.tail )
+            
+        
+        if isinstance( node.tag, str ) and node.tag not in NON_TEXT_TAG_NAMES:
+            
+            if node.text is not None:
+                
+                yield node.text
+                
+            
+            stack.extend( reversed( node ) )
+            
+        
+    
 def MakeParsedTextPretty( parsed_text ):
     
     if isinstance( parsed_text, bytes ):
@@ -811,6 +1072,11 @@ class ParseFormulaHTML( ParseFormula ):
         self._attribute_to_fetch = attribute_to_fetch
         
     
+    def _CanUseLXML( self ):
+        
+        return LXML_IS_OK and False not in ( tag_rule.CanUseLXML() for tag_rule in self._tag_rules )
+        
+    
     def _FindHTMLTags( self, root ):
         
         tags = ( root, )
@@ -823,6 +1089,22 @@ class ParseFormulaHTML( ParseFormula ):
         return tags
         
     
+    def _FindLXMLElements( self, root ):
+        
+        elements = [ root ]
+        
+        from_root = True
+        
+        for tag_rule in self._tag_rules:
+            
+            elements = tag_rule.GetLXMLElements( elements, from_root = from_root )
+            
+            from_root = False
+            
+        
+        return elements
+        
+    
     def _GetParsePrettySeparator( self ):
         
         if self._content_to_fetch == HTML_CONTENT_HTML:
@@ -835,6 +1117,46 @@ class ParseFormulaHTML( ParseFormula ):
             
         
     
+    def _GetRawTextFromLXMLElement( self, element ):
+        
+        if self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
+            
+            result = element.get( self._attribute_to_fetch )
+            
+            if result is None:
+                
+                raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                
+            
+            if IsHTMLMultiValuedAttribute( element.tag, self._attribute_to_fetch ):
+                
+                values = result.split()
+                
+                if len( values ) == 0:
+                    
+                    raise HydrusExceptions.ParseException( 'Attribute ' + self._attribute_to_fetch + ' not found!' )
+                    
+                
+                result = ' '.join( values )
+                
+            
+        elif self._content_to_fetch == HTML_CONTENT_STRING:
+            
+            result = GetLXMLTagString( element )
+            
+        elif self._content_to_fetch == HTML_CONTENT_HTML:
+            
+            result = GetLXMLTagHTML( element )
+            
+        
+        if result is None or result == '':
+            
+            raise HydrusExceptions.ParseException( 'Empty/No results found!' )
+            
+        
+        return result
+        
+    
     def _GetRawTextFromTag( self, tag ):
         
         if tag is None:
@@ -886,6 +1208,35 @@ class ParseFormulaHTML( ParseFormula ):
         return result
         
     
+    def _GetRawTextsFromLXMLElements( self, elements ):
+        
+        raw_texts = []
+        
+        for element in elements:
+            
+            try:
+                
+                raw_text = self._GetRawTextFromLXMLElement( element )
+                
+            except HydrusExceptions.ParseException:
+                
+                continue
+                
+            
+            if self._content_to_fetch == HTML_CONTENT_HTML and HAS_NEWLINES_RE.search( raw_text ) is None:
+                
+                # this html is probably a post for a sub-page parser, so hand the cache the element now rather than have the text re-parsed later
+                # our caller strips newlines from what we return, so if there are any, the copy would not match what a re-parse gives, and we let that happen
+                
+                HG.client_controller.parsing_cache.AddLXMLSubPageElement( raw_text, element )
+                
+            
+            raw_texts.append( raw_text )
+            
+        
+        return raw_texts
+        
+    
     def _GetRawTextsFromTags( self, tags ):
         
         raw_texts = []
@@ -929,18 +1280,38 @@ class ParseFormulaHTML( ParseFormula ):
     
     def _ParseRawTexts( self, parsing_context, parsing_text ):
         
+        # lxml is much faster than bs4, but we fall back to bs4 if any of our rules cannot be done with xpath
+        
+        use_lxml = HG.client_controller.new_options.GetBoolean( 'parse_html_with_lxml' ) and self._CanUseLXML()
+        
         try:
             
-            root = HG.client_controller.parsing_cache.GetSoup( parsing_text )
+            if use_lxml:
+                
+                root = HG.client_controller.parsing_cache.GetLXMLRoot( parsing_text )
+                
+            else:
+                
+                root = HG.client_controller.parsing_cache.GetSoup( parsing_text )
+                
             
         except Exception as e:
             
             raise HydrusExceptions.ParseException( 'Unable to parse that HTML: {}. HTML Sample: {}'.format( str( e ), parsing_text[:1024] ) )
             
         
-        tags = self._FindHTMLTags( root )
-        
-        raw_texts = self._GetRawTextsFromTags( tags )
+        if use_lxml:
+            
+            elements = self._FindLXMLElements( root )
+            
+            raw_texts = self._GetRawTextsFromLXMLElements( elements )
+            
+        else:
+            
+            tags = self._FindHTMLTags( root )
+            
+            raw_texts = self._GetRawTextsFromTags( tags )
+            
         
         return raw_texts
         
@@ -1150,6 +1521,122 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         self._should_test_tag_string = should_test_tag_string
         self._tag_string_string_match = tag_string_string_match
         
+        self._lxml_xpaths = None
+        
+    
+    def _CompileLXMLXPaths( self ):
+        
+        # returns ( from_root_xpath, from_node_xpath, variables ) that select the same nodes as GetNodes, or None if we need bs4
+        # rules are compiled one at a time, not chained, as bs4 can return the same node more than once from overlapping parents and we want to keep that
+        
+        if self._tag_name is None:
+            
+            step = '*'
+            
+        elif XPATH_SAFE_NAME_RE.match( self._tag_name ) is not None:
+            
+            step = self._tag_name
+            
+        else:
+            
+            return None
+            
+        
+        variables = {}
+        
+        if self._rule_type == HTML_RULE_TYPE_DESCENDING:
+            
+            predicates = []
+            
+            for ( i, ( key, value ) ) in enumerate( self._tag_attributes.items() ):
+                
+                if not isinstance( value, str ) or value == '' or XPATH_SAFE_NAME_RE.match( key ) is None:
+                    
+                    return None
+                    
+                
+                variable_name = 'v{}'.format( i )
+                
+                variables[ variable_name ] = value
+                
+                if IsHTMLMultiValuedAttribute( self._tag_name, key ):
+                    
+                    # bs4 matches these if any one value, or the whole normalised list, matches
+                    
+                    if len( value.split() ) > 1:
+                        
+                        predicate = 'normalize-space( @{} ) = ${}'.format( key, variable_name )
+                        
+                    else:
+                        
+                        predicate = 'contains( concat( " ", normalize-space( @{} ), " " ), concat( " ", ${}, " " ) )'.format( key, variable_name )
+                        
+                    
+                elif self._tag_name is None and True in ( key in attributes for attributes in HTML_MULTI_VALUED_ATTRIBUTES.values() ):
+                    
+                    # this depends on what tag we are looking at, so leave it to bs4
+                    
+                    return None
+                    
+                else:
+                    
+                    predicate = '@{} = ${}'.format( key, variable_name )
+                    
+                
+                predicates.append( '[ ' + predicate + ' ]' )
+                
+            
+            from_root_path = 'descendant-or-self::' + step + ''.join( predicates )
+            from_node_path = 'descendant::' + step + ''.join( predicates )
+            
+            if self._tag_index is not None:
+                
+                from_root_path = '( {} )[ {} ]'.format( from_root_path, self._tag_index + 1 )
+                from_node_path = '( {} )[ {} ]'.format( from_node_path, self._tag_index + 1 )
+                
+            
+        elif self._rule_type == HTML_RULE_TYPE_ASCENDING:
+            
+            # ancestor is a reverse axis, so the position counts up from the nearest parent
+            
+            from_root_path = 'ancestor::{}[ {} ]'.format( step, self._tag_depth )
+            from_node_path = from_root_path
+            
+        else:
+            
+            return None
+            
+        
+        try:
+            
+            return ( lxml.etree.XPath( from_root_path ), lxml.etree.XPath( from_node_path ), variables )
+            
+        except lxml.etree.XPathError:
+            
+            return None
+            
+        
+    
+    def _GetLXMLXPaths( self ):
+        
+        if self._lxml_xpaths is None:
+            
+            lxml_xpaths = None
+            
+            if LXML_IS_OK:
+                
+                lxml_xpaths = self._CompileLXMLXPaths()
+                
+            
+            if lxml_xpaths is None:
+                
+                lxml_xpaths = ( None, None, {} )
+                
+            
+            self._lxml_xpaths = lxml_xpaths
+            
+        
+        return self._lxml_xpaths
         
     
     def _GetSerialisableInfo( self ):
@@ -1165,6 +1652,8 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
         
         self._tag_string_string_match = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_tag_string_string_match )
         
+        self._lxml_xpaths = None
+        
     
     def _UpdateSerialisableInfo( self, version, old_serialisable_info ):
         
@@ -1184,6 +1673,43 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def CanUseLXML( self ):
+        
+        ( from_root_xpath, from_node_xpath, variables ) = self._GetLXMLXPaths()
+        
+        return from_root_xpath is not None
+        
+    
+    def GetLXMLElements( self, elements, from_root = False ):
+        
+        # from_root means we are searching from the top of the document, which bs4 includes in its descendant search
+        
+        ( from_root_xpath, from_node_xpath, variables ) = self._GetLXMLXPaths()
+        
+        if from_root:
+            
+            xpath = from_root_xpath
+            
+        else:
+            
+            xpath = from_node_xpath
+            
+        
+        new_elements = []
+        
+        for element in elements:
+            
+            new_elements.extend( xpath( element, **variables ) )
+            
+        
+        if self._should_test_tag_string:
+            
+            new_elements = [ element for element in new_elements if self._tag_string_string_match.Matches( GetLXMLTagString( element ) ) ]
+            
+        
+        return new_elements
+        
+    
     def GetNodes( self, nodes ):
         
         new_nodes = []
@@ -3106,6 +3632,40 @@ class StringMatch( HydrusSerialisable.SerialisableBase ):
         
         self._example_string = example_string
         
+        self._compiled_regex = None
+        
+    
+    def _GetCompiledRegex( self ):
+        
+        # url class matching tests the same few string matches against a great many strings, so we compile once
+        
+        if self._compiled_regex is None:
+            
+            if self._match_type == STRING_MATCH_FLEXIBLE:
+                
+                if self._match_value == ALPHA:
+                    
+                    r = '^[a-zA-Z]+$'
+                    
+                elif self._match_value == ALPHANUMERIC:
+                    
+                    r = '^[a-zA-Z\d]+$'
+                    
+                elif self._match_value == NUMERIC:
+                    
+                    r = '^\d+$'
+                    
+                
+            else:
+                
+                r = self._match_value
+                
+            
+            self._compiled_regex = re.compile( r )
+            
+        
+        return self._compiled_regex
+        
     
     def _GetSerialisableInfo( self ):
         
@@ -3116,6 +3676,8 @@ class StringMatch( HydrusSerialisable.SerialisableBase ):
         
         ( self._match_type, self._match_value, self._min_chars, self._max_chars, self._example_string ) = serialisable_info
         
+        self._compiled_regex = None
+        
     
     def SetMaxChars( self, max_chars ):
         
@@ -3129,17 +3691,40 @@ class StringMatch( HydrusSerialisable.SerialisableBase ):
     
     def Matches( self, text ):
         
-        try:
-            
-            self.Test( text )
+        # the same as Test, but without building any error text
+        
+        text_len = len( text )
+        
+        if self._min_chars is not None and text_len < self._min_chars:
             
-            return True
+            return False
             
-        except HydrusExceptions.StringMatchException:
+        
+        if self._max_chars is not None and text_len > self._max_chars:
             
             return False
             
         
+        if self._match_type == STRING_MATCH_FIXED:
+            
+            return text == self._match_value
+            
+        elif self._match_type in ( STRING_MATCH_FLEXIBLE, STRING_MATCH_REGEX ):
+            
+            try:
+                
+                compiled_regex = self._GetCompiledRegex()
+                
+            except Exception as e:
+                
+                return False
+                
+            
+            return compiled_regex.search( text ) is not None
+            
+        
+        return True
+        
     
     def Test( self, text ):
         
@@ -3193,7 +3778,7 @@ class StringMatch( HydrusSerialisable.SerialisableBase ):
             
             try:
                 
-                result = re.search( r, text )
+                result = self._GetCompiledRegex().search( text )
                 
             except Exception as e:
                 
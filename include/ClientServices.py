@@ -6,6 +6,7 @@ from . import ClientNetworkingContexts
 from . import ClientNetworkingJobs
 from . import ClientRatings
 from . import ClientThreading
+import collections
 import hashlib
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -16,13 +17,20 @@ from . import HydrusNetwork
 from . import HydrusNetworking
 from . import HydrusPaths
 from . import HydrusSerialisable
+from . import HydrusThreading
 import json
 import os
+import queue
 import threading
 import time
 import traceback
 import wx
 
+NUM_CONCURRENT_UPDATE_DOWNLOADS = 4
+
+# how many update files may be read and decoded ahead of the one the db is processing
+NUM_UPDATES_TO_LOAD_AHEAD = 2
+
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -898,7 +906,7 @@ class ServiceRestricted( ServiceRemote ):
         
     
     
-    def Request( self, method, command, request_args = None, request_headers = None, report_hooks = None, temp_path = None ):
+    def Request( self, method, command, request_args = None, request_headers = None, report_hooks = None, temp_path = None, network_job_hook = None ):
         
         if request_args is None: request_args = {}
         if request_headers is None: request_headers = {}
@@ -978,6 +986,11 @@ class ServiceRestricted( ServiceRemote ):
                 network_job.AddAdditionalHeader( 'Content-Type', HC.mime_string_lookup[ content_type ] )
                 
             
+            if network_job_hook is not None:
+                
+                network_job_hook( network_job )
+                
+            
             HG.client_controller.network_engine.AddJob( network_job )
             
             network_job.WaitUntilDone()
@@ -1144,6 +1157,81 @@ class ServiceRestricted( ServiceRemote ):
             
         
     
+class UpdateDownload( object ):
+    
+    def __init__( self, service, update_hash ):
+        
+        self._service = service
+        self._update_hash = update_hash
+        
+        self._lock = threading.Lock()
+        
+        self._cancelled = False
+        self._network_job = None
+        
+        self._result = None
+        self._error = None
+        
+        self._done_event = threading.Event()
+        
+    
+    def _SetNetworkJob( self, network_job ):
+        
+        with self._lock:
+            
+            if self._cancelled:
+                
+                raise HydrusExceptions.CancelledException( 'Update download was cancelled!' )
+                
+            
+            self._network_job = network_job
+            
+        
+    
+    def Cancel( self ):
+        
+        with self._lock:
+            
+            self._cancelled = True
+            
+            if self._network_job is not None:
+                
+                self._network_job.Cancel()
+                
+            
+        
+    
+    def GetResult( self ):
+        
+        if self._error is not None:
+            
+            raise self._error
+            
+        
+        return self._result
+        
+    
+    def WaitUntilDone( self, timeout = None ):
+        
+        return self._done_event.wait( timeout )
+        
+    
+    def Work( self ):
+        
+        try:
+            
+            self._result = self._service.Request( HC.GET, 'update', { 'update_hash' : self._update_hash }, network_job_hook = self._SetNetworkJob )
+            
+        except Exception as e:
+            
+            self._error = e
+            
+        finally:
+            
+            self._done_event.set()
+            
+        
+    
 class ServiceRepository( ServiceRestricted ):
     
     def __init__( self, service_key, service_type, name, dictionary = None ):
@@ -1318,12 +1406,19 @@ class ServiceRepository( ServiceRestricted ):
             
             job_key = ClientThreading.JobKey( cancellable = True, stop_time = stop_time )
             
+            # we keep a few requests in flight, so we are not paying a full round trip for every update
+            # the network engine still holds each job to the service's bandwidth rules
+            
+            downloads = collections.deque()
+            
             try:
                 
                 job_key.SetVariable( 'popup_title', name + ' sync: downloading updates' )
                 
                 HG.client_controller.pub( 'message', job_key )
                 
+                next_download_index = 0
+                
                 for ( i, update_hash ) in enumerate( update_hashes ):
                     
                     status = 'update ' + HydrusData.ConvertValueRangeToPrettyString( i + 1, len( update_hashes ) )
@@ -1352,9 +1447,42 @@ class ServiceRepository( ServiceRestricted ):
                         return
                         
                     
+                    while next_download_index < len( update_hashes ) and len( downloads ) < NUM_CONCURRENT_UPDATE_DOWNLOADS:
+                        
+                        download = UpdateDownload( self, update_hashes[ next_download_index ] )
+                        
+                        HG.client_controller.CallToThread( download.Work )
+                        
+                        downloads.append( download )
+                        
+                        next_download_index += 1
+                        
+                    
+                    download = downloads[0]
+                    
+                    while not download.WaitUntilDone( 0.5 ):
+                        
+                        if HydrusThreading.IsThreadShuttingDown():
+                            
+                            return
+                            
+                        
+                        if job_key.IsCancelled():
+                            
+                            with self._lock:
+                                
+                                self._DelayFutureRequests( 'download was recently cancelled', 3 * 60 )
+                                
+                            
+                            return
+                            
+                        
+                    
+                    downloads.popleft()
+                    
                     try:
                         
-                        update_network_string = self.Request( HC.GET, 'update', { 'update_hash' : update_hash } )
+                        update_network_string = download.GetResult()
                         
                     except HydrusExceptions.CancelledException as e:
                         
@@ -1464,6 +1592,25 @@ class ServiceRepository( ServiceRestricted ):
                 
             finally:
                 
+                # if we bailed out early, the downloads still in flight are no longer wanted, so stop them using bandwidth
+                # we wait on them so none are still writing into the service once we have returned
+                
+                for download in downloads:
+                    
+                    download.Cancel()
+                    
+                
+                for download in downloads:
+                    
+                    while not download.WaitUntilDone( 0.5 ):
+                        
+                        if HydrusThreading.IsThreadShuttingDown():
+                            
+                            break
+                            
+                        
+                    
+                
                 job_key.Finish()
                 job_key.Delete( 5 )
                 
@@ -1487,6 +1634,9 @@ class ServiceRepository( ServiceRestricted ):
         
         work_done = False
         
+        loaded_updates = queue.Queue( maxsize = NUM_UPDATES_TO_LOAD_AHEAD )
+        stop_loading = threading.Event()
+        
         try:
             
             job_key = ClientThreading.JobKey( cancellable = True, maintenance_mode = maintenance_mode, stop_time = stop_time )
@@ -1504,6 +1654,151 @@ class ServiceRepository( ServiceRestricted ):
             
             HydrusData.Print( title )
             
+            # reading and decoding an update is a good chunk of the work, so a worker thread does it for the next few updates while the db processes this one
+            # at most NUM_UPDATES_TO_LOAD_AHEAD + 2 decoded updates are in memory at once: those in the queue, one the worker has decoded and is waiting to put, and the one the db is processing
+            
+            def load_update( update_hash, mime ):
+                
+                update_path = HG.client_controller.client_files_manager.GetFilePath( update_hash, mime )
+                
+                with open( update_path, 'rb' ) as f:
+                    
+                    update_network_bytes = f.read()
+                    
+                
+                try:
+                    
+                    update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+                    
+                except Exception as e:
+                    
+                    raise HydrusExceptions.SerialisationException( str( e ) )
+                    
+                
+                iterator_dict = {}
+                
+                if mime == HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS:
+                    
+                    if not isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                        
+                        raise HydrusExceptions.MimeException( 'Expected a definitions update!' )
+                        
+                    
+                    iterator_dict[ 'service_hash_ids_to_hashes' ] = iter( update.GetHashIdsToHashes().items() )
+                    iterator_dict[ 'service_tag_ids_to_tags' ] = iter( update.GetTagIdsToTags().items() )
+                    
+                else:
+                    
+                    if not isinstance( update, HydrusNetwork.ContentUpdate ):
+                        
+                        raise HydrusExceptions.MimeException( 'Expected a content update!' )
+                        
+                    
+                    iterator_dict[ 'new_files' ] = iter( update.GetNewFiles() )
+                    iterator_dict[ 'deleted_files' ] = iter( update.GetDeletedFiles() )
+                    iterator_dict[ 'new_mappings' ] = HydrusData.SmoothOutMappingIterator( update.GetNewMappings(), 50 )
+                    iterator_dict[ 'deleted_mappings' ] = HydrusData.SmoothOutMappingIterator( update.GetDeletedMappings(), 50 )
+                    iterator_dict[ 'new_parents' ] = iter( update.GetNewTagParents() )
+                    iterator_dict[ 'deleted_parents' ] = iter( update.GetDeletedTagParents() )
+                    iterator_dict[ 'new_siblings' ] = iter( update.GetNewTagSiblings() )
+                    iterator_dict[ 'deleted_siblings' ] = iter( update.GetDeletedTagSiblings() )
+                    
+                
+                return ( iterator_dict, update.GetNumRows() )
+                
+            
+            def load_updates( updates_to_load ):
+                
+                for ( update_hash, mime ) in updates_to_load:
+                    
+                    try:
+                        
+                        loaded_update = load_update( update_hash, mime )
+                        
+                    except Exception as e:
+                        
+                        loaded_update = e
+                        
+                    
+                    while True:
+                        
+                        if stop_loading.is_set():
+                            
+                            return
+                            
+                        
+                        try:
+                            
+                            loaded_updates.put( loaded_update, timeout = 0.5 )
+                            
+                            break
+                            
+                        except queue.Full:
+                            
+                            pass
+                            
+                        
+                    
+                    if isinstance( loaded_update, Exception ):
+                        
+                        return
+                        
+                    
+                
+            
+            def get_next_loaded_update():
+                
+                while True:
+                    
+                    try:
+                        
+                        loaded_update = loaded_updates.get( timeout = 0.5 )
+                        
+                        break
+                        
+                    except queue.Empty:
+                        
+                        if HydrusThreading.IsThreadShuttingDown():
+                            
+                            raise HydrusExceptions.ShutdownException()
+                            
+                        
+                    
+                
+                try:
+                    
+                    if isinstance( loaded_update, Exception ):
+                        
+                        raise loaded_update
+                        
+                    
+                except HydrusExceptions.FileMissingException:
+                    
+                    HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
+                    
+                    raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
+                    
+                except HydrusExceptions.SerialisationException:
+                    
+                    HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
+                    
+                    raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
+                    
+                except HydrusExceptions.MimeException:
+                    
+                    HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
+                    
+                    raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
+                    
+                
+                return loaded_update
+                
+            
+            updates_to_load = [ ( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS ) for definition_hash in definition_hashes ]
+            updates_to_load.extend( ( ( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) for content_hash in content_hashes ) )
+            
+            HG.client_controller.CallToThreadLongRunning( load_updates, updates_to_load )
+            
             num_updates_done = 0
             num_updates_to_do = len( definition_hashes ) + len( content_hashes )
             
@@ -1533,48 +1828,10 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
-                        
-                    except HydrusExceptions.FileMissingException:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        definition_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    if not isinstance( definition_update, HydrusNetwork.DefinitionsUpdate ):
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
-                        
+                    ( iterator_dict, rows_in_this_update ) = get_next_loaded_update()
                     
-                    rows_in_this_update = definition_update.GetNumRows()
                     rows_done_in_this_update = 0
                     
-                    iterator_dict = {}
-                    
-                    iterator_dict[ 'service_hash_ids_to_hashes' ] = iter( definition_update.GetHashIdsToHashes().items() )
-                    iterator_dict[ 'service_tag_ids_to_tags' ] = iter( definition_update.GetTagIdsToTags().items() )
-                    
                     while len( iterator_dict ) > 0:
                         
                         this_work_start_time = HydrusData.GetNowPrecise()
@@ -1661,54 +1918,10 @@ class ServiceRepository( ServiceRestricted ):
                     job_key.SetVariable( 'popup_text_1', status )
                     job_key.SetVariable( 'popup_gauge_1', ( num_updates_done, num_updates_to_do ) )
                     
-                    try:
-                        
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
-                        
-                    except HydrusExceptions.FileMissingException:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        content_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file was invalid. Your repository should be paused, and all update files have been scheduled for an integrity check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
-                        
+                    ( iterator_dict, rows_in_this_update ) = get_next_loaded_update()
                     
-                    if not isinstance( content_update, HydrusNetwork.ContentUpdate ):
-                        
-                        HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA )
-                        
-                        raise Exception( 'An unusual error has occured during repository processing: an update file has incorrect metadata. Your repository should be paused, and all update files have been scheduled for a metadata rescan. Please permit file maintenance to fix them, or tell it to do so manually, before unpausing your repository.' )
-                        
-                    
-                    rows_in_this_update = content_update.GetNumRows()
                     rows_done_in_this_update = 0
                     
-                    iterator_dict = {}
-                    
-                    iterator_dict[ 'new_files' ] = iter( content_update.GetNewFiles() )
-                    iterator_dict[ 'deleted_files' ] = iter( content_update.GetDeletedFiles() )
-                    iterator_dict[ 'new_mappings' ] = HydrusData.SmoothOutMappingIterator( content_update.GetNewMappings(), 50 )
-                    iterator_dict[ 'deleted_mappings' ] = HydrusData.SmoothOutMappingIterator( content_update.GetDeletedMappings(), 50 )
-                    iterator_dict[ 'new_parents' ] = iter( content_update.GetNewTagParents() )
-                    iterator_dict[ 'deleted_parents' ] = iter( content_update.GetDeletedTagParents() )
-                    iterator_dict[ 'new_siblings' ] = iter( content_update.GetNewTagSiblings() )
-                    iterator_dict[ 'deleted_siblings' ] = iter( content_update.GetDeletedTagSiblings() )
-                    
                     while len( iterator_dict ) > 0:
                         
                         this_work_start_time = HydrusData.GetNowPrecise()
@@ -1797,6 +2010,8 @@ class ServiceRepository( ServiceRestricted ):
             
         finally:
             
+            stop_loading.set()
+            
             if work_done:
                 
                 self._is_mostly_caught_up = None
@@ -2034,14 +2249,18 @@ class ServiceRepository( ServiceRestricted ):
             service_key = self._service_key
             
         
+        client_files_manager = HG.client_controller.client_files_manager
+        
+        # the db checks which thumbnails we have, so load any thumbnail packs out here rather than on the db thread
+        
+        client_files_manager.LoadThumbnailPackIndices()
+        
         thumbnail_hashes = HG.client_controller.Read( 'missing_thumbnail_hashes', service_key )
         
         num_to_do = len( thumbnail_hashes )
         
         if num_to_do > 0:
             
-            client_files_manager = HG.client_controller.client_files_manager
-            
             job_key = ClientThreading.JobKey( cancellable = True, stop_time = stop_time )
             
             try:
@@ -0,0 +1,149 @@
+import numpy
+import threading
+
+POPCOUNT_LOOKUP = numpy.array( [ bin( i ).count( '1' ) for i in range( 256 ) ], dtype = numpy.uint8 )
+
+def ConvertPHashesToArray( phashes ):
+    
+    # phashes are stored as 8 big-endian bytes
+    
+    return numpy.frombuffer( b''.join( phashes ), dtype = '>u8' ).astype( numpy.uint64 )
+    
+def GetPopCounts( array ):
+    
+    if hasattr( numpy, 'bitwise_count' ):
+        
+        return numpy.bitwise_count( array )
+        
+    
+    # older numpy, so do it a byte at a time
+    
+    return POPCOUNT_LOOKUP[ array.view( numpy.uint8 ) ].reshape( ( -1, 8 ) ).sum( axis = 1, dtype = numpy.uint8 )
+    
+class PHashIndex( object ):
+    
+    # a brute-force in-memory alternative to the db's vptree
+    # a vectorised xor and popcount over a packed array of every phash takes a few ms per million phashes, with no db hits
+    
+    MAX_MATRIX_SIZE = 4 * 1024 * 1024
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._phash_ids = numpy.zeros( 0, dtype = numpy.int64 )
+        self._phashes = numpy.zeros( 0, dtype = numpy.uint64 )
+        
+        self._phash_ids_to_add = []
+        self._phashes_to_add = []
+        self._phash_ids_to_remove = set()
+        
+    
+    def _GetArrays( self ):
+        
+        # we batch up changes and only rebuild the arrays when someone wants to search them
+        # the arrays are never edited in place, so the caller can use them outside the lock
+        
+        if len( self._phash_ids_to_remove ) > 0:
+            
+            keep = numpy.isin( self._phash_ids, numpy.fromiter( self._phash_ids_to_remove, dtype = numpy.int64 ), invert = True )
+            
+            self._phash_ids = self._phash_ids[ keep ]
+            self._phashes = self._phashes[ keep ]
+            
+            self._phash_ids_to_remove = set()
+            
+        
+        if len( self._phash_ids_to_add ) > 0:
+            
+            self._phash_ids = numpy.concatenate( ( self._phash_ids, numpy.array( self._phash_ids_to_add, dtype = numpy.int64 ) ) )
+            self._phashes = numpy.concatenate( ( self._phashes, ConvertPHashesToArray( self._phashes_to_add ) ) )
+            
+            self._phash_ids_to_add = []
+            self._phashes_to_add = []
+            
+        
+        return ( self._phash_ids, self._phashes )
+        
+    
+    def AddPHashes( self, rows ):
+        
+        with self._lock:
+            
+            rows = list( rows )
+            
+            if not self._phash_ids_to_remove.isdisjoint( ( phash_id for ( phash_id, phash ) in rows ) ):
+                
+                # sqlite can reuse a deleted phash_id, so clear out the old entry first
+                
+                self._GetArrays()
+                
+            
+            for ( phash_id, phash ) in rows:
+                
+                self._phash_ids_to_add.append( phash_id )
+                self._phashes_to_add.append( phash )
+                
+            
+        
+    
+    def GetNumPHashes( self ):
+        
+        with self._lock:
+            
+            ( phash_ids, phashes ) = self._GetArrays()
+            
+            return len( phash_ids )
+            
+        
+    
+    def RemovePHashIds( self, phash_ids ):
+        
+        with self._lock:
+            
+            # removals are applied before additions, so get any pending additions in first
+            
+            self._GetArrays()
+            
+            self._phash_ids_to_remove.update( phash_ids )
+            
+        
+    
+    def Search( self, phash, max_hamming_distance ):
+        
+        return self.SearchMany( ( phash, ), max_hamming_distance )[0]
+        
+    
+    def SearchMany( self, search_phashes, max_hamming_distance ):
+        
+        # returns, for each search phash, a list of ( phash_id, distance )
+        
+        with self._lock:
+            
+            ( phash_ids, phashes ) = self._GetArrays()
+            
+        
+        search_array = ConvertPHashesToArray( search_phashes )
+        
+        # keep the distance matrix to about 32MB
+        block_size = max( 1, self.MAX_MATRIX_SIZE // max( 1, len( phashes ) ) )
+        
+        results = []
+        
+        for i in range( 0, len( search_array ), block_size ):
+            
+            block = search_array[ i : i + block_size ]
+            
+            distances = GetPopCounts( numpy.bitwise_xor( block[ :, None ], phashes[ None, : ] ) ).reshape( ( len( block ), len( phashes ) ) )
+            
+            for row in distances:
+                
+                ( indices, ) = numpy.nonzero( row <= max_hamming_distance )
+                
+                results.append( list( zip( phash_ids[ indices ].tolist(), row[ indices ].tolist() ) ) )
+                
+            
+        
+        return results
+        
+    
@@ -1,3 +1,4 @@
+import collections
 import distutils.version
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -8,8 +9,10 @@ from . import HydrusText
 import os
 import queue
 import sqlite3
+import threading
 import traceback
 import time
+import urllib.request
 
 CONNECTION_REFRESH_TIME = 60 * 30
 
@@ -84,6 +87,10 @@ def ReadLargeIdQueryInSeparateChunks( cursor, select_statement, chunk_size ):
     
     cursor.execute( 'DROP TABLE ' + table_name + ';' )
     
+def GenerateReadOnlyURI( db_path ):
+    
+    return 'file:{}?mode=ro'.format( urllib.request.pathname2url( db_path ) )
+    
 def VacuumDB( db_path ):
     
     db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
@@ -125,9 +132,26 @@ def VacuumDB( db_path ):
         c.execute( 'PRAGMA journal_mode = WAL;' )
         
     
+class DBConnectionData( threading.local ):
+    
+    # the writer and each read-only worker get their own connection and cursor, so the subclass's _c is always the right one for the current thread
+    
+    def __init__( self ):
+        
+        self.db = None
+        self.c = None
+        self.read_only = False
+        self.pubsubs = []
+        
+    
 class HydrusDB( object ):
     
     READ_WRITE_ACTIONS = []
+    
+    # actions listed here do not write to the db, so they can be served in parallel by the read-only connection pool
+    # if one turns out to need a write anyway, it is handed back to the main job queue
+    READ_ONLY_ACTIONS = []
+    
     UPDATE_WAIT = 2
     
     TRANSACTION_COMMIT_TIME = 30
@@ -149,6 +173,8 @@ class HydrusDB( object ):
         
         self._connection_timestamp = 0
         
+        self._connection_data = self._GenerateConnectionData()
+        
         main_db_filename = db_name
         
         if not main_db_filename.endswith( '.db' ):
@@ -182,15 +208,17 @@ class HydrusDB( object ):
         self._could_not_initialise = False
         
         self._jobs = queue.Queue()
-        self._pubsubs = []
+        
+        self._read_only_jobs = queue.Queue()
+        self._read_only_lock = threading.Lock()
+        self._num_read_only_workers = 0
+        self._pending_write_jobs_to_thread_idents = {}
+        self._thread_idents_to_num_pending_write_jobs = collections.Counter()
         
         self._currently_doing_job = False
         self._current_status = ''
         self._current_job_name = ''
         
-        self._db = None
-        self._c = None
-        
         if os.path.exists( os.path.join( self._db_dir, self._db_filenames[ 'main' ] ) ):
             
             # open and close to clean up in case last session didn't close well
@@ -277,24 +305,22 @@ class HydrusDB( object ):
             
         
     
-    def _AttachExternalDatabases( self ):
+    def _AttachExternalDatabases( self, read_only = False ):
+        
+        names_to_paths = { name : os.path.join( self._db_dir, filename ) for ( name, filename ) in self._db_filenames.items() if name != 'main' }
         
-        for ( name, filename ) in list(self._db_filenames.items()):
+        names_to_paths[ 'durable_temp' ] = os.path.join( self._db_dir, self._durable_temp_db_filename )
+        
+        for ( name, db_path ) in names_to_paths.items():
             
-            if name == 'main':
+            if read_only:
                 
-                continue
+                db_path = GenerateReadOnlyURI( db_path )
                 
             
-            db_path = os.path.join( self._db_dir, filename )
-            
             self._c.execute( 'ATTACH ? AS ' + name + ';', ( db_path, ) )
             
         
-        db_path = os.path.join( self._db_dir, self._durable_temp_db_filename )
-        
-        self._c.execute( 'ATTACH ? AS durable_temp;', ( db_path, ) )
-        
     
     def _BeginImmediate( self ):
         
@@ -313,11 +339,18 @@ class HydrusDB( object ):
         pass
         
     
+    def _ClearReadOnlyCaches( self ):
+        
+        pass
+        
+    
     def _CloseDBCursor( self ):
         
         if self._db is not None:
             
-            if self._in_transaction:
+            # read-only connections only ever hold their own short read transactions
+            
+            if self._in_transaction and not self._connection_data.read_only:
                 
                 self._Commit()
                 
@@ -325,9 +358,6 @@ class HydrusDB( object ):
             self._c.close()
             self._db.close()
             
-            del self._c
-            del self._db
-            
             self._db = None
             self._c = None
             
@@ -347,6 +377,20 @@ class HydrusDB( object ):
             
         
     
+    def _CommitAndRestartTransaction( self ):
+        
+        # the read-only pool checks the write flags under this lock, so a read cannot be dispatched between the commit and the flags clearing
+        
+        with self._read_only_lock:
+            
+            self._Commit()
+            
+            self._BeginImmediate()
+            
+            self._transaction_contains_writes = False
+            
+        
+    
     def _CreateDB( self ):
         
         raise NotImplementedError()
@@ -537,6 +581,36 @@ class HydrusDB( object ):
             
         
     
+    def _InitReadOnlyDBCursor( self ):
+        
+        self._CloseDBCursor()
+        
+        db_path = os.path.join( self._db_dir, self._db_filenames[ 'main' ] )
+        
+        self._db = sqlite3.connect( GenerateReadOnlyURI( db_path ), isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES, uri = True )
+        
+        self._c = self._db.cursor()
+        
+        self._connection_data.read_only = True
+        
+        if HG.no_db_temp_files:
+            
+            self._c.execute( 'PRAGMA temp_store = 2;' )
+            
+        
+        # mem and temp are still writable, so temporary integer tables and the like work as normal
+        self._c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        self._AttachExternalDatabases( read_only = True )
+        
+        db_names = [ name for ( index, name, path ) in self._c.execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp' ) ]
+        
+        for db_name in db_names:
+            
+            self._c.execute( 'PRAGMA {}.cache_size = -10000;'.format( db_name ) )
+            
+        
+    
     def _InitDiskCache( self ):
         
         pass
@@ -547,6 +621,45 @@ class HydrusDB( object ):
         pass
         
     
+    def _GenerateConnectionData( self ):
+        
+        return DBConnectionData()
+        
+    
+    def _GetCursor( self ):
+        
+        return self._connection_data.c
+        
+    
+    def _GetDB( self ):
+        
+        return self._connection_data.db
+        
+    
+    def _GetPubSubs( self ):
+        
+        return self._connection_data.pubsubs
+        
+    
+    def _SetCursor( self, c ):
+        
+        self._connection_data.c = c
+        
+    
+    def _SetDB( self, db ):
+        
+        self._connection_data.db = db
+        
+    
+    def _SetPubSubs( self, pubsubs ):
+        
+        self._connection_data.pubsubs = pubsubs
+        
+    
+    _c = property( _GetCursor, _SetCursor )
+    _db = property( _GetDB, _SetDB )
+    _pubsubs = property( _GetPubSubs, _SetPubSubs )
+    
     def _ManageDBError( self, job, e ):
         
         raise NotImplementedError()
@@ -564,8 +677,6 @@ class HydrusDB( object ):
                 
                 self._current_status = 'db write locked'
                 
-                self._transaction_contains_writes = True
-                
             else:
                 
                 self._current_status = 'db read locked'
@@ -582,17 +693,24 @@ class HydrusDB( object ):
                 result = self._Write( action, *args, **kwargs )
                 
             
+            if job_type in ( 'read_write', 'write' ):
+                
+                # only flag the writes once the job is done and before its pubsubs go out
+                # a job still running has not told anyone about its changes, so the read-only pool can keep serving the last commit alongside it
+                
+                with self._read_only_lock:
+                    
+                    self._transaction_contains_writes = True
+                    
+                
+            
             if self._transaction_contains_writes and HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ):
                 
                 self._current_status = 'db committing'
                 
                 self.publish_status_update()
                 
-                self._Commit()
-                
-                self._BeginImmediate()
-                
-                self._transaction_contains_writes = False
+                self._CommitAndRestartTransaction()
                 
             else:
                 
@@ -640,11 +758,196 @@ class HydrusDB( object ):
             
         
     
+    def _ProcessReadOnlyJob( self, job ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        try:
+            
+            self._ClearReadOnlyCaches()
+            
+            self._c.execute( 'BEGIN DEFERRED;' )
+            
+            try:
+                
+                result = self._Read( action, *args, **kwargs )
+                
+            finally:
+                
+                self._c.execute( 'COMMIT;' )
+                
+            
+            for ( topic, args, kwargs ) in self._pubsubs:
+                
+                self._controller.pub( topic, *args, **kwargs )
+                
+            
+            job.PutResult( result )
+            
+        except sqlite3.OperationalError as e:
+            
+            if 'readonly' in str( e ):
+                
+                # this read wanted to write something after all, so let the main loop do it
+                # until that is committed, further reads need to go through the main loop too
+                
+                with self._read_only_lock:
+                    
+                    self._transaction_contains_writes = True
+                    
+                
+                self._jobs.put( job )
+                
+            else:
+                
+                self._ManageDBError( job, e )
+                
+            
+        except Exception as e:
+            
+            self._ManageDBError( job, e )
+            
+        finally:
+            
+            self._pubsubs = []
+            
+        
+    
     def _Read( self, action, *args, **kwargs ):
         
         raise NotImplementedError()
         
     
+    def _PutOnReadOnlyPool( self, job, action ):
+        
+        if action not in self.READ_ONLY_ACTIONS or self._pause_and_disconnect:
+            
+            return False
+            
+        
+        with self._read_only_lock:
+            
+            if self._num_read_only_workers == 0:
+                
+                return False
+                
+            
+            # a reader on another connection cannot see uncommitted writes, so once a write job has finished, reads go through the main loop until the next commit
+            # during a long run of writes, like an import or repository processing, that means the pool sits nearly idle for up to TRANSACTION_COMMIT_TIME at a time
+            # we accept that rather than commit early for waiting reads, which would throw away the write batching those runs depend on
+            # a thread that has queued its own writes expects to see them, so its reads wait in line behind them
+            
+            if self._transaction_contains_writes or self._thread_idents_to_num_pending_write_jobs[ threading.get_ident() ] > 0:
+                
+                return False
+                
+            
+            # we put under the lock, so a worker that fails to start cannot hand back the queue before this job is on it
+            
+            self._read_only_jobs.put( job )
+            
+            return True
+            
+        
+    
+    def _ReadOnlyWorkerLoop( self ):
+        
+        try:
+            
+            self._InitReadOnlyDBCursor()
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'A read-only db connection could not be initialised:' )
+            
+            HydrusData.PrintException( e )
+            
+            with self._read_only_lock:
+                
+                self._num_read_only_workers -= 1
+                
+                if self._num_read_only_workers == 0:
+                    
+                    # reads may have been queued for us before we failed, so hand them to the main loop
+                    
+                    while not self._read_only_jobs.empty():
+                        
+                        self._jobs.put( self._read_only_jobs.get() )
+                        
+                    
+                
+            
+            return
+            
+        
+        while not ( ( self._local_shutdown or HG.model_shutdown ) and self._read_only_jobs.empty() ):
+            
+            if self._pause_and_disconnect:
+                
+                self._CloseDBCursor()
+                
+                while self._pause_and_disconnect:
+                    
+                    if self._local_shutdown or HG.model_shutdown:
+                        
+                        break
+                        
+                    
+                    time.sleep( 1 )
+                    
+                
+                try:
+                    
+                    self._InitReadOnlyDBCursor()
+                    
+                except Exception as e:
+                    
+                    HydrusData.PrintException( e )
+                    
+                    break
+                    
+                
+            
+            try:
+                
+                job = self._read_only_jobs.get( timeout = 1 )
+                
+            except queue.Empty:
+                
+                continue
+                
+            
+            self._ProcessReadOnlyJob( job )
+            
+        
+        self._CloseDBCursor()
+        
+        with self._read_only_lock:
+            
+            self._num_read_only_workers -= 1
+            
+        
+    
+    def _StartReadOnlyWorkers( self ):
+        
+        if len( self.READ_ONLY_ACTIONS ) == 0 or HG.no_wal or HG.db_memory_journaling:
+            
+            # without WAL, readers would block and be blocked by the writer's long-running transaction
+            
+            return
+            
+        
+        for i in range( HG.db_read_only_connections ):
+            
+            with self._read_only_lock:
+                
+                self._num_read_only_workers += 1
+                
+            
+            self._controller.CallToThreadLongRunning( self._ReadOnlyWorkerLoop )
+            
+        
+    
     def _RepairDB( self ):
         
         pass
@@ -846,7 +1149,7 @@ class HydrusDB( object ):
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.empty() and self._read_only_jobs.empty()
         
     
     def MainLoop( self ):
@@ -868,11 +1171,15 @@ class HydrusDB( object ):
             return
             
         
+        # the workers have to be counted before anyone can ask us for anything, or the first reads would all go to the main loop
+        
+        self._StartReadOnlyWorkers()
+        
         self._ready_to_serve_requests = True
         
         error_count = 0
         
-        while not ( ( self._local_shutdown or HG.model_shutdown ) and self._jobs.empty() ):
+        while not ( ( self._local_shutdown or HG.model_shutdown ) and self._jobs.empty() and self._num_read_only_workers == 0 ):
             
             try:
                 
@@ -905,6 +1212,21 @@ class HydrusDB( object ):
                         self._ProcessJob( job )
                         
                     
+                    with self._read_only_lock:
+                        
+                        if job in self._pending_write_jobs_to_thread_idents:
+                            
+                            thread_ident = self._pending_write_jobs_to_thread_idents.pop( job )
+                            
+                            self._thread_idents_to_num_pending_write_jobs[ thread_ident ] -= 1
+                            
+                            if self._thread_idents_to_num_pending_write_jobs[ thread_ident ] == 0:
+                                
+                                del self._thread_idents_to_num_pending_write_jobs[ thread_ident ]
+                                
+                            
+                        
+                    
                     error_count = 0
                     
                 except:
@@ -930,11 +1252,7 @@ class HydrusDB( object ):
                 
                 if self._transaction_contains_writes and HydrusData.TimeHasPassed( self._transaction_started + self.TRANSACTION_COMMIT_TIME ):
                     
-                    self._Commit()
-                    
-                    self._BeginImmediate()
-                    
-                    self._transaction_contains_writes = False
+                    self._CommitAndRestartTransaction()
                     
                 
             
@@ -997,7 +1315,12 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        put_on_read_only_pool = job_type == 'read' and self._PutOnReadOnlyPool( job, action )
+        
+        if not put_on_read_only_pool:
+            
+            self._jobs.put( job )
+            
         
         return job.GetResult()
         
@@ -1023,6 +1346,14 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
+        with self._read_only_lock:
+            
+            thread_ident = threading.get_ident()
+            
+            self._pending_write_jobs_to_thread_idents[ job ] = thread_ident
+            self._thread_idents_to_num_pending_write_jobs[ thread_ident ] += 1
+            
+        
         self._jobs.put( job )
         
         if synchronous: return job.GetResult()
@@ -1055,3 +1386,35 @@ class TemporaryIntegerTable( object ):
         return False
         
     
+class TemporaryValueTable( object ):
+    
+    # like the integer table, but for hashes, tags and other values that have to be joined on their content
+    
+    def __init__( self, cursor, value_iterable, column_name, column_type ):
+        
+        self._cursor = cursor
+        self._value_iterable = value_iterable
+        self._column_name = column_name
+        self._column_type = column_type
+        
+        self._table_name = 'mem.tempvalue' + os.urandom( 32 ).hex()
+        
+    
+    def __enter__( self ):
+        
+        # no index, since we only ever scan this and probe the real table's index with it
+        
+        self._cursor.execute( 'CREATE TABLE ' + self._table_name + ' ( ' + self._column_name + ' ' + self._column_type + ' );' )
+        
+        self._cursor.executemany( 'INSERT INTO ' + self._table_name + ' ( ' + self._column_name + ' ) VALUES ( ? );', ( ( value, ) for value in self._value_iterable ) )
+        
+        return self._table_name
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        self._cursor.execute( 'DROP TABLE ' + self._table_name + ';' )
+        
+        return False
+        
+    
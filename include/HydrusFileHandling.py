@@ -6,6 +6,7 @@ from . import HydrusData
 from . import HydrusDocumentHandling
 from . import HydrusExceptions
 from . import HydrusFlashHandling
+from . import HydrusGlobals as HG
 from . import HydrusImageHandling
 from . import HydrusNetwork
 from . import HydrusPaths
@@ -13,6 +14,7 @@ from . import HydrusSerialisable
 from . import HydrusText
 from . import HydrusVideoHandling
 import os
+import queue
 import threading
 import traceback
 
@@ -114,6 +116,67 @@ def GenerateThumbnailBytes( path, target_resolution, mime, duration, num_frames,
     
     return thumbnail_bytes
     
+def GetAllHashesFromPath( path ):
+    
+    # sha256, md5, sha1 and sha512 from one read of the file
+    # a reader thread keeps the disk busy while we hash, and hashlib lets go of the GIL on big blocks, so the two overlap
+    
+    h_sha256 = hashlib.sha256()
+    h_md5 = hashlib.md5()
+    h_sha1 = hashlib.sha1()
+    h_sha512 = hashlib.sha512()
+    
+    blocks = queue.Queue( maxsize = 16 )
+    errors = []
+    
+    def do_read():
+        
+        try:
+            
+            with open( path, 'rb' ) as f:
+                
+                for block in HydrusPaths.ReadFileLikeAsBlocks( f ):
+                    
+                    blocks.put( block )
+                    
+                
+            
+        except Exception as e:
+            
+            errors.append( e )
+            
+        finally:
+            
+            blocks.put( None )
+            
+        
+    
+    HG.controller.CallToThread( do_read )
+    
+    while True:
+        
+        block = blocks.get()
+        
+        if block is None:
+            
+            # the reader puts this last, so it is done with the file and any error is already recorded
+            
+            break
+            
+        
+        h_sha256.update( block )
+        h_md5.update( block )
+        h_sha1.update( block )
+        h_sha512.update( block )
+        
+    
+    if len( errors ) > 0:
+        
+        raise errors[0]
+        
+    
+    return ( h_sha256.digest(), h_md5.digest(), h_sha1.digest(), h_sha512.digest() )
+    
 def GetExtraHashesFromPath( path ):
     
     h_md5 = hashlib.md5()
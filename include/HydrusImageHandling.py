@@ -197,36 +197,49 @@ def GenerateNumPyImage( path, mime, force_pil = False ):
             
         else:
             
-            if numpy_image.dtype == 'uint16':
-                
-                numpy_image //= 256
-                
-                numpy_image = numpy.array( numpy_image, dtype = 'uint8' )
-                
+            numpy_image = NormaliseOpenCVNumPyImage( numpy_image )
             
-            shape = numpy_image.shape
+        
+    
+    return numpy_image
+    
+def GenerateNumPyImageFromBytes( image_bytes, mime, force_pil = False ):
+    
+    # same as above, but for image data we already have in memory, like a thumbnail out of a pack file
+    
+    if not OPENCV_OK:
+        
+        force_pil = True
+        
+    
+    if mime in PIL_ONLY_MIMETYPES or force_pil:
+        
+        pil_image = GeneratePILImage( io.BytesIO( image_bytes ) )
+        
+        numpy_image = GenerateNumPyImageFromPILImage( pil_image )
+        
+    else:
+        
+        if mime == HC.IMAGE_JPEG:
             
-            if len( shape ) == 2:
-                
-                # monochrome image
-                
-                convert = cv2.COLOR_GRAY2RGB
-                
-            else:
-                
-                ( im_y, im_x, depth ) = shape
-                
-                if depth == 4:
-                    
-                    convert = cv2.COLOR_BGRA2RGBA
-                    
-                else:
-                    
-                    convert = cv2.COLOR_BGR2RGB
-                    
-                
+            flags = CV_IMREAD_FLAGS_SUPPORTS_EXIF_REORIENTATION
             
-            numpy_image = cv2.cvtColor( numpy_image, convert )
+        else:
+            
+            flags = CV_IMREAD_FLAGS_SUPPORTS_ALPHA
+            
+        
+        numpy_image = cv2.imdecode( numpy.frombuffer( image_bytes, dtype = 'uint8' ), flags )
+        
+        if numpy_image is None:
+            
+            pil_image = GeneratePILImage( io.BytesIO( image_bytes ) )
+            
+            numpy_image = GenerateNumPyImageFromPILImage( pil_image )
+            
+        else:
+            
+            numpy_image = NormaliseOpenCVNumPyImage( numpy_image )
             
         
     
@@ -326,7 +339,7 @@ def GeneratePILImage( path ):
     
     if pil_image is None:
         
-        raise Exception( 'The file at ' + path + ' could not be rendered!' )
+        raise Exception( 'The file at ' + str( path ) + ' could not be rendered!' )
         
     
     return pil_image
@@ -695,6 +708,39 @@ def IsDecompressionBomb( path ):
     
     return False
     
+def NormaliseOpenCVNumPyImage( numpy_image ):
+    
+    if numpy_image.dtype == 'uint16':
+        
+        numpy_image //= 256
+        
+        numpy_image = numpy.array( numpy_image, dtype = 'uint8' )
+        
+    
+    shape = numpy_image.shape
+    
+    if len( shape ) == 2:
+        
+        # monochrome image
+        
+        convert = cv2.COLOR_GRAY2RGB
+        
+    else:
+        
+        ( im_y, im_x, depth ) = shape
+        
+        if depth == 4:
+            
+            convert = cv2.COLOR_BGRA2RGBA
+            
+        else:
+            
+            convert = cv2.COLOR_BGR2RGB
+            
+        
+    
+    return cv2.cvtColor( numpy_image, convert )
+    
 def ResizeNumPyImage( numpy_image, target_resolution ):
     
     ( target_width, target_height ) = target_resolution
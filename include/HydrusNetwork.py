@@ -5,6 +5,9 @@ from . import HydrusExceptions
 from . import HydrusGlobals as HG
 from . import HydrusNetworking
 from . import HydrusSerialisable
+import itertools
+import json
+import struct
 import threading
 import urllib
 
@@ -14,6 +17,16 @@ STRING_PARAMS = { 'subject_tag' }
 JSON_PARAMS = set()
 JSON_BYTE_LIST_PARAMS = set()
 
+# how each content type/action block of a binary content update is laid out
+
+CONTENT_BINARY_ENCODING_JSON = 0
+CONTENT_BINARY_ENCODING_IDS = 1
+CONTENT_BINARY_ENCODING_COLUMNS = 2
+CONTENT_BINARY_ENCODING_MAPPINGS = 3
+
+# content type, action, encoding
+CONTENT_BINARY_BLOCK_HEADER_STRUCT = struct.Struct( '<IIB' )
+
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -40,6 +53,8 @@ def GenerateDefaultServiceDictionary( service_type ):
             
             dictionary[ 'metadata' ] = metadata
             
+            dictionary[ 'binary_updates' ] = False
+            
             if service_type == HC.FILE_REPOSITORY:
                 
                 dictionary[ 'log_uploader_ips' ] = False
@@ -239,7 +254,14 @@ def ParseNetworkBytesToParsedHydrusArgs( network_bytes ):
         return HydrusSerialisable.SerialisableDictionary()
         
     
-    args = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+    try:
+        
+        args = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+        
+    except HydrusExceptions.SerialisationException as e:
+        
+        raise HydrusExceptions.BadRequestException( 'Could not parse the request body: ' + str( e ) )
+        
     
     if not isinstance( args, dict ):
         
@@ -1252,6 +1274,100 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         return []
         
     
+    def _GetSerialisableBinary( self ):
+        
+        binary_chunks = []
+        
+        for ( content_type, actions_to_datas ) in self._content_data.items():
+            
+            for ( action, datas ) in actions_to_datas.items():
+                
+                if len( datas ) == 0:
+                    
+                    continue
+                    
+                
+                if content_type == HC.CONTENT_TYPE_MAPPINGS:
+                    
+                    encoding = CONTENT_BINARY_ENCODING_MAPPINGS
+                    
+                elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_DELETE:
+                    
+                    encoding = CONTENT_BINARY_ENCODING_IDS
+                    
+                elif content_type in ( HC.CONTENT_TYPE_FILES, HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_TYPE_TAG_SIBLINGS ):
+                    
+                    encoding = CONTENT_BINARY_ENCODING_COLUMNS
+                    
+                else:
+                    
+                    encoding = CONTENT_BINARY_ENCODING_JSON
+                    
+                
+                try:
+                    
+                    block = self._GetSerialisableBinaryBlock( encoding, datas )
+                    
+                except ( TypeError, ValueError, OverflowError ):
+                    
+                    # something unusual like a negative number, so fall back to json
+                    
+                    encoding = CONTENT_BINARY_ENCODING_JSON
+                    
+                    block = self._GetSerialisableBinaryBlock( encoding, datas )
+                    
+                
+                binary_chunks.append( CONTENT_BINARY_BLOCK_HEADER_STRUCT.pack( content_type, action, encoding ) )
+                binary_chunks.append( block )
+                
+            
+        
+        return b''.join( binary_chunks )
+        
+    
+    def _GetSerialisableBinaryBlock( self, encoding, datas ):
+        
+        if encoding == CONTENT_BINARY_ENCODING_MAPPINGS:
+            
+            # each row's hash ids are sorted and delta encoded, starting again from zero for every row
+            
+            tag_ids = []
+            row_lengths = []
+            hash_id_deltas = []
+            
+            for ( tag_id, hash_ids ) in datas:
+                
+                tag_ids.append( tag_id )
+                row_lengths.append( len( hash_ids ) )
+                
+                hash_ids = sorted( hash_ids )
+                
+                hash_id_deltas.extend( ( hash_id - previous_hash_id for ( previous_hash_id, hash_id ) in zip( [ 0 ] + hash_ids, hash_ids ) ) )
+                
+            
+            return HydrusSerialisable.PackIntegers( tag_ids ) + HydrusSerialisable.PackIntegers( row_lengths ) + HydrusSerialisable.PackIntegers( hash_id_deltas )
+            
+        elif encoding == CONTENT_BINARY_ENCODING_IDS:
+            
+            return HydrusSerialisable.PackIntegers( sorted( datas ), delta = True )
+            
+        elif encoding == CONTENT_BINARY_ENCODING_COLUMNS:
+            
+            if len( { len( row ) for row in datas } ) != 1:
+                
+                raise ValueError( 'Rows were not all the same length!' )
+                
+            
+            columns = list( zip( *datas ) )
+            
+            return struct.pack( '<B', len( columns ) ) + b''.join( ( HydrusSerialisable.PackIntegers( column, nullable = True ) for column in columns ) )
+            
+        else:
+            
+            return HydrusSerialisable.PackBytesList( [ bytes( json.dumps( datas ), 'utf-8' ) ] )
+            
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_info = []
@@ -1266,6 +1382,76 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         return serialisable_info
         
     
+    def _InitialiseFromSerialisableBinary( self, serialisable_binary ):
+        
+        offset = 0
+        
+        while offset < len( serialisable_binary ):
+            
+            ( content_type, action, encoding ) = CONTENT_BINARY_BLOCK_HEADER_STRUCT.unpack_from( serialisable_binary, offset )
+            
+            offset += CONTENT_BINARY_BLOCK_HEADER_STRUCT.size
+            
+            if encoding == CONTENT_BINARY_ENCODING_MAPPINGS:
+                
+                ( tag_ids, offset ) = HydrusSerialisable.UnpackIntegers( serialisable_binary, offset )
+                ( row_lengths, offset ) = HydrusSerialisable.UnpackIntegers( serialisable_binary, offset )
+                ( hash_id_deltas, offset ) = HydrusSerialisable.UnpackIntegers( serialisable_binary, offset )
+                
+                datas = []
+                
+                start = 0
+                
+                for ( tag_id, row_length ) in zip( tag_ids, row_lengths ):
+                    
+                    end = start + row_length
+                    
+                    datas.append( ( tag_id, list( itertools.accumulate( hash_id_deltas[ start : end ] ) ) ) )
+                    
+                    start = end
+                    
+                
+            elif encoding == CONTENT_BINARY_ENCODING_IDS:
+                
+                ( datas, offset ) = HydrusSerialisable.UnpackIntegers( serialisable_binary, offset )
+                
+            elif encoding == CONTENT_BINARY_ENCODING_COLUMNS:
+                
+                ( num_columns, ) = struct.unpack_from( '<B', serialisable_binary, offset )
+                
+                offset += 1
+                
+                columns = []
+                
+                for i in range( num_columns ):
+                    
+                    ( column, offset ) = HydrusSerialisable.UnpackIntegers( serialisable_binary, offset )
+                    
+                    columns.append( column )
+                    
+                
+                datas = list( zip( *columns ) )
+                
+            elif encoding == CONTENT_BINARY_ENCODING_JSON:
+                
+                ( ( json_bytes, ), offset ) = HydrusSerialisable.UnpackBytesList( serialisable_binary, offset )
+                
+                datas = json.loads( str( json_bytes, 'utf-8' ) )
+                
+            else:
+                
+                raise HydrusExceptions.SerialisationException( 'Did not understand content update binary encoding ' + str( encoding ) + '!' )
+                
+            
+            if content_type not in self._content_data:
+                
+                self._content_data[ content_type ] = {}
+                
+            
+            self._content_data[ content_type ][ action ] = datas
+            
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         for ( content_type, serialisable_actions_to_datas ) in serialisable_info:
@@ -1551,6 +1737,24 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
         self._tag_ids_to_tags = {}
         
     
+    def _GetSerialisableBinary( self ):
+        
+        hash_ids = sorted( self._hash_ids_to_hashes.keys() )
+        hashes = [ self._hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids ]
+        
+        tag_ids = sorted( self._tag_ids_to_tags.keys() )
+        tags = [ bytes( self._tag_ids_to_tags[ tag_id ], 'utf-8' ) for tag_id in tag_ids ]
+        
+        binary_chunks = []
+        
+        binary_chunks.append( HydrusSerialisable.PackIntegers( hash_ids, delta = True ) )
+        binary_chunks.append( HydrusSerialisable.PackBytesList( hashes ) )
+        binary_chunks.append( HydrusSerialisable.PackIntegers( tag_ids, delta = True ) )
+        binary_chunks.append( HydrusSerialisable.PackBytesList( tags ) )
+        
+        return b''.join( binary_chunks )
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_info = []
@@ -1568,6 +1772,17 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
         return serialisable_info
         
     
+    def _InitialiseFromSerialisableBinary( self, serialisable_binary ):
+        
+        ( hash_ids, offset ) = HydrusSerialisable.UnpackIntegers( serialisable_binary )
+        ( hashes, offset ) = HydrusSerialisable.UnpackBytesList( serialisable_binary, offset )
+        ( tag_ids, offset ) = HydrusSerialisable.UnpackIntegers( serialisable_binary, offset )
+        ( tags, offset ) = HydrusSerialisable.UnpackBytesList( serialisable_binary, offset )
+        
+        self._hash_ids_to_hashes = dict( zip( hash_ids, hashes ) )
+        self._tag_ids_to_tags = { tag_id : str( tag, 'utf-8' ) for ( tag_id, tag ) in zip( tag_ids, tags ) }
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         for ( definition_type, definitions ) in serialisable_info:
@@ -2280,6 +2495,7 @@ class ServerServiceRepository( ServerServiceRestricted ):
         dictionary = ServerServiceRestricted._GetSerialisableDictionary( self )
         
         dictionary[ 'metadata' ] = self._metadata
+        dictionary[ 'binary_updates' ] = self._binary_updates
         
         return dictionary
         
@@ -2290,6 +2506,15 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         self._metadata = dictionary[ 'metadata' ]
         
+        # services made before the binary format do not have this yet
+        
+        if 'binary_updates' not in dictionary:
+            
+            dictionary[ 'binary_updates' ] = False
+            
+        
+        self._binary_updates = dictionary[ 'binary_updates' ]
+        
     
     def GetMetadata( self ):
         
@@ -2341,10 +2566,12 @@ class ServerServiceRepository( ServerServiceRestricted ):
                         
                         begin = self._metadata.GetNextUpdateBegin()
                         
+                        binary_updates = self._binary_updates
+                        
                     
                     end = begin + HC.UPDATE_DURATION
                     
-                    update_hashes = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end )
+                    update_hashes = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end, binary_updates = binary_updates )
                     
                     next_update_due = end + HC.UPDATE_DURATION + 1
                     
@@ -2499,3 +2726,17 @@ class UpdateBuilder( object ):
         return self._updates
         
     
+    def HasUpdates( self ):
+        
+        return len( self._updates ) > 0
+        
+    
+    def PopUpdates( self ):
+        
+        updates = self._updates
+        
+        self._updates = []
+        
+        return updates
+        
+    
@@ -1,3 +1,4 @@
+import bisect
 import calendar
 import collections
 import datetime
@@ -475,6 +476,8 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         self._minutes_requests = collections.Counter()
         self._seconds_requests = collections.Counter()
         
+        self._RebuildUsageIndices()
+        
     
     def _GetSerialisableInfo( self ):
         
@@ -510,6 +513,8 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         self._minutes_requests = counters[ 8 ]
         self._seconds_requests = counters[ 9 ]
         
+        self._RebuildUsageIndices()
+        
     
     def _GetCurrentDateTime( self ):
         
@@ -627,7 +632,7 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             since = HydrusData.GetNow() - search_time_delta
             
-            return sum( ( value for ( timestamp, value ) in list(counter.items()) if timestamp >= since ) )
+            return self._GetUsageIndex( counter ).GetUsageSince( since )
             
         
     
@@ -652,6 +657,11 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         return ( month_time, day_time, hour_time, minute_time, second_time )
         
     
+    def _GetUsageIndex( self, counter ):
+        
+        return self._counter_ids_to_usage_indices[ id( counter ) ]
+        
+    
     def _GetUsage( self, bandwidth_type, time_delta, for_user ):
         
         if for_user and time_delta is not None and bandwidth_type == HC.BANDWIDTH_TYPE_DATA and time_delta <= self.MIN_TIME_DELTA_FOR_USER:
@@ -672,15 +682,15 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         
         SEARCH_DELTA = self.MIN_TIME_DELTA_FOR_USER
         
-        counter = self._seconds_bytes
+        usage_index = self._GetUsageIndex( self._seconds_bytes )
         
         now = HydrusData.GetNow()
         
         since = now - SEARCH_DELTA
         
-        valid_keys = [ key for key in list(counter.keys()) if key >= since ]
+        earliest_timestamp = usage_index.GetEarliestTimestampSince( since )
         
-        if len( valid_keys ) == 0:
+        if earliest_timestamp is None:
             
             return 0
             
@@ -688,11 +698,9 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
         # If we want the average speed over past five secs but nothing has happened in sec 4 and 5, we don't want to count them
         # otherwise your 1MB/s counts as 200KB/s
         
-        earliest_timestamp = min( valid_keys )
-        
         SAMPLE_DELTA = max( now - earliest_timestamp, 1 )
         
-        total_bytes = sum( ( counter[ key ] for key in valid_keys ) )
+        total_bytes = usage_index.GetUsageSince( since )
         
         time_delta_average_per_sec = total_bytes / SAMPLE_DELTA
         
@@ -729,10 +737,20 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             clear_counter( self._seconds_bytes, oldest_second )
             clear_counter( self._seconds_requests, oldest_second )
             
+            self._RebuildUsageIndices()
+            
             self._next_cache_maintenance_timestamp = HydrusData.GetNow() + self.CACHE_MAINTENANCE_TIME_DELTA
             
         
     
+    def _RebuildUsageIndices( self ):
+        
+        windowed_counters = ( self._days_bytes, self._hours_bytes, self._minutes_bytes, self._seconds_bytes, self._days_requests, self._hours_requests, self._minutes_requests, self._seconds_requests )
+        
+        # the counters are plain Counters for serialisation, so their indices are looked up by identity
+        self._counter_ids_to_usage_indices = { id( counter ) : BandwidthUsageIndex( counter ) for counter in windowed_counters }
+        
+    
     def GetCurrentMonthSummary( self ):
         
         with self._lock:
@@ -814,31 +832,21 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
                 
                 time_delta_in_which_bandwidth_counts = time_delta + window
                 
-                time_and_values = list(counter.items())
-                
-                time_and_values.sort( reverse = True )
+                timestamp = self._GetUsageIndex( counter ).GetLatestTimestampReachingUsage( max_allowed )
                 
-                now = HydrusData.GetNow()
-                usage = 0
-                
-                for ( timestamp, value ) in time_and_values:
-                    
-                    current_search_time_delta = now - timestamp
+                if timestamp is None:
                     
-                    if current_search_time_delta > time_delta_in_which_bandwidth_counts: # we are searching beyond our time delta. no need to wait
-                        
-                        break
-                        
+                    return 0
                     
-                    usage += value
+                
+                current_search_time_delta = HydrusData.GetNow() - timestamp
+                
+                if current_search_time_delta > time_delta_in_which_bandwidth_counts: # the usage that clogs us up is beyond our time delta. no need to wait
                     
-                    if usage >= max_allowed:
-                        
-                        return time_delta_in_which_bandwidth_counts - current_search_time_delta
-                        
+                    return 0
                     
                 
-                return 0
+                return time_delta_in_which_bandwidth_counts - current_search_time_delta
                 
             
         
@@ -861,6 +869,11 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             self._seconds_bytes[ second_time ] += num_bytes
             
+            self._GetUsageIndex( self._days_bytes ).Add( day_time, num_bytes )
+            self._GetUsageIndex( self._hours_bytes ).Add( hour_time, num_bytes )
+            self._GetUsageIndex( self._minutes_bytes ).Add( minute_time, num_bytes )
+            self._GetUsageIndex( self._seconds_bytes ).Add( second_time, num_bytes )
+            
             self._MaintainCache()
             
         
@@ -883,8 +896,105 @@ class BandwidthTracker( HydrusSerialisable.SerialisableBase ):
             
             self._seconds_requests[ second_time ] += num_requests
             
+            self._GetUsageIndex( self._days_requests ).Add( day_time, num_requests )
+            self._GetUsageIndex( self._hours_requests ).Add( hour_time, num_requests )
+            self._GetUsageIndex( self._minutes_requests ).Add( minute_time, num_requests )
+            self._GetUsageIndex( self._seconds_requests ).Add( second_time, num_requests )
+            
             self._MaintainCache()
             
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_BANDWIDTH_TRACKER ] = BandwidthTracker
+
+class BandwidthUsageIndex( object ):
+    
+    # running totals over a timestamp -> value counter, so 'how much since x' is a bisect and a subtraction rather than a sum over every timestamp
+    # usage nearly always arrives in time order, so keeping up is usually an append or an increment of the last total
+    
+    def __init__( self, counter ):
+        
+        self._counter = counter
+        
+        self._Rebuild()
+        
+    
+    def _Rebuild( self ):
+        
+        self._timestamps = sorted( self._counter.keys() )
+        
+        self._cumulative_usages = [ 0 ]
+        
+        total = 0
+        
+        for timestamp in self._timestamps:
+            
+            total += self._counter[ timestamp ]
+            
+            self._cumulative_usages.append( total )
+            
+        
+    
+    def Add( self, timestamp, value ):
+        
+        # the counter has already been incremented, we are just catching up
+        
+        if len( self._timestamps ) > 0 and timestamp == self._timestamps[ -1 ]:
+            
+            self._cumulative_usages[ -1 ] += value
+            
+        elif len( self._timestamps ) == 0 or timestamp > self._timestamps[ -1 ]:
+            
+            self._timestamps.append( timestamp )
+            self._cumulative_usages.append( self._cumulative_usages[ -1 ] + value )
+            
+        else:
+            
+            # the clock went backwards
+            
+            self._Rebuild()
+            
+        
+    
+    def GetEarliestTimestampSince( self, since ):
+        
+        i = bisect.bisect_left( self._timestamps, since )
+        
+        if i == len( self._timestamps ):
+            
+            return None
+            
+        
+        return self._timestamps[ i ]
+        
+    
+    def GetLatestTimestampReachingUsage( self, usage ):
+        
+        # the latest timestamp for which the usage from then until now is at least the given amount
+        
+        if len( self._timestamps ) == 0:
+            
+            return None
+            
+        
+        total = self._cumulative_usages[ -1 ]
+        
+        i = bisect.bisect_right( self._cumulative_usages, total - usage ) - 1
+        
+        if i < 0:
+            
+            return None
+            
+        
+        i = min( i, len( self._timestamps ) - 1 )
+        
+        return self._timestamps[ i ]
+        
+    
+    def GetUsageSince( self, since ):
+        
+        i = bisect.bisect_left( self._timestamps, since )
+        
+        return self._cumulative_usages[ -1 ] - self._cumulative_usages[ i ]
+        
+    
@@ -549,6 +549,58 @@ def LaunchFile( path, launch_path = None ):
     
     thread.start()
     
+def LinkFile( source, dest ):
+    
+    # a copy-on-write clone is as safe as a copy but shares the data on disk. btrfs and xfs support it on linux
+    # a hardlink is the same file under another name, so anything that edits one edits the other
+    
+    if os.path.exists( dest ):
+        
+        MakeFileWritable( dest )
+        
+        os.remove( dest )
+        
+    
+    if HC.PLATFORM_LINUX:
+        
+        try:
+            
+            import fcntl
+            
+            FICLONE = 0x40049409
+            
+            with open( source, 'rb' ) as f_source:
+                
+                with open( dest, 'wb' ) as f_dest:
+                    
+                    fcntl.ioctl( f_dest.fileno(), FICLONE, f_source.fileno() )
+                    
+                
+            
+            shutil.copystat( source, dest )
+            
+            return True
+            
+        except OSError:
+            
+            if os.path.exists( dest ):
+                
+                os.remove( dest )
+                
+            
+        
+    
+    try:
+        
+        os.link( source, dest )
+        
+        return True
+        
+    except OSError:
+        
+        return False
+        
+    
 def MakeSureDirectoryExists( path ):
     
     os.makedirs( path, exist_ok = True )
@@ -707,12 +759,17 @@ def MergeTree( source, dest, text_update_hook = None ):
             
         
     
-def MirrorFile( source, dest ):
+def MirrorFile( source, dest, try_linking = False ):
     
     if not PathsHaveSameSizeAndDate( source, dest ):
         
         try:
             
+            if try_linking and LinkFile( source, dest ):
+                
+                return True
+                
+            
             MakeFileWritable( dest )
             
             # this overwrites on conflict without hassle
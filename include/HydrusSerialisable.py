@@ -1,4 +1,9 @@
+import array
+from . import HydrusExceptions
+import itertools
 import json
+import struct
+import sys
 import zlib
 
 LZ4_OK = False
@@ -97,8 +102,91 @@ SERIALISABLE_TYPE_TAG_DISPLAY_MANAGER = 79
 
 SERIALISABLE_TYPES_TO_OBJECT_TYPES = {}
 
+# big objects like repository updates can use a compact binary network format instead of json
+# it starts with a prefix that zlib or lz4 output will not, so CreateFromNetworkBytes can tell the formats apart
+
+BINARY_NETWORK_BYTES_PREFIX = b'\x00hydrus binary\x00'
+BINARY_NETWORK_BYTES_VERSION = 1
+
+BINARY_COMPRESSION_ZLIB = 0
+BINARY_COMPRESSION_LZ4 = 1
+
+# format version, compression, serialisable type, serialisable version
+BINARY_HEADER_STRUCT = struct.Struct( '<BBHH' )
+
+BINARY_NETWORK_BYTES_SERIALISABLE_TYPES = { SERIALISABLE_TYPE_CONTENT_UPDATE, SERIALISABLE_TYPE_DEFINITIONS_UPDATE }
+
+PACKED_INTEGERS_DELTA = 1
+PACKED_INTEGERS_NULLABLE = 2
+
+# flags, bytes per integer, number of integers
+PACKED_INTEGERS_HEADER_STRUCT = struct.Struct( '<BBI' )
+
+PACKED_INTEGERS_ITEMSIZES_TO_TYPECODES = { array.array( typecode ).itemsize : typecode for typecode in ( 'Q', 'L', 'I', 'H', 'B' ) }
+
+def CreateFromBinaryNetworkBytes( network_bytes ):
+    
+    header_start = len( BINARY_NETWORK_BYTES_PREFIX )
+    body_start = header_start + BINARY_HEADER_STRUCT.size
+    
+    if len( network_bytes ) < body_start:
+        
+        raise HydrusExceptions.SerialisationException( 'Binary network bytes were too short to have a header!' )
+        
+    
+    ( format_version, compression, serialisable_type, version ) = BINARY_HEADER_STRUCT.unpack_from( network_bytes, header_start )
+    
+    if format_version != BINARY_NETWORK_BYTES_VERSION:
+        
+        raise HydrusExceptions.SerialisationException( 'Did not understand binary format version ' + str( format_version ) + '!' )
+        
+    
+    # this can come in from anywhere, including a request body on the server, so only accept what we actually send
+    
+    if serialisable_type not in BINARY_NETWORK_BYTES_SERIALISABLE_TYPES:
+        
+        raise HydrusExceptions.SerialisationException( 'Serialisable type ' + str( serialisable_type ) + ' is not allowed in binary network bytes!' )
+        
+    
+    compressed_body = network_bytes[ body_start : ]
+    
+    try:
+        
+        if compression == BINARY_COMPRESSION_ZLIB:
+            
+            serialisable_binary = zlib.decompress( compressed_body )
+            
+        elif compression == BINARY_COMPRESSION_LZ4 and LZ4_OK:
+            
+            serialisable_binary = lz4.block.decompress( compressed_body )
+            
+        else:
+            
+            raise HydrusExceptions.SerialisationException( 'Could not decompress binary compression type ' + str( compression ) + '!' )
+            
+        
+        obj = SERIALISABLE_TYPES_TO_OBJECT_TYPES[ serialisable_type ]()
+        
+        obj.InitialiseFromSerialisableBinary( version, serialisable_binary )
+        
+    except HydrusExceptions.SerialisationException:
+        
+        raise
+        
+    except Exception as e:
+        
+        raise HydrusExceptions.SerialisationException( 'Could not load binary network bytes: ' + str( e ) )
+        
+    
+    return obj
+    
 def CreateFromNetworkBytes( network_string ):
     
+    if network_string.startswith( BINARY_NETWORK_BYTES_PREFIX ):
+        
+        return CreateFromBinaryNetworkBytes( network_string )
+        
+    
     try:
         
         obj_bytes = zlib.decompress( network_string )
@@ -159,23 +247,135 @@ def GetNonDupeName( original_name, disallowed_names ):
     
     return non_dupe_name
     
+def PackBytesList( byte_strings ):
+    
+    lengths = [ len( byte_string ) for byte_string in byte_strings ]
+    
+    return PackIntegers( lengths ) + b''.join( byte_strings )
+    
+def PackIntegers( integers, delta = False, nullable = False ):
+    
+    # non-negative integers as a little-endian array of the smallest width that fits
+    # sorted ids should be delta encoded, which makes them small and very compressible
+    
+    flags = 0
+    
+    if nullable:
+        
+        flags |= PACKED_INTEGERS_NULLABLE
+        
+        # None becomes 0, so the rest shift up one. negatives are left negative for the check below
+        
+        integers = [ 0 if integer is None else integer + 1 if integer >= 0 else integer for integer in integers ]
+        
+    
+    if delta:
+        
+        flags |= PACKED_INTEGERS_DELTA
+        
+        integers = [ integer - previous_integer for ( previous_integer, integer ) in zip( itertools.chain( ( 0, ), integers ), integers ) ]
+        
+    
+    if min( integers, default = 0 ) < 0:
+        
+        raise ValueError( 'Cannot pack negative integers!' )
+        
+    
+    max_integer = max( integers, default = 0 )
+    
+    for itemsize in ( 1, 2, 4, 8 ):
+        
+        if max_integer < 2 ** ( 8 * itemsize ):
+            
+            break
+            
+        
+    
+    packed_integers = array.array( PACKED_INTEGERS_ITEMSIZES_TO_TYPECODES[ itemsize ], integers )
+    
+    if sys.byteorder == 'big':
+        
+        packed_integers.byteswap()
+        
+    
+    return PACKED_INTEGERS_HEADER_STRUCT.pack( flags, itemsize, len( packed_integers ) ) + packed_integers.tobytes()
+    
 def SetNonDupeName( obj, disallowed_names ):
     
     non_dupe_name = GetNonDupeName( obj.GetName(), disallowed_names )
     
     obj.SetName( non_dupe_name )
-
+    
+def UnpackBytesList( data, offset = 0 ):
+    
+    ( lengths, offset ) = UnpackIntegers( data, offset )
+    
+    byte_strings = []
+    
+    for length in lengths:
+        
+        end = offset + length
+        
+        byte_strings.append( data[ offset : end ] )
+        
+        offset = end
+        
+    
+    return ( byte_strings, offset )
+    
+def UnpackIntegers( data, offset = 0 ):
+    
+    ( flags, itemsize, num_integers ) = PACKED_INTEGERS_HEADER_STRUCT.unpack_from( data, offset )
+    
+    start = offset + PACKED_INTEGERS_HEADER_STRUCT.size
+    end = start + itemsize * num_integers
+    
+    packed_integers = array.array( PACKED_INTEGERS_ITEMSIZES_TO_TYPECODES[ itemsize ] )
+    
+    packed_integers.frombytes( data[ start : end ] )
+    
+    if sys.byteorder == 'big':
+        
+        packed_integers.byteswap()
+        
+    
+    if flags & PACKED_INTEGERS_DELTA:
+        
+        integers = list( itertools.accumulate( packed_integers ) )
+        
+    else:
+        
+        integers = packed_integers.tolist()
+        
+    
+    if flags & PACKED_INTEGERS_NULLABLE:
+        
+        integers = [ None if integer == 0 else integer - 1 for integer in integers ]
+        
+    
+    return ( integers, end )
+    
 class SerialisableBase( object ):
     
     SERIALISABLE_TYPE = SERIALISABLE_TYPE_BASE
     SERIALISABLE_NAME = 'Base Serialisable Object'
     SERIALISABLE_VERSION = 1
     
+    def _GetSerialisableBinary( self ):
+        
+        raise NotImplementedError()
+        
+    
     def _GetSerialisableInfo( self ):
         
         raise NotImplementedError()
         
     
+    def _InitialiseFromSerialisableBinary( self, serialisable_binary ):
+        
+        raise NotImplementedError()
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         raise NotImplementedError()
@@ -186,6 +386,29 @@ class SerialisableBase( object ):
         return old_serialisable_info
         
     
+    def DumpToBinaryNetworkBytes( self, compression = BINARY_COMPRESSION_ZLIB ):
+        
+        serialisable_binary = self._GetSerialisableBinary()
+        
+        if compression == BINARY_COMPRESSION_LZ4 and not LZ4_OK:
+            
+            compression = BINARY_COMPRESSION_ZLIB
+            
+        
+        if compression == BINARY_COMPRESSION_LZ4:
+            
+            compressed_body = lz4.block.compress( serialisable_binary )
+            
+        else:
+            
+            compressed_body = zlib.compress( serialisable_binary, 9 )
+            
+        
+        header = BINARY_HEADER_STRUCT.pack( BINARY_NETWORK_BYTES_VERSION, compression, self.SERIALISABLE_TYPE, self.SERIALISABLE_VERSION )
+        
+        return BINARY_NETWORK_BYTES_PREFIX + header + compressed_body
+        
+    
     def DumpToNetworkBytes( self ):
         
         obj_string = self.DumpToString()
@@ -224,6 +447,18 @@ class SerialisableBase( object ):
         return ( self.SERIALISABLE_TYPE, self.SERIALISABLE_VERSION, serialisable_info )
         
     
+    def InitialiseFromSerialisableBinary( self, version, serialisable_binary ):
+        
+        # there is no update path for old binary, so a class that changes its binary has to handle the old layout itself
+        
+        if version != self.SERIALISABLE_VERSION:
+            
+            raise HydrusExceptions.SerialisationException( 'Cannot load a version ' + str( version ) + ' binary ' + self.SERIALISABLE_NAME + '!' )
+            
+        
+        self._InitialiseFromSerialisableBinary( serialisable_binary )
+        
+    
     def InitialiseFromSerialisableInfo( self, version, serialisable_info ):
         
         while version < self.SERIALISABLE_VERSION:
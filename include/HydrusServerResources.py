@@ -10,12 +10,15 @@ import time
 import traceback
 from twisted.internet import reactor, defer
 from twisted.internet.threads import deferToThread
+from twisted.web import http
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.resource import Resource
-from twisted.web.static import File as FileResource, NoRangeStaticProducer
+from twisted.web.static import File as FileResource
 from . import HydrusData
 from . import HydrusGlobals as HG
 
+FILE_PRODUCER_BUFFER_SIZE = 512 * 1024
+
 def GenerateEris( service ):
     
     name = service.GetName()
@@ -432,32 +435,73 @@ class HydrusResource( Resource ):
             
             path = response_context.GetPath()
             
-            size = os.path.getsize( path )
-            
             mime = response_context.GetMime()
             
             content_type = HC.mime_string_lookup[ mime ]
             
-            content_length = size
-            
             ( base, filename ) = os.path.split( path )
             
             content_disposition = 'inline; filename="' + filename + '"'
             
             request.setHeader( 'Content-Type', str( content_type ) )
-            request.setHeader( 'Content-Length', str( content_length ) )
             request.setHeader( 'Content-Disposition', str( content_disposition ) )
+            request.setHeader( 'Accept-Ranges', 'bytes' )
             
             request.setHeader( 'Expires', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( time.time() + 86400 * 365 ) ) )
             request.setHeader( 'Cache-Control', 'max-age={}'.format( 86400 * 365 ) )
             
-            fileObject = open( path, 'rb' )
+            # files named by their hash never change, so the hash makes a strong etag
+            
+            etag = None
+            
+            if response_context.HasHash():
+                
+                etag = bytes( '"{}"'.format( response_context.GetHash().hex() ), 'ascii' )
+                
             
-            producer = NoRangeStaticProducer( request, fileObject )
+            last_modified = int( os.path.getmtime( path ) )
             
-            producer.start()
+            # these set a 304 response code if the client already has the file
             
-            do_finish = False
+            not_modified = request.setETag( etag ) == http.CACHED
+            not_modified = request.setLastModified( last_modified ) == http.CACHED or not_modified
+            
+            if not_modified:
+                
+                content_length = 0
+                
+            else:
+                
+                if_range = request.getHeader( b'If-Range' )
+                
+                if if_range is not None and if_range not in ( etag, http.datetimeToString( last_modified ) ):
+                    
+                    # the client's partial copy is out of date, so it gets the whole file
+                    
+                    request.requestHeaders.removeHeader( b'Range' )
+                    
+                
+                # twisted's File does the Range parsing, the 206/416 response codes, Content-Range and Content-Length, and multipart ranges
+                
+                file_resource = FileResource( path, defaultType = content_type )
+                
+                file_resource.type = content_type
+                file_resource.encoding = None
+                
+                fileObject = open( path, 'rb' )
+                
+                producer = file_resource.makeProducer( request, fileObject )
+                
+                # twisted has no sendfile, so read in larger blocks to cut down on reactor trips for big files
+                
+                producer.bufferSize = FILE_PRODUCER_BUFFER_SIZE
+                
+                content_length = int( request.responseHeaders.getRawHeaders( 'Content-Length' )[0] )
+                
+                producer.start()
+                
+                do_finish = False
+                
             
         elif response_context.HasBody():
             
@@ -854,7 +898,7 @@ class HydrusResourceWelcome( HydrusResource ):
     
 class ResponseContext( object ):
     
-    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None ):
+    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, hash = None ):
         
         if body is None:
             
@@ -888,6 +932,7 @@ class ResponseContext( object ):
         self._body_bytes = body_bytes
         self._path = path
         self._cookies = cookies
+        self._hash = hash
         
     
     def GetBodyBytes( self ):
@@ -897,6 +942,8 @@ class ResponseContext( object ):
     
     def GetCookies( self ): return self._cookies
     
+    def GetHash( self ): return self._hash
+    
     def GetMime( self ): return self._mime
     
     def GetPath( self ): return self._path
@@ -905,5 +952,7 @@ class ResponseContext( object ):
     
     def HasBody( self ): return self._body_bytes is not None
     
+    def HasHash( self ): return self._hash is not None
+    
     def HasPath( self ): return self._path is not None
     
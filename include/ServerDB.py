@@ -1,3 +1,4 @@
+import collections
 import hashlib
 from . import HydrusConstants as HC
 from . import HydrusDB
@@ -11,12 +12,19 @@ import random
 from . import ServerFiles
 import sqlite3
 import sys
+import threading
 import time
 import traceback
 from . import HydrusData
 from . import HydrusTags
 from . import HydrusGlobals as HG
 
+# how many hash/tag -> id lookups to remember, per cache
+ID_CACHE_SIZE = 250000
+
+# how many generated updates may be waiting to be written to disk before the db waits for the writer
+MAX_UPDATES_WAITING_TO_WRITE = 2
+
 def GenerateRepositoryMasterMapTableNames( service_id ):
     
     suffix = str( service_id )
@@ -75,6 +83,39 @@ def GenerateRepositoryUpdateTableName( service_id ):
     
     return 'updates_' + str( service_id )
     
+def WriteUpdateFile( update, binary_updates, done_event, result ):
+    
+    try:
+        
+        if binary_updates:
+            
+            update_bytes = update.DumpToBinaryNetworkBytes()
+            
+        else:
+            
+            update_bytes = update.DumpToNetworkBytes()
+            
+        
+        update_hash = hashlib.sha256( update_bytes ).digest()
+        
+        dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+        
+        with open( dest_path, 'wb' ) as f:
+            
+            f.write( update_bytes )
+            
+        
+        result.append( update_hash )
+        
+    except Exception as e:
+        
+        result.append( e )
+        
+    finally:
+        
+        done_event.set()
+        
+    
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'access_key', 'immediate_content_update', 'registration_keys' ]
@@ -774,6 +815,28 @@ class DB( HydrusDB.HydrusDB ):
         return list(self._account_type_cache[ service_id ].values())
         
     
+    def _GetCachedIds( self, cache, keys ):
+        
+        keys_to_ids = {}
+        uncached_keys = set()
+        
+        for key in keys:
+            
+            if key in cache:
+                
+                cache.move_to_end( key )
+                
+                keys_to_ids[ key ] = cache[ key ]
+                
+            else:
+                
+                uncached_keys.add( key )
+                
+            
+        
+        return ( keys_to_ids, uncached_keys )
+        
+    
     def _GetHash( self, master_hash_id ):
         
         result = self._c.execute( 'SELECT hash FROM hashes WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
@@ -797,6 +860,13 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetMasterHashId( self, hash ):
         
+        if hash in self._hashes_to_master_hash_ids:
+            
+            self._hashes_to_master_hash_ids.move_to_end( hash )
+            
+            return self._hashes_to_master_hash_ids[ hash ]
+            
+        
         result = self._c.execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
         
         if result is None:
@@ -805,59 +875,52 @@ class DB( HydrusDB.HydrusDB ):
             
             master_hash_id = self._c.lastrowid
             
-            return master_hash_id
-            
         else:
             
             ( master_hash_id, ) = result
             
-            return master_hash_id
-            
+        
+        self._SetCachedIds( self._hashes_to_master_hash_ids, { hash : master_hash_id } )
+        
+        return master_hash_id
         
     
     def _GetMasterHashIds( self, hashes ):
         
-        master_hash_ids = set()
-        hashes_not_in_db = set()
+        ( hashes_to_master_hash_ids, uncached_hashes ) = self._GetCachedIds( self._hashes_to_master_hash_ids, ( hash for hash in hashes if hash is not None ) )
         
-        for hash in hashes:
-            
-            if hash is None:
-                
-                continue
-                
+        if len( uncached_hashes ) > 0:
             
-            result = self._c.execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
-            
-            if result is None:
+            with HydrusDB.TemporaryValueTable( self._c, ( sqlite3.Binary( hash ) for hash in uncached_hashes ), 'hash', 'BLOB_BYTES' ) as temp_table_name:
                 
-                hashes_not_in_db.add( hash )
+                # add whatever is new in one go and then read all the ids back in one join
                 
-            else:
-                
-                ( master_hash_id, ) = result
+                self._c.execute( 'INSERT OR IGNORE INTO hashes ( hash ) SELECT hash FROM ' + temp_table_name + ';' )
                 
-                master_hash_ids.add( master_hash_id )
+                uncached_hashes_to_master_hash_ids = dict( self._c.execute( 'SELECT hash, master_hash_id FROM ' + temp_table_name + ' CROSS JOIN hashes USING ( hash );' ) )
                 
             
-        
-        if len( hashes_not_in_db ) > 0:
-            
-            self._c.executemany( 'INSERT INTO hashes ( hash ) VALUES ( ? );', ( ( sqlite3.Binary( hash ), ) for hash in hashes_not_in_db ) )
+            self._SetCachedIds( self._hashes_to_master_hash_ids, uncached_hashes_to_master_hash_ids )
             
-            for hash in hashes_not_in_db:
-                
-                ( master_hash_id, ) = self._c.execute( 'SELECT master_hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
-                
-                master_hash_ids.add( master_hash_id )
-                
+            hashes_to_master_hash_ids.update( uncached_hashes_to_master_hash_ids )
             
         
-        return master_hash_ids
+        return set( hashes_to_master_hash_ids.values() )
         
     
     def _GetMasterTagId( self, tag ):
         
+        # cleaning a tag always gives the same result, so the raw tag can be the key
+        
+        if tag in self._tags_to_master_tag_ids:
+            
+            self._tags_to_master_tag_ids.move_to_end( tag )
+            
+            return self._tags_to_master_tag_ids[ tag ]
+            
+        
+        raw_tag = tag
+        
         tag = HydrusTags.CleanTag( tag )
         
         HydrusTags.CheckTagNotEmpty( tag )
@@ -870,14 +933,14 @@ class DB( HydrusDB.HydrusDB ):
             
             master_tag_id = self._c.lastrowid
             
-            return master_tag_id
-            
         else:
             
             ( master_tag_id, ) = result
             
-            return master_tag_id
-            
+        
+        self._SetCachedIds( self._tags_to_master_tag_ids, { raw_tag : master_tag_id } )
+        
+        return master_tag_id
         
     
     def _GetOptions( self, service_key ):
@@ -1064,6 +1127,17 @@ class DB( HydrusDB.HydrusDB ):
         self._over_monthly_data = False
         self._services_over_monthly_data = set()
         
+        self._InitIdCaches()
+        
+    
+    def _InitIdCaches( self ):
+        
+        self._hashes_to_master_hash_ids = collections.OrderedDict()
+        self._tags_to_master_tag_ids = collections.OrderedDict()
+        
+        self._service_ids_to_master_hash_ids_to_service_hash_ids = collections.defaultdict( collections.OrderedDict )
+        self._service_ids_to_master_tag_ids_to_service_tag_ids = collections.defaultdict( collections.OrderedDict )
+        
     
     def _InitExternalDatabases( self ):
         
@@ -1522,7 +1596,9 @@ class DB( HydrusDB.HydrusDB ):
         self._c.execute( 'CREATE TABLE ' + update_table_name + ' ( master_hash_id INTEGER PRIMARY KEY );' )
         
     
-    def _RepositoryCreateUpdate( self, service_key, begin, end ):
+    def _RepositoryCreateUpdate( self, service_key, begin, end, binary_updates = False ):
+        
+        # binary updates are smaller and quicker to load, but clients older than the binary format cannot read them, so the service admin chooses
         
         service_id = self._GetServiceId( service_key )
         
@@ -1530,42 +1606,49 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_gmt = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_gmt = True ) )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
-        
         update_hashes = []
         
         total_definition_rows = 0
         total_content_rows = 0
         
-        if len( updates ) > 0:
+        # each update is serialised and written on a worker thread while we read the rows for the next one
+        # only a couple are allowed to wait for the writer, so a busy period does not pile up in memory
+        
+        write_jobs = collections.deque()
+        
+        for update in self._RepositoryGenerateUpdates( service_id, begin, end ):
             
-            for update in updates:
-                
-                num_rows = update.GetNumRows()
-                
-                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                    
-                    total_definition_rows += num_rows
-                    
-                elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                    
-                    total_content_rows += num_rows
-                    
+            num_rows = update.GetNumRows()
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
                 
-                update_bytes = update.DumpToNetworkBytes()
+                total_definition_rows += num_rows
                 
-                update_hash = hashlib.sha256( update_bytes ).digest()
+            elif isinstance( update, HydrusNetwork.ContentUpdate ):
                 
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+                total_content_rows += num_rows
                 
-                with open( dest_path, 'wb' ) as f:
-                    
-                    f.write( update_bytes )
-                    
+            
+            if len( write_jobs ) >= MAX_UPDATES_WAITING_TO_WRITE:
                 
-                update_hashes.append( update_hash )
+                update_hashes.append( self._RepositoryWaitOnUpdateWrite( write_jobs.popleft() ) )
                 
             
+            done_event = threading.Event()
+            result = []
+            
+            self._controller.CallToThread( WriteUpdateFile, update, binary_updates, done_event, result )
+            
+            write_jobs.append( ( done_event, result ) )
+            
+        
+        while len( write_jobs ) > 0:
+            
+            update_hashes.append( self._RepositoryWaitOnUpdateWrite( write_jobs.popleft() ) )
+            
+        
+        if len( update_hashes ) > 0:
+            
             ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
             
             master_hash_ids = self._GetMasterHashIds( update_hashes )
@@ -1573,7 +1656,7 @@ class DB( HydrusDB.HydrusDB ):
             self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
             
         
-        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( updates ) ) + ' update files.' )
+        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( update_hashes ) ) + ' update files.' )
         
         return update_hashes
         
@@ -1709,6 +1792,14 @@ class DB( HydrusDB.HydrusDB ):
             self._c.execute( 'DROP TABLE ' + table_name + ';' )
             
         
+        for cache in ( self._service_ids_to_master_hash_ids_to_service_hash_ids, self._service_ids_to_master_tag_ids_to_service_tag_ids ):
+            
+            if service_id in cache:
+                
+                del cache[ service_id ]
+                
+            
+        
     
     def _RepositoryGenerateImmediateUpdate( self, service_key, account, begin, end ):
         
@@ -1719,7 +1810,7 @@ class DB( HydrusDB.HydrusDB ):
         
         service_id = self._GetServiceId( service_key )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
+        updates = list( self._RepositoryGenerateUpdates( service_id, begin, end ) )
         
         return updates
         
@@ -1731,123 +1822,138 @@ class DB( HydrusDB.HydrusDB ):
         
         MAX_CONTENT_CHUNK = 25000
         
-        updates = []
+        # this yields each update as soon as it fills up, so nothing has to hold the whole period in memory
+        # it reads through its own cursor so whatever the caller does between updates cannot disturb a half-read query
         
-        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
-        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
+        cursor = self._db.cursor()
         
-        ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
-        
-        for ( service_hash_id, hash ) in self._c.execute( 'SELECT service_hash_id, hash FROM ' + service_hash_ids_table_name + ' NATURAL JOIN hashes WHERE hash_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
-            
-            row = ( HC.DEFINITIONS_TYPE_HASHES, service_hash_id, hash )
+        try:
             
-            definitions_update_builder.AddRow( row )
+            definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
+            content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
             
-        
-        for ( service_tag_id, tag ) in self._c.execute( 'SELECT service_tag_id, tag FROM ' + service_tag_ids_table_name + ' NATURAL JOIN tags WHERE tag_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+            ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
             
-            row = ( HC.DEFINITIONS_TYPE_TAGS, service_tag_id, tag )
+            for ( service_hash_id, hash ) in cursor.execute( 'SELECT service_hash_id, hash FROM ' + service_hash_ids_table_name + ' NATURAL JOIN hashes WHERE hash_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+                
+                row = ( HC.DEFINITIONS_TYPE_HASHES, service_hash_id, hash )
+                
+                definitions_update_builder.AddRow( row )
+                
+                if definitions_update_builder.HasUpdates():
+                    
+                    yield from definitions_update_builder.PopUpdates()
+                    
+                
             
-            definitions_update_builder.AddRow( row )
+            for ( service_tag_id, tag ) in cursor.execute( 'SELECT service_tag_id, tag FROM ' + service_tag_ids_table_name + ' NATURAL JOIN tags WHERE tag_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+                
+                row = ( HC.DEFINITIONS_TYPE_TAGS, service_tag_id, tag )
+                
+                definitions_update_builder.AddRow( row )
+                
+                if definitions_update_builder.HasUpdates():
+                    
+                    yield from definitions_update_builder.PopUpdates()
+                    
+                
             
-        
-        definitions_update_builder.Finish()
-        
-        updates.extend( definitions_update_builder.GetUpdates() )
-        
-        #
-        
-        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
-        
-        table_join = self._RepositoryGetFilesInfoFilesTableJoin( service_id, HC.CONTENT_STATUS_CURRENT )
-        
-        for ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words ) in self._c.execute( 'SELECT service_hash_id, size, mime, file_timestamp, width, height, duration, num_frames, num_words FROM ' + table_join + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+            definitions_update_builder.Finish()
             
-            file_row = ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words )
+            yield from definitions_update_builder.PopUpdates()
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, file_row ) )
+            #
             
-        
-        service_hash_ids = [ service_hash_id for ( service_hash_id, ) in self._c.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ) ]
-        
-        for service_hash_id in service_hash_ids:
+            ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = GenerateRepositoryFilesTableNames( service_id )
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ) )
+            table_join = self._RepositoryGetFilesInfoFilesTableJoin( service_id, HC.CONTENT_STATUS_CURRENT )
             
-        
-        #
-        
-        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
-        
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
+            for ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words ) in cursor.execute( 'SELECT service_hash_id, size, mime, file_timestamp, width, height, duration, num_frames, num_words FROM ' + table_join + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+                
+                file_row = ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words )
+                
+                content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, file_row ) )
+                
+                if content_update_builder.HasUpdates():
+                    
+                    yield from content_update_builder.PopUpdates()
+                    
+                
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
+            for ( service_hash_id, ) in cursor.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
                 
-                row_weight = len( block_of_service_hash_ids )
+                content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ) )
                 
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
+                if content_update_builder.HasUpdates():
+                    
+                    yield from content_update_builder.PopUpdates()
+                    
                 
             
-        
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
+            #
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
+            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
+            
+            for ( mappings_table_name, content_update_action ) in ( ( current_mappings_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_mappings_table_name, HC.CONTENT_UPDATE_DELETE ) ):
                 
-                row_weight = len( block_of_service_hash_ids )
+                for ( service_tag_id, block_of_service_hash_ids ) in self._RepositoryIterateMappingsBlocks( cursor, mappings_table_name, begin, end, MAX_CONTENT_CHUNK ):
+                    
+                    row_weight = len( block_of_service_hash_ids )
+                    
+                    content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, content_update_action, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
+                    
+                    if content_update_builder.HasUpdates():
+                        
+                        yield from content_update_builder.PopUpdates()
+                        
+                    
                 
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
+            
+            #
+            
+            ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
+            
+            for ( tag_parents_table_name, content_update_action ) in ( ( current_tag_parents_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_tag_parents_table_name, HC.CONTENT_UPDATE_DELETE ) ):
+                
+                for pair in cursor.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+                    
+                    content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, content_update_action, pair ) )
+                    
+                    if content_update_builder.HasUpdates():
+                        
+                        yield from content_update_builder.PopUpdates()
+                        
+                    
                 
             
-        
-        #
-        
-        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
-        
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + current_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
+            #
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, pair ) )
+            ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
             
-        
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + deleted_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
+            for ( tag_siblings_table_name, content_update_action ) in ( ( current_tag_siblings_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_tag_siblings_table_name, HC.CONTENT_UPDATE_DELETE ) ):
+                
+                for pair in cursor.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+                    
+                    content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, content_update_action, pair ) )
+                    
+                    if content_update_builder.HasUpdates():
+                        
+                        yield from content_update_builder.PopUpdates()
+                        
+                    
+                
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, pair ) )
+            #
             
-        
-        #
-        
-        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
-        
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + current_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
+            content_update_builder.Finish()
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, pair ) )
+            yield from content_update_builder.PopUpdates()
             
-        
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + deleted_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
+        finally:
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, pair ) )
+            cursor.close()
             
         
-        #
-        
-        content_update_builder.Finish()
-        
-        updates.extend( content_update_builder.GetUpdates() )
-        
-        return updates
-        
     
     def _RepositoryGetAccountInfo( self, service_id, account_id ):
         
@@ -2240,6 +2346,15 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetServiceHashId( self, service_id, master_hash_id, timestamp ):
         
+        master_hash_ids_to_service_hash_ids = self._service_ids_to_master_hash_ids_to_service_hash_ids[ service_id ]
+        
+        if master_hash_id in master_hash_ids_to_service_hash_ids:
+            
+            master_hash_ids_to_service_hash_ids.move_to_end( master_hash_id )
+            
+            return master_hash_ids_to_service_hash_ids[ master_hash_id ]
+            
+        
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
         result = self._c.execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
@@ -2250,49 +2365,40 @@ class DB( HydrusDB.HydrusDB ):
             
             service_hash_id = self._c.lastrowid
             
-            return service_hash_id
-            
         else:
             
             ( service_hash_id, ) = result
             
-            return service_hash_id
-            
+        
+        self._SetCachedIds( master_hash_ids_to_service_hash_ids, { master_hash_id : service_hash_id } )
+        
+        return service_hash_id
         
     
     def _RepositoryGetServiceHashIds( self, service_id, master_hash_ids, timestamp ):
         
-        ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
+        master_hash_ids_to_service_hash_ids = self._service_ids_to_master_hash_ids_to_service_hash_ids[ service_id ]
         
-        service_hash_ids = set()
-        master_hash_ids_not_in_table = set()
+        ( cached_master_hash_ids_to_service_hash_ids, uncached_master_hash_ids ) = self._GetCachedIds( master_hash_ids_to_service_hash_ids, master_hash_ids )
         
-        for master_hash_id in master_hash_ids:
+        service_hash_ids = set( cached_master_hash_ids_to_service_hash_ids.values() )
+        
+        if len( uncached_master_hash_ids ) > 0:
             
-            result = self._c.execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
+            ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
             
-            if result is None:
+            with HydrusDB.TemporaryIntegerTable( self._c, uncached_master_hash_ids, 'master_hash_id' ) as temp_table_name:
                 
-                master_hash_ids_not_in_table.add( master_hash_id )
+                # add whatever is new in one go and then read all the ids back in one join
                 
-            else:
-                
-                ( service_hash_id, ) = result
+                self._c.execute( 'INSERT OR IGNORE INTO ' + hash_id_map_table_name + ' ( master_hash_id, hash_id_timestamp ) SELECT master_hash_id, ? FROM ' + temp_table_name + ';', ( timestamp, ) )
                 
-                service_hash_ids.add( service_hash_id )
+                uncached_master_hash_ids_to_service_hash_ids = dict( self._c.execute( 'SELECT master_hash_id, service_hash_id FROM ' + temp_table_name + ' CROSS JOIN ' + hash_id_map_table_name + ' USING ( master_hash_id );' ) )
                 
             
-        
-        if len( master_hash_ids_not_in_table ) > 0:
+            self._SetCachedIds( master_hash_ids_to_service_hash_ids, uncached_master_hash_ids_to_service_hash_ids )
             
-            self._c.executemany( 'INSERT INTO ' + hash_id_map_table_name + ' ( master_hash_id, hash_id_timestamp ) VALUES ( ?, ? );', ( ( master_hash_id, timestamp ) for master_hash_id in master_hash_ids_not_in_table ) )
-            
-            for master_hash_id in master_hash_ids_not_in_table:
-                
-                ( service_hash_id, ) = self._c.execute( 'SELECT service_hash_id FROM ' + hash_id_map_table_name + ' WHERE master_hash_id = ?;', ( master_hash_id, ) ).fetchone()
-                
-                service_hash_ids.add( service_hash_id )
-                
+            service_hash_ids.update( uncached_master_hash_ids_to_service_hash_ids.values() )
             
         
         return service_hash_ids
@@ -2300,6 +2406,15 @@ class DB( HydrusDB.HydrusDB ):
     
     def _RepositoryGetServiceTagId( self, service_id, master_tag_id, timestamp ):
         
+        master_tag_ids_to_service_tag_ids = self._service_ids_to_master_tag_ids_to_service_tag_ids[ service_id ]
+        
+        if master_tag_id in master_tag_ids_to_service_tag_ids:
+            
+            master_tag_ids_to_service_tag_ids.move_to_end( master_tag_id )
+            
+            return master_tag_ids_to_service_tag_ids[ master_tag_id ]
+            
+        
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
         result = self._c.execute( 'SELECT service_tag_id FROM ' + tag_id_map_table_name + ' WHERE master_tag_id = ?;', ( master_tag_id, ) ).fetchone()
@@ -2310,14 +2425,14 @@ class DB( HydrusDB.HydrusDB ):
             
             service_tag_id = self._c.lastrowid
             
-            return service_tag_id
-            
         else:
             
             ( service_tag_id, ) = result
             
-            return service_tag_id
-            
+        
+        self._SetCachedIds( master_tag_ids_to_service_tag_ids, { master_tag_id : service_tag_id } )
+        
+        return service_tag_id
         
     
     def _RepositoryGetTagParentPend( self, service_id ):
@@ -2563,6 +2678,35 @@ class DB( HydrusDB.HydrusDB ):
         return ( True, mime )
         
     
+    def _RepositoryIterateMappingsBlocks( self, cursor, mappings_table_name, begin, end, max_block_size ):
+        
+        # sqlite does the sorting, so we only ever hold one tag's block of hashes
+        
+        block_service_tag_id = None
+        block_of_service_hash_ids = []
+        
+        for ( service_tag_id, service_hash_id ) in cursor.execute( 'SELECT service_tag_id, service_hash_id FROM ' + mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ? ORDER BY service_tag_id;', ( begin, end ) ):
+            
+            if service_tag_id != block_service_tag_id or len( block_of_service_hash_ids ) >= max_block_size:
+                
+                if len( block_of_service_hash_ids ) > 0:
+                    
+                    yield ( block_service_tag_id, block_of_service_hash_ids )
+                    
+                
+                block_service_tag_id = service_tag_id
+                block_of_service_hash_ids = []
+                
+            
+            block_of_service_hash_ids.append( service_hash_id )
+            
+        
+        if len( block_of_service_hash_ids ) > 0:
+            
+            yield ( block_service_tag_id, block_of_service_hash_ids )
+            
+        
+    
     def _RepositoryPendTagParent( self, service_id, account_id, child_master_tag_id, parent_master_tag_id, reason_id ):
         
         ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
@@ -3146,6 +3290,22 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _RepositoryWaitOnUpdateWrite( self, write_job ):
+        
+        ( done_event, result ) = write_job
+        
+        done_event.wait()
+        
+        ( update_hash_or_error, ) = result
+        
+        if isinstance( update_hash_or_error, Exception ):
+            
+            raise update_hash_or_error
+            
+        
+        return update_hash_or_error
+        
+    
     def _RewardAccounts( self, service_id, score_type, scores ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO account_scores ( service_id, account_id, score_type, score ) VALUES ( ?, ?, ?, ? );', [ ( service_id, account_id, score_type, 0 ) for ( account_id, score ) in scores ] )
@@ -3153,6 +3313,15 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'UPDATE account_scores SET score = score + ? WHERE service_id = ? AND account_id = ? and score_type = ?;', [ ( score, service_id, account_id, score_type ) for ( account_id, score ) in scores ] )
         
     
+    def _Rollback( self ):
+        
+        HydrusDB.HydrusDB._Rollback( self )
+        
+        # ids handed out since the savepoint may not exist any more
+        
+        self._InitIdCaches()
+        
+    
     def _SaveAccounts( self, service_id, accounts ):
         
         for account in accounts:
@@ -3200,6 +3369,16 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _SetCachedIds( self, cache, keys_to_ids ):
+        
+        cache.update( keys_to_ids )
+        
+        while len( cache ) > ID_CACHE_SIZE:
+            
+            cache.popitem( last = False )
+            
+        
+    
     def _UnbanKey( self, service_key, account_key ):
         
         service_id = self._GetServiceId( service_key )
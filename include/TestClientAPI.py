@@ -1913,6 +1913,58 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( hashlib.sha256( data ).digest(), hash )
         
+        file_bytes = data
+        
+        etag = '"{}"'.format( hash_hex )
+        
+        self.assertEqual( response.getheader( 'ETag' ), etag )
+        
+        # ranges
+        
+        range_headers = dict( headers )
+        
+        range_headers[ 'Range' ] = 'bytes=100-199'
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        self.assertEqual( data, file_bytes[ 100 : 200 ] )
+        
+        # a stale If-Range gets the whole file
+        
+        range_headers[ 'If-Range' ] = '"{}"'.format( HydrusData.GenerateKey().hex() )
+        
+        connection.request( 'GET', path, headers = range_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        self.assertEqual( data, file_bytes )
+        
+        # conditional get
+        
+        conditional_headers = dict( headers )
+        
+        conditional_headers[ 'If-None-Match' ] = etag
+        
+        connection.request( 'GET', path, headers = conditional_headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        self.assertEqual( data, b'' )
+        
         #
         
         path = '/get_files/thumbnail?hash={}'.format( hash_hex )
@@ -7,11 +7,158 @@ import collections
 from . import HydrusConstants as HC
 import os
 import unittest
+from mock import patch
 from . import HydrusData
 from . import HydrusGlobals as HG
 
 class TestManagers( unittest.TestCase ):
     
+    def test_data_cache( self ):
+        
+        class FakeData( object ):
+            
+            def __init__( self, size ):
+                
+                self._size = size
+                
+            
+            def GetEstimatedMemoryFootprint( self ):
+                
+                return self._size
+                
+            
+        
+        for eviction_policy in ( CC.CACHE_EVICTION_LRU, CC.CACHE_EVICTION_SIZE_WEIGHTED_LRU, CC.CACHE_EVICTION_2Q ):
+            
+            data_cache = ClientCaches.DataCache( HG.client_controller, 100, eviction_policy = eviction_policy )
+            
+            for i in range( 20 ):
+                
+                data_cache.AddData( i, FakeData( 10 ) )
+                
+            
+            ( num_items, memory_usage, num_hits, num_misses, num_evictions ) = data_cache.GetStats()
+            
+            # we only clear room before adding, so we can go one item over
+            self.assertEqual( num_items, 11 )
+            self.assertEqual( memory_usage, 110 )
+            self.assertEqual( num_evictions, 9 )
+            
+            self.assertTrue( data_cache.HasData( 19 ) )
+            
+            self.assertEqual( data_cache.GetIfHasData( 0 ), None )
+            self.assertNotEqual( data_cache.GetIfHasData( 19 ), None )
+            
+            data_cache.DeleteData( 19 )
+            
+            ( num_items, memory_usage, num_hits, num_misses, num_evictions ) = data_cache.GetStats()
+            
+            self.assertEqual( ( num_items, memory_usage, num_hits, num_misses ), ( 10, 100, 1, 1 ) )
+            
+            data_cache.Clear()
+            
+            self.assertEqual( data_cache.GetStats()[:2], ( 0, 0 ) )
+            
+        
+        # lru keeps what we touch
+        
+        data_cache = ClientCaches.DataCache( HG.client_controller, 30 )
+        
+        for i in range( 4 ):
+            
+            data_cache.AddData( i, FakeData( 10 ) )
+            
+        
+        data_cache.GetData( 0 )
+        
+        data_cache.AddData( 4, FakeData( 10 ) )
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 1 ) )
+        
+        # size-weighted drops the big thing first
+        
+        data_cache = ClientCaches.DataCache( HG.client_controller, 30, eviction_policy = CC.CACHE_EVICTION_SIZE_WEIGHTED_LRU )
+        
+        data_cache.AddData( 0, FakeData( 5 ) )
+        data_cache.AddData( 1, FakeData( 25 ) )
+        data_cache.AddData( 2, FakeData( 5 ) )
+        data_cache.AddData( 3, FakeData( 5 ) )
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 1 ) )
+        
+        # data that grows is re-measured when touched
+        
+        data_cache = ClientCaches.DataCache( HG.client_controller, 1000 )
+        
+        growing_data = FakeData( 10 )
+        
+        data_cache.AddData( 0, growing_data )
+        
+        growing_data._size = 50
+        
+        data_cache.GetData( 0 )
+        
+        self.assertEqual( data_cache.GetStats()[1], 50 )
+        
+        # a shared budget takes from whichever cache has the stalest item
+        
+        budget = ClientCaches.DataCacheBudget( 30 )
+        
+        data_cache_1 = ClientCaches.DataCache( HG.client_controller, None, budget = budget )
+        data_cache_2 = ClientCaches.DataCache( HG.client_controller, None, budget = budget )
+        
+        # the first cache is asked first, so it would lose a tie--the second cache's item has to be stalest on its own merits
+        
+        with patch.object( HydrusData, 'GetNow', return_value = 1000 ):
+            
+            data_cache_2.AddData( 0, FakeData( 20 ) )
+            
+        
+        with patch.object( HydrusData, 'GetNow', return_value = 2000 ):
+            
+            data_cache_1.AddData( 0, FakeData( 20 ) )
+            
+        
+        with patch.object( HydrusData, 'GetNow', return_value = 3000 ):
+            
+            data_cache_2.AddData( 1, FakeData( 20 ) )
+            
+        
+        self.assertEqual( budget.GetMemoryUsage(), 40 )
+        self.assertEqual( data_cache_1.GetStats()[4], 0 )
+        self.assertEqual( data_cache_2.GetStats()[4], 1 )
+        
+        self.assertTrue( data_cache_1.HasData( 0 ) )
+        self.assertFalse( data_cache_2.HasData( 0 ) )
+        
+        # asking the size-weighted policy for its victim does not wind its clock--only evicting does
+        
+        data_cache = ClientCaches.DataCache( HG.client_controller, 1000, eviction_policy = CC.CACHE_EVICTION_SIZE_WEIGHTED_LRU )
+        
+        data_cache.AddData( 0, FakeData( 10 ) )
+        data_cache.AddData( 1, FakeData( 20 ) )
+        
+        for i in range( 3 ):
+            
+            data_cache.GetVictimLastAccessTime()
+            
+        
+        # with the clock still at zero, this slots in between the other two, so it goes second
+        
+        data_cache.AddData( 2, FakeData( 12 ) )
+        
+        data_cache.EvictItem()
+        
+        self.assertFalse( data_cache.HasData( 1 ) )
+        
+        data_cache.EvictItem()
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 2 ) )
+        
+    
     def test_services( self ):
         
         def test_service( service, key, service_type, name ):
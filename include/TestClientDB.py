@@ -11,6 +11,7 @@ from . import ClientImporting
 from . import ClientImportLocal
 from . import ClientImportOptions
 from . import ClientImportFileSeeds
+from . import ClientMedia
 from . import ClientRatings
 from . import ClientSearch
 from . import ClientServices
@@ -33,6 +34,7 @@ from . import TestController
 import time
 import threading
 import unittest
+from mock import patch
 import wx
 
 class TestClientDB( unittest.TestCase ):
@@ -192,13 +194,65 @@ class TestClientDB( unittest.TestCase ):
         
         file_search_context = ClientSearch.FileSearchContext(file_service_key = HydrusData.GenerateKey(), tag_service_key = HydrusData.GenerateKey(), predicates = [ ClientSearch.Predicate( HC.PREDICATE_TYPE_TAG, 'test' ) ] )
         
-        export_folder = ClientExporting.ExportFolder( 'test path', export_type = HC.EXPORT_FOLDER_TYPE_REGULAR, delete_from_client_after_export = False, file_search_context = file_search_context, period = 3600, phrase = '{hash}' )
+        manifest = ( ( 'test path', '{hash}', HC.EXPORT_FOLDER_TYPE_REGULAR ), { 5 : ( HydrusData.GenerateKey(), 'file.png', 1500000000, 12345 ) } )
+        
+        export_folder = ClientExporting.ExportFolder( 'test path', export_type = HC.EXPORT_FOLDER_TYPE_REGULAR, delete_from_client_after_export = False, file_search_context = file_search_context, period = 3600, phrase = '{hash}', link_files = True, manifest = manifest )
         
         self._write( 'serialisable', export_folder )
         
         [ result ] = self._read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_EXPORT_FOLDER )
         
         self.assertEqual( result.GetName(), export_folder.GetName() )
+        self.assertEqual( result.ToTuple()[-1], True )
+        self.assertEqual( result.GetManifest(), manifest )
+        
+    
+    def test_file_hashes_mapping( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        ( md5, sha1, sha512 ) = file_import_job.GetExtraHashes()
+        
+        unknown_hash = HydrusData.GenerateKey()
+        unknown_md5 = os.urandom( 16 )
+        
+        #
+        
+        result = self._read( 'file_hashes_mapping', [ md5, unknown_md5, None ], 'md5', 'sha256' )
+        
+        self.assertEqual( result, { md5 : hash } )
+        
+        result = self._read( 'file_hashes_mapping', [ hash, unknown_hash ], 'sha256', 'sha1' )
+        
+        self.assertEqual( result, { hash : sha1 } )
+        
+        result = self._read( 'file_hashes_mapping', [ md5 ], 'md5', 'sha512' )
+        
+        self.assertEqual( result, { md5 : sha512 } )
+        
+        result = self._read( 'file_hashes_mapping', [ hash, unknown_hash ], 'sha256', 'sha256', file_service_key = CC.LOCAL_FILE_SERVICE_KEY )
+        
+        self.assertEqual( result, { hash : hash } )
+        
+        result = self._read( 'file_hashes_mapping', [ md5 ], 'md5', 'sha256', file_service_key = CC.TRASH_SERVICE_KEY )
+        
+        self.assertEqual( result, {} )
+        
+        result = self._read( 'file_hashes_mapping', [], 'md5', 'sha256' )
+        
+        self.assertEqual( result, {} )
         
     
     def test_file_query_ids( self ):
@@ -648,6 +702,31 @@ class TestClientDB( unittest.TestCase ):
         for i in range( len( predicates ) ): self.assertEqual( result[i].GetCount(), predicates[i].GetCount() )
         
     
+    def test_filter_orphans( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        unknown_hash = HydrusData.GenerateKey()
+        
+        # order is kept, and hashes the db has never seen are orphans too
+        
+        self.assertEqual( self._read( 'filter_orphans', 'file', [ unknown_hash, hash ] ), [ unknown_hash ] )
+        self.assertEqual( self._read( 'filter_orphans', 'thumbnail', [ hash, unknown_hash ] ), [ unknown_hash ] )
+        self.assertEqual( self._read( 'filter_orphans', 'file', [] ), [] )
+        
+    
     def test_gui_sessions( self ):
         
         def wx_code():
@@ -852,6 +931,44 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_import_batch( self ):
+        
+        TestClientDB._clear_db()
+        
+        filenames = [ 'muh_jpg.jpg', 'muh_png.png', 'muh_gif.gif', 'muh_jpg.jpg' ]
+        
+        file_import_jobs = []
+        
+        for filename in filenames:
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFileSeeds.FileImportJob( path )
+            
+            file_import_job.GenerateHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            file_import_jobs.append( file_import_job )
+            
+        
+        results = self._write( 'import_files', file_import_jobs )
+        
+        self.assertEqual( [ status for ( status, note ) in results ], [ CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_AND_NEW, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT ] )
+        self.assertIn( 'same batch', results[3][1] )
+        
+        hashes = [ file_import_job.GetHash() for file_import_job in file_import_jobs[:3] ]
+        
+        media_results = self._read( 'media_results', hashes )
+        
+        self.assertEqual( { media_result.GetHash() for media_result in media_results }, set( hashes ) )
+        
+        for media_result in media_results:
+            
+            self.assertTrue( media_result.GetLocationsManager().GetInbox() )
+            
+        
+    
     def test_import_folders( self ):
         
         import_folder_1 = ClientImportLocal.ImportFolder( 'imp 1', path = TestController.DB_DIR, mimes = HC.VIDEO, publish_files_to_popup_button = False )
@@ -1023,6 +1140,83 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( mr_num_words, None )
         
     
+    def test_media_results_during_write( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        # commit every write straight away, so the read-only pool is serving again once each one is done
+        
+        with patch.object( TestClientDB._db, 'TRANSACTION_COMMIT_TIME', -1 ):
+            
+            self._write( 'import_file', file_import_job )
+            
+            hash = file_import_job.GetHash()
+            
+            # hold a pooled media_results read once it has read everything, and add a tag while it waits
+            
+            read_started = threading.Event()
+            write_done = threading.Event()
+            
+            original_media_result = ClientMedia.MediaResult
+            
+            def media_result_and_wait( *args, **kwargs ):
+                
+                media_result = original_media_result( *args, **kwargs )
+                
+                if TestClientDB._db._connection_data.read_only and not read_started.is_set():
+                    
+                    read_started.set()
+                    
+                    write_done.wait( 10 )
+                    
+                
+                return media_result
+                
+            
+            results = []
+            
+            with patch.object( ClientMedia, 'MediaResult', media_result_and_wait ):
+                
+                thread = threading.Thread( target = lambda: results.extend( self._read( 'media_results', ( hash, ) ) ) )
+                
+                thread.start()
+                
+                try:
+                    
+                    self.assertTrue( read_started.wait( 10 ) )
+                    
+                    content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'car', ( hash, ) ) )
+                    
+                    self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ content_update ] } )
+                    
+                finally:
+                    
+                    write_done.set()
+                    
+                    thread.join( 10 )
+                    
+                
+            
+            # the pooled read is right for the commit it started on, but the next read has to see the tag
+            
+            ( stale_media_result, ) = results
+            
+            self.assertEqual( stale_media_result.GetTagsManager().GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+            
+            ( media_result, ) = self._read( 'media_results', ( hash, ) )
+            
+            self.assertEqual( media_result.GetTagsManager().GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), { 'car' } )
+            
+        
+    
     def test_nums_pending( self ):
         
         result = self._read( 'nums_pending' )
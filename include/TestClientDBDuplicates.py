@@ -25,6 +25,7 @@ from . import HydrusNetwork
 from . import HydrusSerialisable
 import itertools
 import os
+import random
 from . import ServerDB
 import shutil
 import sqlite3
@@ -136,6 +137,24 @@ class TestClientDBDuplicates( unittest.TestCase ):
         self._write( 'maintain_similar_files_search_for_potential_duplicates', 0 )
         
     
+    def _search_and_get_potential_counts( self, hashes, search_distance ):
+        
+        self._write( 'maintain_similar_files_tree' )
+        
+        self._write( 'maintain_similar_files_search_for_potential_duplicates', search_distance )
+        
+        hashes_to_counts = {}
+        
+        for hash in hashes:
+            
+            result = self._read( 'file_duplicate_info', CC.LOCAL_FILE_SERVICE_KEY, hash )
+            
+            hashes_to_counts[ hash ] = result[ 'counts' ][ HC.DUPLICATE_POTENTIAL ]
+            
+        
+        return hashes_to_counts
+        
+    
     def _test_initial_state( self ):
         
         both_files_match = True
@@ -1060,3 +1079,94 @@ class TestClientDBDuplicates( unittest.TestCase ):
         self._test_dissolve()
         
     
+    def test_potential_duplicate_search_with_and_without_index( self ):
+        
+        search_distance = 8
+        
+        # clusters of phashes a few bits apart, some near enough to pair up and some not, and some files with several phashes
+        
+        hashes_to_phashes = {}
+        
+        for i in range( 8 ):
+            
+            base_phash = int.from_bytes( os.urandom( 8 ), 'big' )
+            
+            for j in range( 6 ):
+                
+                phashes = []
+                
+                for k in range( 1 + j % 2 ):
+                    
+                    phash = base_phash
+                    
+                    for bit in random.sample( range( 64 ), random.randint( 0, 7 ) ):
+                        
+                        phash ^= 1 << bit
+                        
+                    
+                    phashes.append( phash )
+                    
+                
+                hashes_to_phashes[ HydrusData.GenerateKey() ] = phashes
+                
+            
+        
+        hashes = list( hashes_to_phashes.keys() )
+        
+        expected_hashes_to_counts = collections.Counter()
+        
+        for ( hash_a, hash_b ) in itertools.combinations( hashes, 2 ):
+            
+            distance = min( bin( phash_a ^ phash_b ).count( '1' ) for phash_a in hashes_to_phashes[ hash_a ] for phash_b in hashes_to_phashes[ hash_b ] )
+            
+            if distance <= search_distance:
+                
+                expected_hashes_to_counts[ hash_a ] += 1
+                expected_hashes_to_counts[ hash_b ] += 1
+                
+            
+        
+        expected_hashes_to_counts = { hash : expected_hashes_to_counts[ hash ] for hash in hashes }
+        
+        ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = ( 65536, HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+        
+        for ( hash, phashes ) in hashes_to_phashes.items():
+            
+            fake_file_import_job = ClientImportFileSeeds.FileImportJob( 'fake path' )
+            
+            fake_file_import_job._hash = hash
+            fake_file_import_job._file_info = ( size, mime, width, height, duration, num_frames, has_audio, num_words )
+            fake_file_import_job._extra_hashes = ( b'abcd', b'abcd', b'abcd' )
+            fake_file_import_job._phashes = [ phash.to_bytes( 8, 'big' ) for phash in phashes ]
+            fake_file_import_job._file_import_options = ClientImportOptions.FileImportOptions()
+            
+            self._write( 'import_file', fake_file_import_job )
+            
+        
+        # the vptree, one file at a time
+        
+        hashes_to_counts = self._search_and_get_potential_counts( hashes, search_distance )
+        
+        self.assertEqual( hashes_to_counts, expected_hashes_to_counts )
+        
+        self._write( 'delete_potential_duplicate_pairs' )
+        self._write( 'reset_potential_search_status', hashes )
+        
+        # the in-memory index, in blocks
+        
+        HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', True )
+        
+        try:
+            
+            hashes_to_counts = self._search_and_get_potential_counts( hashes, search_distance )
+            
+            self.assertIsNotNone( TestClientDBDuplicates._db._phash_index )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', False )
+            
+        
+        self.assertEqual( hashes_to_counts, expected_hashes_to_counts )
+        
+    
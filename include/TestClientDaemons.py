@@ -52,14 +52,18 @@ class TestDaemons( unittest.TestCase ):
             HG.test_controller.SetRead( 'serialisable_names', [ 'imp' ] )
             HG.test_controller.SetRead( 'serialisable_named', import_folder )
             
-            HG.test_controller.ClearWrites( 'import_file' )
+            HG.test_controller.ClearWrites( 'import_files' )
             HG.test_controller.ClearWrites( 'serialisable' )
             
             ClientDaemons.DAEMONCheckImportFolders()
             
-            import_file = HG.test_controller.GetWrite( 'import_file' )
+            import_files = HG.test_controller.GetWrite( 'import_files' )
             
-            self.assertEqual( len( import_file ), 3 )
+            file_import_jobs = [ file_import_job for ( ( file_import_jobs, ), kwargs ) in import_files for file_import_job in file_import_jobs ]
+            
+            # 0, 1 and 2 are the same file, so only one copy goes to the db
+            
+            self.assertEqual( len( file_import_jobs ), 1 )
             
             # I need to expand tests here with the new file system
             
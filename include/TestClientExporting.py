@@ -0,0 +1,233 @@
+from . import ClientExporting
+from . import ClientMedia
+from . import ClientRatings
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusGlobals as HG
+import os
+import shutil
+import stat
+from . import TestController
+import unittest
+
+class TestExportFolders( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._export_path = os.path.join( TestController.DB_DIR, 'export_test' )
+        self._other_export_path = os.path.join( TestController.DB_DIR, 'export_test_other' )
+        
+        for path in ( self._export_path, self._other_export_path ):
+            
+            os.makedirs( path )
+            
+        
+        self._media_results = []
+        self._source_paths = []
+        
+        for hash_id in range( 1, 4 ):
+            
+            hash = HydrusData.GenerateKey()
+            
+            file_info_manager = ClientMedia.FileInfoManager( hash_id, hash, size = 100, mime = HC.IMAGE_PNG, width = 20, height = 20 )
+            
+            tags_manager = ClientMedia.TagsManager( {} )
+            
+            locations_manager = ClientMedia.LocationsManager( set(), set(), set(), set() )
+            ratings_manager = ClientRatings.RatingsManager( {} )
+            file_viewing_stats_manager = ClientMedia.FileViewingStatsManager( 0, 0, 0, 0 )
+            
+            self._media_results.append( ClientMedia.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, file_viewing_stats_manager ) )
+            
+            source_path = HG.test_controller.client_files_manager.GetFilePath( hash, HC.IMAGE_PNG, check_file_exists = False )
+            
+            os.makedirs( os.path.dirname( source_path ), exist_ok = True )
+            
+            with open( source_path, 'wb' ) as f:
+                
+                f.write( hash * 10 )
+                
+            
+            self._source_paths.append( source_path )
+            
+        
+    
+    def tearDown( self ):
+        
+        for path in ( self._export_path, self._other_export_path ):
+            
+            shutil.rmtree( path )
+            
+        
+        for source_path in self._source_paths:
+            
+            os.chmod( source_path, stat.S_IRUSR | stat.S_IWUSR )
+            
+            os.remove( source_path )
+            
+        
+    
+    def _do_export( self, export_folder, media_results ):
+        
+        HG.test_controller.SetRead( 'file_query_ids', [ media_result.GetHashId() for media_result in media_results ] )
+        HG.test_controller.SetRead( 'media_results_from_ids', list( media_results ) )
+        
+        export_folder._DoExport()
+        
+    
+    def _get_dest_path( self, media_result, path = None ):
+        
+        if path is None:
+            
+            path = self._export_path
+            
+        
+        return os.path.join( path, media_result.GetHash().hex() + '.png' )
+        
+    
+    def _get_export_folder( self, export_type, path = None, phrase = '{hash}', link_files = False, manifest = None ):
+        
+        if path is None:
+            
+            path = self._export_path
+            
+        
+        return ClientExporting.ExportFolder( 'test', path = path, export_type = export_type, phrase = phrase, link_files = link_files, manifest = manifest )
+        
+    
+    def _read_file( self, path ):
+        
+        with open( path, 'rb' ) as f:
+            
+            return f.read()
+            
+        
+    
+    def test_incremental_export( self ):
+        
+        export_folder = self._get_export_folder( HC.EXPORT_FOLDER_TYPE_REGULAR )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        for media_result in self._media_results:
+            
+            self.assertEqual( self._read_file( self._get_dest_path( media_result ) ), media_result.GetHash() * 10 )
+            
+        
+        ( manifest_key, hash_ids_to_exports ) = export_folder.GetManifest()
+        
+        self.assertEqual( manifest_key, ( self._export_path, '{hash}', HC.EXPORT_FOLDER_TYPE_REGULAR ) )
+        self.assertEqual( set( hash_ids_to_exports.keys() ), { 1, 2, 3 } )
+        
+        # what we get back is a copy
+        
+        hash_ids_to_exports.clear()
+        
+        self.assertEqual( len( export_folder.GetManifest()[1] ), 3 )
+        
+        #
+        
+        ( unchanged, changed, missing ) = self._media_results
+        
+        # the client's copy of an unchanged file changes, but the manifest says the export is fine, so it is not looked at again
+        
+        with open( self._source_paths[0], 'wb' ) as f:
+            
+            f.write( b'x' * 50 )
+            
+        
+        with open( self._get_dest_path( changed ), 'wb' ) as f:
+            
+            f.write( b'edited by the user' )
+            
+        
+        os.remove( self._get_dest_path( missing ) )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        self.assertEqual( self._read_file( self._get_dest_path( unchanged ) ), unchanged.GetHash() * 10 )
+        self.assertEqual( self._read_file( self._get_dest_path( changed ) ), changed.GetHash() * 10 )
+        self.assertEqual( self._read_file( self._get_dest_path( missing ) ), missing.GetHash() * 10 )
+        
+        self.assertEqual( set( export_folder.GetManifest()[1].keys() ), { 1, 2, 3 } )
+        
+    
+    def test_linked_export( self ):
+        
+        for source_path in self._source_paths:
+            
+            os.chmod( source_path, stat.S_IREAD )
+            
+        
+        export_folder = self._get_export_folder( HC.EXPORT_FOLDER_TYPE_REGULAR, link_files = True )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        for ( media_result, source_path ) in zip( self._media_results, self._source_paths ):
+            
+            self.assertEqual( self._read_file( self._get_dest_path( media_result ) ), media_result.GetHash() * 10 )
+            
+            # linking must not make the client's own file writable
+            
+            self.assertEqual( stat.S_IMODE( os.stat( source_path ).st_mode ), stat.S_IREAD )
+            
+        
+    
+    def test_manifest_reset( self ):
+        
+        export_folder = self._get_export_folder( HC.EXPORT_FOLDER_TYPE_SYNCHRONISE )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        manifest = export_folder.GetManifest()
+        
+        # a new phrase means new filenames, so everything is exported again and the old names are cleared out
+        
+        export_folder = self._get_export_folder( HC.EXPORT_FOLDER_TYPE_SYNCHRONISE, phrase = 'new {hash}', manifest = manifest )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        self.assertEqual( export_folder.GetManifest()[0], ( self._export_path, 'new {hash}', HC.EXPORT_FOLDER_TYPE_SYNCHRONISE ) )
+        
+        self.assertEqual( sorted( os.listdir( self._export_path ) ), sorted( 'new ' + media_result.GetHash().hex() + '.png' for media_result in self._media_results ) )
+        
+        # a new path has none of the files yet
+        
+        manifest = export_folder.GetManifest()
+        
+        export_folder = self._get_export_folder( HC.EXPORT_FOLDER_TYPE_SYNCHRONISE, path = self._other_export_path, phrase = 'new {hash}', manifest = manifest )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        self.assertEqual( export_folder.GetManifest()[0], ( self._other_export_path, 'new {hash}', HC.EXPORT_FOLDER_TYPE_SYNCHRONISE ) )
+        
+        self.assertEqual( sorted( os.listdir( self._other_export_path ) ), sorted( os.listdir( self._export_path ) ) )
+        
+    
+    def test_synchronise_removal( self ):
+        
+        export_folder = self._get_export_folder( HC.EXPORT_FOLDER_TYPE_SYNCHRONISE )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        ( kept_1, kept_2, removed ) = self._media_results
+        
+        self._do_export( export_folder, [ kept_1, kept_2 ] )
+        
+        self.assertTrue( os.path.exists( self._get_dest_path( kept_1 ) ) )
+        self.assertTrue( os.path.exists( self._get_dest_path( kept_2 ) ) )
+        self.assertFalse( os.path.exists( self._get_dest_path( removed ) ) )
+        
+        self.assertEqual( set( export_folder.GetManifest()[1].keys() ), { 1, 2 } )
+        
+        # a regular export folder leaves files that drop out of the search alone
+        
+        export_folder = self._get_export_folder( HC.EXPORT_FOLDER_TYPE_REGULAR )
+        
+        self._do_export( export_folder, self._media_results )
+        
+        self._do_export( export_folder, [ kept_1, kept_2 ] )
+        
+        self.assertTrue( os.path.exists( self._get_dest_path( removed ) ) )
+        
+    
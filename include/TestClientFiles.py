@@ -0,0 +1,102 @@
+from . import ClientFiles
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusPaths
+import os
+import shutil
+import unittest
+
+class TestThumbnailPack( unittest.TestCase ):
+    
+    def test_thumbnail_pack( self ):
+        
+        test_dir = HydrusPaths.GetTempDir()
+        
+        try:
+            
+            HydrusPaths.MakeSureDirectoryExists( test_dir )
+            
+            path = os.path.join( test_dir, ClientFiles.THUMBNAIL_PACK_FILENAME )
+            
+            with open( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), 'rb' ) as f:
+                
+                thumbnail_bytes = f.read()
+                
+            
+            hash_1 = HydrusData.GenerateKey()
+            hash_2 = HydrusData.GenerateKey()
+            hash_3 = HydrusData.GenerateKey()
+            
+            thumbnail_pack = ClientFiles.ThumbnailPack( path )
+            
+            # looking does not make a file
+            
+            self.assertFalse( thumbnail_pack.HasThumbnail( hash_1 ) )
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_1 ), None )
+            self.assertFalse( os.path.exists( path ) )
+            
+            thumbnail_pack.AddThumbnail( hash_1, thumbnail_bytes )
+            thumbnail_pack.AddThumbnail( hash_2, b'abcd' )
+            
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_1 ), thumbnail_bytes )
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_2 ), b'abcd' )
+            
+            thumbnail_pack.AddThumbnail( hash_2, b'efgh' )
+            thumbnail_pack.AddThumbnail( hash_3, b'ijkl' )
+            thumbnail_pack.DeleteThumbnail( hash_3 )
+            
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_2 ), b'efgh' )
+            self.assertFalse( thumbnail_pack.HasThumbnail( hash_3 ) )
+            
+            # a fresh pack reads the same index back off disk
+            
+            thumbnail_pack.Close()
+            
+            thumbnail_pack = ClientFiles.ThumbnailPack( path )
+            
+            # the db's lockless check does not walk a cold index
+            
+            self.assertFalse( thumbnail_pack.HasThumbnail( hash_1, load_index = False ) )
+            
+            thumbnail_pack.LoadIndex()
+            
+            self.assertTrue( thumbnail_pack.HasThumbnail( hash_1, load_index = False ) )
+            
+            self.assertEqual( set( thumbnail_pack.GetHashes() ), { hash_1, hash_2 } )
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_1 ), thumbnail_bytes )
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_2 ), b'efgh' )
+            
+            size_before = os.path.getsize( path )
+            
+            thumbnail_pack.Compact()
+            
+            self.assertLess( os.path.getsize( path ), size_before )
+            
+            self.assertEqual( set( thumbnail_pack.GetHashes() ), { hash_1, hash_2 } )
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_2 ), b'efgh' )
+            
+            # an interrupted append is dropped
+            
+            thumbnail_pack.Close()
+            
+            with open( path, 'ab' ) as f:
+                
+                f.write( hash_3 + b'\x00\x00\x10\x00' + b'partial' )
+                
+            
+            thumbnail_pack = ClientFiles.ThumbnailPack( path )
+            
+            self.assertEqual( set( thumbnail_pack.GetHashes() ), { hash_1, hash_2 } )
+            
+            thumbnail_pack.AddThumbnail( hash_3, b'mnop' )
+            
+            self.assertEqual( thumbnail_pack.GetThumbnailBytes( hash_3 ), b'mnop' )
+            
+            thumbnail_pack.Close()
+            
+        finally:
+            
+            shutil.rmtree( test_dir )
+            
+        
+    
@@ -1,6 +1,7 @@
 from . import ClientConstants as CC
 from . import ClientImportFileSeeds
 from . import ClientImportOptions
+from . import ClientImportSubscriptions
 from . import ClientTags
 from . import HydrusConstants as HC
 from . import HydrusData
@@ -392,6 +393,112 @@ class TestFileImportOptions( unittest.TestCase ):
         self.assertTrue( file_import_options.ShouldPresent( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, True ) )
         
     
+class TestFileSeedCache( unittest.TestCase ):
+    
+    def test_indices( self ):
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = []
+        
+        for i in range( 20 ):
+            
+            file_seed = ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://wew.lad/' + str( i ) )
+            
+            file_seed.source_time = 1000 + i
+            
+            file_seeds.append( file_seed )
+            
+        
+        file_seed_cache.AddFileSeeds( file_seeds[:10] )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[0] )
+        self.assertEqual( file_seed_cache.GetNumNewFilesSince( 1005 ), 5 )
+        
+        for file_seed in file_seeds[:3]:
+            
+            file_seed.SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+            
+        
+        file_seed_cache.NotifyFileSeedsUpdated( file_seeds[:3] )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[3] )
+        self.assertEqual( file_seed_cache.GetNextFileSeeds( CC.STATUS_SUCCESSFUL_AND_NEW, 5 ), file_seeds[:3] )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 7 )
+        self.assertEqual( file_seed_cache.GetStatusesToCounts(), { CC.STATUS_UNKNOWN : 7, CC.STATUS_SUCCESSFUL_AND_NEW : 3 } )
+        
+        # insert, move and remove
+        
+        file_seed_cache.InsertFileSeeds( 1, file_seeds[10:15] )
+        
+        self.assertEqual( file_seed_cache.GetFileSeedIndex( file_seeds[10] ), 1 )
+        self.assertEqual( file_seed_cache.GetFileSeedIndex( file_seeds[1] ), 6 )
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[10] )
+        
+        file_seed_cache.DelayFileSeed( file_seeds[10] )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[11] )
+        
+        file_seed_cache.AdvanceFileSeed( file_seeds[10] )
+        file_seed_cache.RemoveFileSeeds( file_seeds[10:12] )
+        
+        self.assertEqual( file_seed_cache.GetFileSeedIndex( file_seeds[12] ), 1 )
+        self.assertEqual( file_seed_cache.GetFileSeeds( CC.STATUS_UNKNOWN ), file_seeds[12:15] + file_seeds[3:10] )
+        self.assertEqual( file_seed_cache.GetNumNewFilesSince( 1012 ), 3 )
+        self.assertEqual( file_seed_cache.GetEarliestSourceTime(), 1000 )
+        self.assertEqual( file_seed_cache.GetLatestSourceTime(), 1014 )
+        
+        # a status change we were not told about
+        
+        file_seeds[12].SetStatus( CC.STATUS_ERROR )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[13] )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_ERROR ), 1 )
+        
+    
+    def test_unnotified_status_changes( self ):
+        
+        query = ClientImportSubscriptions.SubscriptionQuery( 'test' )
+        
+        file_seed_cache = query.GetFileSeedCache()
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://wew.lad/' + str( i ) ) for i in range( 3 ) ]
+        
+        file_seed_cache.AddFileSeeds( file_seeds )
+        
+        self.assertFalse( query.CanRetryFailed() )
+        
+        # importers sometimes set a status without notifying the cache
+        
+        file_seeds[1].SetStatus( CC.STATUS_ERROR )
+        file_seeds[2].SetStatus( CC.STATUS_VETOED )
+        
+        self.assertEqual( file_seed_cache.GetStatusesToCounts(), { CC.STATUS_UNKNOWN : 1, CC.STATUS_ERROR : 1, CC.STATUS_VETOED : 1 } )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 1 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_ERROR ), 1 )
+        self.assertEqual( file_seed_cache.GetFileSeeds( CC.STATUS_ERROR ), [ file_seeds[1] ] )
+        self.assertEqual( query.GetNumURLsAndFailed(), ( 1, 3, 1 ) )
+        self.assertTrue( query.CanRetryFailed() )
+        self.assertTrue( query.CanRetryIgnored() )
+        self.assertEqual( file_seed_cache.GetValueRange(), ( 2, 3 ) )
+        
+        file_seed_cache.RetryFailures()
+        
+        self.assertEqual( file_seeds[1].status, CC.STATUS_UNKNOWN )
+        self.assertFalse( query.CanRetryFailed() )
+        self.assertEqual( query.GetNumURLsAndFailed(), ( 2, 3, 0 ) )
+        self.assertEqual( file_seed_cache.GetValueRange(), ( 1, 3 ) )
+        
+        file_seeds[0].SetStatus( CC.STATUS_ERROR )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_ERROR ), file_seeds[0] )
+        
+        file_seed_cache.RetryIgnored()
+        
+        self.assertEqual( file_seeds[2].status, CC.STATUS_UNKNOWN )
+        self.assertEqual( file_seed_cache.GetStatusesToCounts(), { CC.STATUS_UNKNOWN : 2, CC.STATUS_ERROR : 1 } )
+        
+    
 class TestTagImportOptions( unittest.TestCase ):
     
     def test_basics( self ):
@@ -50,7 +50,7 @@ MOCK_HYDRUS_URL = 'https://123.45.67.89:45871/muh_hydrus_command'
 def catch_wew_error( url, request ):
     
     return { 'status_code' : 500, 'reason' : 'Internal Server Error', 'content' : BAD_RESPONSE }
-
+    
 @urlmatch( netloc = 'wew.lad' )
 def catch_wew_ok( url, request ):
     
@@ -60,12 +60,110 @@ def catch_wew_ok( url, request ):
 def catch_hydrus_error( url, request ):
     
     return response( 500, BAD_RESPONSE, { 'Server' : HC.service_string_lookup[ HC.TAG_REPOSITORY ] + '/' + str( HC.NETWORK_VERSION ) }, 'Internal Server Error' )
-
+    
 @urlmatch( netloc = MOCK_HYDRUS_ADDRESS )
 def catch_hydrus_ok( url, request ):
     
     return response( 200, GOOD_RESPONSE, { 'Server' : HC.service_string_lookup[ HC.TAG_REPOSITORY ] + '/' + str( HC.NETWORK_VERSION ) }, 'OK' )
     
+class MockEngineJob( object ):
+    
+    # just enough of a network job for the engine to schedule
+    
+    def __init__( self, second_level_domain, network_contexts = None ):
+        
+        if network_contexts is None:
+            
+            network_contexts = ( second_level_domain, )
+            
+        
+        self.engine = None
+        
+        self.bandwidth_ok = True
+        self.bandwidth_sleep = 0
+        self.num_bandwidth_checks = 0
+        self.started = False
+        
+        self._second_level_domain = second_level_domain
+        self._network_contexts = network_contexts
+        self._wake_time = 0
+        self._done = False
+        self._finish_event = threading.Event()
+        
+    
+    def BandwidthOK( self ):
+        
+        self.num_bandwidth_checks += 1
+        
+        if not self.bandwidth_ok and self.bandwidth_sleep > 0:
+            
+            self.Sleep( self.bandwidth_sleep )
+            
+        
+        return self.bandwidth_ok
+        
+    
+    def CanValidateInPopup( self ): return False
+    
+    def Finish( self ):
+        
+        self._finish_event.set()
+        
+    
+    def GetNetworkContexts( self ): return self._network_contexts
+    def GetSecondLevelDomain( self ): return self._second_level_domain
+    def GetWakeTime( self ): return self._wake_time
+    
+    def IsAsleep( self ): return not HydrusData.TimeHasPassed( self._wake_time )
+    def IsDone( self ): return self._done
+    def IsValid( self ): return True
+    
+    def NeedsLogin( self ): return False
+    def ObeysBandwidth( self ): return True
+    
+    def SetStatus( self, text ): pass
+    
+    def Sleep( self, seconds ):
+        
+        self._wake_time = HydrusData.GetNow() + seconds
+        
+    
+    def Start( self ):
+        
+        self.started = True
+        
+        self._finish_event.wait( 10 )
+        
+        self._done = True
+        
+        self.engine.WakeJob( self )
+        
+    
+    def TokensOK( self ): return True
+    
+    def Wake( self ):
+        
+        self._wake_time = 0
+        
+        self.engine.WakeJob( self )
+        
+    
+def WaitFor( condition, timeout = 5 ):
+    
+    give_up_time = time.time() + timeout
+    
+    while not condition():
+        
+        if time.time() > give_up_time:
+            
+            return False
+            
+        
+        time.sleep( 0.02 )
+        
+    
+    return True
+    
 class TestBandwidthManager( unittest.TestCase ):
     
     def test_can_start( self ):
@@ -272,6 +370,31 @@ class TestNetworkingDomain( unittest.TestCase ):
         
         #
         
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        
+        domain_manager.SetURLClasses( [ url_class ] )
+        
+        for i in range( 2 ):
+            
+            # second time round comes from the cache
+            
+            self.assertEqual( domain_manager.GetURLClass( unnormalised_good_url_1 ), url_class )
+            self.assertEqual( domain_manager.GetURLClass( bad_url ), None )
+            self.assertEqual( domain_manager.GetURLClass( 'https://testbooru.cx/post' ), None )
+            self.assertEqual( domain_manager.GetURLClass( 'https://testbooru.cx/post/page.php?id=abc&s=view' ), None )
+            
+            self.assertEqual( domain_manager.NormaliseURL( unnormalised_good_url_1 ), good_url )
+            self.assertEqual( domain_manager.NormaliseURL( unnormalised_good_url_2 ), good_url )
+            self.assertEqual( domain_manager.NormaliseURL( 'https://wew.lad/123456?b=2&a=1' ), 'https://wew.lad/123456?a=1&b=2' )
+            
+        
+        domain_manager.SetURLClasses( [] )
+        
+        self.assertEqual( domain_manager.GetURLClass( unnormalised_good_url_1 ), None )
+        self.assertEqual( domain_manager.NormaliseURL( unnormalised_good_url_1 ), 'https://testbooru.cx/post/page.php?additional_gumpf=stuff&id=123456&s=view' )
+        
+        #
+        
         send_referral_url = ClientNetworkingDomain.SEND_REFERRAL_URL_NEVER
         
         url_class = ClientNetworkingDomain.URLClass( name, url_type = url_type, preferred_scheme = preferred_scheme, netloc = netloc, match_subdomains = match_subdomains, keep_matched_subdomains = keep_matched_subdomains, path_components = path_components, parameters = parameters, send_referral_url = send_referral_url, referral_url_converter = referral_url_converter, can_produce_multiple_files = can_produce_multiple_files, should_be_associated_with_files = should_be_associated_with_files, gallery_index_type = gallery_index_type, gallery_index_identifier = gallery_index_identifier, gallery_index_delta = gallery_index_delta, example_url = example_url )
@@ -308,6 +431,239 @@ class TestNetworkingDomain( unittest.TestCase ):
     
 class TestNetworkingEngine( unittest.TestCase ):
     
+    def _GetEngine( self ):
+        
+        mock_controller = TestController.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        return ( mock_controller, engine )
+        
+    
+    def _RunJobs( self, engine, mock_controller, jobs ):
+        
+        for job in jobs:
+            
+            engine.AddJob( job )
+            
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+    
+    def _StopJobs( self, engine, jobs ):
+        
+        engine.Shutdown()
+        
+        for job in jobs:
+            
+            job.Finish()
+            
+        
+    
+    def test_engine_scheduler_bandwidth( self ):
+        
+        ( mock_controller, engine ) = self._GetEngine()
+        
+        head_job = MockEngineJob( 'wew.lad' )
+        tail_job = MockEngineJob( 'wew.lad' )
+        
+        jobs = [ head_job, tail_job ]
+        
+        head_job.bandwidth_ok = False
+        tail_job.bandwidth_ok = False
+        
+        self._RunJobs( engine, mock_controller, jobs )
+        
+        try:
+            
+            # the head is out of bandwidth, which blocks everything in its queue, so the job behind it is not asked
+            
+            self.assertTrue( WaitFor( lambda: head_job.num_bandwidth_checks >= 2 ) )
+            
+            self.assertEqual( tail_job.num_bandwidth_checks, 0 )
+            
+            ( job_statuses_to_counts, second_level_domains_to_counts ) = engine.GetQueueDepths()
+            
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_AWAITING_BANDWIDTH ], 2 )
+            self.assertEqual( second_level_domains_to_counts[ 'wew.lad' ], 2 )
+            
+            # nothing tells the engine when bandwidth frees up, so it has to notice on its own
+            
+            head_job.bandwidth_ok = True
+            tail_job.bandwidth_ok = True
+            
+            self.assertTrue( WaitFor( lambda: head_job.started and tail_job.started ) )
+            
+            ( job_statuses_to_counts, second_level_domains_to_counts ) = engine.GetQueueDepths()
+            
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_RUNNING ], 2 )
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_AWAITING_BANDWIDTH ], 0 )
+            
+        finally:
+            
+            self._StopJobs( engine, jobs )
+            
+        
+    
+    def test_engine_scheduler_bandwidth_sleep( self ):
+        
+        ( mock_controller, engine ) = self._GetEngine()
+        
+        head_job = MockEngineJob( 'wew.lad' )
+        tail_job = MockEngineJob( 'wew.lad' )
+        
+        jobs = [ head_job, tail_job ]
+        
+        head_job.bandwidth_ok = False
+        head_job.bandwidth_sleep = 60
+        
+        self._RunJobs( engine, mock_controller, jobs )
+        
+        try:
+            
+            # napping until bandwidth frees up still holds up the queue
+            
+            self.assertTrue( WaitFor( lambda: head_job.num_bandwidth_checks == 1 ) )
+            
+            time.sleep( 1.5 )
+            
+            self.assertEqual( head_job.num_bandwidth_checks, 1 )
+            self.assertEqual( tail_job.num_bandwidth_checks, 0 )
+            
+            # but once the head passes, the job behind it gets its turn
+            
+            head_job.bandwidth_ok = True
+            head_job.Wake()
+            
+            self.assertTrue( WaitFor( lambda: head_job.started and tail_job.started ) )
+            
+        finally:
+            
+            self._StopJobs( engine, jobs )
+            
+        
+        #
+        
+        ( mock_controller, engine ) = self._GetEngine()
+        
+        head_job = MockEngineJob( 'wew.lad' )
+        tail_job = MockEngineJob( 'wew.lad' )
+        
+        jobs = [ head_job, tail_job ]
+        
+        head_job.bandwidth_ok = False
+        
+        self._RunJobs( engine, mock_controller, jobs )
+        
+        try:
+            
+            self.assertTrue( WaitFor( lambda: head_job.num_bandwidth_checks >= 1 ) )
+            
+            # now the head is asleep for its own reasons, so it should not hold up the job behind it
+            
+            head_job.Sleep( 60 )
+            head_job.bandwidth_ok = True
+            
+            self.assertTrue( WaitFor( lambda: tail_job.started ) )
+            
+            self.assertFalse( head_job.started )
+            
+            ( job_statuses_to_counts, second_level_domains_to_counts ) = engine.GetQueueDepths()
+            
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_AWAITING_BANDWIDTH ], 1 )
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_RUNNING ], 1 )
+            
+            # when it wakes, it is picked up straight away
+            
+            head_job.Wake()
+            
+            self.assertTrue( WaitFor( lambda: head_job.started, timeout = 0.9 ) )
+            
+        finally:
+            
+            self._StopJobs( engine, jobs )
+            
+        
+    
+    def test_engine_scheduler_slots( self ):
+        
+        ( mock_controller, engine ) = self._GetEngine()
+        
+        engine.MAX_JOBS_PER_DOMAIN = 1
+        
+        first_job = MockEngineJob( 'wew.lad' )
+        second_job = MockEngineJob( 'wew.lad' )
+        other_domain_job = MockEngineJob( 'somewhere.else' )
+        
+        jobs = [ first_job, second_job, other_domain_job ]
+        
+        self._RunJobs( engine, mock_controller, jobs )
+        
+        try:
+            
+            self.assertTrue( WaitFor( lambda: first_job.started and other_domain_job.started ) )
+            
+            self.assertFalse( second_job.started )
+            
+            ( job_statuses_to_counts, second_level_domains_to_counts ) = engine.GetQueueDepths()
+            
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_RUNNING ], 2 )
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_AWAITING_SLOT ], 1 )
+            self.assertEqual( second_level_domains_to_counts, collections.Counter( { 'wew.lad' : 1 } ) )
+            
+            # finishing frees the domain's slot, and the job says so, so the next one starts without waiting for the engine's tick
+            
+            other_domain_job.Finish()
+            
+            time.sleep( 0.5 )
+            
+            self.assertFalse( second_job.started )
+            
+            first_job.Finish()
+            
+            self.assertTrue( WaitFor( lambda: second_job.started, timeout = 0.9 ) )
+            
+            ( job_statuses_to_counts, second_level_domains_to_counts ) = engine.GetQueueDepths()
+            
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_RUNNING ], 1 )
+            self.assertEqual( job_statuses_to_counts[ ClientNetworking.JOB_STATUS_AWAITING_SLOT ], 0 )
+            
+        finally:
+            
+            self._StopJobs( engine, jobs )
+            
+        
+        #
+        
+        ( mock_controller, engine ) = self._GetEngine()
+        
+        engine.MAX_JOBS = 2
+        
+        busy_jobs = [ MockEngineJob( 'wew.lad' ) for i in range( 5 ) ]
+        other_job = MockEngineJob( 'somewhere.else' )
+        
+        jobs = busy_jobs + [ other_job ]
+        
+        self._RunJobs( engine, mock_controller, jobs )
+        
+        try:
+            
+            # the busy domain queued first, but it only gets one of the two free slots
+            
+            self.assertTrue( WaitFor( lambda: other_job.started ) )
+            
+            self.assertEqual( len( [ job for job in busy_jobs if job.started ] ), 1 )
+            
+        finally:
+            
+            self._StopJobs( engine, jobs )
+            
+        
+    
     def test_engine_shutdown_app( self ):
         
         mock_controller = TestController.MockController()
@@ -422,9 +778,9 @@ class TestNetworkingEngine( unittest.TestCase ):
     
 class TestNetworkingJob( unittest.TestCase ):
     
-    def _GetJob( self, for_login = False ):
+    def _GetJob( self, for_login = False, temp_path = None ):
         
-        job = ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL )
+        job = ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL, temp_path = temp_path )
         
         job.SetForLogin( for_login )
         
@@ -622,6 +978,150 @@ class TestNetworkingJob( unittest.TestCase ):
             
         
     
+    def _GetResumingJob( self ):
+        
+        temp_path = os.path.join( TestController.DB_DIR, 'resume_test' )
+        
+        # a previous attempt broke after the first 100 bytes of a download that came with an etag
+        
+        with open( temp_path, 'wb' ) as f:
+            
+            f.write( GOOD_RESPONSE[:100] )
+            
+        
+        job = self._GetJob( temp_path = temp_path )
+        
+        job._range_validator = '"muh_etag"'
+        
+        job._SetResumePoint()
+        
+        return job
+        
+    
+    def _GetTempContent( self, job ):
+        
+        with open( job._temp_path, 'rb' ) as f:
+            
+            return f.read()
+            
+        
+    
+    def _RunResumingJob( self, job, handle_range_request ):
+        
+        range_headers = []
+        
+        @urlmatch( netloc = 'wew.lad' )
+        def catch_wew_resume( url, request ):
+            
+            range_headers.append( ( request.headers.get( 'Range', None ), request.headers.get( 'If-Range', None ) ) )
+            
+            if 'Range' in request.headers:
+                
+                return handle_range_request( request )
+                
+            
+            return response( 200, GOOD_RESPONSE, { 'Content-Length' : str( len( GOOD_RESPONSE ) ), 'ETag' : '"muh_etag"' }, 'OK' )
+            
+        
+        try:
+            
+            # no need to wait around before reattempting here
+            
+            with patch.object( ClientNetworkingJobs.NetworkJob, '_WaitOnConnectionError' ):
+                
+                with HTTMock( catch_all ):
+                    
+                    with HTTMock( catch_wew_resume ):
+                        
+                        job.Start()
+                        
+                    
+                
+            
+            self.assertFalse( job.HasError() )
+            
+            return ( range_headers, self._GetTempContent( job ) )
+            
+        finally:
+            
+            os.remove( job._temp_path )
+            
+        
+    
+    def test_resume_appends( self ):
+        
+        job = self._GetResumingJob()
+        
+        def handle_range_request( request ):
+            
+            return response( 206, GOOD_RESPONSE[100:], { 'Content-Length' : '156', 'Content-Range' : 'bytes 100-255/256' }, 'Partial Content' )
+            
+        
+        ( range_headers, content ) = self._RunResumingJob( job, handle_range_request )
+        
+        self.assertEqual( range_headers, [ ( 'bytes=100-', '"muh_etag"' ) ] )
+        
+        self.assertEqual( content, GOOD_RESPONSE )
+        
+        # only what came over the wire this time counts against bandwidth
+        
+        self.assertEqual( job.GetStatus(), ( 'done!', 156, 256, 256 ) )
+        
+    
+    def test_resume_full_response( self ):
+        
+        job = self._GetResumingJob()
+        
+        # the file changed since, so If-Range gets us the whole new thing
+        
+        def handle_range_request( request ):
+            
+            return response( 200, GOOD_RESPONSE, { 'Content-Length' : '256', 'ETag' : '"new_etag"' }, 'OK' )
+            
+        
+        ( range_headers, content ) = self._RunResumingJob( job, handle_range_request )
+        
+        self.assertEqual( range_headers, [ ( 'bytes=100-', '"muh_etag"' ) ] )
+        
+        self.assertEqual( content, GOOD_RESPONSE )
+        
+        self.assertEqual( job.GetStatus(), ( 'done!', 256, 256, 256 ) )
+        
+    
+    def test_resume_mismatched_range( self ):
+        
+        job = self._GetResumingJob()
+        
+        def handle_range_request( request ):
+            
+            return response( 206, GOOD_RESPONSE[50:], { 'Content-Length' : '206', 'Content-Range' : 'bytes 50-255/256' }, 'Partial Content' )
+            
+        
+        ( range_headers, content ) = self._RunResumingJob( job, handle_range_request )
+        
+        # we do not append from the wrong place, but start again from scratch
+        
+        self.assertEqual( range_headers, [ ( 'bytes=100-', '"muh_etag"' ), ( None, None ) ] )
+        
+        self.assertEqual( content, GOOD_RESPONSE )
+        
+    
+    def test_resume_not_satisfiable( self ):
+        
+        job = self._GetResumingJob()
+        
+        def handle_range_request( request ):
+            
+            return response( 416, b'', { 'Content-Range' : 'bytes */256' }, 'Range Not Satisfiable' )
+            
+        
+        ( range_headers, content ) = self._RunResumingJob( job, handle_range_request )
+        
+        self.assertEqual( range_headers, [ ( 'bytes=100-', '"muh_etag"' ), ( None, None ) ] )
+        
+        self.assertEqual( content, GOOD_RESPONSE )
+        
+    
     def test_generate_login_process( self ):
         
         # test the system works as expected
@@ -791,3 +1291,35 @@ class TestNetworkingJobHydrus( unittest.TestCase ):
         pass
         
     
+class TestNetworkingSessions( unittest.TestCase ):
+    
+    def test_connection_pools( self ):
+        
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        
+        network_context = ClientNetworkingContexts.NetworkContext( CC.NETWORK_CONTEXT_DOMAIN, MOCK_DOMAIN )
+        
+        session = session_manager.GetSession( network_context )
+        
+        pool_size = HG.client_controller.new_options.GetInteger( 'network_connection_pool_size' )
+        
+        for url in ( MOCK_URL, 'http://wew.lad/' ):
+            
+            adapter = session.get_adapter( url )
+            
+            self.assertEqual( adapter.poolmanager.connection_pool_kw[ 'maxsize' ], pool_size )
+            
+        
+        self.assertEqual( session.headers[ 'Connection' ], 'keep-alive' )
+        
+        self.assertEqual( session_manager.GetConnectionPoolStats( network_context ), ( 0, 0, 0, 0 ) )
+        
+        # the same session comes back, pools and all
+        
+        self.assertIs( session_manager.GetSession( network_context ).get_adapter( MOCK_URL ), session.get_adapter( MOCK_URL ) )
+        
+        session_manager.ClearSession( network_context )
+        
+        self.assertEqual( session_manager.GetConnectionPoolStats( network_context ), ( 0, 0, 0, 0 ) )
+        
+    
@@ -0,0 +1,126 @@
+from . import ClientParsing
+from . import HydrusGlobals as HG
+import unittest
+
+THREAD_HTML = '''<html>
+<head><title>test thread</title><script>var a = 1 < 2 && "&amp;";</script></head>
+<body>
+<div class="thread" id="t1">
+<div class="post op" id="p1"><span class="name">anon</span><a href="/src/1.jpg?a=1&amp;b=2" rel="nofollow  noopener"><img src="/thumb/1.jpg" alt='a "quoted" thumb'></a><blockquote>first post &gt; second<br>tags: <span class="tag">blue sky</span><!-- mod note --></blockquote></div>
+<div class=" post  reply " id="p2"><span class="name">someone</span><input type="checkbox" checked><a href="/src/2.png">2.png</a><blockquote>reply with <b>bold</b> tail &amp; <i>italics</i></blockquote></div>
+<div class="post reply" id="p3"><span class="name"></span><a href="/src/3.gif" title="it's &quot;3&quot;">3.gif</a><blockquote><span class="tag">green grass</span> <span class="tag">red</span></blockquote></div>
+</div>
+</body>
+</html>'''
+
+class TestHTMLEngineParity( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._original_value = HG.client_controller.new_options.GetBoolean( 'parse_html_with_lxml' )
+        
+    
+    def tearDown( self ):
+        
+        HG.client_controller.new_options.SetBoolean( 'parse_html_with_lxml', self._original_value )
+        
+    
+    def _parse_both( self, formula, parsing_text ):
+        
+        self.assertTrue( formula._CanUseLXML() )
+        
+        HG.client_controller.new_options.SetBoolean( 'parse_html_with_lxml', False )
+        
+        bs4_results = formula.Parse( {}, parsing_text )
+        
+        HG.client_controller.new_options.SetBoolean( 'parse_html_with_lxml', True )
+        
+        lxml_results = formula.Parse( {}, parsing_text )
+        
+        self.assertEqual( bs4_results, lxml_results )
+        
+        return lxml_results
+        
+    
+    def test_formulas( self ):
+        
+        post_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'post' } )
+        reply_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'post reply' } )
+        link_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'a' )
+        tag_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'span', tag_attributes = { 'class' : 'tag' } )
+        second_span_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'span', tag_index = 1 )
+        up_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_ASCENDING, tag_name = 'div', tag_depth = 1 )
+        any_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = None )
+        
+        formulas_and_expected = []
+        
+        formulas_and_expected.append( ( [ post_rule, link_rule ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'href', [ '/src/1.jpg?a=1&b=2', '/src/2.png', '/src/3.gif' ] ) )
+        formulas_and_expected.append( ( [ reply_rule ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'class', [ 'post reply', 'post reply' ] ) )
+        formulas_and_expected.append( ( [ link_rule ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'rel', [ 'nofollow noopener' ] ) )
+        formulas_and_expected.append( ( [ tag_rule ], ClientParsing.HTML_CONTENT_STRING, None, [ 'blue sky', 'green grass', 'red' ] ) )
+        formulas_and_expected.append( ( [ post_rule, second_span_rule ], ClientParsing.HTML_CONTENT_STRING, None, [ 'blue sky', 'green grass' ] ) )
+        formulas_and_expected.append( ( [ tag_rule, up_rule ], ClientParsing.HTML_CONTENT_ATTRIBUTE, 'id', [ 'p1', 'p3', 'p3' ] ) )
+        formulas_and_expected.append( ( [ post_rule, any_rule ], ClientParsing.HTML_CONTENT_STRING, None, None ) )
+        formulas_and_expected.append( ( [ post_rule ], ClientParsing.HTML_CONTENT_HTML, None, None ) )
+        formulas_and_expected.append( ( [ post_rule, link_rule ], ClientParsing.HTML_CONTENT_HTML, None, None ) )
+        
+        for ( tag_rules, content_to_fetch, attribute_to_fetch, expected ) in formulas_and_expected:
+            
+            formula = ClientParsing.ParseFormulaHTML( tag_rules = tag_rules, content_to_fetch = content_to_fetch, attribute_to_fetch = attribute_to_fetch )
+            
+            results = self._parse_both( formula, THREAD_HTML )
+            
+            self.assertTrue( len( results ) > 0 )
+            
+            if expected is not None:
+                
+                self.assertEqual( results, expected )
+                
+            
+        
+    
+    def test_html_content( self ):
+        
+        post_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'post' } )
+        
+        formula = ClientParsing.ParseFormulaHTML( tag_rules = [ post_rule ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML )
+        
+        posts = self._parse_both( formula, THREAD_HTML )
+        
+        self.assertEqual( posts[1], '<div class="post reply" id="p2"><span class="name">someone</span><input checked="" type="checkbox"/><a href="/src/2.png">2.png</a><blockquote>reply with <b>bold</b> tail &amp; <i>italics</i></blockquote></div>' )
+        
+        # these posts now go to a sub-page parser, which in the lxml case gets the cached element rather than a re-parse
+        
+        tag_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'span', tag_attributes = { 'class' : 'tag' } )
+        image_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'img' )
+        
+        tag_formula = ClientParsing.ParseFormulaHTML( tag_rules = [ tag_rule ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING )
+        image_formula = ClientParsing.ParseFormulaHTML( tag_rules = [ image_rule ], content_to_fetch = ClientParsing.HTML_CONTENT_ATTRIBUTE, attribute_to_fetch = 'alt' )
+        html_formula = ClientParsing.ParseFormulaHTML( tag_rules = [ image_rule ], content_to_fetch = ClientParsing.HTML_CONTENT_HTML )
+        
+        self.assertEqual( [ self._parse_both( tag_formula, post ) for post in posts ], [ [ 'blue sky' ], [], [ 'green grass', 'red' ] ] )
+        self.assertEqual( self._parse_both( image_formula, posts[0] ), [ 'a "quoted" thumb' ] )
+        self.assertEqual( self._parse_both( html_formula, posts[0] ), [ '<img alt=\'a "quoted" thumb\' src="/thumb/1.jpg"/>' ] )
+        
+        # the page's tree is untouched by all that
+        
+        self.assertEqual( self._parse_both( formula, THREAD_HTML ), posts )
+        
+    
+    def test_script_and_style_text( self ):
+        
+        html = '<html><head><title>test</title></head><body><div class="post"><script>var a = "not text";</script><style>p { color: red; }</style><!-- note -->real text<b>bold</b></div><script id="data">{"a": 1}</script></body></html>'
+        
+        post_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'div', tag_attributes = { 'class' : 'post' } )
+        script_rule = ClientParsing.ParseRuleHTML( rule_type = ClientParsing.HTML_RULE_TYPE_DESCENDING, tag_name = 'script', tag_attributes = { 'id' : 'data' } )
+        
+        post_formula = ClientParsing.ParseFormulaHTML( tag_rules = [ post_rule ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING )
+        script_formula = ClientParsing.ParseFormulaHTML( tag_rules = [ script_rule ], content_to_fetch = ClientParsing.HTML_CONTENT_STRING )
+        
+        self.assertEqual( self._parse_both( post_formula, html ), [ 'real text' ] )
+        
+        # a script tag's own text still counts, for json in script tags
+        
+        self.assertEqual( self._parse_both( script_formula, html ), [ '{"a": 1}' ] )
+        
+    
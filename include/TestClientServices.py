@@ -0,0 +1,178 @@
+from . import ClientFiles
+from . import ClientServices
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusExceptions
+from . import HydrusGlobals as HG
+from . import HydrusNetwork
+import os
+import threading
+import unittest
+from mock import patch
+
+class TestRepositoryUpdateDownloading( unittest.TestCase ):
+    
+    def test_failure_cancels_downloads_in_flight( self ):
+        
+        class FakeNetworkJob( object ):
+            
+            def __init__( self ):
+                
+                self.cancelled = threading.Event()
+                
+            
+            def Cancel( self ):
+                
+                self.cancelled.set()
+                
+            
+        
+        service_key = HydrusData.GenerateKey()
+        
+        repo = ClientServices.GenerateService( service_key, HC.TAG_REPOSITORY, 'test tag repo' )
+        
+        update_hashes = [ HydrusData.GenerateKey() for i in range( ClientServices.NUM_CONCURRENT_UPDATE_DOWNLOADS + 2 ) ]
+        
+        lock = threading.Lock()
+        
+        started = set()
+        cancelled = set()
+        finished = set()
+        
+        def fake_request( method, command, request_args, network_job_hook = None ):
+            
+            update_hash = request_args[ 'update_hash' ]
+            
+            network_job = FakeNetworkJob()
+            
+            try:
+                
+                network_job_hook( network_job )
+                
+                with lock:
+                    
+                    started.add( update_hash )
+                    
+                
+                if update_hash == update_hashes[0]:
+                    
+                    raise HydrusExceptions.NetworkException( 'test failure' )
+                    
+                
+                # the rest would sit on the network until someone stops them
+                
+                if network_job.cancelled.wait( 10 ):
+                    
+                    with lock:
+                        
+                        cancelled.add( update_hash )
+                        
+                    
+                    raise HydrusExceptions.CancelledException( 'cancelled!' )
+                    
+                
+                return b'not an update'
+                
+            finally:
+                
+                with lock:
+                    
+                    finished.add( update_hash )
+                    
+                
+            
+        
+        HG.test_controller.SetRead( 'missing_repository_update_hashes', update_hashes )
+        
+        with patch.object( repo, '_CanSyncDownload', return_value = True ):
+            
+            with patch.object( repo, 'Request', fake_request ):
+                
+                repo._SyncDownloadUpdates( HydrusData.GetNow() + 60 )
+                
+            
+        
+        # the head download failed, so the others already in flight were stopped, and we waited for them to finish
+        
+        in_flight = set( update_hashes[ : ClientServices.NUM_CONCURRENT_UPDATE_DOWNLOADS ] )
+        
+        with lock:
+            
+            self.assertTrue( started.issubset( in_flight ) )
+            self.assertIn( update_hashes[0], started )
+            self.assertEqual( cancelled, started - { update_hashes[0] } )
+            self.assertEqual( finished, in_flight )
+            
+        
+        self.assertEqual( HG.test_controller.GetWrite( 'import_update' ), [] )
+        
+    
+class TestRepositoryUpdateProcessing( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._service_key = HydrusData.GenerateKey()
+        
+        self._repo = ClientServices.GenerateService( self._service_key, HC.TAG_REPOSITORY, 'test tag repo' )
+        
+        self._update_hash = HydrusData.GenerateKey()
+        
+        self._update_path = HG.test_controller.client_files_manager.GetFilePath( self._update_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS, check_file_exists = False )
+        
+        os.makedirs( os.path.dirname( self._update_path ), exist_ok = True )
+        
+        HG.test_controller.SetRead( 'repository_update_hashes_to_process', ( False, [ self._update_hash ], False, [] ) )
+        
+    
+    def tearDown( self ):
+        
+        if os.path.exists( self._update_path ):
+            
+            os.remove( self._update_path )
+            
+        
+    
+    def _process_bad_update( self, update_network_bytes ):
+        
+        if update_network_bytes is not None:
+            
+            with open( self._update_path, 'wb' ) as f:
+                
+                f.write( update_network_bytes )
+                
+            
+        
+        self._repo._SyncProcessUpdates( maintenance_mode = HC.MAINTENANCE_FORCED )
+        
+        # a bad update pauses the repo and schedules all its update files for the appropriate check
+        
+        self.assertTrue( self._repo.IsPaused() )
+        
+        [ ( args, kwargs ) ] = HG.test_controller.GetWrite( 'schedule_repository_update_file_maintenance' )
+        
+        self.assertEqual( HG.test_controller.GetWrite( 'process_repository_definitions' ), [] )
+        
+        return args
+        
+    
+    def test_corrupt_update( self ):
+        
+        args = self._process_bad_update( b'this is not an update' )
+        
+        self.assertEqual( args, ( self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA ) )
+        
+    
+    def test_missing_update( self ):
+        
+        args = self._process_bad_update( None )
+        
+        self.assertEqual( args, ( self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE ) )
+        
+    
+    def test_wrong_type_update( self ):
+        
+        args = self._process_bad_update( HydrusNetwork.ContentUpdate().DumpToNetworkBytes() )
+        
+        self.assertEqual( args, ( self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_METADATA ) )
+        
+    
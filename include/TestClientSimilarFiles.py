@@ -0,0 +1,198 @@
+from . import ClientConstants as CC
+from . import ClientDB
+from . import ClientImportFileSeeds
+from . import ClientImportOptions
+from . import ClientSearch
+from . import ClientSimilarFiles
+from . import HydrusConstants as HC
+from . import HydrusData
+from . import HydrusGlobals as HG
+import os
+import random
+from . import TestController
+import time
+import unittest
+
+class TestPHashIndex( unittest.TestCase ):
+    
+    def test_search( self ):
+        
+        rows = [ ( phash_id, os.urandom( 8 ) ) for phash_id in range( 1, 2001 ) ]
+        
+        phash_index = ClientSimilarFiles.PHashIndex()
+        
+        phash_index.AddPHashes( rows )
+        
+        self.assertEqual( phash_index.GetNumPHashes(), 2000 )
+        
+        for ( search_phash_id, search_phash ) in rows[:10]:
+            
+            for max_hamming_distance in ( 0, 4, 24 ):
+                
+                expected = { phash_id : HydrusData.Get64BitHammingDistance( search_phash, phash ) for ( phash_id, phash ) in rows }
+                
+                expected = { phash_id : distance for ( phash_id, distance ) in expected.items() if distance <= max_hamming_distance }
+                
+                result = dict( phash_index.Search( search_phash, max_hamming_distance ) )
+                
+                self.assertEqual( result, expected )
+                
+                self.assertEqual( result[ search_phash_id ], 0 )
+                
+            
+        
+        search_phashes = [ phash for ( phash_id, phash ) in rows[:10] ]
+        
+        self.assertEqual( phash_index.SearchMany( search_phashes, 12 ), [ phash_index.Search( search_phash, 12 ) for search_phash in search_phashes ] )
+        
+    
+    def test_add_remove( self ):
+        
+        phash_a = bytes.fromhex( '0000000000000000' )
+        phash_b = bytes.fromhex( '0000000000000003' )
+        phash_c = bytes.fromhex( 'ffffffffffffffff' )
+        
+        phash_index = ClientSimilarFiles.PHashIndex()
+        
+        phash_index.AddPHashes( [ ( 1, phash_a ), ( 2, phash_b ) ] )
+        
+        self.assertEqual( sorted( phash_index.Search( phash_a, 2 ) ), [ ( 1, 0 ), ( 2, 2 ) ] )
+        
+        phash_index.RemovePHashIds( { 2 } )
+        
+        self.assertEqual( phash_index.Search( phash_a, 2 ), [ ( 1, 0 ) ] )
+        
+        # the db can reuse a phash_id
+        
+        phash_index.RemovePHashIds( { 1 } )
+        phash_index.AddPHashes( [ ( 1, phash_c ) ] )
+        
+        self.assertEqual( phash_index.Search( phash_a, 2 ), [] )
+        self.assertEqual( phash_index.Search( phash_c, 0 ), [ ( 1, 0 ) ] )
+        self.assertEqual( phash_index.GetNumPHashes(), 1 )
+        
+    
+class TestSimilarFilesDB( unittest.TestCase ):
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        cls._db = ClientDB.DB( HG.test_controller, TestController.DB_DIR, 'client' )
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        cls._db.Shutdown()
+        
+        while not cls._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        for filename in cls._db._db_filenames.values():
+            
+            os.remove( os.path.join( TestController.DB_DIR, filename ) )
+            
+        
+        del cls._db
+        
+    
+    def _read( self, action, *args, **kwargs ): return TestSimilarFilesDB._db.Read( action, *args, **kwargs )
+    def _write( self, action, *args, **kwargs ): return TestSimilarFilesDB._db.Write( action, True, *args, **kwargs )
+    
+    def _search( self, hash, max_hamming ):
+        
+        predicates = [ ClientSearch.Predicate( HC.PREDICATE_TYPE_SYSTEM_SIMILAR_TO, ( ( hash, ), max_hamming ) ) ]
+        
+        search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = predicates )
+        
+        hash_ids = self._read( 'file_query_ids', search_context )
+        
+        return set( self._read( 'hash_ids_to_hashes', hash_ids = hash_ids ).values() )
+        
+    
+    def test_search_with_and_without_index( self ):
+        
+        # clusters of phashes a few bits apart, and some files with several phashes
+        
+        hashes_to_phashes = {}
+        
+        for i in range( 6 ):
+            
+            base_phash = int.from_bytes( os.urandom( 8 ), 'big' )
+            
+            for j in range( 8 ):
+                
+                phashes = []
+                
+                for k in range( 1 + j % 2 ):
+                    
+                    phash = base_phash
+                    
+                    for bit in random.sample( range( 64 ), random.randint( 0, 6 ) ):
+                        
+                        phash ^= 1 << bit
+                        
+                    
+                    phashes.append( phash )
+                    
+                
+                hashes_to_phashes[ HydrusData.GenerateKey() ] = phashes
+                
+            
+        
+        ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = ( 65535, HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+        
+        for ( hash, phashes ) in hashes_to_phashes.items():
+            
+            fake_file_import_job = ClientImportFileSeeds.FileImportJob( 'fake path' )
+            
+            fake_file_import_job._hash = hash
+            fake_file_import_job._file_info = ( size, mime, width, height, duration, num_frames, has_audio, num_words )
+            fake_file_import_job._extra_hashes = ( b'abcd', b'abcd', b'abcd' )
+            fake_file_import_job._phashes = [ phash.to_bytes( 8, 'big' ) for phash in phashes ]
+            fake_file_import_job._file_import_options = ClientImportOptions.FileImportOptions()
+            
+            self._write( 'import_file', fake_file_import_job )
+            
+        
+        self._write( 'maintain_similar_files_tree' )
+        
+        searches = [ ( hash, max_hamming ) for hash in list( hashes_to_phashes.keys() )[ : 12 ] for max_hamming in ( 0, 4, 8 ) ]
+        
+        expected_results = []
+        
+        for ( search_hash, max_hamming ) in searches:
+            
+            search_phashes = hashes_to_phashes[ search_hash ]
+            
+            expected_results.append( { hash for ( hash, phashes ) in hashes_to_phashes.items() if min( bin( search_phash ^ phash ).count( '1' ) for search_phash in search_phashes for phash in phashes ) <= max_hamming } )
+            
+        
+        # the vptree
+        
+        vptree_results = [ self._search( hash, max_hamming ) for ( hash, max_hamming ) in searches ]
+        
+        self.assertEqual( vptree_results, expected_results )
+        
+        # the in-memory index, which only the writer loads
+        
+        HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', True )
+        
+        try:
+            
+            self._write( 'maintain_similar_files_search_for_potential_duplicates', 8 )
+            
+            self.assertIsNotNone( TestSimilarFilesDB._db._phash_index )
+            
+            index_results = [ self._search( hash, max_hamming ) for ( hash, max_hamming ) in searches ]
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'use_in_memory_similar_files_index', False )
+            
+        
+        self.assertEqual( index_results, vptree_results )
+        
+    
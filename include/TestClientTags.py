@@ -8,6 +8,7 @@ from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
 from . import HydrusGlobals as HG
+from mock import patch
 import os
 import unittest
 
@@ -355,6 +356,113 @@ class TestTagsManager( unittest.TestCase ):
         self.assertNotIn( 'hello', self._other_tags_manager.GetPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ) )
         
     
+    def test_copy_on_write( self ):
+        
+        service_key = HydrusData.GenerateKey()
+        
+        service_keys_to_statuses_to_tags = collections.defaultdict( ClientMedia.GenerateStatusesToTags )
+        
+        service_keys_to_statuses_to_tags[ service_key ] = ClientMedia.BuildStatusesToTags( [ ( HC.CONTENT_STATUS_CURRENT, 'samus aran' ) ] )
+        
+        tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags )
+        
+        dupe_tags_manager = tags_manager.Duplicate()
+        
+        empty_tags_manager = ClientMedia.TagsManager( collections.defaultdict( ClientMedia.GenerateStatusesToTags ) )
+        
+        other_empty_tags_manager = ClientMedia.TagsManager( collections.defaultdict( ClientMedia.GenerateStatusesToTags ) )
+        
+        # statuses with nothing in them start off as the shared empty set
+        
+        self.assertIs( tags_manager.GetPending( service_key, ClientTags.TAG_DISPLAY_STORAGE ), ClientMedia.EMPTY_TAGS )
+        self.assertIs( empty_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), ClientMedia.EMPTY_TAGS )
+        
+        #
+        
+        hashes = { HydrusData.GenerateKey() }
+        
+        tags_manager.ProcessContentUpdate( service_key, HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( 'metroid', hashes ) ) )
+        dupe_tags_manager.ProcessContentUpdate( service_key, HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'samus aran', hashes ) ) )
+        empty_tags_manager.ProcessContentUpdate( service_key, HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'zero suit', hashes ) ) )
+        
+        self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'samus aran' } )
+        self.assertEqual( tags_manager.GetDeleted( service_key, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+        self.assertEqual( tags_manager.GetPending( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'metroid' } )
+        
+        self.assertEqual( dupe_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+        self.assertEqual( dupe_tags_manager.GetDeleted( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'samus aran' } )
+        self.assertEqual( dupe_tags_manager.GetPending( service_key, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+        
+        self.assertEqual( empty_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'zero suit' } )
+        self.assertEqual( empty_tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), { 'zero suit' } )
+        
+        self.assertEqual( other_empty_tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+        self.assertEqual( other_empty_tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), set() )
+        
+        self.assertEqual( ClientMedia.EMPTY_TAGS, frozenset() )
+        self.assertEqual( { status : tags for ( status, tags ) in ClientMedia.EMPTY_STATUSES_TO_TAGS.items() if len( tags ) > 0 }, {} )
+        
+    
+    def test_display_after_content_update( self ):
+        
+        service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY
+        
+        tag_siblings = collections.defaultdict( HydrusData.default_dict_set )
+        
+        tag_siblings[ service_key ][ HC.CONTENT_STATUS_CURRENT ] = { ( 'samus aran', 'character:samus aran' ) }
+        
+        HG.test_controller.SetRead( 'tag_siblings', tag_siblings )
+        
+        tag_siblings_manager = ClientCaches.TagSiblingsManager( HG.test_controller )
+        
+        filter_pages = ClientTags.TagFilter()
+        
+        filter_pages.SetRule( 'page:', CC.FILTER_BLACKLIST )
+        
+        tag_display_manager = ClientTags.TagDisplayManager()
+        
+        tag_display_manager.SetTagFilter( ClientTags.TAG_DISPLAY_SELECTION_LIST, service_key, filter_pages )
+        
+        service_keys_to_statuses_to_tags = collections.defaultdict( ClientMedia.GenerateStatusesToTags )
+        
+        service_keys_to_statuses_to_tags[ service_key ] = ClientMedia.BuildStatusesToTags( [ ( HC.CONTENT_STATUS_CURRENT, 'metroid' ), ( HC.CONTENT_STATUS_CURRENT, 'page:1' ) ] )
+        
+        tags_manager = ClientMedia.TagsManager( service_keys_to_statuses_to_tags )
+        
+        with patch.object( HG.test_controller, 'tag_siblings_manager', tag_siblings_manager ):
+            
+            with patch.object( HG.test_controller, 'tag_display_manager', tag_display_manager ):
+                
+                # build the views, so the content updates have something stale to clear out
+                
+                self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'metroid', 'page:1' } )
+                self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_SELECTION_LIST ), { 'metroid' } )
+                
+                hashes = { HydrusData.GenerateKey() }
+                
+                tags_manager.ProcessContentUpdate( service_key, HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'samus aran', hashes ) ) )
+                tags_manager.ProcessContentUpdate( service_key, HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'page:1', hashes ) ) )
+                tags_manager.ProcessContentUpdate( service_key, HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( 'page:2', hashes ) ) )
+                
+                self.assertEqual( tags_manager.GetCurrent( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'metroid', 'samus aran' } )
+                self.assertEqual( tags_manager.GetDeleted( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'page:1' } )
+                self.assertEqual( tags_manager.GetPending( service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'page:2' } )
+                
+                for display_service_key in ( service_key, CC.COMBINED_TAG_SERVICE_KEY ):
+                    
+                    self.assertEqual( tags_manager.GetCurrent( display_service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'metroid', 'character:samus aran' } )
+                    self.assertEqual( tags_manager.GetPending( display_service_key, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ), { 'page:2' } )
+                    
+                    self.assertEqual( tags_manager.GetCurrent( display_service_key, ClientTags.TAG_DISPLAY_SELECTION_LIST ), { 'metroid', 'character:samus aran' } )
+                    self.assertEqual( tags_manager.GetPending( display_service_key, ClientTags.TAG_DISPLAY_SELECTION_LIST ), set() )
+                    
+                
+                self.assertTrue( tags_manager.HasTag( 'character:samus aran', ClientTags.TAG_DISPLAY_SELECTION_LIST ) )
+                self.assertFalse( tags_manager.HasTag( 'samus aran', ClientTags.TAG_DISPLAY_SELECTION_LIST ) )
+                
+            
+        
+    
     def test_reset_service( self ):
         
         self.assertEqual( self._other_tags_manager.GetCurrent( self._reset_service_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'reset_current' } )
@@ -642,7 +750,7 @@ class TestTagObjects( unittest.TestCase ):
         or_texts_and_namespaces.append( ( ' OR ', 'system' ) )
         or_texts_and_namespaces.append( ( 'character:samus aran', 'character' ) )
         
-        
+    
         self.assertEqual( p.GetTextsAndNamespaces(), or_texts_and_namespaces )
         
     
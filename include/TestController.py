@@ -36,16 +36,22 @@ from . import TestClientDaemons
 from . import TestClientData
 from . import TestClientDB
 from . import TestClientDBDuplicates
+from . import TestClientExporting
+from . import TestClientFiles
 from . import TestClientImageHandling
 from . import TestClientImportOptions
 from . import TestClientImportSubscriptions
 from . import TestClientListBoxes
 from . import TestClientMigration
 from . import TestClientNetworking
+from . import TestClientParsing
+from . import TestClientServices
+from . import TestClientSimilarFiles
 from . import TestClientTags
 from . import TestClientThreading
 from . import TestDialogs
 from . import TestFunctions
+from . import TestHydrusDB
 from . import TestHydrusNATPunch
 from . import TestHydrusNetworking
 from . import TestHydrusSerialisable
@@ -658,7 +664,10 @@ class Controller( object ):
             
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientConstants ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientData ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientExporting ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImportOptions ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientParsing ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientServices ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientTags ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientThreading ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestFunctions ) )
@@ -668,11 +677,13 @@ class Controller( object ):
         if run_all or self.only_run == 'db':
             
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientDB ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestHydrusDB ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestServerDB ) )
             
         if run_all or self.only_run in ( 'db', 'db_duplicates' ):
             
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientDBDuplicates ) )
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientSimilarFiles ) )
             
         if run_all or self.only_run == 'networking':
             
@@ -685,6 +696,7 @@ class Controller( object ):
             
         if run_all or self.only_run == 'image':
             
+            suites.append( unittest.TestLoader().loadTestsFromModule( TestClientFiles ) )
             suites.append( unittest.TestLoader().loadTestsFromModule( TestClientImageHandling ) )
             
         if run_all or self.only_run == 'migration':
@@ -788,5 +800,18 @@ class Controller( object ):
                 return ( CC.STATUS_SUCCESSFUL_AND_NEW, 'test note' )
                 
             
+        elif name == 'import_files':
+            
+            ( file_import_jobs, ) = args
+            
+            if True in ( file_import_job.GetHash().hex() == 'a593942cb7ea9ffcd8ccf2f0fa23c338e23bfecd9a3e508dfc0bcf07501ead08' for file_import_job in file_import_jobs ): # 'blarg' in sha256 hex
+                
+                raise Exception( 'File failed to import for some reason!' )
+                
+            else:
+                
+                return [ ( CC.STATUS_SUCCESSFUL_AND_NEW, 'test note' ) for file_import_job in file_import_jobs ]
+                
+            
         
     
@@ -1,5 +1,7 @@
 import collections
+import hashlib
 from . import HydrusConstants as HC
+from . import HydrusFileHandling
 from . import HydrusGlobals as HG
 from . import ClientData
 from . import ClientTags
@@ -42,6 +44,27 @@ class TestFunctions( unittest.TestCase ):
         self.assertEqual( ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags ), content_updates )
         
     
+    def test_file_hashes( self ):
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        with open( path, 'rb' ) as f:
+            
+            file_bytes = f.read()
+            
+        
+        expected = tuple( ( hashlib.new( name, file_bytes ).digest() for name in ( 'sha256', 'md5', 'sha1', 'sha512' ) ) )
+        
+        self.assertEqual( HydrusFileHandling.GetAllHashesFromPath( path ), expected )
+        
+        # an error in the reader comes back out to the caller
+        
+        with self.assertRaises( FileNotFoundError ):
+            
+            HydrusFileHandling.GetAllHashesFromPath( os.path.join( HC.STATIC_DIR, 'does not exist.png' ) )
+            
+        
+    
     def test_number_conversion( self ):
         
         i = 123456789
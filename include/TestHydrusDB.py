@@ -0,0 +1,199 @@
+from . import HydrusConstants as HC
+from . import HydrusDB
+from . import HydrusGlobals as HG
+import os
+from . import TestController
+import threading
+import time
+import unittest
+from mock import patch
+
+class NumbersDB( HydrusDB.HydrusDB ):
+    
+    READ_ONLY_ACTIONS = [ 'is_read_only', 'numbers' ]
+    
+    def _CreateDB( self ):
+        
+        self._c.execute( 'CREATE TABLE version ( version INTEGER );' )
+        self._c.execute( 'INSERT INTO version ( version ) VALUES ( ? );', ( HC.SOFTWARE_VERSION, ) )
+        
+        self._c.execute( 'CREATE TABLE numbers ( number INTEGER );' )
+        
+    
+    def _ManageDBError( self, job, e ):
+        
+        if job.IsSynchronous():
+            
+            job.PutResult( e )
+            
+        
+    
+    def _Read( self, action, *args, **kwargs ):
+        
+        if action == 'is_read_only': result = self._connection_data.read_only
+        elif action == 'numbers': result = self._STL( self._c.execute( 'SELECT number FROM numbers ORDER BY number;' ) )
+        
+        return result
+        
+    
+    def _Write( self, action, *args, **kwargs ):
+        
+        if action == 'number':
+            
+            ( number, ) = args
+            
+            self._c.execute( 'INSERT INTO numbers ( number ) VALUES ( ? );', ( number, ) )
+            
+        elif action == 'slow_number':
+            
+            ( number, started_event, finish_event ) = args
+            
+            self._c.execute( 'INSERT INTO numbers ( number ) VALUES ( ? );', ( number, ) )
+            
+            started_event.set()
+            
+            finish_event.wait( 10 )
+            
+        
+    
+class TestHydrusDB( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._db = NumbersDB( HG.test_controller, TestController.DB_DIR, 'numbers' )
+        
+    
+    def tearDown( self ):
+        
+        self._db.Shutdown()
+        
+        while not self._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        for filename in self._db._db_filenames.values():
+            
+            for suffix in ( '', '-wal', '-shm' ):
+                
+                path = os.path.join( TestController.DB_DIR, filename + suffix )
+                
+                if os.path.exists( path ):
+                    
+                    os.remove( path )
+                    
+                
+            
+        
+    
+    def _read_from_other_thread( self, action ):
+        
+        results = []
+        
+        thread = threading.Thread( target = lambda: results.append( self._db.Read( action ) ) )
+        
+        thread.start()
+        
+        thread.join( 10 )
+        
+        return results[0]
+        
+    
+    def test_failed_read_only_workers( self ):
+        
+        self._db.Shutdown()
+        
+        while not self._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        release_event = threading.Event()
+        
+        def fail_to_init( db ):
+            
+            release_event.wait( 10 )
+            
+            raise Exception( 'could not open a read-only connection' )
+            
+        
+        with patch.object( NumbersDB, '_InitReadOnlyDBCursor', fail_to_init ):
+            
+            self._db = NumbersDB( HG.test_controller, TestController.DB_DIR, 'numbers' )
+            
+            results = []
+            
+            thread = threading.Thread( target = lambda: results.append( self._db.Read( 'is_read_only' ) ) )
+            
+            thread.start()
+            
+            # the workers are counted before the db says it is ready, so this read is waiting on the pool
+            
+            time.sleep( 0.5 )
+            
+            self.assertEqual( results, [] )
+            
+            # once they have all failed, it is handed to the main loop
+            
+            release_event.set()
+            
+            thread.join( 10 )
+            
+            self.assertEqual( results, [ False ] )
+            
+            self.assertFalse( self._db.Read( 'is_read_only' ) )
+            
+        
+    
+    def test_read_after_write( self ):
+        
+        self.assertTrue( self._db.Read( 'is_read_only' ) )
+        
+        # our own queued write is ahead of our read
+        
+        self._db.Write( 'number', False, 1 )
+        
+        self.assertEqual( self._db.Read( 'numbers' ), [ 1 ] )
+        
+        # everyone else has to see it too, even though it is not committed yet
+        
+        self.assertEqual( self._read_from_other_thread( 'numbers' ), [ 1 ] )
+        self.assertFalse( self._read_from_other_thread( 'is_read_only' ) )
+        
+        self._db.Write( 'number', True, 2 )
+        
+        self.assertEqual( self._db.Read( 'numbers' ), [ 1, 2 ] )
+        self.assertEqual( self._read_from_other_thread( 'numbers' ), [ 1, 2 ] )
+        
+    
+    def test_reads_during_long_write( self ):
+        
+        started_event = threading.Event()
+        finish_event = threading.Event()
+        
+        thread = threading.Thread( target = self._db.Write, args = ( 'slow_number', True, 5, started_event, finish_event ) )
+        
+        thread.start()
+        
+        try:
+            
+            self.assertTrue( started_event.wait( 10 ) )
+            
+            # the write is still going, so these are served in parallel from the last commit
+            
+            self.assertTrue( self._db.Read( 'is_read_only' ) )
+            self.assertEqual( self._db.Read( 'numbers' ), [] )
+            
+            self.assertTrue( thread.is_alive() )
+            
+        finally:
+            
+            finish_event.set()
+            
+            thread.join( 10 )
+            
+        
+        self.assertFalse( self._db.Read( 'is_read_only' ) )
+        self.assertEqual( self._db.Read( 'numbers' ), [ 5 ] )
+        
+    
@@ -521,3 +521,31 @@ class TestBandwidthTracker( unittest.TestCase ):
             
         
     
+    def test_waiting_estimate( self ):
+        
+        bandwidth_tracker = HydrusNetworking.BandwidthTracker()
+        
+        now = HydrusData.GetNow()
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now ):
+            
+            bandwidth_tracker.ReportDataUsed( 1024 )
+            
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now + 10 ):
+            
+            bandwidth_tracker.ReportDataUsed( 256 )
+            
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now + 20 ):
+            
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, 15 ), 256 )
+            self.assertEqual( bandwidth_tracker.GetUsage( HC.BANDWIDTH_TYPE_DATA, 30 ), 1280 )
+            
+            self.assertEqual( bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_DATA, 30, 2048 ), 0 )
+            self.assertEqual( bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_DATA, 30, 1280 ), 10 )
+            self.assertEqual( bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_DATA, 30, 256 ), 20 )
+            self.assertEqual( bandwidth_tracker.GetWaitingEstimate( HC.BANDWIDTH_TYPE_DATA, 15, 1280 ), 0 )
+            
+        
+    
@@ -15,12 +15,14 @@ from . import ClientSearch
 from . import ClientTags
 from . import HydrusConstants as HC
 from . import HydrusData
+from . import HydrusExceptions
 from . import HydrusNetwork
 from . import HydrusSerialisable
 from . import TestController as TC
 import os
 import unittest
 import wx
+from mock import patch
 
 class TestSerialisables( unittest.TestCase ):
     
@@ -152,6 +154,131 @@ class TestSerialisables( unittest.TestCase ):
             
         
     
+    def test_SERIALISABLE_TYPE_CONTENT_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( obj.GetNumRows(), dupe_obj.GetNumRows() )
+            
+            self.assertEqual( [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in obj.GetNewMappings() ], [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in dupe_obj.GetNewMappings() ] )
+            self.assertEqual( [ tuple( row ) for row in obj.GetNewFiles() ], [ tuple( row ) for row in dupe_obj.GetNewFiles() ] )
+            self.assertEqual( sorted( obj.GetDeletedFiles() ), sorted( dupe_obj.GetDeletedFiles() ) )
+            self.assertEqual( [ tuple( pair ) for pair in obj.GetDeletedTagParents() ], [ tuple( pair ) for pair in dupe_obj.GetDeletedTagParents() ] )
+            
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 5, [ 300, 2, 70000, 2 ** 40 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 3, [ 1 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 1, 65536, HC.IMAGE_PNG, 1500000000, 640, 480, None, None, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 20 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 4 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, ( 7, -1 ) ) )
+        
+        self._dump_and_load_and_test( content_update, test )
+        
+        # json stays the default, and binary is only written when a repository asks for it
+        
+        self.assertFalse( content_update.DumpToNetworkBytes().startswith( HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX ) )
+        
+        binary_network_bytes = content_update.DumpToBinaryNetworkBytes()
+        
+        self.assertTrue( binary_network_bytes.startswith( HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX ) )
+        
+        test( content_update, HydrusSerialisable.CreateFromNetworkBytes( binary_network_bytes ) )
+        
+        # asking for lz4 without it falls back to zlib
+        
+        with patch.object( HydrusSerialisable, 'LZ4_OK', False ):
+            
+            lz4_network_bytes = content_update.DumpToBinaryNetworkBytes( compression = HydrusSerialisable.BINARY_COMPRESSION_LZ4 )
+            
+            test( content_update, HydrusSerialisable.CreateFromNetworkBytes( lz4_network_bytes ) )
+            
+        
+        # anything else with the binary prefix, like a request body, is a serialisation error, which the server turns into a 400
+        
+        header_start = len( HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX )
+        
+        header = HydrusSerialisable.BINARY_HEADER_STRUCT.pack( HydrusSerialisable.BINARY_NETWORK_BYTES_VERSION, HydrusSerialisable.BINARY_COMPRESSION_ZLIB, HydrusSerialisable.SERIALISABLE_TYPE_DICTIONARY, 1 )
+        
+        not_allowed_network_bytes = HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX + header + binary_network_bytes[ header_start + HydrusSerialisable.BINARY_HEADER_STRUCT.size : ]
+        
+        # even if that type could load the body, it is not one we send as binary
+        
+        with patch.dict( HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES, { HydrusSerialisable.SERIALISABLE_TYPE_DICTIONARY : HydrusNetwork.ContentUpdate } ):
+            
+            with self.assertRaises( HydrusExceptions.SerialisationException ):
+                
+                HydrusSerialisable.CreateFromNetworkBytes( not_allowed_network_bytes )
+                
+            
+        
+        bad_network_bytes_list = []
+        
+        bad_network_bytes_list.append( not_allowed_network_bytes )
+        bad_network_bytes_list.append( binary_network_bytes[ : header_start + 2 ] )
+        bad_network_bytes_list.append( binary_network_bytes[ : -10 ] )
+        
+        for bad_network_bytes in bad_network_bytes_list:
+            
+            with self.assertRaises( HydrusExceptions.SerialisationException ):
+                
+                HydrusSerialisable.CreateFromNetworkBytes( bad_network_bytes )
+                
+            
+            with self.assertRaises( HydrusExceptions.BadRequestException ):
+                
+                HydrusNetwork.ParseNetworkBytesToParsedHydrusArgs( bad_network_bytes )
+                
+            
+        
+        # an update file written by network version 18
+        
+        old_network_bytes = bytes.fromhex( '78da8b3636d15130d451888e368013c640022864140b06400e480024126d64001103005ffe0da1' )
+        
+        old_content_update = HydrusSerialisable.CreateFromNetworkBytes( old_network_bytes )
+        
+        self.assertEqual( old_content_update.GetNewMappings(), [ [ 3, [ 1, 2 ] ] ] )
+        self.assertEqual( old_content_update.GetDeletedFiles(), [ 20 ] )
+        
+    
+    def test_SERIALISABLE_TYPE_DEFINITIONS_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( obj.GetHashIdsToHashes(), dupe_obj.GetHashIdsToHashes() )
+            self.assertEqual( obj.GetTagIdsToTags(), dupe_obj.GetTagIdsToTags() )
+            
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for i in range( 100, 200 ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i, 'series:t\u00e9st ' + str( i ) ) )
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, i * 3, HydrusData.GenerateKey() ) )
+            
+        
+        self._dump_and_load_and_test( definitions_update, test )
+        
+        self.assertFalse( definitions_update.DumpToNetworkBytes().startswith( HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX ) )
+        
+        binary_network_bytes = definitions_update.DumpToBinaryNetworkBytes()
+        
+        self.assertTrue( binary_network_bytes.startswith( HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX ) )
+        
+        test( definitions_update, HydrusSerialisable.CreateFromNetworkBytes( binary_network_bytes ) )
+        
+        # an update file written by network version 18
+        
+        old_network_bytes = bytes.fromhex( '78da1dcc3d1283201806e1ab30d614fb8a80e42a84c29fcf99b4c1dc3f6ab3cdce3c3524efe45daddcc9de0d8018094c44129999c2c2cac68e710849a38226452565cd2a5ab46ad32ed331b4d62eeb41e3e575fb7eacbfcef70facf4f3feadfd019a8e1e87' )
+        
+        old_definitions_update = HydrusSerialisable.CreateFromNetworkBytes( old_network_bytes )
+        
+        self.assertEqual( old_definitions_update.GetHashIdsToHashes(), { 7 : bytes( range( 32 ) ) } )
+        self.assertEqual( old_definitions_update.GetTagIdsToTags(), { 5 : 'series:t\u00e9st' } )
+        
+    
     def test_SERIALISABLE_TYPE_DUPLICATE_ACTION_OPTIONS( self ):
         
         def test( obj, dupe_obj ):
@@ -16,6 +16,7 @@ from . import ClientSearch
 from . import ClientServices
 from . import ClientTags
 import collections
+import hashlib
 from . import HydrusConstants as HC
 from . import HydrusData
 from . import HydrusExceptions
@@ -24,6 +25,7 @@ from . import HydrusGlobals as HG
 from . import HydrusNetwork
 from . import HydrusSerialisable
 import itertools
+from mock import patch
 import os
 from . import ServerDB
 import shutil
@@ -35,6 +37,329 @@ import threading
 import unittest
 import wx
 
+class RepositoryDB( ServerDB.DB ):
+    
+    def _PopulateRepository( self, service_key, timestamp, late_timestamp ):
+        
+        # a repository with a bit of everything in the period, plus some rows after it, and what updates for the period should hold
+        
+        self._c.execute( 'INSERT INTO services ( service_key, service_type, name, port, dictionary_string ) VALUES ( ?, ?, ?, ?, ? );', ( sqlite3.Binary( service_key ), HC.TAG_REPOSITORY, 'test tag repo', 0, '' ) )
+        
+        service_id = self._c.lastrowid
+        
+        self._RepositoryCreate( service_id )
+        
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = ServerDB.GenerateRepositoryFilesTableNames( service_id )
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ServerDB.GenerateRepositoryMappingsTableNames( service_id )
+        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = ServerDB.GenerateRepositoryTagParentsTableNames( service_id )
+        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = ServerDB.GenerateRepositoryTagSiblingsTableNames( service_id )
+        
+        expected = collections.defaultdict( set )
+        
+        service_hash_ids_to_master_hash_ids = {}
+        
+        for i in range( 30000 ):
+            
+            hash = HydrusData.GenerateKey()
+            
+            master_hash_id = self._GetMasterHashId( hash )
+            
+            service_hash_id = self._RepositoryGetServiceHashId( service_id, master_hash_id, timestamp )
+            
+            service_hash_ids_to_master_hash_ids[ service_hash_id ] = master_hash_id
+            
+            expected[ 'hashes' ].add( ( service_hash_id, hash ) )
+            
+        
+        service_hash_ids = sorted( service_hash_ids_to_master_hash_ids.keys() )
+        
+        late_service_hash_id = self._RepositoryGetServiceHashId( service_id, self._GetMasterHashId( HydrusData.GenerateKey() ), late_timestamp )
+        
+        for tag in ( 'big', 'small', 'deleted', 'child', 'parent', 'bad', 'good' ):
+            
+            expected[ 'tags' ].add( ( self._RepositoryGetServiceTagId( service_id, self._GetMasterTagId( tag ), timestamp ), tag ) )
+            
+        
+        tags_to_service_tag_ids = { tag : service_tag_id for ( service_tag_id, tag ) in expected[ 'tags' ] }
+        
+        #
+        
+        master_hash_id = service_hash_ids_to_master_hash_ids[ service_hash_ids[0] ]
+        
+        self._c.execute( 'INSERT INTO files_info ( master_hash_id, size, mime, width, height, duration, num_frames, num_words ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ? );', ( master_hash_id, 100, HC.IMAGE_PNG, 20, 20, None, None, None ) )
+        self._c.execute( 'INSERT INTO ' + current_files_table_name + ' ( service_hash_id, account_id, file_timestamp ) VALUES ( ?, ?, ? );', ( service_hash_ids[0], 1, timestamp ) )
+        
+        expected[ 'new_files' ].add( ( service_hash_ids[0], 100, HC.IMAGE_PNG, timestamp, 20, 20, None, None, None ) )
+        
+        self._c.execute( 'INSERT INTO ' + deleted_files_table_name + ' ( service_hash_id, account_id, file_timestamp ) VALUES ( ?, ?, ? );', ( service_hash_ids[1], 1, timestamp ) )
+        
+        expected[ 'deleted_files' ].add( service_hash_ids[1] )
+        
+        #
+        
+        # 'big' has more hashes than fit in one mappings row
+        
+        current_mappings = [ ( tags_to_service_tag_ids[ 'big' ], service_hash_id ) for service_hash_id in service_hash_ids ]
+        current_mappings.extend( ( ( tags_to_service_tag_ids[ 'small' ], service_hash_id ) for service_hash_id in service_hash_ids[:10] ) )
+        
+        deleted_mappings = [ ( tags_to_service_tag_ids[ 'deleted' ], service_hash_id ) for service_hash_id in service_hash_ids[5:15] ]
+        
+        self._c.executemany( 'INSERT INTO ' + current_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', ( ( service_tag_id, service_hash_id, 1, timestamp ) for ( service_tag_id, service_hash_id ) in current_mappings ) )
+        self._c.executemany( 'INSERT INTO ' + deleted_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', ( ( service_tag_id, service_hash_id, 1, timestamp ) for ( service_tag_id, service_hash_id ) in deleted_mappings ) )
+        
+        self._c.execute( 'INSERT INTO ' + current_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', ( tags_to_service_tag_ids[ 'small' ], late_service_hash_id, 1, late_timestamp ) )
+        
+        expected[ 'new_mappings' ] = set( current_mappings )
+        expected[ 'deleted_mappings' ] = set( deleted_mappings )
+        
+        #
+        
+        parent_pair = ( tags_to_service_tag_ids[ 'child' ], tags_to_service_tag_ids[ 'parent' ] )
+        sibling_pair = ( tags_to_service_tag_ids[ 'bad' ], tags_to_service_tag_ids[ 'good' ] )
+        
+        self._c.execute( 'INSERT INTO ' + current_tag_parents_table_name + ' ( child_service_tag_id, parent_service_tag_id, account_id, parent_timestamp ) VALUES ( ?, ?, ?, ? );', ( *parent_pair, 1, timestamp ) )
+        self._c.execute( 'INSERT INTO ' + deleted_tag_siblings_table_name + ' ( bad_service_tag_id, good_service_tag_id, account_id, sibling_timestamp ) VALUES ( ?, ?, ?, ? );', ( *sibling_pair, 1, timestamp ) )
+        
+        expected[ 'new_parents' ].add( parent_pair )
+        expected[ 'deleted_siblings' ].add( sibling_pair )
+        
+        return ( service_id, expected )
+        
+    
+
+    def _Read( self, action, *args, **kwargs ):
+        
+        if action == 'cached_master_hash_ids': result = dict( self._hashes_to_master_hash_ids )
+        elif action == 'db_master_hash_ids': result = dict( self._c.execute( 'SELECT hash, master_hash_id FROM hashes;' ) )
+        elif action == 'db_service_hash_ids':
+            
+            ( service_id, ) = args
+            
+            ( hash_id_map_table_name, tag_id_map_table_name ) = ServerDB.GenerateRepositoryMasterMapTableNames( service_id )
+            
+            result = dict( self._c.execute( 'SELECT master_hash_id, service_hash_id FROM ' + hash_id_map_table_name + ';' ) )
+            
+        elif action == 'streamed_updates': result = list( self._RepositoryGenerateUpdates( *args ) )
+        else: result = ServerDB.DB._Read( self, action, *args, **kwargs )
+        
+        return result
+        
+    
+    def _Write( self, action, *args, **kwargs ):
+        
+        if action == 'master_hash_ids': result = self._GetMasterHashIds( *args )
+        elif action == 'master_hash_ids_then_fail':
+            
+            self._GetMasterHashIds( *args )
+            
+            raise Exception( 'Something broke after some new ids were made!' )
+            
+        elif action == 'populate_repository': result = self._PopulateRepository( *args )
+        elif action == 'repository': result = self._RepositoryCreate( *args )
+        elif action == 'service_hash_ids': result = self._RepositoryGetServiceHashIds( *args, HydrusData.GetNow() )
+        else: result = ServerDB.DB._Write( self, action, *args, **kwargs )
+        
+        return result
+        
+    
+class TestServerDBRepository( unittest.TestCase ):
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        # the server's external dbs have fixed names, so this one needs its own dir
+        
+        cls._db_dir = os.path.join( TestController.DB_DIR, 'server_repository' )
+        
+        os.makedirs( cls._db_dir )
+        
+        cls._db = RepositoryDB( HG.test_controller, cls._db_dir, 'server' )
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        cls._db.Shutdown()
+        
+        while not cls._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        del cls._db
+        
+        shutil.rmtree( cls._db_dir )
+        
+    
+    def _flatten_updates( self, updates ):
+        
+        rows = collections.defaultdict( set )
+        
+        for update in updates:
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                
+                rows[ 'hashes' ].update( update.GetHashIdsToHashes().items() )
+                rows[ 'tags' ].update( update.GetTagIdsToTags().items() )
+                
+            else:
+                
+                rows[ 'new_files' ].update( ( tuple( file_row ) for file_row in update.GetNewFiles() ) )
+                rows[ 'deleted_files' ].update( update.GetDeletedFiles() )
+                
+                for ( key, mappings ) in ( ( 'new_mappings', update.GetNewMappings() ), ( 'deleted_mappings', update.GetDeletedMappings() ) ):
+                    
+                    for ( service_tag_id, service_hash_ids ) in mappings:
+                        
+                        rows[ key ].update( ( ( service_tag_id, service_hash_id ) for service_hash_id in service_hash_ids ) )
+                        
+                    
+                
+                rows[ 'new_parents' ].update( ( tuple( pair ) for pair in update.GetNewTagParents() ) )
+                rows[ 'deleted_parents' ].update( ( tuple( pair ) for pair in update.GetDeletedTagParents() ) )
+                rows[ 'new_siblings' ].update( ( tuple( pair ) for pair in update.GetNewTagSiblings() ) )
+                rows[ 'deleted_siblings' ].update( ( tuple( pair ) for pair in update.GetDeletedTagSiblings() ) )
+                
+            
+        
+        return { key : value for ( key, value ) in rows.items() if len( value ) > 0 }
+        
+    
+    def test_bulk_ids( self ):
+        
+        ( hash_a, hash_b, hash_c ) = [ HydrusData.GenerateKey() for i in range( 3 ) ]
+        
+        # the same hash twice in one batch only makes one row
+        
+        master_hash_ids = self._db.Write( 'master_hash_ids', True, [ hash_a, hash_a, hash_b, None ] )
+        
+        db_master_hash_ids = self._db.Read( 'db_master_hash_ids' )
+        
+        self.assertEqual( master_hash_ids, { db_master_hash_ids[ hash_a ], db_master_hash_ids[ hash_b ] } )
+        self.assertEqual( len( master_hash_ids ), 2 )
+        
+        # a mix of cached and new
+        
+        master_hash_ids = self._db.Write( 'master_hash_ids', True, [ hash_b, hash_c, hash_c ] )
+        
+        db_master_hash_ids = self._db.Read( 'db_master_hash_ids' )
+        
+        self.assertEqual( master_hash_ids, { db_master_hash_ids[ hash_b ], db_master_hash_ids[ hash_c ] } )
+        self.assertEqual( len( db_master_hash_ids ), 3 )
+        
+        self.assertEqual( self._db.Read( 'cached_master_hash_ids' ), db_master_hash_ids )
+        
+        #
+        
+        service_id = 12345
+        
+        self._db.Write( 'repository', True, service_id )
+        
+        some_master_hash_ids = [ db_master_hash_ids[ hash_a ], db_master_hash_ids[ hash_a ], db_master_hash_ids[ hash_b ] ]
+        
+        service_hash_ids = self._db.Write( 'service_hash_ids', True, service_id, some_master_hash_ids )
+        
+        db_service_hash_ids = self._db.Read( 'db_service_hash_ids', service_id )
+        
+        self.assertEqual( len( db_service_hash_ids ), 2 )
+        self.assertEqual( service_hash_ids, set( db_service_hash_ids.values() ) )
+        
+        service_hash_ids = self._db.Write( 'service_hash_ids', True, service_id, list( db_master_hash_ids.values() ) )
+        
+        db_service_hash_ids = self._db.Read( 'db_service_hash_ids', service_id )
+        
+        self.assertEqual( len( db_service_hash_ids ), 3 )
+        self.assertEqual( set( db_service_hash_ids.keys() ), set( db_master_hash_ids.values() ) )
+        self.assertEqual( service_hash_ids, set( db_service_hash_ids.values() ) )
+        
+    
+    def test_rollback_resets_cache( self ):
+        
+        ( old_hash, new_hash ) = [ HydrusData.GenerateKey() for i in range( 2 ) ]
+        
+        self._db.Write( 'master_hash_ids', True, [ old_hash ] )
+        
+        with self.assertRaises( Exception ):
+            
+            self._db.Write( 'master_hash_ids_then_fail', True, [ old_hash, new_hash ] )
+            
+        
+        # the new row was rolled back, so the cache cannot be trusted to know its id
+        
+        self.assertEqual( self._db.Read( 'cached_master_hash_ids' ), {} )
+        
+        db_master_hash_ids = self._db.Read( 'db_master_hash_ids' )
+        
+        self.assertIn( old_hash, db_master_hash_ids )
+        self.assertNotIn( new_hash, db_master_hash_ids )
+        
+        master_hash_ids = self._db.Write( 'master_hash_ids', True, [ old_hash, new_hash ] )
+        
+        db_master_hash_ids = self._db.Read( 'db_master_hash_ids' )
+        
+        self.assertEqual( master_hash_ids, { db_master_hash_ids[ old_hash ], db_master_hash_ids[ new_hash ] } )
+        
+    
+    def test_update_generation( self ):
+        
+        service_key = HydrusData.GenerateKey()
+        
+        ( service_id, expected ) = self._db.Write( 'populate_repository', True, service_key, 1000, 5000 )
+        
+        updates = self._db.Read( 'streamed_updates', service_id, 0, 2000 )
+        
+        # the streamed updates hold everything the old all-at-once generation did, in the same sort of updates
+        
+        self.assertEqual( self._flatten_updates( updates ), expected )
+        
+        update_types = [ type( update ) for update in updates ]
+        
+        self.assertEqual( update_types, sorted( update_types, key = lambda update_type: update_type != HydrusNetwork.DefinitionsUpdate ) )
+        
+        for update in updates:
+            
+            if isinstance( update, HydrusNetwork.ContentUpdate ):
+                
+                for ( service_tag_id, service_hash_ids ) in update.GetNewMappings():
+                    
+                    self.assertLessEqual( len( service_hash_ids ), 25000 )
+                    
+                
+            
+        
+        #
+        
+        for binary_updates in ( False, True ):
+            
+            # update files go in the server's files dir, which here is this db's own
+            
+            with patch.object( HG.test_controller, 'GetFilesDir', return_value = self._db.GetFilesDir() ):
+                
+                update_hashes = self._db.Write( 'create_update', True, service_key, 0, 2000, binary_updates = binary_updates )
+                
+            
+        
+            self.assertEqual( len( update_hashes ), len( updates ) )
+            
+            written_updates = []
+            
+            for update_hash in update_hashes:
+                
+                with open( os.path.join( self._db.GetFilesDir(), update_hash.hex()[:2], update_hash.hex() ), 'rb' ) as f:
+                    
+                    update_network_bytes = f.read()
+                    
+                
+                self.assertEqual( hashlib.sha256( update_network_bytes ).digest(), update_hash )
+                self.assertEqual( update_network_bytes.startswith( HydrusSerialisable.BINARY_NETWORK_BYTES_PREFIX ), binary_updates )
+                
+                written_updates.append( HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes ) )
+                
+            
+            self.assertEqual( self._flatten_updates( written_updates ), expected )
+            
+        
+    
 class TestServerDB( unittest.TestCase ):
     
     def _read( self, action, *args, **kwargs ): return TestServerDB._db.Read( action, *args, **kwargs )
@@ -205,4 +530,4 @@ class TestServerDB( unittest.TestCase ):
         
         #self._test_content_creation()
         
-
+    